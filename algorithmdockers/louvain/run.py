@@ -1,11 +1,20 @@
 #!/usr/bin/env python
 
 import os
+import io
 import sys
+import json
 import argparse
+import contextlib
 import louvain
 import igraph
 
+try:
+    from commundetect_rest.edgelist import read_edge_list
+except ImportError:
+    # in the docker image edgelist.py is copied next to this script
+    from edgelist import read_edge_list
+
 
 def _parse_arguments(desc, args):
     """
@@ -17,8 +26,14 @@ def _parse_arguments(desc, args):
     help_fm = argparse.RawDescriptionHelpFormatter
     parser = argparse.ArgumentParser(description=desc,
                                      formatter_class=help_fm)
-    parser.add_argument('input',
+    parser.add_argument('input', nargs='?',
                         help='Edge file in tab delimited format')
+    parser.add_argument('--serve', action='store_true',
+                        help='If set, stay running and read jobs as one '
+                             'json object per line on standard in. Each '
+                             'job is {"args": [...], "stdout": path} and '
+                             'a json line with returncode and stderr is '
+                             'written to standard out when done')
     parser.add_argument('--directed', action='store_true',
                         help='If set, then generate directed graph')
     parser.add_argument('--configmodel', default='Default',
@@ -27,9 +42,53 @@ def _parse_arguments(desc, args):
     return parser.parse_args(args)
 
 
+class _ResultBuffer(object):
+    """
+    Buffers edges in memory so they can be written out in one call.
+    Same interface as commundetect_rest.results.ResultWriter which
+    is not available inside the docker image
+    """
+    def __init__(self):
+        """
+        Constructor
+        """
+        self._buf = io.StringIO()
+
+    def add_edge(self, src, dst, edgetype):
+        """
+        Adds edge
+        """
+        self._buf.write(str(src) + ',' + str(dst) + ',' + edgetype + ';')
+
+    def get_result(self):
+        """
+        Gets edges as string
+        """
+        return self._buf.getvalue()
+
+
+def _load_graph(graphfile, directed=False):
+    """
+    Loads edge list into graph whose vertices are named
+    by node id, edges get a weight attribute if weighted
+
+    :param graphfile: path to edge list
+    :param directed: if True make directed graph
+    :return: (graph, True if weighted)
+    :rtype: tuple
+    """
+    edges = read_edge_list(graphfile)
+    g = igraph.Graph(n=edges.nodes, edges=edges.get_edges().tolist(),
+                     directed=directed)
+    g.vs['name'] = edges.nodeids.tolist()
+    if edges.weighted:
+        g.es['weight'] = edges.weight.tolist()
+    return g, edges.weighted
+
+
 def run_louvain(graph, config_model='RB',
                 overlap=False, directed=False, interslice_weight=0.1,
-                resolution_parameter=0.1):
+                resolution_parameter=0.1, writer=None):
 
     """
     :outdir: the output directory to comprehend the output link file
@@ -39,6 +98,9 @@ def run_louvain(graph, config_model='RB',
     :param directed
     :param interslice_weight
     :param resolution_parameter
+    :param writer: object with add_edge(src, dst, edgetype) method that
+                   receives result edges, if None edges are written to
+                   standard out
     :return
     """
 
@@ -81,24 +143,9 @@ def run_louvain(graph, config_model='RB',
         wL = []
         G = []
         for file in graph:
-            with open(file, 'r') as f:
-                lines = f.read().splitlines()
-            elts = lines[0].split()
-            if len(elts) == 3:
-                weighted = True
-            else:
-                weighted = False
-            for i in range(len(lines)):
-                elts = lines[i].split()
-                for j in range(2):
-                    elts[j] = int(elts[j])
-                if weighted == True:
-                    elts[2] = float(elts[2])
-                lines[i] = tuple(elts)
-            g = igraph.Graph.TupleList(lines, directed=directed, weights=weighted)
+            g, weighted = _load_graph(file, directed=directed)
             G.append(g)
             wL.append(weighted)
-            f.close()
         if True in wL and False in wL:
             raise Exception('all graphs should follow the same format')
         if partition_type == louvain.CPMVertexPartition and directed == True:
@@ -111,30 +158,7 @@ def run_louvain(graph, config_model='RB',
             partition, quality = louvain_multiplex(G, partition_type, interslice_weight, resolution_parameter)
 
     else:
-        with open(graph, 'r') as f:
-            lines = f.read().splitlines()
-        Node2Index = {}
-        elts = lines[0].split()
-        if len(elts) == 3:
-            weighted = True
-        else:
-            weighted = False
-        index = 0
-        for i in range(len(lines)):
-            elts = lines[i].split()
-            for j in range(2):
-                elts[j] = int(elts[j])
-                if elts[j] not in Node2Index :
-                    Node2Index[elts[j]] = index
-                    index += 1
-            if weighted == True:
-                elts[2] = float(elts[2])
-            lines[i] = tuple(elts)
-        Index2Node = {}
-        for node in Node2Index:
-            Index2Node[Node2Index[node]] = node
-        f.close()
-        G = igraph.Graph.TupleList(lines, directed=directed, weights=weighted)
+        G, weighted = _load_graph(graph, directed=directed)
         if weighted == False:
             weights = None
         else:
@@ -147,15 +171,76 @@ def run_louvain(graph, config_model='RB',
         sys.stderr.write("No cluster; Resolution parameter may be too extreme")
         return 1
 
-    maxNode = max(list(Node2Index.keys()))
+    # vertices of partition are named by node id
+    Index2Node = partition.graph.vs['name']
+    maxNode = max(Index2Node)
+
+    tostdout = writer is None
+    if tostdout:
+        writer = _ResultBuffer()
 
     for i in range(len(partition)):
-        sys.stdout.write(str(maxNode+len(partition)+1) + ',' + str(maxNode+i+1) + ',' + 'term-term' + ';')
-        for n in partition[i]:
-            sys.stdout.write(str(maxNode+i+1) + ',' + str(Index2Node[n]) + ',' + 'term-gene' + ';')
-    sys.stdout.flush()
+        writer.add_edge(maxNode+len(partition)+1, maxNode+i+1, 'term-term')
+        for node in sorted([Index2Node[n] for n in partition[i]]):
+            writer.add_edge(maxNode+i+1, node, 'term-gene')
+
+    if tostdout:
+        sys.stdout.write(writer.get_result())
+        sys.stdout.flush()
     return 0
 
+def _run_job(args, outfile):
+    """
+    Runs one job in serve mode
+
+    :param args: command line arguments for job without program name
+    :param outfile: path to write result to
+    :return: (return code, standard error)
+    """
+    err = io.StringIO()
+    writer = _ResultBuffer()
+    # anything written to standard out would break the
+    # serve protocol so send it to standard error
+    with contextlib.redirect_stderr(err), contextlib.redirect_stdout(err):
+        try:
+            theargs = _parse_arguments('', args)
+            inputfile = os.path.abspath(theargs.input)
+            ecode = run_louvain(inputfile, directed=theargs.directed,
+                                writer=writer)
+        except SystemExit as e:
+            ecode = e.code if isinstance(e.code, int) else 2
+        except Exception as e:
+            sys.stderr.write('Caught exception: ' + str(e))
+            ecode = 2
+    with open(outfile, 'w') as f:
+        if ecode == 0:
+            f.write(writer.get_result())
+    return ecode, err.getvalue()
+
+
+def serve(instream, outstream):
+    """
+    Runs jobs read from instream until it is closed. Lets the
+    worker keep this container and interpreter warm between jobs
+
+    :param instream: stream with one json job per line
+    :param outstream: stream to write one json response per line to
+    :return: 0
+    """
+    for line in instream:
+        if line.strip() == '':
+            continue
+        try:
+            job = json.loads(line)
+            ecode, err = _run_job(job['args'], job['stdout'])
+        except Exception as e:
+            ecode, err = 2, 'Caught exception: ' + str(e)
+        outstream.write(json.dumps({'returncode': ecode,
+                                    'stderr': err}) + '\n')
+        outstream.flush()
+    return 0
+
+
 def main(args):
     """
     Main entry point for program
@@ -171,6 +256,13 @@ def main(args):
 
     theargs = _parse_arguments(desc, args[1:])
 
+    if theargs.serve is True:
+        return serve(sys.stdin, sys.stdout)
+
+    if theargs.input is None:
+        sys.stderr.write('input is required')
+        return 2
+
     try:
         inputfile = os.path.abspath(theargs.input)
 
@@ -5,8 +5,15 @@ __email__ = "cchuras@ucsd.edu"
 __version__ = "0.3.0"
 
 import os
-import shutil
+import json
 import time
+import uuid
+import shutil
+import threading
+import hashlib
+import tarfile
+import zipfile
+import tempfile
 from datetime import datetime
 import flask
 from flask import Flask, jsonify, request
@@ -14,9 +21,29 @@ from flask_restplus import reqparse, Api, Resource, fields, marshal, abort
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from flask_cors import CORS
+from werkzeug.exceptions import HTTPException
 
 from commundetect_rest.tasks import run_communitydetection
 from commundetect_rest.tasks import celeryapp
+from commundetect_rest.tasks import algorithms
+from commundetect_rest.tasks import EDGE_FILE
+from commundetect_rest.tasks import sizeclasses
+from commundetect_rest.tasks import dispatcher
+from commundetect_rest import cache
+from commundetect_rest import backpressure
+from commundetect_rest import compression
+from commundetect_rest import costs
+from commundetect_rest import delivery
+from commundetect_rest import edgelist
+from commundetect_rest import coalesce
+from commundetect_rest import events
+from commundetect_rest import fairshare
+from commundetect_rest import offload
+from commundetect_rest import quota
+from commundetect_rest import resources
+from commundetect_rest import routing
+from commundetect_rest import staging
+from celery import group
 from celery.result import AsyncResult
 
 
@@ -35,6 +62,58 @@ DISKFULL_CUTOFF_KEY = 'DISKFULL_CUTOFF'
 DEFAULT_RATE_LIMIT_KEY = 'DEFAULT_RATE_LIMIT'
 GET_RATE_LIMIT_KEY = 'GET_RATE_LIMIT'
 
+# type of result cache, 'local', 'redis' or None to disable
+RESULT_CACHE_KEY = 'RESULT_CACHE'
+RESULT_CACHE_SIZE_KEY = 'RESULT_CACHE_SIZE'
+RESULT_CACHE_TTL_KEY = 'RESULT_CACHE_TTL'
+REDIS_URL_KEY = 'REDIS_URL'
+
+# type of tracker used to coalesce identical submissions that are
+# queued or running onto one task, 'local', 'redis' or None to disable.
+# Ids handed out as aliases only resolve while the tracker has them,
+# so 'local' only suits a single web process that is never restarted
+COALESCE_KEY = 'COALESCE_SUBMISSIONS'
+
+# source of task state changes for long polling and
+# server sent events, 'redis' or None to disable
+TASK_EVENTS_KEY = 'TASK_EVENTS'
+
+# longest time in seconds a GET with wait parameter is held
+MAX_WAIT_KEY = 'MAX_WAIT'
+
+# longest time in seconds an event stream is kept open and how
+# often a comment is sent on it to keep proxies from closing it
+EVENT_STREAM_TIMEOUT_KEY = 'EVENT_STREAM_TIMEOUT'
+EVENT_STREAM_HEARTBEAT_KEY = 'EVENT_STREAM_HEARTBEAT'
+
+# most GETs of a web process held open at once waiting for a task
+# or streaming its events, each ties up a thread so this must stay
+# well below threads of WSGIDaemonProcess in commundetect.httpconf
+MAX_HELD_REQUESTS_KEY = 'MAX_HELD_REQUESTS'
+
+# seconds a caller turned away because too many GETs are held
+# open is told to wait before trying again
+HELD_REQUEST_RETRY_AFTER = 5
+
+# most edge lists accepted in one batch submission
+BATCH_MAX_SIZE_KEY = 'BATCH_MAX_SIZE'
+
+# finished results with at least this many characters are streamed
+# in chunks, compressed if client accepts it, instead of being
+# serialized in one piece
+RESULT_STREAM_MIN_KEY = 'RESULT_STREAM_MIN'
+
+# most task ids accepted by bulk status lookup
+BULK_STATUS_MAX_KEY = 'BULK_STATUS_MAX'
+
+# most task ids accepted by bulk status lookup that includes
+# results, they are read and serialized together in memory
+BULK_RESULTS_MAX_KEY = 'BULK_RESULTS_MAX'
+
+# prefix of key in result backend holding names and
+# task ids of a batch
+BATCH_KEY_PREFIX = 'commundetect-batch-'
+
 LOCATION = 'Location'
 RESULT = 'result.json'
 
@@ -50,6 +129,9 @@ PROCESSING_STATUS = 'processing'
 DONE_STATUS = 'done'
 ERROR_STATUS = 'error'
 
+# job was killed for using more memory than its size class allows
+OUT_OF_MEMORY_STATUS = resources.OUT_OF_MEMORY_STATUS
+
 # directory where token files named after tasks to delete
 # are stored
 DELETE_REQUESTS = 'delete_requests'
@@ -74,12 +156,28 @@ ALGO_PARAM = 'algorithm'
 
 EDGE_PARAM = 'edgefile'
 
-EDGE_FILE = 'edgefile.txt'
+# binary edge list, sent instead of edgefile
+EDGE_ARRAYS_PARAM = 'edgearrays'
 
 ROOTNETWORK_PARAM = 'rootnetwork'
 
 GRAPHDIRECTED_PARAM = 'graphdirected'
 
+WAIT_PARAM = 'wait'
+
+# page of result edges to get
+OFFSET_PARAM = 'offset'
+LIMIT_PARAM = 'limit'
+
+# bulk status parameters
+IDS_PARAM = 'ids'
+RESULTS_PARAM = 'results'
+
+# batch specific parameters
+EDGEFILES_PARAM = 'edgefiles'
+ARCHIVE_PARAM = 'archive'
+ITEMS_PARAM = 'items'
+
 RESULTKEY_KEY = 'resultkey'
 RESULTVALUE_KEY = 'resultvalue'
 
@@ -93,9 +191,85 @@ app.config[SLEEP_TIME_KEY] = 10
 app.config[DISKFULL_CUTOFF_KEY] = 90
 app.config[DEFAULT_RATE_LIMIT_KEY] = '360 per hour'
 app.config[GET_RATE_LIMIT_KEY] = '3600 per hour'
+app.config[RESULT_CACHE_KEY] = cache.LOCAL_CACHE
+app.config[RESULT_CACHE_SIZE_KEY] = 1000
+app.config[RESULT_CACHE_TTL_KEY] = 86400
+app.config[REDIS_URL_KEY] = 'redis://localhost'
+app.config[COALESCE_KEY] = coalesce.REDIS_TRACKER
+app.config[staging.INPUT_STAGING_KEY] = staging.SHARED_STAGING
+app.config[staging.INLINE_INPUT_MAX_KEY] = 0
+app.config[staging.BLOB_STORE_KEY] = None
+app.config[TASK_EVENTS_KEY] = events.REDIS_EVENTS
+app.config[MAX_WAIT_KEY] = 60
+app.config[BATCH_MAX_SIZE_KEY] = 10000
+app.config[BULK_STATUS_MAX_KEY] = 10000
+app.config[BULK_RESULTS_MAX_KEY] = 100
+app.config[RESULT_STREAM_MIN_KEY] = 1024 * 1024
+app.config[offload.RESULT_STORE_KEY] = None
+app.config[costs.COST_MODEL_KEY] = None
+app.config[costs.RUN_TIMES_FILE_KEY] = None
+app.config[costs.MAX_JOB_COST_KEY] = 3600
+app.config[costs.TIME_LIMIT_FACTOR_KEY] = 4.0
+app.config[costs.MIN_TIME_LIMIT_KEY] = 30
+app.config[costs.TIME_LIMIT_GRACE_KEY] = 30
+app.config[costs.TASK_EXPIRES_KEY] = None
+app.config[backpressure.MAX_QUEUE_WAIT_KEY] = 600
+app.config[backpressure.QUEUE_STATS_TTL_KEY] = 5
+app.config[backpressure.THROUGHPUT_WINDOW_KEY] = 600
+app.config[backpressure.DEFAULT_JOB_SECONDS_KEY] = 60
+app.config[quota.RATE_LIMIT_STORAGE_KEY] = None
+app.config[quota.WORK_RATE_LIMIT_KEY] = '100000000 per hour'
+app.config[fairshare.FAIR_SHARE_WEIGHTS_KEY] = {}
+app.config[fairshare.CLIENT_KEY_HEADER_KEY] = None
+app.config[EVENT_STREAM_TIMEOUT_KEY] = 600
+app.config[EVENT_STREAM_HEARTBEAT_KEY] = 15
+app.config[MAX_HELD_REQUESTS_KEY] = 2
 app.config.from_envvar(NETANT_REST_SETTINGS_ENV, silent=True)
 app.config.SWAGGER_UI_DOC_EXPANSION = 'list'
 
+resultcache = cache.create_result_cache(app.config[RESULT_CACHE_KEY],
+                                        maxsize=app.config[RESULT_CACHE_SIZE_KEY],
+                                        ttl=app.config[RESULT_CACHE_TTL_KEY],
+                                        url=app.config[REDIS_URL_KEY])
+
+inflight = coalesce.create_inflight_tracker(app.config[COALESCE_KEY],
+                                            url=app.config[REDIS_URL_KEY],
+                                            ttl=app.config[RESULT_CACHE_TTL_KEY])
+
+blobstore = staging.create_blob_store(app.config[staging.BLOB_STORE_KEY])
+blobrefs = None
+if blobstore is not None:
+    # shared with workers through the redis result backend
+    blobrefs = staging.BlobReferences(blobstore, celeryapp.backend.client)
+
+stager = staging.InputStager(backend=app.config[staging.INPUT_STAGING_KEY],
+                              inline_max=app.config[staging.INLINE_INPUT_MAX_KEY],
+                              blobrefs=blobrefs)
+
+# stored results expire with the references to them in the
+# result backend, see RESULT_TTL in worker
+resultstore = offload.create_result_store(
+    app.config[offload.RESULT_STORE_KEY],
+    ttl=celeryapp.conf.result_expires)
+
+costmodel = costs.create_cost_model(app.config[costs.COST_MODEL_KEY],
+                                    app.config[costs.RUN_TIMES_FILE_KEY])
+
+queuemonitor = backpressure.QueueMonitor(
+    celeryapp, sizeclasses,
+    ttl=app.config[backpressure.QUEUE_STATS_TTL_KEY],
+    window=app.config[backpressure.THROUGHPUT_WINDOW_KEY],
+    defaultjobseconds=app.config[backpressure.DEFAULT_JOB_SECONDS_KEY],
+    dispatcher=dispatcher)
+
+taskevents = events.create_task_events(app.config[TASK_EVENTS_KEY],
+                                       url=app.config[REDIS_URL_KEY])
+
+heldrequests = threading.BoundedSemaphore(app.config[MAX_HELD_REQUESTS_KEY])
+
+# celery states of a task that will never produce a result
+FAILED_STATES = ['FAILURE', 'REVOKED']
+
 api = Api(app, version=str(__version__),
           title="Community Detection",
           description=desc,
@@ -109,14 +283,37 @@ ns = api.namespace(
     description='Runs Community Detection'
 )
 
+@app.after_request
+def set_retry_after(response):
+    """
+    Sets Retry-After header to value chosen by request. Registered
+    before rate limiter so it runs after the rate limiter, which
+    otherwise overwrites Retry-After with its own reset time
+
+    :param response: response
+    :return: response
+    """
+    retryafter = getattr(flask.g, 'retryafter', None)
+    if retryafter is not None:
+        response.headers['Retry-After'] = str(retryafter)
+    return response
+
+
 # enable rate limiting
 limiter = Limiter(
     app,
     key_func=get_remote_address,
     default_limits=[app.config[DEFAULT_RATE_LIMIT_KEY]],
-    headers_enabled=True
+    headers_enabled=True,
+    storage_uri=quota.get_storage_uri(
+        app.config[quota.RATE_LIMIT_STORAGE_KEY],
+        celeryapp.conf.result_backend),
+    in_memory_fallback_enabled=True
 )
 
+# limits edges each client submits, on top of number of requests
+workquota = quota.WorkQuota(limiter, app.config[quota.WORK_RATE_LIMIT_KEY])
+
 # add rate limiting logger to the regular app logger
 for handler in app.logger.handlers:
     limiter.logger.addHandler(handler)
@@ -148,7 +345,7 @@ post_parser = reqparse.RequestParser()
 post_parser.add_argument(
     ALGO_PARAM,
     type=str,
-    choices=['infomap', 'louvain'],
+    choices=algorithms.get_names(),
     help='algorithm to use',
     default='infomap',
     required=True,
@@ -158,8 +355,23 @@ post_parser.add_argument(
 post_parser.add_argument(
     EDGE_PARAM,
     type=reqparse.FileStorage,
-    help='Edge list as file in format of edge1\\tedge2\\nedge3\\tedge4\\n',
-    required=True,
+    help='Edge list as file in format of edge1\\tedge2\\nedge3\\tedge4\\n '
+         'can be gzip or zstd compressed, compression is detected '
+         'from Content-Encoding of the file or its first bytes. '
+         'Required unless ' + EDGE_ARRAYS_PARAM + ' is set',
+    location='files'
+)
+
+post_parser.add_argument(
+    EDGE_ARRAYS_PARAM,
+    type=reqparse.FileStorage,
+    help='Edge list as .npz file, as written by numpy.savez, with '
+         'integer arrays src and dst of node ids and optional weight '
+         'array, or a CSR adjacency with indptr, indices and optional '
+         'data arrays. With a nodeids array node ids are positions in '
+         'it. Sent instead of ' + EDGE_PARAM + ' so the graph does not '
+         'have to be written as text, must not be compressed with '
+         'Content-Encoding',
     location='files'
 )
 
@@ -177,6 +389,54 @@ post_parser.add_argument(
     location='form'
 )
 
+batch_parser = reqparse.RequestParser()
+batch_parser.add_argument(
+    EDGEFILES_PARAM,
+    type=reqparse.FileStorage,
+    action='append',
+    help='Edge lists as files, see ' + EDGE_PARAM + ' of single '
+         'submission. Name of each item is its file name',
+    location='files'
+)
+batch_parser.add_argument(
+    ARCHIVE_PARAM,
+    type=reqparse.FileStorage,
+    help='zip or tar (can be compressed) archive of edge lists, '
+         'name of each item is its path in the archive',
+    location='files'
+)
+batch_parser.add_argument(
+    ALGO_PARAM,
+    type=str,
+    choices=algorithms.get_names(),
+    help='algorithm to use for items not set in ' + ITEMS_PARAM,
+    default='infomap',
+    location='form'
+)
+batch_parser.add_argument(
+    GRAPHDIRECTED_PARAM,
+    type=bool,
+    help='If set to True then graphs not set in ' + ITEMS_PARAM +
+         ' are directed',
+    default=False,
+    location='form'
+)
+batch_parser.add_argument(
+    ROOTNETWORK_PARAM,
+    type=str,
+    help='Name of root network for items not set in ' + ITEMS_PARAM +
+         ', defaults to name of item',
+    location='form'
+)
+batch_parser.add_argument(
+    ITEMS_PARAM,
+    type=str,
+    help='JSON object of item name to object with any of ' +
+         ALGO_PARAM + ', ' + GRAPHDIRECTED_PARAM + ', ' +
+         ROOTNETWORK_PARAM + ' to use for that item',
+    location='form'
+)
+
 ERROR_RESP = api.model('ErrorResponseSchema', {
     'errorCode': fields.String(description='Error code to help identify '
                                            'issue'),
@@ -220,6 +480,374 @@ class ErrorResponse(object):
         self.timeStamp = dt.strftime('%Y-%m-%dT%H:%M.%s')
 
 
+def iter_stored_result(ref):
+    """
+    Reads result task moved to result store in chunks
+
+    :param ref: reference to stored result, see
+                :py:func:`~commundetect_rest.offload.offload_result`
+    :raises ResultStoreError: if result is missing, has expired
+                              or no result store is configured
+    :return: generator of str
+    """
+    if resultstore is None:
+        raise offload.ResultStoreError('No result store configured '
+                                       'for stored result ' +
+                                       str(ref.get(offload.REF_NAME)))
+    return resultstore.iter_text(ref)
+
+
+def prepare_task(taskid, stream, contentencoding, algorithm, directed,
+                 rootnetwork, binary=False, pending=None):
+    """
+    Writes edge list to task directory and stages it for the worker.
+    If an identical task has finished, per the result cache, or is
+    queued or running taskid is made an alias of it, otherwise the
+    task needs to be queued
+
+    :param taskid: id for task
+    :param stream: file like object with edge list, can be compressed
+    :param contentencoding: Content-Encoding of edge list or None
+    :param algorithm: name of algorithm
+    :param directed: True if graph is directed
+    :param rootnetwork: name of root network
+    :param binary: if True stream has a binary edge list, see
+                   :py:func:`~commundetect_rest.edgelist.load_edge_arrays`
+    :param pending: dict of size class name to number of tasks
+                    already accepted by the same submission that are
+                    not queued yet, counted by queue check and
+                    updated if this task needs to be queued
+    :raises CompressionError: if edge list cannot be decompressed
+    :raises EdgeListError: if binary edge list is not valid
+    :raises CostLimitError: if task is predicted to take too long
+    :raises OverloadedError: if queue for task has too long a wait
+    :raises QuotaExceededError: if caller has submitted too many edges
+    :return: keyword arguments for
+             :py:meth:`run_communitydetection.apply_async` or None if
+             task does not need to be queued
+    :rtype: dict
+    """
+    jobdir = os.path.join(app.config[JOB_PATH_KEY], taskid)
+    os.makedirs(jobdir, mode=0o775)
+    os.chmod(jobdir, mode=0o775)
+
+    # edge list is kept as sent, compressed or not, and
+    # hashed decompressed so cache key does not depend
+    # on how it was sent
+    edgefile = os.path.join(jobdir, EDGE_FILE)
+    edgefiletmp = edgefile + '.tmp'
+    digest = hashlib.sha256()
+    counter = None
+    if binary is False:
+        counter = routing.GraphCounter(
+            maxnodes=sizeclasses.get_max_tracked_nodes())
+    try:
+        with open(edgefiletmp, 'wb') as f:
+            encoding = compression.copy_and_hash(
+                stream, f, digest, contentencoding=contentencoding,
+                counter=counter)
+            f.flush()
+        if binary is True:
+            if encoding != compression.IDENTITY_ENCODING:
+                raise edgelist.EdgeListError('Binary edge list cannot be '
+                                             'compressed, use '
+                                             'numpy.savez_compressed')
+            # counted from arrays, memory mapped so not read in
+            counter = edgelist.load_edge_arrays(edgefiletmp)
+    except Exception:
+        shutil.rmtree(jobdir)
+        raise
+    app.logger.debug('Received ' + encoding + ' edge list for ' +
+                     taskid)
+    contenthash = digest.hexdigest()
+    os.chmod(edgefiletmp, mode=0o775)
+    shutil.move(edgefiletmp, edgefile)
+
+    cachekey = None
+    if resultcache is not None or inflight is not None:
+        algo = algorithms.get(algorithm)
+        cachekey = cache.make_cache_key(contenthash, algorithm,
+                                        algo.version,
+                                        {GRAPHDIRECTED_PARAM: directed})
+
+    if resultcache is not None:
+        cached = resultcache.get(cachekey, check=has_cached_result)
+        if cached is not None:
+            app.logger.debug('Task ' + taskid + ' is cache hit of ' +
+                             cached)
+            shutil.rmtree(jobdir)
+            if inflight is not None:
+                inflight.add_alias(cached, taskid, rootnetwork=rootnetwork)
+            else:
+                # without aliases result, which is only a reference
+                # if it was offloaded, is stored again for taskid
+                result = dict(celeryapp.AsyncResult(cached).result)
+                result[ROOTNETWORK_PARAM] = rootnetwork
+                celeryapp.backend.store_result(taskid, result, 'SUCCESS')
+            return None
+
+    sizeclass = sizeclasses.classify(counter.nodes, counter.edges)
+    sizeinfo = routing.get_size_info(sizeclass, counter)
+    app.logger.debug('Task ' + taskid + ' is ' +
+                     sizeclass[routing.NAME_KEY] + ' with ' +
+                     str(counter.edges) + ' edges')
+    predicted = costmodel.predict(algorithm, counter.nodes, counter.edges)
+    softlimit, hardlimit = costs.get_time_limits(
+        predicted, factor=app.config[costs.TIME_LIMIT_FACTOR_KEY],
+        mintime=app.config[costs.MIN_TIME_LIMIT_KEY],
+        grace=app.config[costs.TIME_LIMIT_GRACE_KEY])
+    expires = app.config[costs.TASK_EXPIRES_KEY]
+    if expires is None:
+        expires = costs.get_expires(
+            app.config[backpressure.MAX_QUEUE_WAIT_KEY], hardlimit)
+    try:
+        costs.check_cost(predicted, app.config[costs.MAX_JOB_COST_KEY])
+        queuemonitor.check(sizeclass[routing.NAME_KEY],
+                           app.config[backpressure.MAX_QUEUE_WAIT_KEY],
+                           expires=expires,
+                           pending=(pending or {}).get(
+                               sizeclass[routing.NAME_KEY], 0))
+        workquota.consume(get_remote_address(), counter.edges)
+        # given back if task is discarded
+        get_charged_edges()[taskid] = counter.edges
+    except (costs.CostLimitError, backpressure.OverloadedError,
+            quota.QuotaExceededError):
+        shutil.rmtree(jobdir)
+        raise
+
+    if inflight is not None:
+        # claim is dropped once task could no longer be waiting or
+        # running, even if nobody asks for its status
+        claimttl = None
+        if expires is not None:
+            claimttl = expires + hardlimit
+        primary = inflight.claim(cachekey, taskid, ttl=claimttl)
+        if primary is not None and not can_coalesce(primary):
+            inflight.finish(primary)
+            primary = inflight.claim(cachekey, taskid, ttl=claimttl)
+        if primary is not None:
+            app.logger.debug('Task ' + taskid + ' is alias of ' + primary)
+            shutil.rmtree(jobdir)
+            inflight.add_alias(primary, taskid, rootnetwork=rootnetwork)
+            return None
+
+    try:
+        inputref = stager.stage(edgefile, taskid, contenthash)
+        if inputref[staging.REF_TYPE] != staging.SHARED_STAGING:
+            # worker gets input from somewhere else
+            shutil.rmtree(jobdir)
+
+        # lets status show size class while task is queued
+        celeryapp.backend.store_result(taskid, sizeinfo, 'PENDING')
+    except Exception:
+        discard_task(taskid)
+        raise
+
+    if resultcache is not None:
+        # hit once worker has stored the result
+        resultcache.put(cachekey, taskid)
+
+    if pending is not None:
+        pending[sizeclass[routing.NAME_KEY]] =\
+            pending.get(sizeclass[routing.NAME_KEY], 0) + 1
+
+    return {'args': [algorithm, app.config[JOB_PATH_KEY], directed,
+                     rootnetwork],
+            'kwargs': {'inputref': inputref,
+                       'sizeinfo': sizeinfo,
+                       'costinfo': costs.get_cost_info(counter.nodes,
+                                                       counter.edges,
+                                                       predicted)},
+            'task_id': taskid,
+            'queue': sizeclass[routing.QUEUE_KEY],
+            'priority': routing.get_priority(counter.edges),
+            'soft_time_limit': softlimit,
+            'time_limit': hardlimit,
+            'retry': False,
+            'expires': expires,
+            'counter': 1}
+
+
+def delete_stored_result(res):
+    """
+    Removes result of finished task from result store if it
+    was offloaded there
+
+    :param res: result of task
+    :type res: :py:class:`celery.result.AsyncResult`
+    """
+    if resultstore is None or res.state != 'SUCCESS':
+        return
+    result = res.result
+    if isinstance(result, dict) and\
+            result.get(offload.RESULT_REF_KEY) is not None:
+        resultstore.delete(result[offload.RESULT_REF_KEY])
+
+
+def has_cached_result(taskid):
+    """
+    Checks task in result cache finished without error and its
+    result can still be read
+
+    :param taskid: id of task from result cache
+    :return: True if result of task can be used for an identical
+             submission
+    :rtype: bool
+    """
+    res = celeryapp.AsyncResult(taskid)
+    if res.state != 'SUCCESS':
+        return False
+    result = res.result
+    if not isinstance(result, dict) or\
+            result.get(STATUS_RESULT_KEY) != DONE_STATUS:
+        return False
+    ref = result.get(offload.RESULT_REF_KEY)
+    if ref is not None and (resultstore is None or
+                            not resultstore.exists(ref)):
+        # stored result has expired, run task again
+        return False
+    return True
+
+
+def can_coalesce(primary):
+    """
+    Checks identical submission can share task primary, which it
+    can while primary is queued or running or if it finished
+    without error
+
+    :param primary: id of task claimed for identical submission
+    :return: True if submission can be made an alias of primary
+    :rtype: bool
+    """
+    state = celeryapp.AsyncResult(primary).state
+    if state in FAILED_STATES:
+        return False
+    if state == 'SUCCESS':
+        return has_cached_result(primary)
+    return True
+
+
+def overloaded(error):
+    """
+    Creates 503 response telling caller when to submit again
+
+    :param error: error raised by queue check
+    :type error: :py:class:`~commundetect_rest.backpressure.OverloadedError`
+    :return: response
+    """
+    resp = jsonify({'message': str(error)})
+    resp.status_code = 503
+    flask.g.retryafter = error.retryafter
+    return resp
+
+
+def too_much_work(error):
+    """
+    Creates 429 response telling caller when its work quota resets
+
+    :param error: error raised by work quota
+    :type error: :py:class:`~commundetect_rest.quota.QuotaExceededError`
+    :return: response
+    """
+    resp = jsonify({'message': str(error)})
+    resp.status_code = 429
+    flask.g.retryafter = error.retryafter
+    return resp
+
+
+def too_many_held():
+    """
+    Creates 503 response for a GET that would be held open while
+    :py:data:`MAX_HELD_REQUESTS_KEY` GETs already are
+
+    :return: response
+    """
+    return overloaded(backpressure.OverloadedError(
+        'Too many requests waiting for tasks, try again later',
+        HELD_REQUEST_RETRY_AFTER))
+
+
+def get_client():
+    """
+    Gets key and weight of caller for fair share of workers,
+    callers are told apart by api token header if configured
+    and sent, otherwise by remote address
+
+    :return: (client key, weight)
+    :rtype: tuple
+    """
+    token = None
+    header = app.config[fairshare.CLIENT_KEY_HEADER_KEY]
+    if header is not None:
+        token = request.headers.get(header)
+    remoteaddr = get_remote_address()
+    return fairshare.make_client_key(remoteaddr, token=token),\
+        fairshare.get_weight(app.config[fairshare.FAIR_SHARE_WEIGHTS_KEY],
+                             remoteaddr, token=token)
+
+
+def hold_tasks(taskoptslist):
+    """
+    Holds tasks in sub-queues of caller, they are released to the
+    broker in turn with tasks of other callers
+
+    :param taskoptslist: keyword arguments for
+                         :py:meth:`run_communitydetection.apply_async`
+                         of each task, see :py:func:`prepare_task`
+    """
+    clientkey, weight = get_client()
+    byqueue = {}
+    for taskopts in taskoptslist:
+        byqueue.setdefault(taskopts['queue'], []).append(taskopts)
+    for queue, queueopts in byqueue.items():
+        dispatcher.submit(queue, clientkey, queueopts, weight=weight)
+
+
+def remove_job_dir(taskid):
+    """
+    Removes task directory holding staged input of task
+
+    :param taskid: id of task, ids that are not ones given out
+                   by this service are ignored
+    """
+    try:
+        uuid.UUID(taskid)
+    except ValueError:
+        return
+    shutil.rmtree(os.path.join(app.config[JOB_PATH_KEY], taskid),
+                  ignore_errors=True)
+
+
+def get_charged_edges():
+    """
+    Gets edges charged to work quota of caller by each task
+    prepared in this request
+
+    :return: dict of task id to number of edges
+    :rtype: dict
+    """
+    if 'chargededges' not in flask.g:
+        flask.g.chargededges = {}
+    return flask.g.chargededges
+
+
+def discard_task(taskid):
+    """
+    Undoes :py:func:`prepare_task` for a task that could not be queued,
+    edges charged for it are given back to work quota of caller
+
+    :param taskid: id of task
+    """
+    edges = get_charged_edges().pop(taskid, None)
+    if edges is not None:
+        workquota.refund(get_remote_address(), edges)
+    if inflight is not None:
+        inflight.release(taskid)
+    stager.discard(taskid)
+    shutil.rmtree(os.path.join(app.config[JOB_PATH_KEY], taskid),
+                  ignore_errors=True)
+
+
 @api.doc('Runs Community Detection')
 @ns.route('/v1', strict_slashes=False)
 class TaskBasedRestApp(Resource):
@@ -236,6 +864,13 @@ class TaskBasedRestApp(Resource):
                        'Visit the URL'
                        ' specified in **Location** field in HEADERS to '
                        'status and results', taskobj, headers=POST_HEADERS)
+    @api.response(400, 'Edge list compressed with unsupported encoding, '
+                       'corrupt or not valid', headers=RATE_LIMIT_HEADERS)
+    @api.response(413, 'Graph is predicted to take longer to process '
+                       'than allowed', headers=RATE_LIMIT_HEADERS)
+    @api.response(503, 'Too many jobs waiting, try again after number '
+                       'of seconds in **Retry-After** header',
+                  headers=RATE_LIMIT_HEADERS)
     @api.response(429, 'Too many requests', TOO_MANY_REQUESTS,
                   headers=RATE_LIMIT_HEADERS)
     @api.response(500, 'Internal server error', headers=RATE_LIMIT_HEADERS)
@@ -248,43 +883,66 @@ class TaskBasedRestApp(Resource):
 
         try:
             params = post_parser.parse_args(request, strict=True)
-            res = run_communitydetection.apply_async(args=[params[ALGO_PARAM],
-                                                           app.config[JOB_PATH_KEY],
-                                                           params[GRAPHDIRECTED_PARAM],
-                                                           params[ROOTNETWORK_PARAM]],
-                                                     retry=False, expires=120,
-                                                     counter=1)
-
-            jobdir = os.path.join(app.config[JOB_PATH_KEY], res.id)
-            os.makedirs(jobdir, mode=0o775)
-
-            counter = 0
-            while not os.path.exists(jobdir):
-                app.logger.debug('Waiting for directory to appear')
-                time.sleep(0.1)
-                if counter > 10:
-                    raise Exception('Even after 10 seconds the directory: ' +
-                                    jobdir + ' did not get created')
-                counter = counter + 1
-
-            os.chmod(jobdir, mode=0o775)
-
-            edgefile = os.path.join(jobdir, EDGE_FILE)
-            edgefiletmp = edgefile + '.tmp'
-            with open(edgefiletmp, 'wb') as f:
-                shutil.copyfileobj(params[EDGE_PARAM].stream, f)
-                f.flush()
-            os.chmod(edgefiletmp, mode=0o775)
-            shutil.move(edgefiletmp, edgefile)
-
-            task = SimpleTask(res.id)
-            return marshal(task, TaskBasedRestApp.taskobj), 202,\
-                   {'Location': request.url + '/' + task.id}
+            edgefile = params[EDGE_PARAM]
+            binary = params[EDGE_ARRAYS_PARAM] is not None
+            if binary is True:
+                if edgefile is not None:
+                    abort(400, 'Only one of ' + EDGE_PARAM + ' and ' +
+                          EDGE_ARRAYS_PARAM + ' can be set')
+                edgefile = params[EDGE_ARRAYS_PARAM]
+            elif edgefile is None:
+                abort(400, EDGE_PARAM + ' or ' + EDGE_ARRAYS_PARAM +
+                      ' is required')
+            paramname = EDGE_ARRAYS_PARAM if binary else EDGE_PARAM
+            taskid = str(uuid.uuid4())
+            try:
+                taskopts = prepare_task(taskid, edgefile.stream,
+                                        edgefile.headers.get(
+                                            'Content-Encoding'),
+                                        params[ALGO_PARAM],
+                                        params[GRAPHDIRECTED_PARAM],
+                                        params[ROOTNETWORK_PARAM],
+                                        binary=binary)
+            except (compression.CompressionError,
+                    edgelist.EdgeListError) as ce:
+                abort(400, 'Unable to read ' + paramname + ': ' + str(ce))
+            except costs.CostLimitError as cle:
+                abort(413, str(cle))
+            except backpressure.OverloadedError as oe:
+                return overloaded(oe)
+            except quota.QuotaExceededError as qe:
+                return too_much_work(qe)
+
+            if taskopts is not None:
+                try:
+                    if dispatcher is None:
+                        run_communitydetection.apply_async(**taskopts)
+                    else:
+                        hold_tasks([taskopts])
+                except Exception:
+                    discard_task(taskid)
+                    raise
+
+            return TaskBasedRestApp._accepted(taskid)
+        except HTTPException:
+            raise
         except Exception as ea:
             app.logger.exception('Error creating task due to Exception ' +
                                  str(ea))
             abort(500, 'Unable to create task ' + str(ea))
 
+    @staticmethod
+    def _accepted(taskid):
+        """
+        Creates 202 response for task
+
+        :param taskid: id of task
+        :return: response body, status code, headers
+        """
+        task = SimpleTask(taskid)
+        return marshal(task, TaskBasedRestApp.taskobj), 202,\
+            {'Location': request.url + '/' + task.id}
+
     @api.hide
     def options(self):
         """
@@ -313,20 +971,205 @@ class GetTask(Resource):
     decorators = [limiter.limit(app.config[GET_RATE_LIMIT_KEY],
                                 per_method=True, methods=['GET', 'DELETE'])]
 
+    @api.doc(params={WAIT_PARAM: 'If set, seconds to wait for status to '
+                                  'change or task to finish before '
+                                  'responding, at most ' +
+                                  str(app.config[MAX_WAIT_KEY]),
+                     OFFSET_PARAM: 'Number of result edges to skip',
+                     LIMIT_PARAM: 'If set, most result edges to return. '
+                                  'If this or ' + OFFSET_PARAM + ' is set '
+                                  'finished result has ' +
+                                  delivery.OFFSET_KEY + ', ' +
+                                  delivery.COUNT_KEY + ' and ' +
+                                  delivery.TOTAL_KEY + ' numbers of '
+                                  'edges'})
     @api.response('200', 'Success in asking server, but does not mean'
                          'processing has completed. See the json response'
                          'in body for status', headers=RATE_LIMIT_HEADERS)
+    @api.response(400, 'Invalid ' + OFFSET_PARAM + ' or ' + LIMIT_PARAM,
+                  headers=RATE_LIMIT_HEADERS)
     @api.response(429, 'Too many requests', TOO_MANY_REQUESTS,
                   headers=RATE_LIMIT_HEADERS)
+    @api.response(503, 'Too many requests waiting for tasks, try again '
+                       'after number of seconds in **Retry-After** header',
+                  headers=RATE_LIMIT_HEADERS)
     @api.response(500, 'Internal server error', headers=RATE_LIMIT_HEADERS)
     def get(self, id):
         """
         Gets result and status of netant task
 
+        Large results are streamed and compressed with gzip or deflate
+        if allowed by Accept-Encoding
+        """
+        offset = request.args.get(OFFSET_PARAM, default=0, type=int)
+        limit = request.args.get(LIMIT_PARAM, default=None, type=int)
+        if offset < 0 or (limit is not None and limit < 0):
+            abort(400, OFFSET_PARAM + ' and ' + LIMIT_PARAM +
+                  ' must not be negative')
+
+        primary, alias = GetTask.resolve(id)
+        wait = min(request.args.get(WAIT_PARAM, default=0, type=float),
+                   app.config[MAX_WAIT_KEY])
+        if wait <= 0 or taskevents is None:
+            done, status = GetTask.get_task_status(primary, alias)
+            return GetTask.respond(done, status, offset, limit)
+
+        if not heldrequests.acquire(False):
+            return too_many_held()
+        try:
+            try:
+                sub = taskevents.watch(primary)
+            except Exception:
+                app.logger.exception('Unable to watch task ' + primary)
+                done, status = GetTask.get_task_status(primary, alias)
+                return GetTask.respond(done, status, offset, limit)
+
+            with sub:
+                done, status = GetTask.get_task_status(primary, alias)
+                if done is False and sub.wait(wait) is True:
+                    done, status = GetTask.get_task_status(primary, alias)
+        finally:
+            heldrequests.release()
+        return GetTask.respond(done, status, offset, limit)
+
+    @staticmethod
+    def respond(done, status, offset=0, limit=None):
+        """
+        Creates response for status of task. Finished results that are
+        large or paged are streamed in chunks so neither the result
+        nor its JSON is copied in full
+
+        :param done: True if task is finished
+        :param status: status or result from :py:meth:`get_task_status`
+        :param offset: number of result edges to skip
+        :param limit: most result edges to return or None for all
+        :return: response
+        """
+        if done is False or not isinstance(status, dict):
+            return jsonify(status)
+
+        paged = offset > 0 or limit is not None
+        ref = status.get(offload.RESULT_REF_KEY)
+        if ref is not None:
+            # result is read from result store as it is sent
+            status = dict(status)
+            del status[offload.RESULT_REF_KEY]
+            try:
+                chunks = iter_stored_result(ref)
+            except offload.ResultStoreError as e:
+                app.logger.error('Unable to get stored result: ' + str(e))
+                resp = jsonify(GetTask.result_expired(status))
+                resp.status_code = 410
+                return resp
+            length = ref[offload.REF_SIZE]
+            total = ref[offload.REF_EDGES]
+        else:
+            text = status.get(RESULT_KEY)
+            if not isinstance(text, str):
+                return jsonify(status)
+            length = len(text)
+            if paged is False and\
+                    length < app.config[RESULT_STREAM_MIN_KEY]:
+                return jsonify(status)
+            chunks = delivery.iter_text(text)
+            total = delivery.count_edges(text) if paged else None
+
+        if paged is True:
+            count = max(0, total - offset)
+            if limit is not None:
+                count = min(count, limit)
+            status = dict(status)
+            status[delivery.OFFSET_KEY] = offset
+            status[delivery.COUNT_KEY] = count
+            status[delivery.TOTAL_KEY] = total
+            chunks = delivery.iter_edges(chunks, offset=offset, limit=limit)
+
+        body = delivery.iter_json(status, RESULT_KEY, chunks)
+        headers = {'Vary': 'Accept-Encoding'}
+        encoding = delivery.select_encoding(
+            request.headers.get('Accept-Encoding'))
+        if encoding is not None and\
+                length >= app.config[RESULT_STREAM_MIN_KEY]:
+            headers['Content-Encoding'] = encoding
+            body = delivery.compress(body, encoding)
+        else:
+            body = delivery.encode(body)
+        return flask.Response(body, mimetype='application/json',
+                              headers=headers)
+
+    @staticmethod
+    def resolve(id):
+        """
+        Gets task holding result for id
+
+        :param id: id of task given to caller
+        :return: (id of task, alias info or None), see
+                 :py:meth:`~commundetect_rest.coalesce.InFlightTracker.resolve`
+        :rtype: tuple
+        """
+        if inflight is not None:
+            return inflight.resolve(id)
+        return id, None
+
+    @staticmethod
+    def result_expired(result):
         """
-        res = celeryapp.AsyncResult(id)
+        Creates error for finished task whose result is no longer
+        in result store
+
+        :param result: result of task
+        :return: result with error status
+        :rtype: dict
+        """
+        expired = dict(result)
+        expired.pop(offload.RESULT_REF_KEY, None)
+        expired[STATUS_RESULT_KEY] = ERROR_STATUS
+        expired['message'] = 'Result has expired'
+        expired[RESULT_KEY] = None
+        return expired
+
+    @staticmethod
+    def load_result(result):
+        """
+        Reads result from result store if it was stored there
+
+        :param result: result of task
+        :return: result with result text in it
+        :rtype: dict
+        """
+        if not isinstance(result, dict) or\
+                result.get(offload.RESULT_REF_KEY) is None:
+            return result
+        try:
+            text = ''.join(iter_stored_result(
+                result[offload.RESULT_REF_KEY]))
+        except offload.ResultStoreError as e:
+            app.logger.error('Unable to get stored result: ' + str(e))
+            return GetTask.result_expired(result)
+        loaded = dict(result)
+        del loaded[offload.RESULT_REF_KEY]
+        loaded[RESULT_KEY] = text
+        return loaded
+
+    @staticmethod
+    def get_task_status(primary, alias):
+        """
+        Gets status of task, or result if it is finished
+
+        :param primary: id of task
+        :param alias: alias info from :py:meth:`resolve`
+        :return: (True if task is finished, status or result dict)
+        :rtype: tuple
+        """
+        res = celeryapp.AsyncResult(primary)
         if res.ready() is True:
-            return jsonify(res.get())
+            result = res.get()
+            if inflight is not None:
+                inflight.finish(primary)
+            if alias is not None and isinstance(result, dict):
+                result = dict(result)
+                result[ROOTNETWORK_PARAM] = alias[coalesce.ROOTNETWORK]
+            return True, result
 
         res_dict = {}
 
@@ -340,7 +1183,7 @@ class GetTask(Resource):
             for key in res.info.keys():
                 res_dict[key] = res.info[key]
 
-        return jsonify(res_dict)
+        return False, res_dict
 
     @api.response(200, 'Delete request successfully received',
                   headers=RATE_LIMIT_HEADERS)
@@ -354,9 +1197,19 @@ class GetTask(Resource):
         """
         resp = flask.make_response()
         try:
-            res = AsyncResult(id)
-            res.revoke(terminate=True)
-            res.forget()
+            primary, cancel = id, True
+            if inflight is not None:
+                # task may be shared with other identical submissions
+                primary, cancel = inflight.release(id)
+            if cancel is True:
+                res = AsyncResult(primary)
+                res.revoke(terminate=True)
+                delete_stored_result(res)
+                res.forget()
+                # worker stops container of job, input is removed
+                # now in case job is still queued
+                remove_job_dir(primary)
+                stager.discard(primary)
             resp.status_code = 200
             return resp
         except Exception:
@@ -378,6 +1231,529 @@ class GetTask(Resource):
         return resp
 
 
+@ns.route('/v1/<string:id>/events', strict_slashes=False)
+class GetTaskEvents(Resource):
+    """
+    Server sent events stream of task status
+    """
+    decorators = [limiter.limit(app.config[GET_RATE_LIMIT_KEY],
+                                per_method=True, methods=['GET'])]
+
+    @api.response(200, 'text/event-stream with a status event holding '
+                       'same json as GET of task each time status changes. '
+                       'Last event has result once task is finished, a '
+                       'timeout event is sent if stream is open too long',
+                  headers=RATE_LIMIT_HEADERS)
+    @api.response(429, 'Too many requests', TOO_MANY_REQUESTS,
+                  headers=RATE_LIMIT_HEADERS)
+    @api.response(503, 'Too many streams open, try again after number '
+                       'of seconds in **Retry-After** header',
+                  headers=RATE_LIMIT_HEADERS)
+    def get(self, id):
+        """
+        Streams status of task until it is finished
+        """
+        primary, alias = GetTask.resolve(id)
+        # without task events stream only has current status
+        held = taskevents is not None
+        if held is True and not heldrequests.acquire(False):
+            return too_many_held()
+        resp = flask.Response(GetTaskEvents.generate_events(
+            primary, alias, app.config[EVENT_STREAM_TIMEOUT_KEY],
+            app.config[EVENT_STREAM_HEARTBEAT_KEY]),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache',
+                     'X-Accel-Buffering': 'no'})
+        if held is True:
+            # called once stream is finished or client went away
+            resp.call_on_close(heldrequests.release)
+        return resp
+
+    @staticmethod
+    def format_event(eventtype, data):
+        """
+        Formats server sent event
+
+        :param eventtype: type of event
+        :param data: data to send as json
+        :return: event
+        :rtype: str
+        """
+        return 'event: ' + eventtype + '\ndata: ' + json.dumps(data) + '\n\n'
+
+    @staticmethod
+    def generate_events(primary, alias, timeout, heartbeat):
+        """
+        Generates events for task, if task events are disabled
+        only the current status is sent
+
+        :param primary: id of task
+        :param alias: alias info from :py:meth:`GetTask.resolve`
+        :param timeout: seconds to keep stream open
+        :param heartbeat: seconds between keep alive comments
+        """
+        sub = None
+        if taskevents is not None:
+            try:
+                sub = taskevents.watch(primary)
+            except Exception:
+                app.logger.exception('Unable to watch task ' + primary)
+        try:
+            deadline = time.time() + timeout
+            done, last = GetTask.get_task_status(primary, alias)
+            yield GetTaskEvents.format_event(
+                'status', GetTask.load_result(last) if done else last)
+            while done is False and sub is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    yield GetTaskEvents.format_event('timeout', {})
+                    return
+                if sub.wait(min(heartbeat, remaining)) is False:
+                    yield ': keepalive\n\n'
+                    continue
+                done, status = GetTask.get_task_status(primary, alias)
+                if status != last:
+                    yield GetTaskEvents.format_event(
+                        'status',
+                        GetTask.load_result(status) if done else status)
+                    last = status
+        finally:
+            if sub is not None:
+                sub.close()
+
+    @api.hide
+    def options(self, id):
+        """
+        Lets caller know what what HTTP request types are valid with
+        request passed in. Used by CORS.
+
+        :return:
+        """
+        resp = flask.make_response()
+        resp.headers[ACCESS_CONTROL_ALLOW_METHODS] = 'GET, OPTIONS'
+        resp.status_code = 204
+        return resp
+
+
+def get_task_states(ids, include_results=False):
+    """
+    Gets status of many tasks with one read of the result backend
+
+    :param ids: ids of tasks given to callers
+    :param include_results: if True add result of finished tasks
+    :return: id => dict with status, submitted, processing, done or
+             error, and for tasks being processed the message. If
+             include_results is True finished tasks also have result
+             which is the same as a GET of the task returns
+    :rtype: dict
+    """
+    if inflight is not None:
+        resolved = inflight.resolve_many(ids)
+    else:
+        resolved = [(taskid, None) for taskid in ids]
+
+    primaries = list(set([r[0] for r in resolved]))
+    backend = celeryapp.backend
+    metas = {}
+    try:
+        values = backend.mget([backend.get_key_for_task(p)
+                               for p in primaries]) if primaries else []
+        for primary, value in zip(primaries, values):
+            if value is None:
+                metas[primary] = {'status': 'PENDING', 'result': None}
+            else:
+                metas[primary] = backend.decode_result(value)
+    except (AttributeError, NotImplementedError):
+        # result backend is not a key value store
+        for primary in primaries:
+            metas[primary] = backend.get_task_meta(primary)
+
+    states = {}
+    for taskid, (primary, alias) in zip(ids, resolved):
+        meta = metas[primary]
+        state = meta['status']
+        result = meta.get('result')
+        entry = {}
+        if state == 'SUCCESS':
+            status = DONE_STATUS
+            if isinstance(result, dict):
+                status = result.get(STATUS_RESULT_KEY, DONE_STATUS)
+                if alias is not None:
+                    result = dict(result)
+                    result[ROOTNETWORK_PARAM] = alias[coalesce.ROOTNETWORK]
+            if inflight is not None:
+                inflight.finish(primary)
+            if include_results is True:
+                result = GetTask.load_result(result)
+                entry[RESULT_KEY] = result
+                if isinstance(result, dict):
+                    status = result.get(STATUS_RESULT_KEY, status)
+        elif state in FAILED_STATES:
+            status = ERROR_STATUS
+            entry['message'] = str(result)
+        else:
+            status = GetTask.STATE_MAP.get(state, state)
+            if isinstance(result, dict):
+                for key in ('message', routing.SIZE_CLASS_STATUS_KEY):
+                    if key in result:
+                        entry[key] = result[key]
+        entry[STATUS_RESULT_KEY] = status
+        states[taskid] = entry
+    return states
+
+
+@ns.route('/v1/tasks', strict_slashes=False)
+class BulkTaskStatus(Resource):
+    """
+    Status of many tasks
+    """
+    decorators = [limiter.limit(app.config[GET_RATE_LIMIT_KEY],
+                                per_method=True, methods=['POST'])]
+
+    bulkobj = api.model('BulkStatusRequest', {
+        IDS_PARAM: fields.List(fields.String, required=True,
+                               description='ids of tasks'),
+        RESULTS_PARAM: fields.Boolean(default=False,
+                                      description='If true, include '
+                                                  'results of finished '
+                                                  'tasks, at most ' +
+                                                  str(app.config[
+                                                      BULK_RESULTS_MAX_KEY]) +
+                                                  ' ids are allowed')})
+
+    @api.expect(bulkobj)
+    @api.response(200, 'JSON object with tasks mapping each id to '
+                       'status, message while processing and, if '
+                       'requested, result once finished',
+                  headers=RATE_LIMIT_HEADERS)
+    @api.response(400, 'Invalid request', headers=RATE_LIMIT_HEADERS)
+    @api.response(429, 'Too many requests', TOO_MANY_REQUESTS,
+                  headers=RATE_LIMIT_HEADERS)
+    @api.response(500, 'Internal server error', headers=RATE_LIMIT_HEADERS)
+    def post(self):
+        """
+        Gets status of many tasks in one request
+        """
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or\
+                not isinstance(data.get(IDS_PARAM), list):
+            abort(400, 'Expected JSON object with list of ' + IDS_PARAM)
+        ids = [str(taskid) for taskid in data[IDS_PARAM]]
+        if len(ids) > app.config[BULK_STATUS_MAX_KEY]:
+            abort(400, 'More than ' + str(app.config[BULK_STATUS_MAX_KEY]) +
+                  ' ' + IDS_PARAM)
+        include_results = data.get(RESULTS_PARAM) is True
+        if include_results is True and\
+                len(ids) > app.config[BULK_RESULTS_MAX_KEY]:
+            abort(400, 'More than ' + str(app.config[BULK_RESULTS_MAX_KEY]) +
+                  ' ' + IDS_PARAM + ' with ' + RESULTS_PARAM + ', get '
+                  'results of each task instead')
+        try:
+            return jsonify({'tasks': get_task_states(
+                ids, include_results=include_results)})
+        except Exception as ea:
+            app.logger.exception('Error getting status of tasks')
+            abort(500, 'Unable to get status of tasks ' + str(ea))
+
+    @api.hide
+    def options(self):
+        """
+        Lets caller know what what HTTP request types are valid with
+        request passed in. Used by CORS.
+
+        :return:
+        """
+        resp = flask.make_response()
+        resp.headers[ACCESS_CONTROL_ALLOW_METHODS] = 'POST, OPTIONS'
+        resp.status_code = 204
+        return resp
+
+
+def iter_batch_inputs(params):
+    """
+    Gets edge lists of batch submission
+
+    :param params: parsed arguments from :py:data:`batch_parser`
+    :raises ValueError: if archive is not zip or tar
+    :return: generator of (name, file like object, Content-Encoding
+             or None)
+    """
+    for edgefile in params[EDGEFILES_PARAM] or []:
+        yield edgefile.filename, edgefile.stream,\
+            edgefile.headers.get('Content-Encoding')
+
+    archive = params[ARCHIVE_PARAM]
+    if archive is None:
+        return
+    stream = archive.stream
+    if not hasattr(stream, 'seekable'):
+        # zipfile needs seekable() which SpooledTemporaryFile
+        # used by werkzeug for large uploads lacks before python 3.11
+        stream = tempfile.TemporaryFile(dir=app.config[JOB_PATH_KEY])
+        shutil.copyfileobj(archive.stream, stream, cache.COPY_CHUNK_SIZE)
+        stream.seek(0)
+
+    with stream:
+        for item in _iter_archive(stream):
+            yield item
+
+
+def save_batch(batchid, tasks):
+    """
+    Saves tasks of batch in result backend so they expire with
+    the results of the tasks
+
+    :param batchid: id of batch
+    :type batchid: str
+    :param tasks: name and id of each task in batch
+    :type tasks: list
+    """
+    key = BATCH_KEY_PREFIX + batchid
+    backend = celeryapp.backend
+    backend.set(key, json.dumps(tasks))
+    # set() of backends other than redis does not expire the key
+    if backend.expires:
+        backend.expire(key, backend.expires)
+
+
+def _iter_archive(stream):
+    """
+    Gets edge lists in zip or tar archive
+
+    :param stream: seekable file like object with archive
+    :raises ValueError: if archive is not zip or tar
+    :return: generator of (name, file like object, None)
+    """
+    if zipfile.is_zipfile(stream):
+        stream.seek(0)
+        with zipfile.ZipFile(stream) as zf:
+            for info in zf.infolist():
+                if info.is_dir() or\
+                        os.path.basename(info.filename).startswith('.'):
+                    continue
+                with zf.open(info) as f:
+                    yield info.filename, f, None
+        return
+
+    stream.seek(0)
+    try:
+        tf = tarfile.open(fileobj=stream, mode='r:*')
+    except tarfile.TarError:
+        raise ValueError(ARCHIVE_PARAM + ' is not a zip or tar file')
+    with tf:
+        for member in tf:
+            if not member.isfile() or\
+                    os.path.basename(member.name).startswith('.'):
+                continue
+            yield member.name, tf.extractfile(member), None
+
+
+@ns.route('/v1/batch', strict_slashes=False)
+class BatchRestApp(Resource):
+    """
+    Submits many edge lists in one request
+    """
+    decorators = [limiter.limit(app.config[DEFAULT_RATE_LIMIT_KEY],
+                                per_method=True, methods=['POST'])]
+
+    batchobj = api.model('Batch', {
+        'id': fields.String(description='id of batch'),
+        'tasks': fields.List(fields.Nested(api.model('BatchTask', {
+            'name': fields.String(description='name of item'),
+            'id': fields.String(description='id of task for item, use '
+                                            'like id of single '
+                                            'submission')})))})
+
+    @api.response(202, 'The tasks were successfully submitted. Visit the '
+                       'URL in **Location** field in HEADERS for status '
+                       'of batch', batchobj,
+                  headers=TaskBasedRestApp.POST_HEADERS)
+    @api.response(400, 'No edge lists, too many edge lists or invalid '
+                       'items', headers=RATE_LIMIT_HEADERS)
+    @api.response(413, 'An edge list is predicted to take longer to '
+                       'process than allowed', headers=RATE_LIMIT_HEADERS)
+    @api.response(503, 'Too many jobs waiting, try again after number '
+                       'of seconds in **Retry-After** header',
+                  headers=RATE_LIMIT_HEADERS)
+    @api.response(429, 'Too many requests', TOO_MANY_REQUESTS,
+                  headers=RATE_LIMIT_HEADERS)
+    @api.response(500, 'Internal server error', headers=RATE_LIMIT_HEADERS)
+    @api.expect(batch_parser)
+    def post(self):
+        """
+        Submits batch of Community Detection tasks
+
+        All tasks are queued with one publish to the broker, or held
+        together in sub-queues of caller if fair share is enabled
+        """
+        app.logger.debug('Post batch received')
+        try:
+            params = batch_parser.parse_args(request, strict=True)
+            try:
+                items = json.loads(params[ITEMS_PARAM] or '{}')
+            except ValueError as ve:
+                abort(400, 'Unable to parse ' + ITEMS_PARAM + ': ' + str(ve))
+            if not isinstance(items, dict):
+                abort(400, ITEMS_PARAM + ' must be a JSON object')
+            for name in items:
+                if not isinstance(items[name], dict):
+                    abort(400, ITEMS_PARAM + ' entry for ' + name +
+                          ' must be a JSON object')
+                algorithm = items[name].get(ALGO_PARAM)
+                if algorithm is not None and\
+                        algorithms.get(algorithm) is None:
+                    abort(400, 'Unknown ' + ALGO_PARAM + ' for ' + name +
+                          ': ' + str(algorithm))
+
+            batchid = str(uuid.uuid4())
+            tasks = []
+            # items are queued together after the loop so queue
+            # stats do not count ones already accepted
+            pending = {}
+            try:
+                held = []
+                for name, stream, encoding in iter_batch_inputs(params):
+                    if len(tasks) >= app.config[BATCH_MAX_SIZE_KEY]:
+                        abort(400, 'Batch has more than ' +
+                              str(app.config[BATCH_MAX_SIZE_KEY]) +
+                              ' edge lists')
+                    itemparams = items.get(name, {})
+                    rootnetwork = itemparams.get(ROOTNETWORK_PARAM,
+                                                 params[ROOTNETWORK_PARAM])
+                    if rootnetwork is None:
+                        rootnetwork = name
+                    taskid = str(uuid.uuid4())
+                    try:
+                        taskopts = prepare_task(
+                            taskid, stream, encoding,
+                            itemparams.get(ALGO_PARAM, params[ALGO_PARAM]),
+                            bool(itemparams.get(
+                                GRAPHDIRECTED_PARAM,
+                                params[GRAPHDIRECTED_PARAM])),
+                            rootnetwork, pending=pending)
+                    except costs.CostLimitError as cle:
+                        abort(413, name + ': ' + str(cle))
+                    except backpressure.OverloadedError as oe:
+                        for task in tasks:
+                            discard_task(task['id'])
+                        return overloaded(oe)
+                    except quota.QuotaExceededError as qe:
+                        for task in tasks:
+                            discard_task(task['id'])
+                        return too_much_work(qe)
+                    tasks.append({'name': name, 'id': taskid})
+                    if taskopts is None:
+                        continue
+                    # tasks of a large batch wait in the queue longer
+                    # than a single submission is allowed to
+                    taskopts['expires'] = None
+                    held.append(taskopts)
+
+                if len(tasks) == 0:
+                    abort(400, 'No edge lists in ' + EDGEFILES_PARAM +
+                          ' or ' + ARCHIVE_PARAM)
+                if len(held) > 0 and dispatcher is not None:
+                    hold_tasks(held)
+                elif len(held) > 0:
+                    group([run_communitydetection.signature(**x)
+                           for x in held]).apply_async()
+            except Exception:
+                # accepted items share tasks or were charged for
+                for task in tasks:
+                    discard_task(task['id'])
+                raise
+
+            save_batch(batchid, tasks)
+            return marshal({'id': batchid, 'tasks': tasks},
+                           BatchRestApp.batchobj), 202,\
+                {'Location': request.url + '/' + batchid}
+        except HTTPException:
+            raise
+        except (compression.CompressionError, ValueError) as ve:
+            abort(400, 'Unable to read edge lists: ' + str(ve))
+        except Exception as ea:
+            app.logger.exception('Error creating batch due to Exception ' +
+                                 str(ea))
+            abort(500, 'Unable to create batch ' + str(ea))
+
+    @api.hide
+    def options(self):
+        """
+        Lets caller know what what HTTP request types are valid with
+        request passed in. Used by CORS.
+
+        :return:
+        """
+        resp = flask.make_response()
+        resp.headers[ACCESS_CONTROL_ALLOW_METHODS] = 'POST, OPTIONS'
+        resp.status_code = 204
+        return resp
+
+
+@ns.route('/v1/batch/<string:id>', strict_slashes=False)
+class GetBatch(Resource):
+    """
+    Status of batch
+    """
+    decorators = [limiter.limit(app.config[GET_RATE_LIMIT_KEY],
+                                per_method=True, methods=['GET'])]
+
+    @api.response(200, 'Status of batch with number of tasks in each '
+                       'status and status of each task',
+                  headers=RATE_LIMIT_HEADERS)
+    @api.response(404, 'Batch not found', headers=RATE_LIMIT_HEADERS)
+    @api.response(429, 'Too many requests', TOO_MANY_REQUESTS,
+                  headers=RATE_LIMIT_HEADERS)
+    def get(self, id):
+        """
+        Gets status of batch, results are gotten for each task
+        """
+        data = celeryapp.backend.get(BATCH_KEY_PREFIX + id)
+        if data is None:
+            resp = jsonify({STATUS_RESULT_KEY: NOTFOUND_STATUS})
+            resp.status_code = 404
+            return resp
+
+        counts = {SUBMITTED_STATUS: 0, PROCESSING_STATUS: 0,
+                  DONE_STATUS: 0, ERROR_STATUS: 0, OUT_OF_MEMORY_STATUS: 0}
+        tasks = json.loads(data)
+        states = get_task_states([t['id'] for t in tasks])
+        for task in tasks:
+            status = states[task['id']][STATUS_RESULT_KEY]
+            counts[status] = counts.get(status, 0) + 1
+            task[STATUS_RESULT_KEY] = status
+
+        total = len(tasks)
+        if counts[DONE_STATUS] + counts[ERROR_STATUS] +\
+                counts[OUT_OF_MEMORY_STATUS] == total:
+            status = DONE_STATUS
+        elif counts[SUBMITTED_STATUS] == total:
+            status = SUBMITTED_STATUS
+        else:
+            status = PROCESSING_STATUS
+
+        res_dict = {'id': id, STATUS_RESULT_KEY: status, 'total': total,
+                    'progress': int(float(total - counts[SUBMITTED_STATUS] -
+                                          counts[PROCESSING_STATUS]) /
+                                    float(total) * 100) if total else 100,
+                    'tasks': tasks}
+        res_dict.update(counts)
+        return jsonify(res_dict)
+
+    @api.hide
+    def options(self, id):
+        """
+        Lets caller know what what HTTP request types are valid with
+        request passed in. Used by CORS.
+
+        :return:
+        """
+        resp = flask.make_response()
+        resp.headers[ACCESS_CONTROL_ALLOW_METHODS] = 'GET, OPTIONS'
+        resp.status_code = 204
+        return resp
+
+
 class ServerStatus(object):
     """Represents status of server
     """
@@ -411,6 +1787,24 @@ class ServerStatus(object):
         self.load[1] = loadavg[1]
         self.load[2] = loadavg[2]
 
+        self.cacheHits = 0
+        self.cacheMisses = 0
+        self.cacheSize = 0
+        if resultcache is not None:
+            try:
+                stats = resultcache.get_stats()
+                self.cacheHits = stats[cache.HITS]
+                self.cacheMisses = stats[cache.MISSES]
+                self.cacheSize = stats[cache.SIZE]
+            except Exception:
+                app.logger.exception('Caught exception getting cache stats')
+
+        self.queues = []
+        stats = queuemonitor.get_stats()
+        for name in sizeclasses.get_names():
+            if name in stats:
+                self.queues.append(stats[name])
+
 
 @ns.route('/v1/status', strict_slashes=False)
 class SystemStatus(Resource):
@@ -423,7 +1817,40 @@ class SystemStatus(Resource):
         'load': fields.List(fields.Float(description='server load'),
                             description='List of 3 floats containing 1 minute,'
                                         ' 5 minute, 15minute load'),
-        'restVersion': fields.String(description='Version of REST service')
+        'restVersion': fields.String(description='Version of REST service'),
+        'cacheHits': fields.Integer(description='Number of submissions '
+                                                'answered from result cache'),
+        'cacheMisses': fields.Integer(description='Number of submissions '
+                                                  'not in result cache'),
+        'cacheSize': fields.Integer(description='Number of results in '
+                                                'result cache'),
+        'queues': fields.List(fields.Nested(api.model('QueueSchema', {
+            backpressure.SIZE_CLASS_KEY: fields.String(
+                description='Size class of jobs in queue'),
+            backpressure.QUEUE_KEY: fields.String(
+                description='Name of queue'),
+            backpressure.DEPTH_KEY: fields.Integer(
+                description='Number of jobs waiting'),
+            backpressure.HELD_KEY: fields.Integer(
+                description='Number of waiting jobs held in sub-queues '
+                            'of their clients'),
+            backpressure.CLIENTS_KEY: fields.List(fields.Nested(
+                api.model('ClientQueueSchema', {
+                    fairshare.CLIENT_KEY: fields.String(
+                        description='Hash of api token or address '
+                                    'of client'),
+                    fairshare.DEPTH_KEY: fields.Integer(
+                        description='Number of jobs held for client')})),
+                description='Jobs held for each client, most first'),
+            backpressure.CONSUMERS_KEY: fields.Integer(
+                description='Number of workers taking jobs from queue'),
+            backpressure.THROUGHPUT_KEY: fields.Float(
+                description='Jobs finished per second recently'),
+            backpressure.ESTIMATED_WAIT_KEY: fields.Float(
+                description='Estimated seconds a job submitted now waits '
+                            'before it runs, null if no workers are '
+                            'taking jobs')})),
+            description='Queue of each size class')
     })
     @api.doc('Gets status')
     @api.response(200, 'Success', statusobj, headers=RATE_LIMIT_HEADERS)
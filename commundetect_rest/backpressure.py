@@ -0,0 +1,295 @@
+
+import math
+import time
+import logging
+import threading
+
+from commundetect_rest import routing
+
+logger = logging.getLogger(__name__)
+
+# submissions are refused while estimated wait in queue of job is
+# above this many seconds, None to never refuse
+MAX_QUEUE_WAIT_KEY = 'MAX_QUEUE_WAIT'
+
+# seconds queue stats are reused before broker is asked again
+QUEUE_STATS_TTL_KEY = 'QUEUE_STATS_TTL'
+
+# seconds of finished jobs throughput is measured over
+THROUGHPUT_WINDOW_KEY = 'THROUGHPUT_WINDOW'
+
+# seconds a job is assumed to take when no jobs of a queue
+# finished recently
+DEFAULT_JOB_SECONDS_KEY = 'DEFAULT_JOB_SECONDS'
+
+# longest Retry-After sent
+MAX_RETRY_AFTER = 3600
+
+# finished jobs are counted in redis keys of this prefix, one
+# key per queue per bucket of this many seconds
+DONE_KEY_PREFIX = 'commundetect-done-'
+BUCKET_SECONDS = 60
+
+# keys in queue stats
+SIZE_CLASS_KEY = 'sizeclass'
+QUEUE_KEY = 'queue'
+DEPTH_KEY = 'depth'
+CONSUMERS_KEY = 'consumers'
+THROUGHPUT_KEY = 'throughput'
+ESTIMATED_WAIT_KEY = 'estimatedWait'
+HELD_KEY = 'held'
+CLIENTS_KEY = 'clients'
+
+
+class OverloadedError(Exception):
+    """
+    Raised when a queue has too long a wait to take more jobs
+    """
+    def __init__(self, message, retryafter):
+        """
+        Constructor
+
+        :param message: error message
+        :param retryafter: seconds caller should wait before
+                           submitting again
+        """
+        super(OverloadedError, self).__init__(message)
+        self.retryafter = retryafter
+
+
+def _get_bucket_key(queue, bucket):
+    return DONE_KEY_PREFIX + queue + '-' + str(bucket)
+
+
+def record_done(client, queue, window=600, now=None):
+    """
+    Counts a finished job of queue so throughput can be measured
+
+    :param client: redis client
+    :param queue: name of queue job came from
+    :param window: seconds throughput is measured over, counts
+                   are kept this long
+    :param now: current time in seconds, None for now
+    """
+    if now is None:
+        now = time.time()
+    key = _get_bucket_key(queue, int(now // BUCKET_SECONDS))
+    pipe = client.pipeline()
+    pipe.incr(key)
+    pipe.expire(key, int(window) + BUCKET_SECONDS)
+    pipe.execute()
+
+
+def get_throughput(client, queue, window=600, now=None):
+    """
+    Gets jobs of queue finished per second over the last
+    window seconds
+
+    :param client: redis client
+    :param queue: name of queue
+    :param window: seconds to measure over
+    :param now: current time in seconds, None for now
+    :return: jobs per second
+    :rtype: float
+    """
+    if now is None:
+        now = time.time()
+    current = int(now // BUCKET_SECONDS)
+    nbuckets = max(1, int(math.ceil(window / BUCKET_SECONDS)))
+    keys = [_get_bucket_key(queue, current - x) for x in range(nbuckets)]
+    done = sum(int(val) for val in client.mget(keys) if val is not None)
+
+    # current bucket is only partly over
+    elapsed = (nbuckets - 1) * BUCKET_SECONDS + (now - current *
+                                                 BUCKET_SECONDS)
+    return done / max(elapsed, 1.0)
+
+
+def get_queue_depth(connection, queue):
+    """
+    Asks broker how many jobs are waiting in queue
+
+    :param connection: :py:class:`kombu.Connection` to broker
+    :param queue: name of queue
+    :return: (jobs waiting, number of consumers), (0, 0) if
+             queue does not exist
+    :rtype: tuple
+    """
+    channel = connection.channel()
+    try:
+        ok = channel.queue_declare(queue=queue, passive=True)
+        return ok.message_count, ok.consumer_count
+    except connection.channel_errors:
+        # queue is declared when first job is sent or worker starts
+        return 0, 0
+    finally:
+        try:
+            channel.close()
+        except Exception:
+            pass
+
+
+def estimate_wait(depth, consumers, throughput, defaultjobseconds=60):
+    """
+    Estimates seconds a job sent now waits before it runs
+
+    :param depth: jobs waiting in queue
+    :param consumers: workers consuming queue
+    :param throughput: jobs finished per second
+    :param defaultjobseconds: seconds a job is assumed to take if
+                              none finished recently
+    :return: seconds, None if queue has jobs and nothing consumes it
+    :rtype: float
+    """
+    if depth == 0:
+        return 0.0
+    if throughput <= 0:
+        throughput = consumers / float(defaultjobseconds)
+    if throughput <= 0:
+        return None
+    return depth / throughput
+
+
+def get_retry_after(estimatedwait, maxwait):
+    """
+    Gets seconds until wait drops below maxwait, assuming
+    queue keeps draining at its current rate
+
+    :param estimatedwait: estimated wait in seconds or None
+                          if queue is not draining
+    :param maxwait: most seconds a job may wait
+    :return: seconds
+    :rtype: int
+    """
+    if estimatedwait is None:
+        return MAX_RETRY_AFTER
+    return int(min(MAX_RETRY_AFTER,
+                   max(1, math.ceil(estimatedwait - maxwait))))
+
+
+class QueueMonitor(object):
+    """
+    Gets depth, throughput and estimated wait of each size class
+    queue, reusing them for ttl seconds so checking every
+    submission stays cheap
+    """
+    def __init__(self, celeryapp, sizeclasses, ttl=5, window=600,
+                 defaultjobseconds=60, timefunc=time.time,
+                 dispatcher=None):
+        """
+        Constructor
+
+        :param celeryapp: celery app whose broker holds queues and
+                          whose redis result backend holds counts
+                          of finished jobs
+        :param sizeclasses: size classes
+        :type sizeclasses: :py:class:`~commundetect_rest.routing.SizeClasses`
+        :param ttl: seconds stats are reused
+        :param window: seconds throughput is measured over
+        :param defaultjobseconds: seconds a job is assumed to take if
+                                  none finished recently
+        :param timefunc: function that returns current time in seconds
+        :param dispatcher: fair share dispatcher holding jobs of each
+                           client, held jobs count towards depth, or
+                           None if jobs are not held
+        :type dispatcher: :py:class:`~commundetect_rest.fairshare.FairDispatcher`
+        """
+        self._celeryapp = celeryapp
+        self._sizeclasses = sizeclasses
+        self._ttl = ttl
+        self._window = window
+        self._defaultjobseconds = defaultjobseconds
+        self._time = timefunc
+        self._dispatcher = dispatcher
+        self._lock = threading.Lock()
+        self._stats = None
+        self._expires = 0
+
+    def _get_queue_stats(self):
+        client = self._celeryapp.backend.client
+        now = self._time()
+        stats = {}
+        with self._celeryapp.connection_for_read() as conn:
+            for name in self._sizeclasses.get_names():
+                queue = self._sizeclasses.get(name)[routing.QUEUE_KEY]
+                depth, consumers = get_queue_depth(conn, queue)
+                clients = []
+                if self._dispatcher is not None:
+                    clients = self._dispatcher.get_depths(queue)
+                held = sum(c[DEPTH_KEY] for c in clients)
+                depth += held
+                throughput = get_throughput(client, queue,
+                                            window=self._window, now=now)
+                stats[name] = {
+                    SIZE_CLASS_KEY: name,
+                    QUEUE_KEY: queue,
+                    DEPTH_KEY: depth,
+                    HELD_KEY: held,
+                    CLIENTS_KEY: clients,
+                    CONSUMERS_KEY: consumers,
+                    THROUGHPUT_KEY: throughput,
+                    ESTIMATED_WAIT_KEY: estimate_wait(
+                        depth, consumers, throughput,
+                        defaultjobseconds=self._defaultjobseconds)}
+        return stats
+
+    def get_stats(self):
+        """
+        Gets stats of each size class queue
+
+        :return: dict of size class name to stats, empty if
+                 stats could not be gotten
+        :rtype: dict
+        """
+        with self._lock:
+            if self._stats is None or self._time() >= self._expires:
+                try:
+                    self._stats = self._get_queue_stats()
+                except Exception:
+                    # failure is kept for ttl too so an unreachable
+                    # broker is not asked on every submission
+                    logger.exception('Unable to get queue stats')
+                    self._stats = {}
+                self._expires = self._time() + self._ttl
+            return self._stats
+
+    def check(self, sizeclass, maxwait, expires=None, pending=0):
+        """
+        Checks queue of size class can take another job
+
+        :param sizeclass: name of size class
+        :param maxwait: most seconds a job may wait or None
+                        to accept any wait
+        :param expires: seconds job is kept in queue before it is
+                        revoked or None if it is never revoked, a
+                        job that would be revoked before it runs
+                        is refused too
+        :param pending: jobs of size class accepted by the same
+                        submission but not queued yet, they are
+                        ahead of this job and not in stats
+        :raises OverloadedError: if estimated wait is above maxwait
+                                 or expires
+        """
+        if expires is not None and (maxwait is None or expires < maxwait):
+            maxwait = expires
+        if maxwait is None:
+            return
+        stats = self.get_stats().get(sizeclass)
+        if stats is None:
+            # not knowing the queue depth should not
+            # stop submissions
+            return
+        wait = stats[ESTIMATED_WAIT_KEY]
+        if pending > 0:
+            wait = estimate_wait(stats[DEPTH_KEY] + pending,
+                                 stats[CONSUMERS_KEY], stats[THROUGHPUT_KEY],
+                                 defaultjobseconds=self._defaultjobseconds)
+        if wait is not None and wait <= maxwait:
+            return
+        if wait is None:
+            message = 'No workers are running ' + sizeclass + ' jobs'
+        else:
+            message = 'Estimated wait for ' + sizeclass + ' jobs is ' +\
+                      str(int(wait)) + ' seconds which is more than the ' +\
+                      str(maxwait) + ' seconds allowed'
+        raise OverloadedError(message, get_retry_after(wait, maxwait))
@@ -0,0 +1,228 @@
+
+import abc
+import time
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# size of chunks read when copying uploads
+COPY_CHUNK_SIZE = 1024 * 1024
+
+LOCAL_CACHE = 'local'
+REDIS_CACHE = 'redis'
+
+REDIS_PREFIX = 'commundetect:cache:'
+
+HITS = 'hits'
+MISSES = 'misses'
+SIZE = 'size'
+
+
+def make_cache_key(contenthash, algorithm, version, params):
+    """
+    Creates cache key from content hash of input, algorithm and
+    parameters that affect the result
+
+    :param contenthash: hash of input
+    :param algorithm: name of algorithm
+    :param version: version of algorithm
+    :param params: dict of parameters
+    :return: cache key
+    :rtype: str
+    """
+    data = json.dumps([contenthash, algorithm, version, params],
+                      sort_keys=True)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+class ResultCache(abc.ABC):
+    """
+    Base class for caches of finished results keyed by
+    :py:func:`make_cache_key`. Only the id of the task holding the
+    result is kept, results stay in the result backend, so entries
+    are small and a hit is an alias of that task. The task id is
+    added when the task is queued, it becomes a hit once the worker
+    has stored the result
+    """
+    @abc.abstractmethod
+    def get(self, key, check=None):
+        """
+        Gets id of task holding result
+
+        :param key: cache key
+        :param check: function given task id that returns False if
+                      the task has no usable result, for example it
+                      is still running, failed or its result expired.
+                      Such entries are kept, they are replaced by
+                      :py:meth:`put`, and counted as a miss
+        :return: id of task or None if not in cache
+        """
+
+    @abc.abstractmethod
+    def put(self, key, taskid):
+        """
+        Adds id of task that will hold result
+
+        :param key: cache key
+        :param taskid: id of task
+        """
+
+    @abc.abstractmethod
+    def get_stats(self):
+        """
+        Gets hit, miss counts and number of entries
+
+        :return: dict with hits, misses, size
+        :rtype: dict
+        """
+
+
+class LocalResultCache(ResultCache):
+    """
+    In memory LRU cache with time to live. Only shared by threads
+    of one process
+    """
+    def __init__(self, maxsize=1000, ttl=86400, timefunc=time.time):
+        """
+        Constructor
+
+        :param maxsize: maximum number of task ids to keep
+        :param ttl: seconds an entry stays in cache
+        :param timefunc: function that returns current time in seconds
+        """
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._time = timefunc
+        self._entries = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, check=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < self._time():
+                del self._entries[key]
+                entry = None
+        if entry is not None and check is not None and\
+                check(entry[1]) is False:
+            entry = None
+        with self._lock:
+            if entry is None:
+                self._misses += 1
+                return None
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[1]
+
+    def put(self, key, taskid):
+        with self._lock:
+            self._entries[key] = (self._time() + self._ttl, taskid)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+
+    def get_stats(self):
+        with self._lock:
+            return {HITS: self._hits, MISSES: self._misses,
+                    SIZE: len(self._entries)}
+
+
+class RedisResultCache(ResultCache):
+    """
+    Cache stored in Redis so it is shared by all web processes. Entries
+    expire via Redis TTL and once there are more than maxsize entries
+    the least recently used are removed
+    """
+    def __init__(self, url='redis://localhost', maxsize=1000, ttl=86400,
+                 client=None):
+        """
+        Constructor
+
+        :param url: url of redis server
+        :param maxsize: maximum number of task ids to keep
+        :param ttl: seconds an entry stays in cache
+        :param client: redis client to use instead of creating one
+                       from url
+        """
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self._redis = client
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._lru = REDIS_PREFIX + 'lru'
+        self._hits = REDIS_PREFIX + HITS
+        self._misses = REDIS_PREFIX + MISSES
+
+    def _entry(self, key):
+        return REDIS_PREFIX + 'entry:' + key
+
+    def get(self, key, check=None):
+        taskid = self._redis.get(self._entry(key))
+        if taskid is None:
+            self._redis.zrem(self._lru, key)
+        elif isinstance(taskid, bytes):
+            taskid = taskid.decode('utf-8')
+        if taskid is None or (check is not None and
+                              check(taskid) is False):
+            self._redis.incr(self._misses)
+            return None
+        pipe = self._redis.pipeline()
+        pipe.zadd(self._lru, {key: time.time()})
+        pipe.incr(self._hits)
+        pipe.execute()
+        return taskid
+
+    def put(self, key, taskid):
+        pipe = self._redis.pipeline()
+        pipe.set(self._entry(key), taskid, ex=self._ttl)
+        pipe.zadd(self._lru, {key: time.time()})
+        pipe.zcard(self._lru)
+        count = pipe.execute()[-1]
+        if count > self._maxsize:
+            oldest = self._redis.zrange(self._lru, 0,
+                                        count - self._maxsize - 1)
+            if oldest:
+                pipe = self._redis.pipeline()
+                for old in oldest:
+                    if isinstance(old, bytes):
+                        old = old.decode('utf-8')
+                    pipe.delete(self._entry(old))
+                    pipe.zrem(self._lru, old)
+                pipe.execute()
+
+    def get_stats(self):
+        pipe = self._redis.pipeline()
+        pipe.get(self._hits)
+        pipe.get(self._misses)
+        pipe.zcard(self._lru)
+        hits, misses, size = pipe.execute()
+        return {HITS: int(hits or 0), MISSES: int(misses or 0),
+                SIZE: int(size)}
+
+
+def create_result_cache(cachetype, maxsize=1000, ttl=86400,
+                        url='redis://localhost'):
+    """
+    Creates result cache
+
+    :param cachetype: 'local', 'redis' or None for no cache
+    :param maxsize: maximum number of task ids
+    :param ttl: seconds entries live in cache
+    :param url: redis url, only used by redis cache
+    :raises ValueError: if cachetype is unknown
+    :return: cache or None
+    """
+    if cachetype is None:
+        return None
+    if cachetype == LOCAL_CACHE:
+        return LocalResultCache(maxsize=maxsize, ttl=ttl)
+    if cachetype == REDIS_CACHE:
+        return RedisResultCache(url=url, maxsize=maxsize, ttl=ttl)
+    raise ValueError('Unknown result cache type: ' + str(cachetype))
@@ -0,0 +1,320 @@
+
+import abc
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+LOCAL_TRACKER = 'local'
+REDIS_TRACKER = 'redis'
+
+REDIS_PREFIX = 'commundetect:inflight:'
+
+PRIMARY = 'primary'
+ROOTNETWORK = 'rootnetwork'
+
+
+class InFlightTracker(abc.ABC):
+    """
+    Tracks tasks that are queued or running by cache key so identical
+    submissions can share one task. Every submission gets its own id,
+    later ones are aliases of the first (primary) task. The primary
+    task is only cancelled once every id referring to it is released.
+    A claim lasts until the primary task is finished or its ttl
+    passes, whichever comes first
+    """
+    @abc.abstractmethod
+    def claim(self, key, taskid, ttl=None):
+        """
+        Makes taskid the primary task for key unless another
+        task already is
+
+        :param key: cache key from
+                    :py:func:`~commundetect_rest.cache.make_cache_key`
+        :param taskid: id of task about to be queued
+        :param ttl: seconds the claim is kept, should be the longest
+                    the task can wait in queue and run, or None to
+                    keep it as long as other entries
+        :return: id of existing primary task or None if taskid is
+                 now the primary task
+        """
+
+    @abc.abstractmethod
+    def add_alias(self, primary, aliasid, rootnetwork=None):
+        """
+        Makes aliasid refer to primary task
+
+        :param primary: id of primary task
+        :param aliasid: new id handed to caller
+        :param rootnetwork: rootnetwork of submission for aliasid
+        """
+
+    @abc.abstractmethod
+    def resolve(self, taskid):
+        """
+        Gets the task that holds result for taskid
+
+        :param taskid: id given to caller
+        :return: (id of primary task, alias info dict or None if
+                 taskid is not an alias)
+        :rtype: tuple
+        """
+
+    def resolve_many(self, taskids):
+        """
+        Gets the tasks that hold results for many ids
+
+        :param taskids: ids given to callers
+        :return: list of (id of primary task, alias info dict or None)
+                 in same order as taskids
+        :rtype: list
+        """
+        return [self.resolve(taskid) for taskid in taskids]
+
+    @abc.abstractmethod
+    def release(self, taskid):
+        """
+        Drops reference taskid holds on its primary task
+
+        :param taskid: id given to caller
+        :return: (id of primary task, True if no ids refer to primary
+                 task anymore and it can be cancelled)
+        :rtype: tuple
+        """
+
+    @abc.abstractmethod
+    def finish(self, primary):
+        """
+        Marks primary task as done so new submissions no longer
+        coalesce onto it. Aliases still resolve
+
+        :param primary: id of primary task
+        """
+
+
+class LocalInFlightTracker(InFlightTracker):
+    """
+    In memory tracker, only shared by threads of one process
+    """
+    def __init__(self, maxsize=10000):
+        """
+        Constructor
+
+        :param maxsize: maximum number of tasks and of aliases
+                        to remember
+        """
+        self._maxsize = maxsize
+        self._bykey = {}
+        self._keyof = {}
+        self._refs = OrderedDict()
+        self._aliases = OrderedDict()
+        self._lock = threading.Lock()
+
+    def claim(self, key, taskid, ttl=None):
+        with self._lock:
+            now = time.time()
+            claimed = self._bykey.get(key)
+            if claimed is not None and (claimed[1] is None or
+                                        claimed[1] > now):
+                return claimed[0]
+            self._bykey[key] = (taskid, None if ttl is None else now + ttl)
+            self._keyof[taskid] = key
+            self._refs[taskid] = set([taskid])
+            while len(self._refs) > self._maxsize:
+                oldest, refs = self._refs.popitem(last=False)
+                oldkey = self._keyof.pop(oldest, None)
+                if oldkey is not None and self._is_claim(oldkey, oldest):
+                    del self._bykey[oldkey]
+            return None
+
+    def _is_claim(self, key, taskid):
+        claimed = self._bykey.get(key)
+        return claimed is not None and claimed[0] == taskid
+
+    def add_alias(self, primary, aliasid, rootnetwork=None):
+        with self._lock:
+            self._aliases[aliasid] = {PRIMARY: primary,
+                                      ROOTNETWORK: rootnetwork}
+            while len(self._aliases) > self._maxsize:
+                self._aliases.popitem(last=False)
+            # primary that finished and dropped its references, such as
+            # a cache hit, still holds one on its result
+            self._refs.setdefault(primary, set([primary])).add(aliasid)
+
+    def resolve(self, taskid):
+        with self._lock:
+            alias = self._aliases.get(taskid)
+        if alias is None:
+            return taskid, None
+        return alias[PRIMARY], alias
+
+    def resolve_many(self, taskids):
+        with self._lock:
+            aliases = [self._aliases.get(t) for t in taskids]
+        return [(t, None) if a is None else (a[PRIMARY], a)
+                for t, a in zip(taskids, aliases)]
+
+    def release(self, taskid):
+        with self._lock:
+            alias = self._aliases.pop(taskid, None)
+            primary = taskid if alias is None else alias[PRIMARY]
+            refs = self._refs.get(primary)
+            if refs is None:
+                return primary, alias is None
+            refs.discard(taskid)
+            if len(refs) > 0:
+                return primary, False
+            del self._refs[primary]
+            key = self._keyof.pop(primary, None)
+            if key is not None and self._is_claim(key, primary):
+                del self._bykey[key]
+            return primary, True
+
+    def finish(self, primary):
+        with self._lock:
+            key = self._keyof.pop(primary, None)
+            if key is not None and self._is_claim(key, primary):
+                del self._bykey[key]
+            # references are only needed if there are aliases
+            # whose delete must not remove the shared result
+            refs = self._refs.get(primary)
+            if refs is not None and refs == set([primary]):
+                del self._refs[primary]
+
+
+class RedisInFlightTracker(InFlightTracker):
+    """
+    Tracker stored in Redis so it is shared by all web processes
+    """
+    def __init__(self, url='redis://localhost', ttl=86400, client=None):
+        """
+        Constructor
+
+        :param url: url of redis server
+        :param ttl: seconds entries are kept
+        :param client: redis client to use instead of creating one
+                       from url
+        """
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self._redis = client
+        self._ttl = ttl
+
+    def _key(self, key):
+        return REDIS_PREFIX + 'key:' + key
+
+    def _keyof(self, taskid):
+        return REDIS_PREFIX + 'keyof:' + taskid
+
+    def _refs(self, taskid):
+        return REDIS_PREFIX + 'refs:' + taskid
+
+    def _alias(self, taskid):
+        return REDIS_PREFIX + 'alias:' + taskid
+
+    @staticmethod
+    def _str(val):
+        if isinstance(val, bytes):
+            return val.decode('utf-8')
+        return val
+
+    def claim(self, key, taskid, ttl=None):
+        if not self._redis.set(self._key(key), taskid,
+                               ex=self._ttl if ttl is None else int(ttl),
+                               nx=True):
+            primary = self._str(self._redis.get(self._key(key)))
+            if primary is not None:
+                return primary
+            # primary finished between the two calls
+            return self.claim(key, taskid, ttl=ttl)
+        pipe = self._redis.pipeline()
+        pipe.set(self._keyof(taskid), key, ex=self._ttl)
+        pipe.sadd(self._refs(taskid), taskid)
+        pipe.expire(self._refs(taskid), self._ttl)
+        pipe.execute()
+        return None
+
+    def add_alias(self, primary, aliasid, rootnetwork=None):
+        pipe = self._redis.pipeline()
+        pipe.set(self._alias(aliasid),
+                 json.dumps({PRIMARY: primary, ROOTNETWORK: rootnetwork}),
+                 ex=self._ttl)
+        pipe.exists(self._refs(primary))
+        pipe.sadd(self._refs(primary), aliasid)
+        pipe.expire(self._refs(primary), self._ttl)
+        if not pipe.execute()[1]:
+            # primary that finished and dropped its references, such as
+            # a cache hit, still holds one on its result
+            self._redis.sadd(self._refs(primary), primary)
+
+    def _to_alias(self, taskid, data):
+        if data is None:
+            return taskid, None
+        alias = json.loads(self._str(data))
+        return alias[PRIMARY], alias
+
+    def resolve(self, taskid):
+        return self._to_alias(taskid, self._redis.get(self._alias(taskid)))
+
+    def resolve_many(self, taskids):
+        if len(taskids) == 0:
+            return []
+        values = self._redis.mget([self._alias(t) for t in taskids])
+        return [self._to_alias(t, v) for t, v in zip(taskids, values)]
+
+    def release(self, taskid):
+        primary, alias = self.resolve(taskid)
+        pipe = self._redis.pipeline()
+        pipe.delete(self._alias(taskid))
+        pipe.exists(self._refs(primary))
+        pipe.srem(self._refs(primary), taskid)
+        pipe.scard(self._refs(primary))
+        res = pipe.execute()
+        if not res[1]:
+            return primary, alias is None
+        if res[3] > 0:
+            return primary, False
+        self._forget(primary)
+        return primary, True
+
+    def _forget(self, primary, refs=True):
+        key = self._str(self._redis.get(self._keyof(primary)))
+        pipe = self._redis.pipeline()
+        # claim of primary may have expired and key been claimed again
+        if key is not None and\
+                self._str(self._redis.get(self._key(key))) == primary:
+            pipe.delete(self._key(key))
+        pipe.delete(self._keyof(primary))
+        if refs is True:
+            pipe.delete(self._refs(primary))
+        pipe.execute()
+
+    def finish(self, primary):
+        # references are only needed if there are aliases
+        # whose delete must not remove the shared result
+        self._forget(primary,
+                     refs=self._redis.scard(self._refs(primary)) <= 1)
+
+
+def create_inflight_tracker(trackertype, url='redis://localhost',
+                            ttl=86400):
+    """
+    Creates tracker for in flight tasks
+
+    :param trackertype: 'local', 'redis' or None to disable
+    :param url: redis url, only used by redis tracker
+    :param ttl: seconds redis entries are kept
+    :raises ValueError: if trackertype is unknown
+    :return: tracker or None
+    """
+    if trackertype is None:
+        return None
+    if trackertype == LOCAL_TRACKER:
+        return LocalInFlightTracker()
+    if trackertype == REDIS_TRACKER:
+        return RedisInFlightTracker(url=url, ttl=ttl)
+    raise ValueError('Unknown in flight tracker type: ' + str(trackertype))
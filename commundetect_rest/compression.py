@@ -0,0 +1,206 @@
+
+import gzip
+import logging
+
+logger = logging.getLogger(__name__)
+
+IDENTITY_ENCODING = 'identity'
+GZIP_ENCODING = 'gzip'
+
+# needs zstandard package which is only imported when
+# a zstd compressed input is seen
+ZSTD_ENCODING = 'zstd'
+
+# values of Content-Encoding header mapped to encoding
+CONTENT_ENCODINGS = {'': IDENTITY_ENCODING,
+                     IDENTITY_ENCODING: IDENTITY_ENCODING,
+                     GZIP_ENCODING: GZIP_ENCODING,
+                     'x-gzip': GZIP_ENCODING,
+                     ZSTD_ENCODING: ZSTD_ENCODING}
+
+# leading bytes of compressed data
+MAGIC_BYTES = {GZIP_ENCODING: b'\x1f\x8b',
+               ZSTD_ENCODING: b'\x28\xb5\x2f\xfd'}
+
+MAGIC_LENGTH = 4
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class CompressionError(ValueError):
+    """
+    Raised when input is compressed with an unsupported
+    encoding or cannot be decompressed
+    """
+    pass
+
+
+def detect_encoding(prefix, contentencoding=None):
+    """
+    Gets encoding of data from Content-Encoding value if set
+    otherwise from magic bytes at start of data
+
+    :param prefix: first bytes of data, at least
+                   :py:const:`MAGIC_LENGTH` unless data is shorter
+    :param contentencoding: value of Content-Encoding header or None
+    :raises CompressionError: if contentencoding is not supported
+    :return: :py:const:`IDENTITY_ENCODING`, :py:const:`GZIP_ENCODING`
+             or :py:const:`ZSTD_ENCODING`
+    :rtype: str
+    """
+    if contentencoding is not None:
+        encoding = CONTENT_ENCODINGS.get(contentencoding.strip().lower())
+        if encoding is None:
+            raise CompressionError('Unsupported Content-Encoding: ' +
+                                   contentencoding)
+        if encoding != IDENTITY_ENCODING:
+            return encoding
+    for encoding in MAGIC_BYTES:
+        if prefix.startswith(MAGIC_BYTES[encoding]):
+            return encoding
+    return IDENTITY_ENCODING
+
+
+def detect_file_encoding(path):
+    """
+    Gets encoding of file from its magic bytes
+
+    :param path: path to file
+    :return: encoding, see :py:func:`detect_encoding`
+    :rtype: str
+    """
+    with open(path, 'rb') as f:
+        return detect_encoding(f.read(MAGIC_LENGTH))
+
+
+def _get_zstandard():
+    """
+    Imports zstandard
+
+    :raises CompressionError: if zstandard is not installed
+    :return: zstandard module
+    """
+    try:
+        import zstandard
+    except ImportError:
+        raise CompressionError('zstd compressed input needs the '
+                               'zstandard package')
+    return zstandard
+
+
+def _decompressing_reader(fileobj, encoding):
+    """
+    Wraps binary file object with one that decompresses as it is read
+
+    :param fileobj: binary file object
+    :param encoding: encoding of data in fileobj
+    :return: binary file object
+    """
+    if encoding == GZIP_ENCODING:
+        return gzip.GzipFile(fileobj=fileobj, mode='rb')
+    if encoding == ZSTD_ENCODING:
+        return _get_zstandard().ZstdDecompressor().stream_reader(
+            fileobj, read_across_frames=True)
+    return fileobj
+
+
+class _PrefixedReader(object):
+    """
+    Binary reader that returns prefix already read from
+    fsrc followed by rest of fsrc. Anything read is also
+    written to fdst
+    """
+    mode = 'rb'
+
+    def __init__(self, prefix, fsrc, fdst):
+        """
+        Constructor
+
+        :param prefix: bytes already read from fsrc
+        :param fsrc: file like object to read from
+        :param fdst: file like object to write to
+        """
+        self._prefix = prefix
+        self._fsrc = fsrc
+        self._fdst = fdst
+
+    def read(self, size=-1):
+        if self._prefix:
+            if size is None or size < 0:
+                buf = self._prefix + self._fsrc.read()
+                self._prefix = b''
+            else:
+                buf = self._prefix[:size]
+                self._prefix = self._prefix[size:]
+        else:
+            buf = self._fsrc.read(size)
+        if buf:
+            self._fdst.write(buf)
+        return buf
+
+
+def copy_and_hash(fsrc, fdst, digest, contentencoding=None,
+                  chunksize=COPY_CHUNK_SIZE, counter=None):
+    """
+    Copies fsrc to fdst as is, compressed or not, updating digest
+    with the decompressed data so identical edge lists get the same
+    digest however they were sent
+
+    :param fsrc: file like object to read from
+    :param fdst: file like object to write to
+    :param digest: :py:mod:`hashlib` object to update
+    :param contentencoding: value of Content-Encoding header or None
+                            to detect encoding from data
+    :param chunksize: bytes to read at a time
+    :param counter: if set, its update() is also called with the
+                    decompressed data and finish() when done
+    :raises CompressionError: if data cannot be decompressed
+    :return: encoding of data
+    :rtype: str
+    """
+    prefix = fsrc.read(MAGIC_LENGTH)
+    encoding = detect_encoding(prefix, contentencoding=contentencoding)
+    reader = _PrefixedReader(prefix, fsrc, fdst)
+    try:
+        decompressed = _decompressing_reader(reader, encoding)
+        while True:
+            buf = decompressed.read(chunksize)
+            if not buf:
+                break
+            digest.update(buf)
+            if counter is not None:
+                counter.update(buf)
+    except CompressionError:
+        raise
+    except Exception as e:
+        raise CompressionError('Unable to decompress ' + encoding +
+                               ' input: ' + str(e))
+
+    # copy anything the decompressor did not need
+    while reader.read(chunksize):
+        pass
+    if counter is not None:
+        counter.finish()
+    return encoding
+
+
+def open_decompressed(path):
+    """
+    Opens file for reading decompressing it as it is read if
+    it is compressed
+
+    :param path: path to file
+    :return: binary file object
+    """
+    encoding = detect_file_encoding(path)
+    f = open(path, 'rb')
+    if encoding == IDENTITY_ENCODING:
+        return f
+    try:
+        if encoding == ZSTD_ENCODING:
+            return _get_zstandard().ZstdDecompressor().stream_reader(
+                f, read_across_frames=True, closefd=True)
+        return gzip.GzipFile(fileobj=f, mode='rb')
+    except Exception:
+        f.close()
+        raise
@@ -0,0 +1,493 @@
+
+import os
+import json
+import uuid
+import atexit
+import logging
+import threading
+import subprocess
+
+logger = logging.getLogger(__name__)
+
+# profile keys used to describe how to keep a container warm
+MODE_KEY = 'mode'
+ENTRYPOINT_KEY = 'entrypoint'
+ARGS_KEY = 'args'
+POOLSIZE_KEY = 'poolsize'
+
+# container runs a server that reads one json job per line on
+# standard in and replies with one json line on standard out
+SERVE_MODE = 'serve'
+
+# container is kept alive doing nothing and jobs are
+# run in it via docker exec
+EXEC_MODE = 'exec'
+
+# job request keys for serve mode
+JOB_ARGS = 'args'
+JOB_STDOUT = 'stdout'
+
+# job response keys for serve mode
+JOB_RETURNCODE = 'returncode'
+JOB_STDERR = 'stderr'
+
+KEEPALIVE_ENTRYPOINT = 'sleep'
+KEEPALIVE_ARGS = ['infinity']
+
+CONTAINER_PREFIX = 'commundetect_'
+
+# label put on container running a job, value is task id of job
+TASK_LABEL = 'commundetect.task'
+
+# seconds to wait for docker to remove containers
+REMOVE_TIMEOUT = 30
+
+
+class ContainerError(Exception):
+    """
+    Raised when a warm container dies
+    """
+    pass
+
+
+class WarmContainer(object):
+    """
+    Long lived docker container that runs jobs for one algorithm image
+    """
+    def __init__(self, imagename, mountdir, profile, limits=None):
+        """
+        Constructor
+
+        :param imagename: docker image
+        :param mountdir: directory bind mounted into container, job
+                         directories must be under this directory
+        :param profile: dict with mode, entrypoint, args keys
+        :param limits: resources container may use or None for no
+                       limits, cores are set for each job
+        :type limits: :py:class:`~commundetect_rest.resources.ResourceProfile`
+        :raises ValueError: if profile uses exec mode without an entrypoint
+        """
+        self._imagename = imagename
+        self._mountdir = mountdir
+        self._mode = profile.get(MODE_KEY, SERVE_MODE)
+        self._entrypoint = profile.get(ENTRYPOINT_KEY)
+        if self._mode == EXEC_MODE and not self._entrypoint:
+            raise ValueError('Profile for ' + imagename + ' uses ' +
+                             EXEC_MODE + ' mode but sets no ' +
+                             ENTRYPOINT_KEY)
+        self._args = profile.get(ARGS_KEY, [])
+        self._limits = limits
+        self._name = CONTAINER_PREFIX + str(os.getpid()) + '_' +\
+            uuid.uuid4().hex[:8]
+        self._proc = None
+        self._cpuset = None
+
+    @property
+    def name(self):
+        """
+        Name of docker container
+        """
+        return self._name
+
+    def start(self):
+        """
+        Starts the container
+        """
+        if self._mode == EXEC_MODE:
+            entrypoint = KEEPALIVE_ENTRYPOINT
+            args = KEEPALIVE_ARGS
+        else:
+            entrypoint = self._entrypoint
+            args = self._args
+
+        # not run with --rm so docker can be asked if the OOM
+        # killer stopped it, removed by stop
+        cmd = ['docker', 'run', '-i',
+               '--name', self._name,
+               '-v', self._mountdir + ':' + self._mountdir]
+        if self._limits is not None:
+            cmd.extend(self._limits.pin(None).get_docker_options())
+        if entrypoint is not None:
+            cmd.extend(['--entrypoint', entrypoint])
+        cmd.append(self._imagename)
+        cmd.extend(args)
+        logger.info('Starting warm container: ' + ' '.join(cmd))
+        self._proc = subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                                      stdout=subprocess.PIPE,
+                                      universal_newlines=True)
+
+    def is_alive(self):
+        """
+        Checks if container process is still running
+
+        :return: True if running
+        :rtype: bool
+        """
+        return self._proc is not None and self._proc.poll() is None
+
+    def pin(self, cpuset):
+        """
+        Pins running container to cores
+
+        :param cpuset: list of cores
+        :raises ContainerError: if docker could not pin container
+        """
+        if cpuset == self._cpuset:
+            return
+        cores = ','.join(str(c) for c in cpuset)
+        try:
+            ecode = subprocess.call(['docker', 'update', '--cpuset-cpus',
+                                     cores, self._name],
+                                    stdout=subprocess.DEVNULL,
+                                    stderr=subprocess.DEVNULL,
+                                    timeout=REMOVE_TIMEOUT)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            raise ContainerError('Unable to pin container ' + self._name +
+                                 ' to cores ' + cores + ': ' + str(e))
+        if ecode != 0:
+            raise ContainerError('Unable to pin container ' + self._name +
+                                 ' to cores ' + cores)
+        self._cpuset = cpuset
+
+    def run(self, args, stdoutfile, cpuset=None):
+        """
+        Runs job in container
+
+        :param args: arguments for algorithm
+        :param stdoutfile: path to file, under mount directory, that
+                           receives standard out of algorithm
+        :param cpuset: list of cores job is pinned to or None
+        :raises ContainerError: if container died while running job
+        :return: (return code, stderr as bytes)
+        :rtype: tuple
+        """
+        if cpuset:
+            self.pin(cpuset)
+        if self._mode == EXEC_MODE:
+            return self._run_exec(args, stdoutfile)
+        return self._run_serve(args, stdoutfile)
+
+    def _run_exec(self, args, stdoutfile):
+        """
+        Runs job via docker exec
+        """
+        cmd = ['docker', 'exec', self._name, self._entrypoint]
+        cmd.extend(args)
+        logger.info('Running command: ' + ' '.join(cmd))
+        with open(stdoutfile, 'wb') as f:
+            p = subprocess.Popen(cmd, stdout=f, stderr=subprocess.PIPE)
+            out, err = p.communicate()
+        if not self.is_alive():
+            raise ContainerError('Container ' + self._name +
+                                 ' exited while running job')
+        return p.returncode, err
+
+    def _run_serve(self, args, stdoutfile):
+        """
+        Sends job to server in container over its standard in
+        """
+        job = {JOB_ARGS: args, JOB_STDOUT: stdoutfile}
+        try:
+            self._proc.stdin.write(json.dumps(job) + '\n')
+            self._proc.stdin.flush()
+            line = self._proc.stdout.readline()
+        except (IOError, OSError) as e:
+            raise ContainerError('Unable to talk to container ' +
+                                 self._name + ' : ' + str(e))
+        if line == '':
+            raise ContainerError('Container ' + self._name +
+                                 ' exited while running job')
+        resp = json.loads(line)
+        return resp[JOB_RETURNCODE], resp.get(JOB_STDERR, '').encode('utf-8')
+
+    def stop(self):
+        """
+        Stops container
+        """
+        if self._proc is None:
+            return
+        try:
+            self._proc.stdin.close()
+        except (IOError, OSError):
+            pass
+        # removed even if it exited as it is not run with --rm
+        _remove_containers([self._name])
+        self._proc.wait()
+        self._proc = None
+
+
+class ContainerPool(object):
+    """
+    Pool of warm containers for one docker image and resource
+    limits. Containers that have crashed are replaced the next
+    time they are handed out
+    """
+    def __init__(self, imagename, mountdir, profile, limits=None):
+        """
+        Constructor
+
+        :param imagename: docker image
+        :param mountdir: directory bind mounted into containers
+        :param profile: dict with mode, entrypoint, args, poolsize keys
+        :param limits: resources containers may use or None for no
+                       limits
+        :type limits: :py:class:`~commundetect_rest.resources.ResourceProfile`
+        """
+        self._imagename = imagename
+        self._mountdir = mountdir
+        self._profile = profile
+        self._limits = limits
+        self._idle = []
+        self._all = []
+        self._lock = threading.Lock()
+        self._available = threading.Semaphore(profile.get(POOLSIZE_KEY, 1))
+
+    def _new_container(self):
+        """
+        Creates and starts a container
+        """
+        container = WarmContainer(self._imagename, self._mountdir,
+                                  self._profile, limits=self._limits)
+        container.start()
+        return container
+
+    def _acquire(self):
+        """
+        Gets a running container, starting or respawning one if needed
+        """
+        self._available.acquire()
+        try:
+            with self._lock:
+                container = self._idle.pop() if self._idle else None
+                if container is not None and not container.is_alive():
+                    logger.warning('Warm container ' + container.name +
+                                   ' died, respawning')
+                    self._all.remove(container)
+                    container.stop()
+                    container = None
+                if container is None:
+                    container = self._new_container()
+                    self._all.append(container)
+            return container
+        except Exception:
+            self._available.release()
+            raise
+
+    def _release(self, container):
+        """
+        Returns container to pool
+        """
+        with self._lock:
+            self._idle.append(container)
+        self._available.release()
+
+    def _run_job(self, container, args, stdoutfile, cpuset):
+        """
+        Runs job on container
+
+        :return: (return code, stderr as bytes, True if container
+                  was killed by the OOM killer)
+        :rtype: tuple
+        """
+        failed = False
+        try:
+            ecode, err = container.run(args, stdoutfile, cpuset=cpuset)
+        except (ContainerError, ValueError) as e:
+            logger.error('Warm container ' + container.name +
+                         ' failed: ' + str(e))
+            ecode, err = -1, str(e).encode('utf-8')
+            failed = True
+        except BaseException:
+            # job was interrupted, such as by time limit of task,
+            # and may still be running in container
+            logger.error('Stopping warm container ' + container.name +
+                         ' of interrupted job')
+            container.stop()
+            raise
+        oomkilled = False
+        if ecode != 0 and self._limits is not None and\
+                self._limits.memory is not None:
+            oomkilled = is_oom_killed(container.name)
+        if failed or oomkilled:
+            # container is in an unknown state, or stays flagged as
+            # killed by the OOM killer, so stop it and let the next
+            # job get a fresh one
+            container.stop()
+        return ecode, err, oomkilled
+
+    def run(self, args, stdoutfile, cpuset=None):
+        """
+        Runs job on a container from the pool
+
+        :param args: arguments for algorithm
+        :param stdoutfile: path to file, under mount directory,
+                           to write standard out to
+        :param cpuset: list of cores job is pinned to or None
+        :raises OutOfMemoryError: if job was killed for using more
+                                  than the memory limit of pool
+        :return: (return code, stderr as bytes)
+        :rtype: tuple
+        """
+        container = self._acquire()
+        try:
+            ecode, err, oomkilled = self._run_job(container, args,
+                                                  stdoutfile, cpuset)
+        finally:
+            self._release(container)
+        if self._limits is not None:
+            self._limits.check_oom_killed(oomkilled)
+        return ecode, err
+
+    def shutdown(self):
+        """
+        Stops all containers in pool
+        """
+        with self._lock:
+            for container in self._all:
+                container.stop()
+            self._all = []
+            self._idle = []
+
+
+def get_job_container_name(taskid):
+    """
+    Gets name of container running job of task
+
+    :param taskid: id of task
+    :return: name
+    :rtype: str
+    """
+    return CONTAINER_PREFIX + 'job_' + taskid
+
+
+def get_job_run_options(taskid):
+    """
+    Gets docker run options that name and label container after
+    task of job, so it can be stopped if job is cancelled. The
+    container is kept once it exits, so docker can be asked how
+    it exited, and is removed by :py:func:`remove_job_container`
+
+    :param taskid: id of task
+    :return: options
+    :rtype: list
+    """
+    return ['--name', get_job_container_name(taskid),
+            '--label', TASK_LABEL + '=' + taskid]
+
+
+def is_oom_killed(name):
+    """
+    Asks docker if container was killed by the OOM killer, must
+    be asked before container is removed
+
+    :param name: name of container
+    :return: True if container was killed by the OOM killer,
+             False if not or if docker could not be asked
+    :rtype: bool
+    """
+    try:
+        out = subprocess.check_output(
+            ['docker', 'inspect', '--format', '{{.State.OOMKilled}}',
+             name], stderr=subprocess.DEVNULL, timeout=REMOVE_TIMEOUT)
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.error('Unable to inspect container ' + name + ': ' + str(e))
+        return False
+    return out.decode('utf-8').strip() == 'true'
+
+
+def _remove_containers(names):
+    """
+    Force removes containers, killing them if running
+    """
+    try:
+        subprocess.call(['docker', 'rm', '-f'] + names,
+                        stdout=subprocess.DEVNULL,
+                        stderr=subprocess.DEVNULL,
+                        timeout=REMOVE_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.error('Unable to remove containers ' + ' '.join(names) +
+                     ': ' + str(e))
+
+
+def stop_job_container(taskid):
+    """
+    Stops container running job of task, does nothing if there
+    is no such container
+
+    :param taskid: id of task
+    """
+    logger.info('Stopping container of task ' + taskid)
+    _remove_containers([get_job_container_name(taskid)])
+
+
+def remove_job_container(taskid):
+    """
+    Removes container of job of task once it has exited
+
+    :param taskid: id of task
+    """
+    _remove_containers([get_job_container_name(taskid)])
+
+
+def stop_process_containers(pid):
+    """
+    Stops warm containers started by a worker process, used when
+    the process was killed and could not stop them itself
+
+    :param pid: id of worker process
+    """
+    try:
+        out = subprocess.check_output(
+            ['docker', 'ps', '-aq', '--filter',
+             'name=' + CONTAINER_PREFIX + str(pid) + '_'],
+            stderr=subprocess.DEVNULL, timeout=REMOVE_TIMEOUT)
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.error('Unable to list containers of process ' + str(pid) +
+                     ': ' + str(e))
+        return
+    ids = out.decode('utf-8').split()
+    if len(ids) > 0:
+        logger.info('Stopping warm containers of process ' + str(pid))
+        _remove_containers(ids)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_container_pool(imagename, mountdir, profile, limits=None):
+    """
+    Gets pool of warm containers for image, mount directory and
+    resource limits creating it if needed. Pools live for the life
+    of the process
+
+    :param imagename: docker image
+    :param mountdir: directory to bind mount
+    :param profile: dict with mode, entrypoint, args, poolsize keys
+    :param limits: resources containers may use or None for no
+                   limits, cores job is pinned to do not matter
+    :type limits: :py:class:`~commundetect_rest.resources.ResourceProfile`
+    :return: pool
+    :rtype: :py:class:`ContainerPool`
+    """
+    if limits is not None:
+        limits = limits.pin(None)
+        key = (imagename, mountdir, tuple(limits.get_docker_options()))
+    else:
+        key = (imagename, mountdir, ())
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ContainerPool(imagename, mountdir, profile,
+                                        limits=limits)
+        return _pools[key]
+
+
+@atexit.register
+def shutdown_container_pools():
+    """
+    Stops all warm containers
+    """
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.shutdown()
+        _pools.clear()
@@ -0,0 +1,321 @@
+
+import os
+import json
+import logging
+from collections import deque
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# predicted seconds for each algorithm, see DEFAULT_COST_MODEL
+COST_MODEL_KEY = 'COST_MODEL'
+
+# file workers append run times of finished jobs to, the REST
+# service fits the cost model to them when it starts. None to
+# not record run times
+RUN_TIMES_FILE_KEY = 'RUN_TIMES_FILE'
+
+# jobs predicted to take more seconds than this are rejected,
+# None to accept any job
+MAX_JOB_COST_KEY = 'MAX_JOB_COST'
+
+# soft time limit of job is predicted seconds times this factor,
+# at least MIN_TIME_LIMIT seconds
+TIME_LIMIT_FACTOR_KEY = 'TIME_LIMIT_FACTOR'
+MIN_TIME_LIMIT_KEY = 'MIN_TIME_LIMIT'
+
+# seconds job has after soft time limit to clean up before
+# it is killed
+TIME_LIMIT_GRACE_KEY = 'TIME_LIMIT_GRACE'
+
+# seconds a queued job is kept before it is revoked if no worker
+# has taken it, None to derive it from MAX_QUEUE_WAIT and the time
+# limit of the job, see get_expires
+TASK_EXPIRES_KEY = 'TASK_EXPIRES'
+
+# fewest seconds a queued job is kept
+MIN_TASK_EXPIRES = 120
+
+# keys in cost model of algorithm
+BASE_KEY = 'base'
+PER_EDGE_KEY = 'peredge'
+PER_NODE_KEY = 'pernode'
+
+# cost model used for algorithms not in cost model
+DEFAULT_ALGORITHM = '*'
+
+DEFAULT_COST_MODEL = {DEFAULT_ALGORITHM: {BASE_KEY: 5.0,
+                                          PER_EDGE_KEY: 2e-5,
+                                          PER_NODE_KEY: 0.0}}
+
+# keys of run time record and cost info passed to task
+ALGORITHM_KEY = 'algorithm'
+NODES_KEY = 'nodes'
+EDGES_KEY = 'edges'
+SECONDS_KEY = 'seconds'
+PREDICTED_KEY = 'predicted'
+
+# set in run time record of job stopped by its time limit, its
+# seconds are a lower bound of how long it would have taken
+TIMED_OUT_KEY = 'timedout'
+
+# fewest run times of an algorithm needed to fit its cost model
+MIN_CALIBRATION_RUNS = 10
+
+# most recent run times used to fit cost model
+MAX_CALIBRATION_RUNS = 10000
+
+# times cost model is fit again with run times of timed out
+# jobs raised to what the previous fit predicts for them
+CENSORED_FIT_ROUNDS = 5
+
+
+class CostLimitError(Exception):
+    """
+    Raised when a job is predicted to cost more than allowed
+    """
+    pass
+
+
+class CostModel(object):
+    """
+    Predicts seconds a job takes as a linear function of
+    number of edges and nodes in input graph for each algorithm
+    """
+    def __init__(self, model=None):
+        """
+        Constructor
+
+        :param model: dict of algorithm name to dict with
+                      :py:const:`BASE_KEY`, :py:const:`PER_EDGE_KEY`
+                      and :py:const:`PER_NODE_KEY` coefficients, see
+                      :py:const:`DEFAULT_COST_MODEL`
+        """
+        self._model = dict(DEFAULT_COST_MODEL)
+        if model is not None:
+            self._model.update(model)
+
+    def get_coefficients(self, algorithm):
+        """
+        Gets coefficients for algorithm
+
+        :param algorithm: name of algorithm
+        :return: coefficients
+        :rtype: dict
+        """
+        return self._model.get(algorithm, self._model[DEFAULT_ALGORITHM])
+
+    def predict(self, algorithm, nodes, edges):
+        """
+        Predicts seconds a job takes
+
+        :param algorithm: name of algorithm
+        :param nodes: number of nodes in input graph
+        :param edges: number of edges in input graph
+        :return: seconds
+        :rtype: float
+        """
+        coef = self.get_coefficients(algorithm)
+        return coef.get(BASE_KEY, 0.0) +\
+            coef.get(PER_EDGE_KEY, 0.0) * edges +\
+            coef.get(PER_NODE_KEY, 0.0) * nodes
+
+    def calibrate(self, runtimes, minruns=MIN_CALIBRATION_RUNS):
+        """
+        Fits coefficients of each algorithm with at least minruns
+        recorded run times by least squares, negative coefficients
+        are set to zero. Run times of jobs that timed out are only
+        lower bounds, so they are fit as the larger of their run
+        time and the prediction of a fit to jobs that finished,
+        refined :py:const:`CENSORED_FIT_ROUNDS` times
+
+        :param runtimes: list of run time records, see
+                         :py:func:`record_run_time`
+        :param minruns: fewest run times needed to fit an algorithm
+        :return: names of algorithms that were fit
+        :rtype: list
+        """
+        byalgo = {}
+        for run in runtimes:
+            byalgo.setdefault(run[ALGORITHM_KEY], []).append(run)
+
+        fitted = []
+        for algorithm, runs in byalgo.items():
+            if len(runs) < minruns:
+                continue
+            a = np.array([[1.0, run[EDGES_KEY], run[NODES_KEY]]
+                          for run in runs], dtype=float)
+            b = np.array([run[SECONDS_KEY] for run in runs], dtype=float)
+            timedout = np.array([bool(run.get(TIMED_OUT_KEY))
+                                 for run in runs])
+            # first fit to jobs that finished, if there are enough
+            finished = ~timedout
+            if np.count_nonzero(finished) < a.shape[1]:
+                finished[:] = True
+            coef = np.maximum(np.linalg.lstsq(a[finished], b[finished],
+                                              rcond=None)[0], 0.0)
+            if timedout.any():
+                for x in range(CENSORED_FIT_ROUNDS):
+                    target = np.where(timedout,
+                                      np.maximum(b, a.dot(coef)), b)
+                    coef = np.maximum(np.linalg.lstsq(a, target,
+                                                      rcond=None)[0], 0.0)
+            self._model[algorithm] = {BASE_KEY: float(coef[0]),
+                                      PER_EDGE_KEY: float(coef[1]),
+                                      PER_NODE_KEY: float(coef[2])}
+            logger.info('Fit cost model of ' + algorithm + ' to ' +
+                        str(len(runs)) + ' run times: ' +
+                        str(self._model[algorithm]))
+            fitted.append(algorithm)
+        return fitted
+
+
+def get_time_limits(predicted, factor=4.0, mintime=30, grace=30):
+    """
+    Gets time limits for a job
+
+    :param predicted: predicted seconds job takes
+    :param factor: soft limit is predicted times this
+    :param mintime: shortest soft limit
+    :param grace: seconds between soft and hard limit
+    :return: (soft time limit, hard time limit) in seconds
+    :rtype: tuple
+    """
+    soft = int(max(mintime, predicted * factor))
+    return soft, soft + int(grace)
+
+
+def get_expires(maxwait, timelimit, mintime=MIN_TASK_EXPIRES):
+    """
+    Gets seconds a job is kept in queue before it is revoked. Jobs
+    are admitted while estimated wait of their queue is up to
+    maxwait, which is an estimate and jobs ahead in the same size
+    class can each overrun it by up to about the time limit of
+    this job, so job is kept twice maxwait plus its time limit
+
+    :param maxwait: most seconds a job may wait when admitted or
+                    None if any wait is accepted
+    :param timelimit: hard time limit of job in seconds
+    :param mintime: fewest seconds job is kept
+    :return: seconds or None to never revoke job
+    :rtype: int
+    """
+    if maxwait is None:
+        return None
+    return int(max(mintime, 2 * maxwait + timelimit))
+
+
+def check_cost(predicted, maxcost):
+    """
+    Checks job is not predicted to cost too much
+
+    :param predicted: predicted seconds job takes
+    :param maxcost: most seconds allowed or None for no limit
+    :raises CostLimitError: if predicted is above maxcost
+    """
+    if maxcost is not None and predicted > maxcost:
+        raise CostLimitError('Graph is predicted to take ' +
+                             str(int(predicted)) + ' seconds to process '
+                             'which is more than the ' + str(maxcost) +
+                             ' seconds allowed')
+
+
+def get_cost_info(nodes, edges, predicted):
+    """
+    Gets cost info passed to task so it can record its run time
+
+    :param nodes: number of nodes in input graph
+    :param edges: number of edges in input graph
+    :param predicted: predicted seconds job takes
+    :return: cost info
+    :rtype: dict
+    """
+    return {NODES_KEY: nodes, EDGES_KEY: edges, PREDICTED_KEY: predicted}
+
+
+def set_graph_size(costinfo, nodes, edges):
+    """
+    Sets size of input graph in cost info to its exact size as
+    read by worker, REST service only counts nodes of large
+    graphs up to a limit
+
+    :param costinfo: cost info from :py:func:`get_cost_info` or None
+    :param nodes: number of nodes in input graph
+    :param edges: number of edges in input graph
+    """
+    if costinfo is None:
+        return
+    costinfo[NODES_KEY] = int(nodes)
+    costinfo[EDGES_KEY] = int(edges)
+
+
+def record_run_time(path, algorithm, costinfo, seconds, timedout=False):
+    """
+    Appends run time of job to run times file
+
+    :param path: run times file, if None nothing is recorded
+    :param algorithm: name of algorithm
+    :param costinfo: cost info from :py:func:`get_cost_info`
+    :param seconds: seconds job took
+    :param timedout: True if job was stopped by its time limit
+                     so it would have taken longer
+    """
+    if path is None or costinfo is None:
+        return
+    record = {ALGORITHM_KEY: algorithm,
+              NODES_KEY: costinfo[NODES_KEY],
+              EDGES_KEY: costinfo[EDGES_KEY],
+              SECONDS_KEY: seconds}
+    if timedout is True:
+        record[TIMED_OUT_KEY] = True
+    try:
+        # one write of a short line so lines from
+        # concurrent workers do not interleave
+        with open(path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+    except OSError as e:
+        logger.error('Unable to record run time in ' + path + ': ' +
+                     str(e))
+
+
+def load_run_times(path, maxruns=MAX_CALIBRATION_RUNS):
+    """
+    Loads most recent run times from run times file
+
+    :param path: run times file
+    :param maxruns: most run times to load
+    :return: run time records, empty if file does not exist
+    :rtype: list
+    """
+    if path is None or not os.path.isfile(path):
+        return []
+    runtimes = deque(maxlen=maxruns)
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                run = json.loads(line)
+                float(run[SECONDS_KEY])
+            except (ValueError, KeyError, TypeError):
+                logger.warning('Skipping invalid run time: ' + line)
+                continue
+            runtimes.append(run)
+    return list(runtimes)
+
+
+def create_cost_model(model, runtimesfile):
+    """
+    Creates cost model fit to recorded run times
+
+    :param model: cost model from configuration
+    :param runtimesfile: run times file or None
+    :return: cost model
+    :rtype: :py:class:`CostModel`
+    """
+    costmodel = CostModel(model)
+    try:
+        costmodel.calibrate(load_run_times(runtimesfile))
+    except Exception:
+        logger.exception('Unable to fit cost model to run times in ' +
+                         str(runtimesfile))
+    return costmodel
@@ -0,0 +1,189 @@
+
+import json
+import uuid
+import zlib
+import logging
+
+from commundetect_rest.results import EDGE_SEP
+
+logger = logging.getLogger(__name__)
+
+# characters of result sent per chunk
+CHUNK_SIZE = 256 * 1024
+
+GZIP_ENCODING = 'gzip'
+DEFLATE_ENCODING = 'deflate'
+
+# preferred first when client accepts both equally
+ENCODINGS = [GZIP_ENCODING, DEFLATE_ENCODING]
+
+COMPRESS_LEVEL = 6
+
+# keys added to result when a page of edges is requested
+OFFSET_KEY = 'offset'
+COUNT_KEY = 'count'
+TOTAL_KEY = 'total'
+
+
+def select_encoding(acceptencoding):
+    """
+    Picks content encoding for response from Accept-Encoding header
+
+    :param acceptencoding: value of Accept-Encoding header or None
+    :return: :py:const:`GZIP_ENCODING`, :py:const:`DEFLATE_ENCODING`
+             or None to send uncompressed
+    :rtype: str
+    """
+    if not acceptencoding:
+        return None
+    qualities = {}
+    for part in acceptencoding.split(','):
+        fields = part.strip().split(';')
+        name = fields[0].strip().lower()
+        quality = 1.0
+        for param in fields[1:]:
+            key, sep, val = param.strip().partition('=')
+            if key.strip() == 'q':
+                try:
+                    quality = float(val)
+                except ValueError:
+                    quality = 0.0
+        qualities[name] = quality
+
+    best = None
+    bestquality = 0.0
+    for encoding in ENCODINGS:
+        quality = qualities.get(encoding, qualities.get('*', 0.0))
+        if quality > bestquality:
+            best = encoding
+            bestquality = quality
+    return best
+
+
+def count_edges(text):
+    """
+    Counts edges in result
+
+    :param text: result as ``src,dst,type;`` edges
+    :return: number of edges
+    :rtype: int
+    """
+    return text.count(EDGE_SEP)
+
+
+def iter_text(text, chunksize=CHUNK_SIZE):
+    """
+    Splits text into chunks
+
+    :param text: text
+    :param chunksize: characters per chunk
+    :return: generator of str
+    """
+    for pos in range(0, len(text), chunksize):
+        yield text[pos:pos + chunksize]
+
+
+def _after_nth_sep(chunk, n):
+    """
+    Gets index just past the nth edge separator in chunk
+
+    :param chunk: text
+    :param n: number of separators, must be at most number in chunk
+    :return: index
+    :rtype: int
+    """
+    pos = -1
+    for x in range(n):
+        pos = chunk.find(EDGE_SEP, pos + 1)
+    return pos + 1
+
+
+def iter_edges(chunks, offset=0, limit=None):
+    """
+    Gets edges offset to offset + limit of result given as chunks
+    of text, without joining the chunks
+
+    :param chunks: iterable of str holding ``src,dst,type;`` edges
+    :param offset: number of edges to skip
+    :param limit: most edges to return or None for all
+    :return: generator of str
+    """
+    seen = 0
+    end = None if limit is None else offset + limit
+    for chunk in chunks:
+        nseps = chunk.count(EDGE_SEP)
+        start = 0
+        if seen < offset:
+            if offset - seen > nseps:
+                seen += nseps
+                continue
+            start = _after_nth_sep(chunk, offset - seen)
+        stop = len(chunk)
+        finished = False
+        if end is not None and end - seen <= nseps:
+            stop = _after_nth_sep(chunk, end - seen)
+            finished = True
+        if stop > start:
+            yield chunk[start:stop]
+        if finished:
+            return
+        seen += nseps
+
+
+def iter_json(resultdict, resultkey, chunks):
+    """
+    Serializes dict as JSON with value of resultkey given as chunks
+    of text so the value is never held as one string. Output is the
+    same as :py:func:`json.dumps` with sorted keys and no whitespace
+
+    :param resultdict: dict to serialize, value of resultkey is ignored
+    :param resultkey: key whose value is the text in chunks
+    :param chunks: iterable of str
+    :return: generator of str
+    """
+    placeholder = uuid.uuid4().hex
+    meta = dict(resultdict)
+    meta[resultkey] = placeholder
+    prefix, suffix = json.dumps(meta, sort_keys=True,
+                                separators=(',', ':')).split(
+        '"' + placeholder + '"')
+    yield prefix + '"'
+    for chunk in chunks:
+        yield json.dumps(chunk)[1:-1]
+    yield '"' + suffix
+
+
+def encode(chunks):
+    """
+    Encodes chunks of text as utf-8
+
+    :param chunks: iterable of str
+    :return: generator of bytes
+    """
+    for chunk in chunks:
+        yield chunk.encode('utf-8')
+
+
+def compress(chunks, encoding, level=COMPRESS_LEVEL):
+    """
+    Compresses chunks of text as a stream
+
+    :param chunks: iterable of str
+    :param encoding: :py:const:`GZIP_ENCODING` or
+                     :py:const:`DEFLATE_ENCODING`
+    :param level: compression level
+    :raises ValueError: if encoding is not supported
+    :return: generator of bytes
+    """
+    if encoding == GZIP_ENCODING:
+        wbits = 16 + zlib.MAX_WBITS
+    elif encoding == DEFLATE_ENCODING:
+        wbits = zlib.MAX_WBITS
+    else:
+        raise ValueError('Unsupported encoding: ' + str(encoding))
+    compressor = zlib.compressobj(level, zlib.DEFLATED, wbits)
+    for chunk in encode(chunks):
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,839 @@
+
+import io
+import os
+import re
+import mmap
+import struct
+import zipfile
+import itertools
+import logging
+import warnings
+from contextlib import closing
+from contextlib import contextmanager
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# This module only needs numpy so it is also copied into the
+# algorithm docker images, see algorithmdockers/louvain/Dockerfile
+
+# lines starting with this are skipped
+COMMENT = b'#'
+
+# matches comment lines so they can be blanked before parsing
+COMMENT_LINE_RE = re.compile(rb'^[ \t]*#[^\n]*', re.MULTILINE)
+
+# matches from first character of first row that is not blank
+FIRST_ROW_RE = re.compile(rb'\S[^\n]*')
+
+# matches a character that cannot be part of a number
+NOT_NUMBER_RE = re.compile(rb'[^0-9eE.+\-\s]')
+
+# matches a row whose source or target node id is not written
+# the way an integer is printed, such as 007, +7, -0, 7.0 or 7e0,
+# node ids are then kept as labels so they are given back as sent
+NOT_PLAIN_ID_RE = re.compile(rb'^[ \t]*(?:\S+[ \t]+)?'
+                             rb'(?:\+|-?0\d|-0(?!\S)|\S*[.eE])',
+                             re.MULTILINE)
+
+# columns in an unweighted and a weighted edge list
+UNWEIGHTED_COLUMNS = 2
+WEIGHTED_COLUMNS = 3
+
+# bytes of text parsed at a time
+CHUNK_SIZE = 4 * 1024 * 1024
+
+# first bytes of a .npz file, which is a zip archive of .npy files
+NPZ_MAGIC = b'PK\x03\x04'
+
+# arrays in a binary edge list, either src and dst with optional
+# weight, or a CSR adjacency of indptr and indices with optional
+# data holding weights. Both can have nodeids, then src, dst, the
+# rows and indices are positions in nodeids, otherwise they are
+# node ids, rows of a CSR adjacency are nodes 0..n-1
+SRC_ARRAY = 'src'
+DST_ARRAY = 'dst'
+WEIGHT_ARRAY = 'weight'
+INDPTR_ARRAY = 'indptr'
+INDICES_ARRAY = 'indices'
+DATA_ARRAY = 'data'
+NODEIDS_ARRAY = 'nodeids'
+
+# size of fixed part of local file header in a zip archive
+# and offset of its file name and extra field lengths
+ZIP_LOCAL_HEADER_SIZE = 30
+ZIP_NAME_LENGTHS_OFFSET = 26
+
+# rows of binary edge list formatted as text at a time
+WRITE_CHUNK_ROWS = 65536
+
+# node ids up to this value are exact when parsed as float64
+MAX_EXACT_ID = 2 ** 53
+
+
+
+class EdgeListError(ValueError):
+    """
+    Raised when an edge list cannot be read
+    """
+    pass
+
+
+class EdgeList(object):
+    """
+    Edges of a graph as NumPy arrays. Nodes are interned as
+    compact ids 0..n-1, :py:attr:`nodeids` maps a compact id back
+    to the original id. Arrays may be memory mapped read only
+    """
+    def __init__(self, src, dst, nodeids, weight=None):
+        """
+        Constructor
+
+        :param src: compact id of source node of each edge
+        :type src: :py:class:`numpy.ndarray`
+        :param dst: compact id of target node of each edge
+        :type dst: :py:class:`numpy.ndarray`
+        :param nodeids: original id of each compact id, integers or,
+                    if any node id is not an integer, labels
+        :type nodeids: :py:class:`numpy.ndarray`
+        :param weight: weight of each edge or None if unweighted
+        :type weight: :py:class:`numpy.ndarray`
+        """
+        self.src = src
+        self.dst = dst
+        self.nodeids = nodeids
+        self.weight = weight
+
+    @property
+    def edges(self):
+        """
+        Number of edges
+        """
+        return len(self.src)
+
+    @property
+    def nodes(self):
+        """
+        Number of distinct nodes
+        """
+        return len(self.nodeids)
+
+    @property
+    def weighted(self):
+        """
+        True if edges have weights
+        """
+        return self.weight is not None
+
+    @property
+    def exact(self):
+        """
+        Always True, :py:attr:`nodes` is the number of distinct
+        nodes, same as
+        :py:attr:`~commundetect_rest.routing.GraphCounter.exact`
+        """
+        return True
+
+    @property
+    def minid(self):
+        """
+        Smallest original node id or None if there are no
+        edges or node ids are labels
+        """
+        if self.nodes == 0 or not np.issubdtype(self.nodeids.dtype,
+                                                np.integer):
+            return None
+        return int(self.nodeids.min())
+
+    def get_edges(self):
+        """
+        Gets edges as compact id pairs
+
+        :return: array of shape (edges, 2)
+        :rtype: :py:class:`numpy.ndarray`
+        """
+        return np.column_stack((self.src, self.dst))
+
+
+class ArrayBuilder(object):
+    """
+    Appends values to a preallocated array that grows by half
+    when full, so an array of unknown final length is built
+    without keeping a list of parts
+    """
+    def __init__(self, dtype, capacity=0):
+        """
+        Constructor
+
+        :param dtype: type of values
+        :param capacity: values to make room for up front
+        """
+        self._arr = np.empty(max(0, capacity), dtype=dtype)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, values):
+        """
+        Appends values
+
+        :param values: 1 dimensional array
+        """
+        end = self._size + len(values)
+        if end > len(self._arr):
+            self._arr.resize(max(end, len(self._arr) * 3 // 2),
+                             refcheck=False)
+        self._arr[self._size:end] = values
+        self._size = end
+
+    def finish(self):
+        """
+        Gets array of values appended, spare room is let go of
+
+        :return: array
+        :rtype: :py:class:`numpy.ndarray`
+        """
+        if len(self._arr) != self._size:
+            self._arr.resize(self._size, refcheck=False)
+        return self._arr
+
+
+def iter_chunks(fileobj, chunksize=CHUNK_SIZE):
+    """
+    Reads file in chunks of about chunksize bytes that each
+    end at the end of a line, so no line is split across chunks
+
+    :param fileobj: binary file object or :py:class:`mmap.mmap`
+    :param chunksize: bytes to read at a time
+    :return: generator of bytes
+    """
+    partial = b''
+    while True:
+        buf = fileobj.read(chunksize)
+        if not buf:
+            break
+        if partial:
+            buf = partial + buf
+        end = buf.rfind(b'\n') + 1
+        if end == 0:
+            partial = buf
+            continue
+        partial = buf[end:]
+        yield buf[:end]
+    if partial:
+        yield partial
+
+
+def count_lines(fileobj, chunksize=CHUNK_SIZE):
+    """
+    Counts lines of file from where it is positioned, a last
+    line without a newline counts too
+
+    :param fileobj: binary file object or :py:class:`mmap.mmap`
+    :param chunksize: bytes to read at a time
+    :return: number of lines
+    :rtype: int
+    """
+    lines = 0
+    last = b''
+    while True:
+        buf = fileobj.read(chunksize)
+        if not buf:
+            break
+        lines += buf.count(b'\n')
+        last = buf
+    if last and not last.endswith(b'\n'):
+        lines += 1
+    return lines
+
+
+@contextmanager
+def open_mapped(path):
+    """
+    Memory maps file for reading, pages of file are read by the
+    operating system as they are used and are not counted as
+    memory of this process
+
+    :param path: path to file
+    :return: :py:class:`mmap.mmap` or, if file is empty, an
+             empty file object
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield io.BytesIO(b'')
+            return
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield mapped
+        finally:
+            mapped.close()
+
+
+def _get_columns(data):
+    """
+    Gets number of columns on first line that is not blank,
+    comment lines must already be removed
+    """
+    match = FIRST_ROW_RE.search(data)
+    if match is None:
+        return 0
+    return len(match.group(0).split())
+
+
+def _compact_dtype(n):
+    """
+    Gets smallest integer type holding ids 0..n-1
+    """
+    if n <= np.iinfo(np.int32).max:
+        return np.int32
+    return np.int64
+
+
+def parse_numbers(data, dtype=np.float64):
+    """
+    Parses whitespace delimited numbers in a single NumPy call
+
+    :param data: numbers
+    :type data: bytes
+    :param dtype: type of numbers
+    :raises EdgeListError: if a value is not a number of dtype
+    :return: 1 dimensional array
+    :rtype: :py:class:`numpy.ndarray`
+    """
+    # checked up front as numpy before 2.0 only warns when text
+    # is not a number, later versions raise ValueError
+    if NOT_NUMBER_RE.search(data) is not None:
+        raise EdgeListError('Found a value that is not a number')
+    if FIRST_ROW_RE.search(data) is None:
+        # numpy parses blank text as -1
+        return np.empty(0, dtype=dtype)
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', DeprecationWarning)
+        try:
+            return np.fromstring(data, dtype=dtype, sep=' ')
+        except (DeprecationWarning, ValueError):
+            raise EdgeListError('Found a value that is not a number')
+
+
+def _parse_chunk(data, ncols):
+    """
+    Parses chunk of whole rows of edge list whose node ids are
+    integers written plainly
+
+    :return: (source ids, target ids, weights or None) or None
+             if a node id is not an integer or is written in
+             another way, such as 007, so it would not be given
+             back as it was written
+    """
+    if NOT_PLAIN_ID_RE.search(data) is not None:
+        return None
+    try:
+        values = parse_numbers(data)
+    except EdgeListError:
+        return None
+    if values.size % ncols != 0:
+        raise EdgeListError('Expected ' + str(ncols) +
+                            ' columns on every row of edge list')
+    values = values.reshape(-1, ncols)
+    ends = values[:, :UNWEIGHTED_COLUMNS]
+    if len(ends) > 0 and (not np.array_equal(ends, np.trunc(ends)) or
+                          np.abs(ends).max() > MAX_EXACT_ID):
+        return None
+    weight = None
+    if ncols == WEIGHTED_COLUMNS:
+        weight = values[:, UNWEIGHTED_COLUMNS]
+    return ends[:, 0], ends[:, 1], weight
+
+
+def _parse_label_chunk(data, ncols):
+    """
+    Parses chunk of whole rows of edge list whose node ids
+    are labels. Labels are interned within the chunk so only
+    its distinct labels are kept
+
+    :return: (distinct labels, position in distinct labels of
+              source then target of each row, weights or None)
+    """
+    tokens = data.split()
+    if len(tokens) % ncols != 0:
+        raise EdgeListError('Expected ' + str(ncols) +
+                            ' columns on every row of edge list')
+    labels = np.array(tokens[0::ncols] + tokens[1::ncols], dtype=np.bytes_)
+    weight = None
+    if ncols == WEIGHTED_COLUMNS:
+        weight = parse_numbers(b' '.join(tokens[UNWEIGHTED_COLUMNS::ncols]))
+    del tokens
+    table, inverse = np.unique(labels, return_inverse=True)
+    return table, inverse, weight
+
+
+class _LabelTable(object):
+    """
+    Interns node labels of an edge list chunk by chunk. Each
+    chunk adds its distinct labels to a list of arrays and its
+    rows as positions in those, once all chunks are read the
+    arrays are merged into one sorted table of distinct labels
+    """
+    def __init__(self, capacity=0):
+        self._tables = []
+        self._size = 0
+        self._src = ArrayBuilder(np.int64, capacity)
+        self._dst = ArrayBuilder(np.int64, capacity)
+
+    def __len__(self):
+        return len(self._src)
+
+    def add(self, table, inverse):
+        """
+        Adds chunk
+
+        :param table: distinct labels of chunk
+        :param inverse: position in table of source of each row
+                        followed by target of each row
+        """
+        nrows = len(inverse) // 2
+        self._src.append(inverse[:nrows] + self._size)
+        self._dst.append(inverse[nrows:] + self._size)
+        self._tables.append(table)
+        self._size += len(table)
+
+    def finish(self):
+        """
+        Gets edges
+
+        :return: (source ids, target ids, labels) where ids are
+                 positions in labels
+        """
+        tables = self._tables
+        self._tables = []
+        if len(tables) == 0:
+            empty = np.empty(0, dtype=np.int32)
+            return empty, empty, np.empty(0, dtype=np.bytes_)
+        labels, merged = np.unique(np.concatenate(tables),
+                                   return_inverse=True)
+        del tables
+        merged = merged.astype(_compact_dtype(len(labels)))
+        return merged[self._src.finish()], merged[self._dst.finish()],\
+            labels
+
+
+def _iter_rows(chunks):
+    """
+    Removes comment lines from chunks and gets number of
+    columns from first row
+
+    :raises EdgeListError: if number of columns is not valid
+    :return: generator of (chunk, number of columns)
+    """
+    ncols = 0
+    for data in chunks:
+        if COMMENT in data:
+            data = COMMENT_LINE_RE.sub(b'', data)
+        if ncols == 0:
+            ncols = _get_columns(data)
+            if ncols == 0:
+                continue
+            if ncols not in (UNWEIGHTED_COLUMNS, WEIGHTED_COLUMNS):
+                raise EdgeListError('Expected ' + str(UNWEIGHTED_COLUMNS) +
+                                    ' or ' + str(WEIGHTED_COLUMNS) +
+                                    ' columns in edge list, found ' +
+                                    str(ncols))
+        yield data, ncols
+
+
+def _read_integers(chunks, capacity=0):
+    """
+    Parses edge list whose node ids are integers into
+    preallocated arrays
+
+    :return: edges or None if a node id is not an integer
+    :rtype: :py:class:`EdgeList`
+    """
+    src = ArrayBuilder(np.int64, capacity)
+    dst = ArrayBuilder(np.int64, capacity)
+    weight = None
+    for data, ncols in _iter_rows(chunks):
+        parsed = _parse_chunk(data, ncols)
+        if parsed is None:
+            return None
+        chunksrc, chunkdst, chunkweight = parsed
+        src.append(chunksrc)
+        dst.append(chunkdst)
+        if chunkweight is not None:
+            if weight is None:
+                weight = ArrayBuilder(np.float64, capacity)
+            weight.append(chunkweight)
+
+    if weight is not None:
+        weight = weight.finish()
+    nedges = len(src)
+    ends = np.concatenate((src.finish(), dst.finish()))
+    del src
+    del dst
+    nodeids, inverse = np.unique(ends, return_inverse=True)
+    del ends
+    inverse = inverse.astype(_compact_dtype(len(nodeids)))
+    return EdgeList(inverse[:nedges], inverse[nedges:], nodeids,
+                    weight=weight)
+
+
+def _read_labels(chunks, capacity=0):
+    """
+    Parses edge list keeping node ids as the labels they
+    are written as
+
+    :return: edges
+    :rtype: :py:class:`EdgeList`
+    """
+    labeltable = _LabelTable(capacity)
+    weight = None
+    for data, ncols in _iter_rows(chunks):
+        table, inverse, chunkweight = _parse_label_chunk(data, ncols)
+        labeltable.add(table, inverse)
+        if chunkweight is not None:
+            if weight is None:
+                weight = ArrayBuilder(np.float64, capacity)
+            weight.append(chunkweight)
+
+    if weight is not None:
+        weight = weight.finish()
+    src, dst, nodeids = labeltable.finish()
+    return EdgeList(src, dst, nodeids, weight=weight)
+
+
+def _read_chunks(open_chunks, capacity=0):
+    """
+    Parses edge list chunk by chunk so only one chunk of text
+    is held at a time. Node ids are parsed as numbers, if one
+    turns out not to be a plainly written integer the edge list
+    is read again from its start keeping every node id as the
+    label it is written as, so labels given back match those
+    sent exactly
+
+    :param open_chunks: function returning generator of chunks
+                        of edge list from its start
+    :param capacity: rows to make room for up front
+    :return: edges
+    :rtype: :py:class:`EdgeList`
+    """
+    with closing(open_chunks()) as chunks:
+        edges = _read_integers(chunks, capacity)
+    if edges is not None:
+        return edges
+    with closing(open_chunks()) as chunks:
+        return _read_labels(chunks, capacity)
+
+
+def parse_edge_list(data, chunksize=CHUNK_SIZE):
+    """
+    Parses a tab or space delimited edge list. Every row has
+    source and target node ids and, if weighted, a weight. Blank
+    and comment lines are skipped. Numbers are parsed by NumPy a
+    chunk at a time so no Python object is made per line or field.
+    Node ids that are not all integers, such as gene symbols, are
+    kept as labels exactly as they are written
+
+    :param data: edge list
+    :type data: bytes
+    :param chunksize: bytes to parse at a time
+    :raises EdgeListError: if edge list cannot be parsed
+    :return: edges
+    :rtype: :py:class:`EdgeList`
+    """
+    return _read_chunks(lambda: iter_chunks(io.BytesIO(data), chunksize))
+
+
+def _iter_opened(edgefile, opener, chunksize):
+    """
+    Opens edge list and reads it in chunks
+
+    :return: generator of bytes
+    """
+    with opener(edgefile) as f:
+        for data in iter_chunks(f, chunksize):
+            yield data
+
+
+def _iter_from(fileobj, start, chunksize):
+    """
+    Reads file object in chunks from start
+
+    :return: generator of bytes
+    """
+    fileobj.seek(start)
+    for data in iter_chunks(fileobj, chunksize):
+        yield data
+
+
+def read_edge_list(edgefile, chunksize=CHUNK_SIZE, opener=None):
+    """
+    Reads edge list, see :py:func:`parse_edge_list`, or binary
+    edge list, see :py:func:`load_edge_arrays`. A path is
+    memory mapped and its lines counted first so arrays are
+    allocated once, peak memory is then about the size of the
+    arrays and not of the text. A file object, or a path opened
+    with opener, is read in chunks into arrays that grow
+
+    :param edgefile: path to edge list or seekable binary file
+                     object to read it from
+    :param chunksize: bytes to parse at a time
+    :param opener: function opening path as binary file object,
+                   such as one decompressing it, or None to
+                   memory map path. Called again if edge list
+                   has to be read a second time
+    :raises EdgeListError: if edge list cannot be parsed
+    :return: edges
+    :rtype: :py:class:`EdgeList`
+    """
+    if hasattr(edgefile, 'read'):
+        start = edgefile.tell()
+        return _read_chunks(lambda: _iter_from(edgefile, start, chunksize))
+    if opener is not None:
+        return _read_chunks(lambda: _iter_opened(edgefile, opener,
+                                                 chunksize))
+    if is_edge_arrays(edgefile):
+        return load_edge_arrays(edgefile)
+    with open_mapped(edgefile) as mapped:
+        capacity = count_lines(mapped, chunksize)
+        return _read_chunks(lambda: _iter_from(mapped, 0, chunksize),
+                            capacity=capacity)
+
+
+def is_edge_arrays(path):
+    """
+    Checks if file is a binary edge list, told apart from
+    text by its first bytes
+
+    :param path: path to file
+    :return: True if file is a .npz archive
+    :rtype: bool
+    """
+    with open(path, 'rb') as f:
+        return f.read(len(NPZ_MAGIC)) == NPZ_MAGIC
+
+
+def _map_member(path, f, info):
+    """
+    Memory maps array of .npy file stored uncompressed in .npz
+
+    :return: array or None if it cannot be mapped
+    """
+    f.seek(info.header_offset)
+    header = f.read(ZIP_LOCAL_HEADER_SIZE)
+    namelen, extralen = struct.unpack(
+        '<HH', header[ZIP_NAME_LENGTHS_OFFSET:ZIP_LOCAL_HEADER_SIZE])
+    f.seek(info.header_offset + ZIP_LOCAL_HEADER_SIZE + namelen + extralen)
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+    elif version == (2, 0):
+        shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+    else:
+        return None
+    if dtype.hasobject:
+        raise EdgeListError('Arrays of objects are not allowed')
+    if int(np.prod(shape)) == 0:
+        return np.empty(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=f.tell(),
+                     shape=shape, order='F' if fortran else 'C')
+
+
+def load_arrays(path):
+    """
+    Loads arrays of .npz file. Arrays stored uncompressed, as
+    :py:func:`numpy.savez` does, are memory mapped so they are
+    not copied into memory, compressed arrays are read
+
+    :param path: path to .npz file
+    :raises EdgeListError: if file is not a .npz file
+    :return: dict of array name to array
+    :rtype: dict
+    """
+    arrays = {}
+    try:
+        with zipfile.ZipFile(path) as zf, open(path, 'rb') as f:
+            for info in zf.infolist():
+                name, ext = os.path.splitext(info.filename)
+                if ext != '.npy':
+                    continue
+                arr = None
+                if info.compress_type == zipfile.ZIP_STORED:
+                    arr = _map_member(path, f, info)
+                if arr is None:
+                    with zf.open(info) as member:
+                        arr = np.lib.format.read_array(member,
+                                                       allow_pickle=False)
+                arrays[name] = arr
+    except (zipfile.BadZipFile, OSError, ValueError) as e:
+        raise EdgeListError('Unable to read arrays: ' + str(e))
+    return arrays
+
+
+def _check_array(arrays, name, kind):
+    """
+    Gets 1 dimensional array checking its type
+
+    :param kind: 'integer' or 'number'
+    :return: array or None if not in arrays
+    """
+    arr = arrays.get(name)
+    if arr is None:
+        return None
+    if arr.ndim != 1:
+        raise EdgeListError(name + ' must be 1 dimensional')
+    if not np.issubdtype(arr.dtype, np.integer if kind == 'integer'
+                         else np.number):
+        raise EdgeListError(name + ' must be an array of ' + kind + 's')
+    return arr
+
+
+def _check_positions(arr, name, count):
+    """
+    Checks values of arr are positions in an array of count values
+    """
+    if len(arr) > 0 and (int(arr.min()) < 0 or int(arr.max()) >= count):
+        raise EdgeListError(name + ' has values outside of 0..' +
+                            str(count - 1))
+
+
+def get_edge_list(arrays):
+    """
+    Gets edge list from arrays of a binary edge list, see
+    :py:const:`SRC_ARRAY` and :py:const:`INDPTR_ARRAY` for the
+    two layouts. Arrays are used as is where they already hold
+    compact ids, only node ids are remapped
+
+    :param arrays: dict of array name to array
+    :raises EdgeListError: if arrays are not a valid edge list
+    :return: edges
+    :rtype: :py:class:`EdgeList`
+    """
+    nodeids = arrays.get(NODEIDS_ARRAY)
+    if nodeids is not None and nodeids.dtype.kind not in 'SU':
+        nodeids = _check_array(arrays, NODEIDS_ARRAY, 'integer')
+    if INDPTR_ARRAY in arrays:
+        indptr = _check_array(arrays, INDPTR_ARRAY, 'integer')
+        dst = _check_array(arrays, INDICES_ARRAY, 'integer')
+        weight = _check_array(arrays, DATA_ARRAY, 'number')
+        if dst is None:
+            raise EdgeListError(INDICES_ARRAY + ' is required with ' +
+                                INDPTR_ARRAY)
+        counts = np.diff(indptr)
+        if len(indptr) == 0 or indptr[0] != 0 or indptr[-1] != len(dst)\
+                or (len(counts) > 0 and counts.min() < 0):
+            raise EdgeListError(INDPTR_ARRAY + ' must start at 0, not '
+                                'decrease and end at length of ' +
+                                INDICES_ARRAY)
+        if nodeids is None:
+            nodeids = np.arange(len(counts), dtype=np.int64)
+        if len(counts) > len(nodeids):
+            raise EdgeListError(INDPTR_ARRAY + ' has more rows than ' +
+                                NODEIDS_ARRAY)
+        src = np.repeat(np.arange(len(counts),
+                                  dtype=_compact_dtype(len(nodeids))),
+                        counts)
+    elif SRC_ARRAY in arrays:
+        src = _check_array(arrays, SRC_ARRAY, 'integer')
+        dst = _check_array(arrays, DST_ARRAY, 'integer')
+        weight = _check_array(arrays, WEIGHT_ARRAY, 'number')
+        if dst is None or len(dst) != len(src):
+            raise EdgeListError(DST_ARRAY + ' of same length as ' +
+                                SRC_ARRAY + ' is required')
+        if nodeids is None:
+            nodeids, inverse = np.unique(np.concatenate((src, dst)),
+                                         return_inverse=True)
+            inverse = inverse.astype(_compact_dtype(len(nodeids)))
+            src = inverse[:len(dst)]
+            dst = inverse[len(dst):]
+    else:
+        raise EdgeListError('Expected ' + SRC_ARRAY + ' and ' + DST_ARRAY +
+                            ' or ' + INDPTR_ARRAY + ' and ' +
+                            INDICES_ARRAY + ' arrays')
+    if weight is not None and len(weight) != len(dst):
+        raise EdgeListError('Expected a weight for every edge')
+    _check_positions(src, SRC_ARRAY, len(nodeids))
+    _check_positions(dst, DST_ARRAY, len(nodeids))
+    return EdgeList(src, dst, nodeids, weight=weight)
+
+
+def load_edge_arrays(path):
+    """
+    Loads binary edge list, a .npz file of arrays described at
+    :py:const:`SRC_ARRAY`, memory mapping arrays where possible
+
+    :param path: path to .npz file
+    :raises EdgeListError: if file is not a valid edge list
+    :return: edges
+    :rtype: :py:class:`EdgeList`
+    """
+    return get_edge_list(load_arrays(path))
+
+
+def get_labels(nodeids):
+    """
+    Gets node ids as text
+
+    :param nodeids: node ids, integers or labels
+    :type nodeids: :py:class:`numpy.ndarray`
+    :return: list of str
+    :rtype: list
+    """
+    if nodeids.dtype.kind == 'S':
+        return [x.decode('utf-8') for x in nodeids.tolist()]
+    return [str(x) for x in nodeids.tolist()]
+
+
+def get_max_integer_id(nodeids):
+    """
+    Gets largest node id that is an integer, labels
+    made of digits count as integers
+
+    :param nodeids: node ids, integers or labels
+    :type nodeids: :py:class:`numpy.ndarray`
+    :return: largest id or -1 if no node id is an integer
+    :rtype: int
+    """
+    if len(nodeids) == 0:
+        return -1
+    if np.issubdtype(nodeids.dtype, np.integer):
+        return int(nodeids.max())
+    numeric = nodeids[np.char.isdigit(nodeids)]
+    if len(numeric) == 0:
+        return -1
+    return max(int(x) for x in numeric.tolist())
+
+
+def write_edge_list(edges, path, compact=False, chunkrows=WRITE_CHUNK_ROWS):
+    """
+    Writes edges as tab delimited text for tools that only
+    read text
+
+    :param edges: edges
+    :type edges: :py:class:`EdgeList`
+    :param path: path to write to
+    :param compact: if True write compact ids 0..n-1 instead
+                    of original node ids
+    :param chunkrows: rows formatted at a time
+    :return: path
+    """
+    rowformat = '%s\t%s\n'
+    if edges.weighted:
+        rowformat = '%s\t%s\t%r\n'
+    labels = None
+    if compact is False:
+        labels = np.array(get_labels(edges.nodeids), dtype=object)
+    with open(path, 'w') as f:
+        for start in range(0, edges.edges, chunkrows):
+            end = min(start + chunkrows, edges.edges)
+            if labels is None:
+                columns = [edges.src[start:end].tolist(),
+                           edges.dst[start:end].tolist()]
+            else:
+                columns = [labels[edges.src[start:end]].tolist(),
+                           labels[edges.dst[start:end]].tolist()]
+            if edges.weighted:
+                columns.append(edges.weight[start:end].tolist())
+            f.write((rowformat * (end - start)) %
+                    tuple(itertools.chain.from_iterable(zip(*columns))))
+    return path
@@ -0,0 +1,249 @@
+
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+REDIS_EVENTS = 'redis'
+
+# prefix of redis key the celery redis result backend stores
+# task state in, it also publishes every update on a channel
+# of the same name
+TASK_CHANNEL_PREFIX = 'celery-task-meta-'
+
+
+def get_task_channel(taskid):
+    """
+    Gets name of channel celery publishes state changes
+    of task on
+
+    :param taskid: id of task
+    :return: channel name
+    :rtype: str
+    """
+    return TASK_CHANNEL_PREFIX + taskid
+
+
+class Subscription(object):
+    """
+    Notified whenever a message is published on a channel. Use
+    as context manager or call :py:meth:`close` when done
+    """
+    def __init__(self, watcher, channel):
+        """
+        Constructor
+
+        :param watcher: watcher that created this subscription
+        :param channel: channel name
+        """
+        self.channel = channel
+        self._watcher = watcher
+        self._changed = threading.Event()
+
+    def notify(self):
+        """
+        Called by watcher when a message arrives
+        """
+        self._changed.set()
+
+    def wait(self, timeout):
+        """
+        Waits for a message
+
+        :param timeout: seconds to wait
+        :return: True if a message arrived since subscribing or
+                 since the last call to wait, False on timeout
+        :rtype: bool
+        """
+        changed = self._changed.wait(timeout)
+        self._changed.clear()
+        return changed
+
+    def close(self):
+        """
+        Stops subscription
+        """
+        self._watcher.unwatch(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+
+class RedisTaskEvents(object):
+    """
+    Lets callers wait for state changes of tasks, got from the
+    redis pub/sub messages the celery redis result backend sends.
+    All subscriptions of a process share one redis connection read
+    by a background thread, so waiting clients cost no requests
+    to redis
+    """
+    def __init__(self, url='redis://localhost', client=None,
+                 poll_interval=0.1, subscribe_timeout=2):
+        """
+        Constructor
+
+        :param url: url of redis server used as celery result backend
+        :param client: redis client to use instead of creating one
+                       from url
+        :param poll_interval: longest time in seconds the background
+                              thread holds the connection before new
+                              channels can be subscribed to
+        :param subscribe_timeout: seconds to wait for redis to confirm
+                                  a subscription
+        """
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self._redis = client
+        self._poll_interval = poll_interval
+        self._subscribe_timeout = subscribe_timeout
+        self._pubsub = None
+        self._subs = {}
+        self._confirmed = {}
+        self._lock = threading.Lock()
+        self._pslock = threading.Lock()
+        self._thread = None
+
+    @staticmethod
+    def _str(val):
+        if isinstance(val, bytes):
+            return val.decode('utf-8')
+        return val
+
+    def _get_pubsub(self):
+        if self._pubsub is None:
+            self._pubsub = self._redis.pubsub()
+        return self._pubsub
+
+    def watch(self, taskid):
+        """
+        Subscribes to state changes of task. Changes published
+        after this returns are seen by the subscription
+
+        :param taskid: id of task
+        :return: subscription
+        :rtype: :py:class:`Subscription`
+        """
+        channel = get_task_channel(taskid)
+        sub = Subscription(self, channel)
+        with self._lock:
+            subs = self._subs.get(channel)
+            if subs is None:
+                subs = set()
+                self._subs[channel] = subs
+                self._confirmed[channel] = threading.Event()
+                with self._pslock:
+                    self._get_pubsub().subscribe(channel)
+            subs.add(sub)
+            confirmed = self._confirmed[channel]
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+        if not confirmed.wait(self._subscribe_timeout):
+            logger.warning('Subscription to ' + channel +
+                           ' not confirmed, changes may be missed')
+        return sub
+
+    def unwatch(self, subscription):
+        """
+        Stops subscription
+
+        :param subscription: subscription from :py:meth:`watch`
+        """
+        with self._lock:
+            subs = self._subs.get(subscription.channel)
+            if subs is None:
+                return
+            subs.discard(subscription)
+            if len(subs) > 0:
+                return
+            del self._subs[subscription.channel]
+            del self._confirmed[subscription.channel]
+            try:
+                with self._pslock:
+                    self._get_pubsub().unsubscribe(subscription.channel)
+            except Exception:
+                logger.exception('Unable to unsubscribe from ' +
+                                 subscription.channel)
+
+    def _dispatch(self, message):
+        """
+        Notifies subscriptions of channel message was sent on
+        """
+        channel = self._str(message.get('channel'))
+        with self._lock:
+            if message.get('type') == 'subscribe':
+                confirmed = self._confirmed.get(channel)
+                if confirmed is not None:
+                    confirmed.set()
+                return
+            if message.get('type') != 'message':
+                return
+            subs = list(self._subs.get(channel, []))
+        for sub in subs:
+            sub.notify()
+
+    def _reconnect(self):
+        """
+        Replaces connection after an error, resubscribing to every
+        channel being watched. Subscriptions are notified since
+        changes may have been missed
+        """
+        with self._lock:
+            channels = list(self._subs.keys())
+            with self._pslock:
+                try:
+                    self._pubsub.close()
+                except Exception:
+                    pass
+                self._pubsub = None
+                if channels:
+                    self._get_pubsub().subscribe(*channels)
+            subs = [s for c in channels for s in self._subs[c]]
+        for sub in subs:
+            sub.notify()
+
+    def _run(self):
+        """
+        Reads messages until nothing is being watched
+        """
+        while True:
+            with self._lock:
+                if len(self._subs) == 0:
+                    self._thread = None
+                    return
+            try:
+                with self._pslock:
+                    message = self._get_pubsub().get_message(
+                        timeout=self._poll_interval)
+                if message is not None:
+                    self._dispatch(message)
+            except Exception:
+                logger.exception('Error reading task events, reconnecting')
+                time.sleep(self._poll_interval)
+                try:
+                    self._reconnect()
+                except Exception:
+                    logger.exception('Unable to reconnect')
+
+
+def create_task_events(eventstype, url='redis://localhost'):
+    """
+    Creates source of task state changes
+
+    :param eventstype: 'redis' or None to disable
+    :param url: redis url of celery result backend
+    :raises ValueError: if eventstype is unknown
+    :return: task events or None
+    """
+    if eventstype is None:
+        return None
+    if eventstype == REDIS_EVENTS:
+        return RedisTaskEvents(url=url)
+    raise ValueError('Unknown task events type: ' + str(eventstype))
@@ -0,0 +1,301 @@
+
+import json
+import hashlib
+import logging
+
+from commundetect_rest import backpressure
+
+logger = logging.getLogger(__name__)
+
+# how jobs are shared between clients, None sends jobs straight
+# to the broker in the order they are submitted, 'redis' holds
+# jobs of each client in its own sub-queue in the redis server of
+# the celery result backend and releases them to the broker in
+# weighted round robin order across clients
+FAIR_SHARE_KEY = 'FAIR_SHARE'
+REDIS_FAIR_SHARE = 'redis'
+
+# dict of client address or api token to weight, a client gets
+# this many jobs released each turn, clients not listed get 1
+FAIR_SHARE_WEIGHTS_KEY = 'FAIR_SHARE_WEIGHTS'
+
+# jobs kept ready in broker queue of each size class, the rest
+# are held in sub-queues of their clients until workers catch up
+FAIR_SHARE_TARGET_KEY = 'FAIR_SHARE_TARGET'
+
+# header with api token of client, jobs of callers sending it are
+# shared by token instead of remote address, None to always use
+# remote address
+CLIENT_KEY_HEADER_KEY = 'CLIENT_KEY_HEADER'
+
+# prefix of redis keys holding sub-queues
+KEY_PREFIX = 'commundetect-fair-'
+
+# keys in per client depth, reported in queue stats
+CLIENT_KEY = 'client'
+DEPTH_KEY = backpressure.DEPTH_KEY
+
+
+def make_client_key(remoteaddr, token=None):
+    """
+    Gets key jobs of a client are held under. Addresses and tokens
+    are hashed so neither is kept in redis or shown in status
+
+    :param remoteaddr: remote address of client
+    :param token: api token of client or None
+    :return: key
+    :rtype: str
+    """
+    if token:
+        value = 'token:' + token
+    else:
+        value = 'addr:' + str(remoteaddr)
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()[:16]
+
+
+def get_weight(weights, remoteaddr, token=None):
+    """
+    Gets weight of client
+
+    :param weights: dict of address or token to weight or None
+    :param remoteaddr: remote address of client
+    :param token: api token of client or None
+    :return: weight, at least 1
+    :rtype: int
+    """
+    if not weights:
+        return 1
+    weight = None
+    if token:
+        weight = weights.get(token)
+    if weight is None:
+        weight = weights.get(remoteaddr, 1)
+    return max(1, int(weight))
+
+
+def _str(val):
+    if isinstance(val, bytes):
+        return val.decode('utf-8')
+    return val
+
+
+class RedisFairQueue(object):
+    """
+    Holds jobs in a sub-queue per client for each broker queue.
+    Clients with jobs are kept in a ring, the client at the tail
+    of the ring gets up to its weight of jobs released before it
+    is moved to the head, clients without a backlog join at the
+    tail. Only single redis commands are relied on
+    to be atomic, a race between processes can at worst give a
+    client an extra turn
+    """
+    def __init__(self, client):
+        """
+        Constructor
+
+        :param client: redis client
+        """
+        self._redis = client
+
+    def _ring(self, queue):
+        return KEY_PREFIX + queue + '-ring'
+
+    def _credits(self, queue):
+        return KEY_PREFIX + queue + '-credits'
+
+    def _weights(self, queue):
+        return KEY_PREFIX + queue + '-weights'
+
+    def _jobs(self, queue, clientkey):
+        return KEY_PREFIX + queue + '-jobs-' + clientkey
+
+    def push(self, queue, clientkey, entries, weight=1):
+        """
+        Adds jobs to end of sub-queue of client
+
+        :param queue: name of broker queue jobs go to
+        :param clientkey: key of client
+        :param entries: list of jobs as str
+        :param weight: jobs client gets released each turn
+        """
+        if len(entries) == 0:
+            return
+        pipe = self._redis.pipeline()
+        pipe.hset(self._weights(queue), clientkey, weight)
+        pipe.rpush(self._jobs(queue, clientkey), *entries)
+        length = pipe.execute()[1]
+        if length == len(entries):
+            # sub-queue was empty so client is not in ring, it joins
+            # at the tail so a client submitting now and then gets
+            # its job released before those with a backlog
+            self._redis.rpush(self._ring(queue), clientkey)
+
+    def requeue(self, queue, clientkey, entry):
+        """
+        Puts job that could not be released back at start of
+        sub-queue of client
+
+        :param queue: name of broker queue job goes to
+        :param clientkey: key of client
+        :param entry: job as str
+        """
+        if self._redis.lpush(self._jobs(queue, clientkey), entry) == 1:
+            self._redis.rpush(self._ring(queue), clientkey)
+
+    def _drop(self, queue, clientkey):
+        pipe = self._redis.pipeline()
+        pipe.lrem(self._ring(queue), 1, clientkey)
+        pipe.hdel(self._credits(queue), clientkey)
+        pipe.execute()
+
+    def pop(self, queue):
+        """
+        Takes next job in weighted round robin order
+
+        :param queue: name of broker queue
+        :return: (key of client, job as str) or None if no
+                 jobs are held
+        :rtype: tuple
+        """
+        while True:
+            clientkey = _str(self._redis.lindex(self._ring(queue), -1))
+            if clientkey is None:
+                return None
+            entry = self._redis.lpop(self._jobs(queue, clientkey))
+            if entry is None:
+                self._drop(queue, clientkey)
+                continue
+            pipe = self._redis.pipeline()
+            pipe.hincrby(self._credits(queue), clientkey, 1)
+            pipe.hget(self._weights(queue), clientkey)
+            pipe.llen(self._jobs(queue, clientkey))
+            used, weight, left = pipe.execute()
+            if left == 0:
+                self._drop(queue, clientkey)
+            elif used >= int(weight or 1):
+                pipe = self._redis.pipeline()
+                pipe.hdel(self._credits(queue), clientkey)
+                pipe.rpoplpush(self._ring(queue), self._ring(queue))
+                pipe.execute()
+            return clientkey, _str(entry)
+
+    def get_depths(self, queue):
+        """
+        Gets number of jobs held for each client
+
+        :param queue: name of broker queue
+        :return: dict of client key to number of jobs held
+        :rtype: dict
+        """
+        clientkeys = sorted(set(_str(c) for c in
+                                self._redis.lrange(self._ring(queue),
+                                                   0, -1)))
+        if len(clientkeys) == 0:
+            return {}
+        pipe = self._redis.pipeline()
+        for clientkey in clientkeys:
+            pipe.llen(self._jobs(queue, clientkey))
+        return {c: n for c, n in zip(clientkeys, pipe.execute()) if n > 0}
+
+
+def create_fair_queue(sharetype, celeryapp):
+    """
+    Creates queue holding jobs of each client
+
+    :param sharetype: 'redis' or None to disable
+    :param celeryapp: celery app whose redis result backend
+                      holds the jobs
+    :raises ValueError: if sharetype is unknown
+    :return: fair queue or None
+    """
+    if sharetype is None:
+        return None
+    if sharetype == REDIS_FAIR_SHARE:
+        return RedisFairQueue(celeryapp.backend.client)
+    raise ValueError('Unknown fair share type: ' + str(sharetype))
+
+
+class FairDispatcher(object):
+    """
+    Releases held jobs to the broker while fewer than target
+    jobs are waiting in the broker queue. The REST service
+    releases jobs when they are submitted and workers release
+    jobs when one of theirs finishes, so a client submitting
+    many jobs only gets its turn along with everyone else
+    """
+    def __init__(self, celeryapp, fairqueue, publish, target=2):
+        """
+        Constructor
+
+        :param celeryapp: celery app whose broker holds queues
+        :param fairqueue: queue holding jobs of each client
+        :type fairqueue: :py:class:`RedisFairQueue`
+        :param publish: function called with keyword arguments of
+                        a job to send it to the broker, such as
+                        apply_async of the task
+        :param target: jobs kept waiting in each broker queue
+        """
+        self._celeryapp = celeryapp
+        self._fairqueue = fairqueue
+        self._publish = publish
+        self._target = target
+
+    def _get_ready(self, queue):
+        with self._celeryapp.connection_for_read() as conn:
+            return backpressure.get_queue_depth(conn, queue)[0]
+
+    def submit(self, queue, clientkey, taskoptslist, weight=1):
+        """
+        Holds jobs of client then releases as many jobs
+        as the broker queue has room for
+
+        :param queue: name of broker queue jobs go to
+        :param clientkey: key of client
+        :param taskoptslist: keyword arguments of each job
+        :param weight: jobs client gets released each turn
+        """
+        self._fairqueue.push(queue, clientkey,
+                             [json.dumps(x) for x in taskoptslist],
+                             weight=weight)
+        self.release(queue)
+
+    def release(self, queue):
+        """
+        Releases held jobs of queue in weighted round robin
+        order until target jobs are waiting in broker queue.
+        Errors are logged, jobs stay held until next release
+
+        :param queue: name of broker queue
+        :return: number of jobs released
+        :rtype: int
+        """
+        released = 0
+        try:
+            ready = self._get_ready(queue)
+            while ready + released < self._target:
+                item = self._fairqueue.pop(queue)
+                if item is None:
+                    break
+                clientkey, entry = item
+                try:
+                    self._publish(**json.loads(entry))
+                except Exception:
+                    self._fairqueue.requeue(queue, clientkey, entry)
+                    raise
+                released += 1
+        except Exception:
+            logger.exception('Unable to release held jobs of ' + queue)
+        return released
+
+    def get_depths(self, queue):
+        """
+        Gets number of jobs held for each client
+
+        :param queue: name of broker queue
+        :return: list of dicts with :py:const:`CLIENT_KEY` and
+                 :py:const:`DEPTH_KEY`, most jobs first
+        :rtype: list
+        """
+        depths = self._fairqueue.get_depths(queue)
+        return [{CLIENT_KEY: c, DEPTH_KEY: depths[c]}
+                for c in sorted(depths, key=lambda c: (-depths[c], c))]
@@ -0,0 +1,249 @@
+
+import os
+import time
+import gzip
+import logging
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+# configuration keys shared by REST service and worker
+
+# directory large results are written to, must be readable by the
+# REST service. None keeps every result in the celery result backend
+RESULT_STORE_KEY = 'RESULT_STORE'
+
+# results with at least this many characters go to the result store
+RESULT_STORE_MIN_KEY = 'RESULT_STORE_MIN'
+
+# seconds results are kept, both in the result store and
+# in the celery result backend
+RESULT_TTL_KEY = 'RESULT_TTL'
+
+# key in task result holding reference to stored result,
+# result key is then None
+RESULT_REF_KEY = 'resultref'
+
+# keys in reference to stored result
+REF_NAME = 'name'
+REF_SIZE = 'size'
+REF_EDGES = 'edges'
+
+RESULT_SUFFIX = '.gz'
+
+EDGE_SEP = ';'
+
+READ_CHUNK_SIZE = 256 * 1024
+
+
+class ResultStoreError(Exception):
+    """
+    Raised when a stored result is missing or has expired
+    """
+    pass
+
+
+class DirectoryResultStore(object):
+    """
+    Keeps gzip compressed results in a directory, which can be on
+    a shared or network filesystem, for ttl seconds. Expired results
+    are removed by :py:meth:`sweep` which :py:meth:`put` runs at most
+    every sweep_interval seconds
+    """
+    def __init__(self, rootdir, ttl=86400, sweep_interval=3600,
+                 timefunc=time.time):
+        """
+        Constructor
+
+        :param rootdir: directory to store results in
+        :param ttl: seconds results are kept
+        :param sweep_interval: least seconds between sweeps run by put
+        :param timefunc: function that returns current time in seconds
+        """
+        self._rootdir = rootdir
+        self._ttl = ttl
+        self._sweep_interval = sweep_interval
+        self._time = timefunc
+        self._last_sweep = timefunc()
+
+    def _path(self, name):
+        return os.path.join(self._rootdir, name[:2], name + RESULT_SUFFIX)
+
+    def put(self, taskid, text):
+        """
+        Stores result
+
+        :param taskid: id of task result is for
+        :param text: result
+        :return: reference to result to keep in task result
+        :rtype: dict
+        """
+        dest = self._path(taskid)
+        destdir = os.path.dirname(dest)
+        os.makedirs(destdir, mode=0o775, exist_ok=True)
+        fd, tmpfile = tempfile.mkstemp(dir=destdir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f,\
+                    gzip.GzipFile(fileobj=f, mode='wb',
+                                  compresslevel=6) as gz:
+                gz.write(text.encode('utf-8'))
+            os.chmod(tmpfile, 0o664)
+            os.rename(tmpfile, dest)
+        except Exception:
+            if os.path.isfile(tmpfile):
+                os.unlink(tmpfile)
+            raise
+        self.maybe_sweep()
+        return {REF_NAME: taskid, REF_SIZE: len(text),
+                REF_EDGES: text.count(EDGE_SEP)}
+
+    def _expired(self, path):
+        return os.path.getmtime(path) + self._ttl < self._time()
+
+    def exists(self, ref):
+        """
+        Checks if stored result is still available
+
+        :param ref: reference from :py:meth:`put`
+        :return: True if result can be read
+        :rtype: bool
+        """
+        path = self._path(ref[REF_NAME])
+        try:
+            return not self._expired(path)
+        except OSError:
+            return False
+
+    def iter_text(self, ref, chunksize=READ_CHUNK_SIZE):
+        """
+        Reads stored result in chunks
+
+        :param ref: reference from :py:meth:`put`
+        :param chunksize: characters per chunk
+        :raises ResultStoreError: if result is missing or expired
+        :return: generator of str
+        """
+        path = self._path(ref[REF_NAME])
+        try:
+            if self._expired(path):
+                raise ResultStoreError('Result ' + ref[REF_NAME] +
+                                       ' has expired')
+            f = gzip.open(path, 'rt', encoding='utf-8')
+        except OSError:
+            raise ResultStoreError('Result ' + ref[REF_NAME] +
+                                   ' not found')
+        return self._read_chunks(f, chunksize)
+
+    @staticmethod
+    def _read_chunks(f, chunksize):
+        with f:
+            while True:
+                chunk = f.read(chunksize)
+                if not chunk:
+                    return
+                yield chunk
+
+    def get_text(self, ref):
+        """
+        Reads stored result
+
+        :param ref: reference from :py:meth:`put`
+        :raises ResultStoreError: if result is missing or expired
+        :return: result
+        :rtype: str
+        """
+        return ''.join(self.iter_text(ref))
+
+    def delete(self, ref):
+        """
+        Removes stored result if it exists
+
+        :param ref: reference from :py:meth:`put`
+        """
+        try:
+            os.unlink(self._path(ref[REF_NAME]))
+        except OSError:
+            pass
+
+    def sweep(self):
+        """
+        Removes expired results
+
+        :return: number of results removed
+        :rtype: int
+        """
+        self._last_sweep = self._time()
+        removed = 0
+        if not os.path.isdir(self._rootdir):
+            return removed
+        for subdir in os.listdir(self._rootdir):
+            path = os.path.join(self._rootdir, subdir)
+            if not os.path.isdir(path):
+                continue
+            for entry in os.listdir(path):
+                entrypath = os.path.join(path, entry)
+                try:
+                    if self._expired(entrypath):
+                        os.unlink(entrypath)
+                        removed += 1
+                except OSError:
+                    # removed by another sweep
+                    pass
+        if removed > 0:
+            logger.info('Removed ' + str(removed) + ' expired results')
+        return removed
+
+    def maybe_sweep(self):
+        """
+        Runs :py:meth:`sweep` if it has not run in the last
+        sweep_interval seconds
+        """
+        if self._last_sweep + self._sweep_interval > self._time():
+            return
+        try:
+            self.sweep()
+        except Exception:
+            logger.exception('Error removing expired results')
+
+
+def create_result_store(location, ttl=86400):
+    """
+    Creates result store
+
+    :param location: directory or None for no result store
+    :param ttl: seconds results are kept
+    :return: result store or None
+    :rtype: :py:class:`DirectoryResultStore`
+    """
+    if location is None:
+        return None
+    return DirectoryResultStore(location, ttl=ttl)
+
+
+def offload_result(store, taskid, resultdict, minsize, resultkey='result'):
+    """
+    Moves result to store if it is large
+
+    :param store: result store or None
+    :param taskid: id of task
+    :param resultdict: task result dict
+    :param minsize: results with at least this many characters
+                    are moved
+    :param resultkey: key in resultdict holding result
+    :return: resultdict or copy of it with a reference to stored
+             result in place of result
+    :rtype: dict
+    """
+    text = resultdict.get(resultkey)
+    if store is None or not isinstance(text, str) or len(text) < minsize:
+        return resultdict
+    try:
+        ref = store.put(taskid, text)
+    except Exception:
+        logger.exception('Unable to store result of ' + taskid +
+                         ' keeping it in result backend')
+        return resultdict
+    offloaded = dict(resultdict)
+    offloaded[resultkey] = None
+    offloaded[RESULT_REF_KEY] = ref
+    return offloaded
@@ -0,0 +1,172 @@
+
+import logging
+import numpy as np
+
+from commundetect_rest import edgelist
+
+logger = logging.getLogger(__name__)
+
+TREE_COMMENT = edgelist.COMMENT
+
+# number of whitespace delimited columns in each
+# data row of an Infomap .tree file:
+# path flow "name" nodeindex
+TREE_COLUMNS = 4
+
+# bytes of .tree file parsed at a time, rows of a chunk
+# are split into Python strings so this is kept small
+TREE_CHUNK_SIZE = 1024 * 1024
+
+
+def _parse_tree_chunk(data):
+    """
+    Parses chunk of whole rows of .tree file
+
+    :return: (number of rows, path lengths, path values,
+              leaf ids) of rows with non zero flow
+    """
+    if TREE_COMMENT in data:
+        data = edgelist.COMMENT_LINE_RE.sub(b'', data)
+    tokens = data.split()
+    if len(tokens) % TREE_COLUMNS != 0:
+        raise ValueError('expected ' + str(TREE_COLUMNS) +
+                         ' columns on every row')
+    paths = tokens[0::TREE_COLUMNS]
+    nrows = len(paths)
+    flow = edgelist.parse_numbers(b' '.join(tokens[1::TREE_COLUMNS]))
+    leaves = edgelist.parse_numbers(
+        b' '.join(tokens[2::TREE_COLUMNS]).replace(b'"', b' '),
+        dtype=np.int64)
+    del tokens
+    pathlen = np.fromiter((p.count(b':') for p in paths),
+                          dtype=np.int64, count=nrows) + 1
+    pathvals = edgelist.parse_numbers(b' '.join(paths).replace(b':', b' '),
+                                      dtype=np.int64)
+    if len(flow) != nrows or len(leaves) != nrows or\
+            len(pathvals) != int(pathlen.sum()):
+        raise ValueError('unable to parse rows')
+    keep = flow != 0
+    return nrows, pathlen[keep], pathvals[np.repeat(keep, pathlen)],\
+        leaves[keep]
+
+
+def _read_tree(treefile, chunksize=TREE_CHUNK_SIZE):
+    """
+    Reads Infomap .tree file a chunk at a time into preallocated
+    arrays skipping comment lines and rows with zero flow. File
+    is memory mapped so only the arrays count towards memory
+    used, not the text
+
+    :param treefile: path to .tree file
+    :param chunksize: bytes to parse at a time
+    :raises ValueError: if file has no rows or cannot be parsed
+    :return: (path lengths, path values, leaf ids), path values
+             holds the module indexes and leaf index of each path
+             one after the other
+    :rtype: tuple
+    """
+    nrows = 0
+    with edgelist.open_mapped(treefile) as mapped:
+        capacity = edgelist.count_lines(mapped)
+        mapped.seek(0)
+        pathlen = edgelist.ArrayBuilder(np.int64, capacity)
+        pathvals = edgelist.ArrayBuilder(np.int64, capacity * 2)
+        leaves = edgelist.ArrayBuilder(np.int64, capacity)
+        for data in edgelist.iter_chunks(mapped, chunksize):
+            try:
+                rows, chunkpathlen, chunkpathvals, chunkleaves =\
+                    _parse_tree_chunk(data)
+            except ValueError as e:
+                raise ValueError('Unable to parse ' + treefile + ' ' +
+                                 str(e))
+            nrows += rows
+            pathlen.append(chunkpathlen)
+            pathvals.append(chunkpathvals)
+            leaves.append(chunkleaves)
+    if nrows == 0:
+        raise ValueError('No rows found in ' + treefile)
+    return pathlen.finish(), pathvals.finish(), leaves.finish()
+
+
+def parse_infomap_tree(treefile):
+    """
+    Parses Infomap .tree file into hierarchy edges
+
+    Rows with zero flow are dropped. Each distinct module path prefix
+    is given a term id, deepest level first, starting just above the
+    largest leaf id. The root term gets the id following the last
+    module. Everything is done on flat NumPy arrays so memory grows
+    with the number of path entries and not rows x maximum depth.
+
+    :param treefile: path to .tree file
+    :return: tuple (termedges, geneedges) where each is a numpy
+             array of shape (N, 2) with parent, child ids. termedges
+             are term to term edges (including root) and geneedges
+             are term to leaf edges
+    """
+    pathlen, pathvals, leaves = _read_tree(treefile)
+
+    # the last element of each path is the index of the
+    # leaf within its module so it is not a module
+    depth = pathlen - 1
+    starts = np.zeros(len(pathlen), dtype=np.int64)
+    np.cumsum(pathlen[:-1], out=starts[1:])
+
+    maxdepth = int(depth.max())
+
+    # for each level get the rows that have a module at that level
+    # and assign a level local id that increments each time the
+    # (parent, module index) pair changes between consecutive rows
+    rows_by_level = []
+    newmod_by_level = []
+    localid_by_level = []
+    parent = None
+    for k in range(maxdepth):
+        rows = np.flatnonzero(depth > k)
+        modidx = pathvals[starts[rows] + k]
+        change = np.empty(len(rows), dtype=bool)
+        change[0] = True
+        change[1:] = modidx[1:] != modidx[:-1]
+        if parent is not None:
+            # rows at level k are a subset of rows at level k - 1
+            parent = parent[np.searchsorted(rows_by_level[-1], rows)]
+            change[1:] |= parent[1:] != parent[:-1]
+        localid = np.cumsum(change) - 1
+        rows_by_level.append(rows)
+        newmod_by_level.append(change)
+        localid_by_level.append(localid)
+        parent = localid
+    del pathvals
+
+    # deepest level gets the lowest ids, just above the largest leaf
+    offset = int(leaves.max()) + 1
+    level_offsets = [0] * maxdepth
+    for k in range(maxdepth - 1, -1, -1):
+        level_offsets[k] = offset
+        offset += int(localid_by_level[k][-1]) + 1 \
+            if len(localid_by_level[k]) > 0 else 0
+    root = offset
+
+    termedges = []
+    # id of deepest module for every row, leaves directly
+    # under root (depth 0) hang off the root term
+    deepest = np.full(len(leaves), root, dtype=np.int64)
+    parentids = None
+    for k in range(maxdepth):
+        rows = rows_by_level[k]
+        ids = localid_by_level[k] + level_offsets[k]
+        newmod = newmod_by_level[k]
+        if k == 0:
+            pids = np.full(len(rows), root, dtype=np.int64)
+        else:
+            pids = parentids[np.searchsorted(rows_by_level[k - 1], rows)]
+        termedges.append(np.column_stack((pids[newmod], ids[newmod])))
+        deepest[rows] = ids
+        parentids = ids
+
+    if len(termedges) > 0:
+        termedges = np.concatenate(termedges)
+    else:
+        termedges = np.empty((0, 2), dtype=np.int64)
+    geneedges = np.unique(np.column_stack((deepest, leaves)), axis=0)
+    return termedges, geneedges
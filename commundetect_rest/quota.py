@@ -0,0 +1,125 @@
+
+import time
+import logging
+
+from limits import parse
+
+logger = logging.getLogger(__name__)
+
+# where rate limit counters are kept so every web process shares
+# them, None keeps them in memory of each process, 'backend' uses
+# the redis server of the celery result backend, any other value
+# is a storage uri such as redis://host:6379
+RATE_LIMIT_STORAGE_KEY = 'RATE_LIMIT_STORAGE'
+BACKEND_STORAGE = 'backend'
+
+# edges each client may submit, as a rate limit string such as
+# '50000000 per hour', None for no limit
+WORK_RATE_LIMIT_KEY = 'WORK_RATE_LIMIT'
+
+# scope of work rate limit counters
+WORK_SCOPE = 'work'
+
+
+class QuotaExceededError(Exception):
+    """
+    Raised when a client has submitted more work than allowed
+    """
+    def __init__(self, message, retryafter):
+        """
+        Constructor
+
+        :param message: error message
+        :param retryafter: seconds until quota resets
+        """
+        super(QuotaExceededError, self).__init__(message)
+        self.retryafter = retryafter
+
+
+def get_storage_uri(storage, backendurl):
+    """
+    Gets storage uri for rate limiter
+
+    :param storage: value of :py:const:`RATE_LIMIT_STORAGE_KEY`
+    :param backendurl: url of celery result backend
+    :return: storage uri
+    :rtype: str
+    """
+    if storage is None:
+        return 'memory://'
+    if storage == BACKEND_STORAGE:
+        return backendurl
+    return storage
+
+
+class WorkQuota(object):
+    """
+    Limits work each client submits, each submission uses up
+    quota in proportion to the number of edges in its graph.
+    Counters are kept in storage of rate limiter so they are
+    shared the same way
+    """
+    def __init__(self, limiter, limit, timefunc=time.time):
+        """
+        Constructor
+
+        :param limiter: rate limiter
+        :type limiter: :py:class:`flask_limiter.Limiter`
+        :param limit: rate limit string such as '50000000 per hour'
+                      or None for no limit
+        :param timefunc: function that returns current time in seconds
+        """
+        self._limiter = limiter
+        self._item = None if limit is None else parse(limit)
+        self._time = timefunc
+
+    def consume(self, client, edges):
+        """
+        Uses up quota of client
+
+        :param client: key of client such as its address
+        :param edges: number of edges in submitted graph, a graph
+                      larger than the limit uses up all of it
+        :raises QuotaExceededError: if client has too little quota
+                                    left, no quota is used up then
+        """
+        if self._item is None:
+            return
+        cost = min(max(1, edges), self._item.amount)
+        strategy = self._limiter.limiter
+        try:
+            if strategy.test(self._item, WORK_SCOPE, client, cost=cost):
+                strategy.hit(self._item, WORK_SCOPE, client, cost=cost)
+                return
+            stats = strategy.get_window_stats(self._item, WORK_SCOPE,
+                                              client)
+        except Exception:
+            # as with request rate limits, an unreachable
+            # storage does not stop submissions
+            logger.exception('Unable to check work quota of ' + client)
+            return
+        retryafter = max(1, int(stats[0] - self._time()))
+        raise QuotaExceededError('Submitting ' + str(edges) + ' edges is '
+                                 'more than the ' + str(stats[1]) +
+                                 ' left of the limit of ' +
+                                 str(self._item), retryafter)
+
+    def refund(self, client, edges):
+        """
+        Gives back quota used up by a submission that was not run
+
+        :param client: key of client such as its address
+        :param edges: number of edges passed to :py:meth:`consume`
+        """
+        if self._item is None:
+            return
+        cost = min(max(1, edges), self._item.amount)
+        storage = self._limiter.limiter.storage
+        key = self._item.key_for(WORK_SCOPE, client)
+        try:
+            # window may have reset since, it is not taken below zero
+            cost = min(cost, storage.get(key))
+            if cost > 0:
+                storage.incr(key, self._item.get_expiry(), amount=-cost)
+        except Exception:
+            logger.exception('Unable to refund work quota of ' + client)
@@ -0,0 +1,168 @@
+
+import os
+import logging
+import importlib
+import importlib.util
+
+logger = logging.getLogger(__name__)
+
+# configuration key holding dict of algorithm name => algorithm settings
+ALGORITHMS_KEY = 'ALGORITHMS'
+
+# keys in algorithm settings
+BACKEND_KEY = 'backend'
+IMAGE_KEY = 'image'
+FLAGS_KEY = 'flags'
+DIRECTED_FLAG_KEY = 'directedflag'
+CALLABLE_KEY = 'callable'
+KWARGS_KEY = 'kwargs'
+
+# resource profile of algorithm, overrides profile of size class
+# of job, see commundetect_rest/resources.py
+RESOURCES_KEY = 'resources'
+
+# flags setting number of threads algorithm runs, {threads} is
+# replaced by thread count of resource profile of job. For example
+# ['--num-trials', '{threads}'] to run as many Infomap trials in
+# parallel as job has threads
+THREAD_FLAGS_KEY = 'threadflags'
+
+# version of algorithm, part of result cache key so bump this
+# when a new image or code gives different results
+VERSION_KEY = 'version'
+
+# docker image that writes result edges to standard out
+DOCKER_BACKEND = 'docker'
+
+# Infomap docker image whose .tree output is converted to edges
+INFOMAP_BACKEND = 'infomap'
+
+# python callable run inside the worker process. Callable is given
+# as module:function or /path/to/file.py:function and is invoked as
+# function(edgelistfile, directed=bool, writer=ResultWriter, **kwargs)
+# returning 0 on success
+INPROCESS_BACKEND = 'inprocess'
+
+BACKENDS = [DOCKER_BACKEND, INFOMAP_BACKEND, INPROCESS_BACKEND]
+
+# Example of running Louvain in the worker instead of docker:
+#
+# ALGORITHMS = {
+#     'louvain': {'backend': 'inprocess',
+#                 'callable': '/path/to/algorithmdockers/louvain/'
+#                             'run.py:run_louvain'}
+# }
+DEFAULT_ALGORITHMS = {
+    'infomap': {BACKEND_KEY: INFOMAP_BACKEND,
+                IMAGE_KEY: 'coleslawndex/infomap'},
+    'louvain': {BACKEND_KEY: DOCKER_BACKEND,
+                IMAGE_KEY: 'coleslawndex/testlouvain',
+                DIRECTED_FLAG_KEY: '--directed'}
+}
+
+
+class Algorithm(object):
+    """
+    Settings for one algorithm
+    """
+    def __init__(self, name, settings):
+        """
+        Constructor
+
+        :param name: name of algorithm
+        :param settings: dict of settings
+        :raises ValueError: if settings are invalid
+        """
+        self.name = name
+        self.backend = settings.get(BACKEND_KEY, DOCKER_BACKEND)
+        if self.backend not in BACKENDS:
+            raise ValueError('Algorithm ' + name + ' has unknown backend: ' +
+                             str(self.backend))
+        self.image = settings.get(IMAGE_KEY)
+        self.flags = list(settings.get(FLAGS_KEY, []))
+        self.directedflag = settings.get(DIRECTED_FLAG_KEY)
+        self.callablename = settings.get(CALLABLE_KEY)
+        self.kwargs = dict(settings.get(KWARGS_KEY, {}))
+        self.resources = dict(settings.get(RESOURCES_KEY, {}))
+        self.threadflags = list(settings.get(THREAD_FLAGS_KEY, []))
+        self.version = settings.get(VERSION_KEY)
+        if self.version is None:
+            self.version = self.image or self.callablename
+        if self.backend == INPROCESS_BACKEND:
+            if self.callablename is None:
+                raise ValueError('Algorithm ' + name + ' needs ' +
+                                 CALLABLE_KEY + ' set')
+        elif self.image is None:
+            raise ValueError('Algorithm ' + name + ' needs ' +
+                             IMAGE_KEY + ' set')
+        self._callable = None
+
+    def get_callable(self):
+        """
+        Loads, on first call, the python callable for in process
+        algorithms
+
+        :return: callable
+        """
+        if self._callable is None:
+            self._callable = load_callable(self.callablename)
+        return self._callable
+
+
+def load_callable(callablename):
+    """
+    Loads callable given as module:function or /path/to/file.py:function
+
+    :param callablename: name of callable
+    :raises ValueError: if callablename is not in expected format
+    :return: callable
+    """
+    modname, sep, funcname = callablename.rpartition(':')
+    if sep == '' or modname == '' or funcname == '':
+        raise ValueError('Expected module:function or '
+                         'file.py:function, got: ' + callablename)
+    if modname.endswith('.py'):
+        modpath = os.path.abspath(modname)
+        spec = importlib.util.spec_from_file_location(
+            'commundetect_algo_' +
+            os.path.splitext(os.path.basename(modpath))[0], modpath)
+        mod = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(mod)
+    else:
+        mod = importlib.import_module(modname)
+    logger.info('Loaded algorithm callable: ' + callablename)
+    return getattr(mod, funcname)
+
+
+class AlgorithmRegistry(object):
+    """
+    Maps algorithm name to :py:class:`Algorithm`
+    """
+    def __init__(self, algorithms):
+        """
+        Constructor
+
+        :param algorithms: dict of algorithm name => settings dict
+        """
+        self._algorithms = {}
+        for name in algorithms:
+            self._algorithms[name] = Algorithm(name, algorithms[name])
+
+    def get(self, name):
+        """
+        Gets algorithm
+
+        :param name: name of algorithm
+        :return: algorithm or None if not found
+        :rtype: :py:class:`Algorithm`
+        """
+        return self._algorithms.get(name)
+
+    def get_names(self):
+        """
+        Gets names of all algorithms
+
+        :return: sorted names
+        :rtype: list
+        """
+        return sorted(self._algorithms.keys())
@@ -0,0 +1,288 @@
+
+import os
+import math
+import time
+import fcntl
+import logging
+import tempfile
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# dict of size class name to resource profile of its jobs, see
+# DEFAULT_RESOURCES. Algorithms can override values with a
+# 'resources' profile in their settings
+RESOURCES_KEY = 'RESOURCES'
+
+# directory of lock files, one per core, used to give concurrent
+# jobs on a host their own cores. None to not pin jobs to cores
+CORE_LOCK_DIR_KEY = 'CORE_LOCK_DIR'
+
+# keys in resource profile
+CPUS_KEY = 'cpus'
+MEMORY_KEY = 'memory'
+THREADS_KEY = 'threads'
+
+# cpus of profile for a job that gets every core of the host, it
+# waits until other jobs let go of their cores
+ALL_CPUS = 'all'
+
+# memory of profile can be a percentage of memory of the host
+PERCENT_SUFFIX = '%'
+
+# concurrency of size class times its cores should not be more
+# than the host has, large jobs take the whole host but leave some
+# memory to the worker and system
+DEFAULT_RESOURCES = {
+    'small': {CPUS_KEY: 1, MEMORY_KEY: '2g'},
+    'medium': {CPUS_KEY: 2, MEMORY_KEY: '8g'},
+    'large': {CPUS_KEY: ALL_CPUS, MEMORY_KEY: '80%'}
+}
+
+DEFAULT_CORE_LOCK_DIR = os.path.join(tempfile.gettempdir(),
+                                     'commundetect_cores')
+
+# status of job killed for using more than its memory limit
+OUT_OF_MEMORY_STATUS = 'outofmemory'
+
+# exit code of docker run when container is killed with SIGKILL,
+# which is sent by the kernel OOM killer and by docker kill alike
+KILLED_EXIT_CODE = 137
+
+# placeholder in thread flags of algorithm replaced by thread count
+THREADS_PLACEHOLDER = '{threads}'
+
+
+class OutOfMemoryError(Exception):
+    """
+    Raised when a job is killed for using more than its memory limit
+    """
+    pass
+
+
+class ResourceProfile(object):
+    """
+    CPUs, memory and threads a job may use
+    """
+    def __init__(self, cpus=None, memory=None, threads=None, cpuset=None):
+        """
+        Constructor
+
+        :param cpus: number of cores or None for no limit
+        :param memory: memory limit as docker size such as '4g'
+                       or None for no limit
+        :param threads: threads algorithm should run, if None
+                        the number of cores
+        :param cpuset: list of cores job is pinned to or None
+        """
+        self.cpus = cpus
+        self.memory = memory
+        if threads is None and cpus is not None:
+            threads = max(1, int(math.ceil(cpus)))
+        self.threads = threads
+        self.cpuset = cpuset
+
+    def pin(self, cpuset):
+        """
+        Gets copy of profile pinned to cores
+
+        :param cpuset: list of cores or None
+        :return: profile
+        :rtype: :py:class:`ResourceProfile`
+        """
+        return ResourceProfile(cpus=self.cpus, memory=self.memory,
+                               threads=self.threads, cpuset=cpuset)
+
+    def get_docker_options(self):
+        """
+        Gets docker run options applying profile
+
+        :return: options
+        :rtype: list
+        """
+        opts = []
+        if self.cpus is not None:
+            opts.extend(['--cpus', str(self.cpus)])
+        if self.cpuset:
+            opts.extend(['--cpuset-cpus',
+                         ','.join(str(c) for c in self.cpuset)])
+        if self.memory is not None:
+            # no swap so limit is a real limit
+            opts.extend(['--memory', str(self.memory),
+                         '--memory-swap', str(self.memory)])
+        if self.threads is not None:
+            opts.extend(['-e', 'OMP_NUM_THREADS=' + str(self.threads)])
+        return opts
+
+    def get_thread_flags(self, threadflags):
+        """
+        Gets algorithm flags setting number of threads
+
+        :param threadflags: flags of algorithm with
+                            :py:const:`THREADS_PLACEHOLDER` where
+                            thread count goes
+        :return: flags, empty if threads is not set
+        :rtype: list
+        """
+        if self.threads is None or not threadflags:
+            return []
+        return [f.replace(THREADS_PLACEHOLDER, str(self.threads))
+                for f in threadflags]
+
+    def check_oom_killed(self, oomkilled):
+        """
+        Checks if job was killed because it ran out of memory
+
+        :param oomkilled: True if docker reports container of job
+                          was killed by the OOM killer
+        :raises OutOfMemoryError: if job was killed by the OOM
+                                  killer and has a memory limit
+        """
+        if self.memory is not None and oomkilled is True:
+            raise OutOfMemoryError('Job was killed for using more than '
+                                   'its memory limit of ' +
+                                   str(self.memory))
+
+
+def get_exit_message(ecode):
+    """
+    Gets error message of command that exited with non-zero
+    exit code
+
+    :param ecode: exit code
+    :return: message
+    :rtype: str
+    """
+    message = 'Command failed with non-zero exit code: ' + str(ecode)
+    if ecode == KILLED_EXIT_CODE:
+        message += ', it was killed'
+    return message
+
+
+def get_host_cpus():
+    """
+    Gets number of cores this process may run on
+
+    :return: number of cores
+    :rtype: int
+    """
+    return len(os.sched_getaffinity(0))
+
+
+def get_host_memory():
+    """
+    Gets physical memory of host
+
+    :return: bytes
+    :rtype: int
+    """
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+
+
+def get_profile(sizeprofiles, sizeclass, algoprofile=None):
+    """
+    Gets resource profile of job
+
+    :param sizeprofiles: dict of size class name to profile
+    :param sizeclass: name of size class of job or None
+    :param algoprofile: profile of algorithm, its values
+                        override those of size class, or None
+    :return: profile
+    :rtype: :py:class:`ResourceProfile`
+    """
+    settings = dict((sizeprofiles or {}).get(sizeclass) or {})
+    settings.update(algoprofile or {})
+    cpus = settings.get(CPUS_KEY)
+    if cpus == ALL_CPUS:
+        cpus = get_host_cpus()
+    memory = settings.get(MEMORY_KEY)
+    if isinstance(memory, str) and memory.endswith(PERCENT_SUFFIX):
+        # docker takes memory in bytes without a unit
+        memory = str(int(get_host_memory() *
+                         float(memory[:-len(PERCENT_SUFFIX)]) / 100.0))
+    return ResourceProfile(cpus=cpus, memory=memory,
+                           threads=settings.get(THREADS_KEY))
+
+
+class CoreAllocator(object):
+    """
+    Packs jobs onto cores of the host. Each core has a lock file
+    that a job holds an exclusive lock on while it runs, so jobs
+    of every worker process on the host get their own cores. The
+    operating system lets go of locks of killed processes
+    """
+    def __init__(self, lockdir, cores=None, poll=0.5, sleepfunc=time.sleep):
+        """
+        Constructor
+
+        :param lockdir: directory of lock files, created if needed
+        :param cores: list of cores to hand out, None for cores
+                      this process may run on
+        :param poll: seconds between tries while cores are busy
+        :param sleepfunc: function that sleeps given seconds
+        """
+        self._lockdir = lockdir
+        if cores is None:
+            cores = sorted(os.sched_getaffinity(0))
+        self._cores = cores
+        self._poll = poll
+        self._sleep = sleepfunc
+
+    def _try_lock(self, ncores):
+        os.makedirs(self._lockdir, exist_ok=True)
+        held = []
+        for core in self._cores:
+            f = open(os.path.join(self._lockdir, str(core) + '.lock'), 'a')
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                continue
+            held.append((core, f))
+            if len(held) == ncores:
+                return held
+        self._unlock(held)
+        return None
+
+    @staticmethod
+    def _unlock(held):
+        for core, f in held:
+            f.close()
+
+    @contextmanager
+    def allocate(self, ncores):
+        """
+        Waits for free cores and holds them until context exits.
+        Lowest free cores are taken so jobs stay packed together.
+        Cores are not held while waiting so jobs cannot block
+        each other
+
+        :param ncores: number of cores wanted, None for no
+                       pinning, more than host has gets all cores
+        :return: list of cores held or None if ncores is None
+        """
+        if ncores is None:
+            yield None
+            return
+        ncores = max(1, min(int(math.ceil(ncores)), len(self._cores)))
+        held = self._try_lock(ncores)
+        while held is None:
+            self._sleep(self._poll)
+            held = self._try_lock(ncores)
+        try:
+            yield [core for core, f in held]
+        finally:
+            self._unlock(held)
+
+
+def create_core_allocator(lockdir):
+    """
+    Creates core allocator
+
+    :param lockdir: directory of lock files or None to not pin
+                    jobs to cores
+    :return: allocator or None
+    """
+    if lockdir is None:
+        return None
+    return CoreAllocator(lockdir)
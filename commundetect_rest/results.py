@@ -0,0 +1,162 @@
+
+import io
+import logging
+import numpy as np
+
+from commundetect_rest import edgelist
+
+logger = logging.getLogger(__name__)
+
+# edge types used in Infomap results
+TERM_TERM = 't-t'
+TERM_GENE = 't-g'
+
+# edge types used by algorithms run in docker
+TERM_TERM_LONG = 'term-term'
+TERM_GENE_LONG = 'term-gene'
+
+# edge types whose destination is a node of the input graph
+GENE_EDGE_TYPES = [TERM_GENE, TERM_GENE_LONG]
+
+EDGE_SEP = ';'
+FIELD_SEP = ','
+
+# fields of each edge: source, destination and type
+EDGE_FIELDS = 3
+
+# number of edges formatted per write call
+WRITE_CHUNK = 65536
+
+
+class ResultWriter(object):
+    """
+    Serializes hierarchy edges as ``src,dst,type;`` into a buffer
+    or file in linear time. Call :py:meth:`get_result` once all edges
+    have been added to get the payload as a single string
+    """
+    def __init__(self, outfile=None):
+        """
+        Constructor
+
+        :param outfile: path to file to write edges to, if None
+                        edges are kept in memory
+        """
+        self._outfile = outfile
+        if outfile is None:
+            self._stream = io.BytesIO()
+        else:
+            self._stream = open(outfile, 'w+b')
+
+    @property
+    def stream(self):
+        """
+        Binary stream edges are written to. Can be handed to
+        a subprocess as stdout if this writer is backed by a file
+        """
+        return self._stream
+
+    def add_edge(self, src, dst, edgetype):
+        """
+        Adds a single edge
+
+        :param src: source node id
+        :param dst: destination node id
+        :param edgetype: type of edge
+        """
+        self._stream.write((str(src) + FIELD_SEP + str(dst) + FIELD_SEP +
+                            edgetype + EDGE_SEP).encode('utf-8'))
+
+    def add_edges(self, edges, edgetype):
+        """
+        Adds edges sorted by source then destination so output
+        is the same from run to run
+
+        :param edges: numpy array of shape (N, 2) with source,
+                      destination node ids
+        :param edgetype: type of edges
+        """
+        edges = np.asarray(edges)
+        if len(edges) == 0:
+            return
+        order = np.lexsort((edges[:, 1], edges[:, 0]))
+        edges = edges[order]
+        suffix = FIELD_SEP + edgetype + EDGE_SEP
+        for start in range(0, len(edges), WRITE_CHUNK):
+            chunk = edges[start:start + WRITE_CHUNK].tolist()
+            self._stream.write(''.join([str(e[0]) + FIELD_SEP +
+                                        str(e[1]) + suffix
+                                        for e in chunk]).encode('utf-8'))
+
+    def get_result(self):
+        """
+        Gets everything written and closes the writer
+
+        :return: edges as string
+        :rtype: str
+        """
+        try:
+            if self._outfile is None:
+                return self._stream.getvalue().decode('utf-8')
+            self._stream.flush()
+            self._stream.seek(0)
+            return self._stream.read().decode('utf-8')
+        finally:
+            self.close()
+
+    def close(self):
+        """
+        Closes underlying stream
+        """
+        if not self._stream.closed:
+            self._stream.close()
+
+
+def translate_result(result, nodeids):
+    """
+    Translates result of algorithm run on graph whose nodes were
+    interned as ids 0..n-1 back to node ids of the input graph.
+    Terms are renumbered to start just above the largest integer
+    node id so a term never has the id of a node, if no node id
+    is an integer terms keep the small ids the algorithm gave them
+
+    :param result: edges as ``src,dst,type;``
+    :param nodeids: node id of each interned id
+    :type nodeids: :py:class:`numpy.ndarray`
+    :raises ValueError: if result cannot be parsed or has a node
+                        that is not in the input graph
+    :return: edges with node ids of input graph
+    :rtype: str
+    """
+    if not result:
+        return result
+    fields = result.replace(EDGE_SEP, FIELD_SEP).split(FIELD_SEP)
+    if fields[-1] == '':
+        fields.pop()
+    if len(fields) % EDGE_FIELDS != 0:
+        raise ValueError('Expected ' + str(EDGE_FIELDS) +
+                         ' fields on every edge of result')
+    src = np.array(fields[0::EDGE_FIELDS], dtype=np.int64)
+    dst = np.array(fields[1::EDGE_FIELDS], dtype=np.int64)
+    edgetypes = fields[2::EDGE_FIELDS]
+    del fields
+    isgene = np.isin(np.array(edgetypes), GENE_EDGE_TYPES)
+    genes = dst[isgene]
+    if len(genes) > 0 and (genes.min() < 0 or genes.max() >= len(nodeids)):
+        raise ValueError('Result has a node that is not in input graph')
+
+    terms = np.concatenate((src, dst[~isgene]))
+    shift = max(0, edgelist.get_max_integer_id(nodeids) + 1 -
+                int(terms.min())) if len(terms) > 0 else 0
+    labels = edgelist.get_labels(nodeids)
+    out = []
+    for start in range(0, len(src), WRITE_CHUNK):
+        end = start + WRITE_CHUNK
+        out.append(''.join([str(s + shift) + FIELD_SEP +
+                            (labels[d] if g else str(d + shift)) +
+                            FIELD_SEP + t + EDGE_SEP
+                            for s, d, t, g in
+                            zip(src[start:end].tolist(),
+                                dst[start:end].tolist(),
+                                edgetypes[start:end],
+                                isgene[start:end].tolist())]))
+    return ''.join(out)
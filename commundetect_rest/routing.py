@@ -0,0 +1,301 @@
+
+import math
+import logging
+
+import numpy as np
+from kombu import Queue
+
+from commundetect_rest import edgelist
+
+logger = logging.getLogger(__name__)
+
+# list of size classes, see DEFAULT_SIZE_CLASSES
+SIZE_CLASSES_KEY = 'SIZE_CLASSES'
+
+# environment variable naming size class a worker runs jobs for,
+# the worker then only consumes the queue of that class with
+# the concurrency of that class
+WORKER_SIZE_CLASS_ENV = 'COMMUNDETECT_WORKER_SIZE_CLASS'
+
+# keys in size class
+NAME_KEY = 'name'
+MAX_NODES_KEY = 'maxnodes'
+MAX_EDGES_KEY = 'maxedges'
+QUEUE_KEY = 'queue'
+CONCURRENCY_KEY = 'concurrency'
+
+# keys added to task status
+SIZE_CLASS_STATUS_KEY = 'sizeclass'
+NODES_STATUS_KEY = 'nodes'
+EDGES_STATUS_KEY = 'edges'
+
+# highest priority a job gets, queues are declared with this
+# as x-max-priority
+MAX_PRIORITY = 9
+
+# bytes of an edge list, those up to SPACE are taken as whitespace
+SPACE = ord(' ')
+NEWLINE = ord('\n')
+
+# checked in order, a graph goes in the first class whose limits
+# it is within, a limit of None means no limit
+DEFAULT_SIZE_CLASSES = [
+    {NAME_KEY: 'small',
+     MAX_NODES_KEY: 10000,
+     MAX_EDGES_KEY: 50000,
+     QUEUE_KEY: 'communitydetection-small',
+     CONCURRENCY_KEY: 4},
+    {NAME_KEY: 'medium',
+     MAX_NODES_KEY: 200000,
+     MAX_EDGES_KEY: 1000000,
+     QUEUE_KEY: 'communitydetection-medium',
+     CONCURRENCY_KEY: 2},
+    {NAME_KEY: 'large',
+     MAX_NODES_KEY: None,
+     MAX_EDGES_KEY: None,
+     QUEUE_KEY: 'communitydetection-large',
+     CONCURRENCY_KEY: 1}
+]
+
+
+class GraphCounter(object):
+    """
+    Counts edges and distinct nodes of an edge list fed to it in
+    chunks of bytes, lines with fewer than two columns and comment
+    lines are skipped. Distinct nodes are only tracked up to
+    maxnodes so memory used stays bounded. Chunks are counted
+    with NumPy and bytes methods, not line by line. Integer node
+    ids are tracked in a sorted array until a chunk has labels,
+    then all node ids are tracked as labels
+    """
+    def __init__(self, maxnodes=None):
+        """
+        Constructor
+
+        :param maxnodes: stop tracking nodes once more than this
+                         many are seen, None to track all
+        """
+        self._maxnodes = maxnodes
+        self._ids = np.empty(0, dtype=np.float64)
+        self._labels = set()
+        self._partial = b''
+        self.edges = 0
+
+    @property
+    def nodes(self):
+        """
+        Number of distinct nodes, only a lower bound
+        if :py:attr:`exact` is False
+        """
+        if self._ids is None:
+            return len(self._labels)
+        return len(self._ids)
+
+    @property
+    def exact(self):
+        """
+        True if :py:attr:`nodes` is the number of distinct nodes
+        """
+        return self._maxnodes is None or self.nodes <= self._maxnodes
+
+    @staticmethod
+    def _parse_ids(data, ncols):
+        """
+        Gets distinct node ids of chunk whose rows all have ncols
+        columns
+
+        :return: sorted node ids or None if they are not integers
+        """
+        try:
+            values = edgelist.parse_numbers(data)
+        except edgelist.EdgeListError:
+            return None
+        ids = np.unique(values.reshape(-1, ncols)[:, :2])
+        if not np.array_equal(ids, np.trunc(ids)):
+            return None
+        return ids
+
+    def _count(self, data):
+        """
+        Counts chunk of whole lines
+        """
+        if edgelist.COMMENT in data:
+            data = edgelist.COMMENT_LINE_RE.sub(b'', data)
+        text = np.frombuffer(data, dtype=np.uint8)
+        space = text <= SPACE
+        starts = np.flatnonzero(~space & np.concatenate(([True],
+                                                         space[:-1])))
+        # columns of each line that has any
+        lines = np.searchsorted(np.flatnonzero(text == NEWLINE), starts)
+        columns = np.bincount(lines)
+        columns = columns[columns > 0]
+        self.edges += int(np.count_nonzero(columns >= 2))
+        if self.exact is False or len(columns) == 0:
+            return
+
+        ncols = columns[0]
+        if self._ids is not None and ncols >= 2 and\
+                np.all(columns == ncols):
+            ids = self._parse_ids(data, ncols)
+            if ids is not None:
+                ids = np.concatenate((self._ids, ids))
+                # stable sort merges the two sorted runs
+                ids.sort(kind='stable')
+                self._ids = ids[np.concatenate(([True],
+                                                ids[1:] != ids[:-1]))]
+                return
+        if self._ids is not None:
+            self._labels.update(b'%d' % x for x in self._ids)
+            self._ids = None
+
+        # first two tokens of each line with at least two
+        tokens = np.array(data.split(), dtype=object)
+        first = (np.cumsum(columns) - columns)[columns >= 2]
+        self._labels.update(tokens[first])
+        self._labels.update(tokens[first + 1])
+
+    def update(self, buf):
+        """
+        Counts edges in chunk of edge list
+
+        :param buf: bytes
+        """
+        end = buf.rfind(b'\n')
+        if end == -1:
+            self._partial += buf
+            return
+        data = self._partial + buf[:end]
+        self._partial = buf[end + 1:]
+        self._count(data)
+
+    def finish(self):
+        """
+        Counts last line if edge list does not end with a newline
+        """
+        if self._partial:
+            self._count(self._partial)
+            self._partial = b''
+
+
+class SizeClasses(object):
+    """
+    Assigns jobs to a size class, each with its own queue, based
+    on number of nodes and edges in the input graph
+    """
+    def __init__(self, sizeclasses=None):
+        """
+        Constructor
+
+        :param sizeclasses: list of size classes, see
+                            :py:const:`DEFAULT_SIZE_CLASSES`
+        :raises ValueError: if there are no size classes
+        """
+        if sizeclasses is None:
+            sizeclasses = DEFAULT_SIZE_CLASSES
+        if len(sizeclasses) == 0:
+            raise ValueError('At least one size class is needed')
+        self._classes = sizeclasses
+
+    def get_names(self):
+        """
+        Gets names of size classes
+
+        :return: names in order they are checked
+        :rtype: list
+        """
+        return [c[NAME_KEY] for c in self._classes]
+
+    def get(self, name):
+        """
+        Gets size class
+
+        :param name: name of size class
+        :raises KeyError: if there is no size class with name
+        :return: size class
+        :rtype: dict
+        """
+        for sizeclass in self._classes:
+            if sizeclass[NAME_KEY] == name:
+                return sizeclass
+        raise KeyError('No size class named ' + str(name))
+
+    def get_max_tracked_nodes(self):
+        """
+        Gets largest node limit of any size class, counting
+        distinct nodes past this does not change the class
+
+        :return: limit, 0 if no size class limits nodes
+        :rtype: int
+        """
+        limits = [c.get(MAX_NODES_KEY) for c in self._classes[:-1]]
+        limits = [x for x in limits if x is not None]
+        if len(limits) == 0:
+            return 0
+        return max(limits)
+
+    def classify(self, nodes, edges):
+        """
+        Gets size class for graph, graphs larger than every
+        class go in the last one
+
+        :param nodes: number of nodes
+        :param edges: number of edges
+        :return: size class
+        :rtype: dict
+        """
+        for sizeclass in self._classes:
+            maxnodes = sizeclass.get(MAX_NODES_KEY)
+            maxedges = sizeclass.get(MAX_EDGES_KEY)
+            if maxnodes is not None and nodes > maxnodes:
+                continue
+            if maxedges is not None and edges > maxedges:
+                continue
+            return sizeclass
+        return self._classes[-1]
+
+    def get_queues(self, name=None):
+        """
+        Gets queues to declare
+
+        :param name: name of size class to get queue of or None
+                     to get queues of all size classes
+        :return: queues
+        :rtype: list
+        """
+        if name is not None:
+            classes = [self.get(name)]
+        else:
+            classes = self._classes
+        return [Queue(c[QUEUE_KEY], routing_key=c[QUEUE_KEY])
+                for c in classes]
+
+
+def get_priority(edges):
+    """
+    Gets priority of job so smaller graphs in a queue go first,
+    priority drops by one for every factor of ten more edges
+
+    :param edges: number of edges
+    :return: priority from 0 to :py:const:`MAX_PRIORITY`
+    :rtype: int
+    """
+    if edges <= 1:
+        return MAX_PRIORITY
+    return max(0, MAX_PRIORITY - int(math.log10(edges)))
+
+
+def get_size_info(sizeclass, counter):
+    """
+    Gets size of graph for task status
+
+    :param sizeclass: size class of graph
+    :param counter: :py:class:`GraphCounter` that counted graph
+    :return: size info, number of nodes is left out if it
+             was not counted exactly
+    :rtype: dict
+    """
+    sizeinfo = {SIZE_CLASS_STATUS_KEY: sizeclass[NAME_KEY],
+                EDGES_STATUS_KEY: counter.edges}
+    if counter.exact is True:
+        sizeinfo[NODES_STATUS_KEY] = counter.nodes
+    return sizeinfo
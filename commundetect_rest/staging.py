@@ -0,0 +1,383 @@
+
+import abc
+import os
+import zlib
+import base64
+import shutil
+import logging
+import tempfile
+import urllib.error
+import urllib.request
+
+logger = logging.getLogger(__name__)
+
+# configuration keys shared by REST service and worker
+INPUT_STAGING_KEY = 'INPUT_STAGING'
+INLINE_INPUT_MAX_KEY = 'INLINE_INPUT_MAX'
+BLOB_STORE_KEY = 'BLOB_STORE'
+
+# input is in task directory under JOB_PATH which REST
+# service and worker must share
+SHARED_STAGING = 'shared'
+
+# input is compressed and sent with the task through the broker
+INLINE_STAGING = 'inline'
+
+# input is put in a blob store, named by its content hash, that
+# the worker pulls it from, it is deleted once no task uses it
+BLOB_STAGING = 'blob'
+
+# keys in input reference passed to task
+REF_TYPE = 'type'
+REF_DATA = 'data'
+REF_NAME = 'name'
+REF_TASK = 'task'
+
+# prefix of redis keys holding tasks that use each blob
+REDIS_PREFIX = 'commundetect:blobrefs:'
+
+# seconds references are kept after a task was last staged, in
+# case the task is lost without releasing its input
+REF_TTL = 7 * 86400
+
+# longest time in seconds a blob is locked while it is stored
+# or deleted
+REF_LOCK_TIMEOUT = 600
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class StagingError(Exception):
+    """
+    Raised when input cannot be staged or fetched
+    """
+    pass
+
+
+class BlobStore(abc.ABC):
+    """
+    Store of input files keyed by hash of their content
+    """
+    @abc.abstractmethod
+    def put(self, name, path):
+        """
+        Stores file
+
+        :param name: name of blob, hash of file content
+        :param path: path to file
+        """
+
+    @abc.abstractmethod
+    def get(self, name, path):
+        """
+        Writes blob to file
+
+        :param name: name of blob, hash of file content
+        :param path: path to write to
+        :raises StagingError: if blob is not found
+        """
+
+    @abc.abstractmethod
+    def delete(self, name):
+        """
+        Removes blob if it exists
+
+        :param name: name of blob, hash of file content
+        """
+
+
+class DirectoryBlobStore(BlobStore):
+    """
+    Blob store in a directory, for example on a shared or
+    network filesystem
+    """
+    def __init__(self, rootdir):
+        """
+        Constructor
+
+        :param rootdir: directory to store blobs in
+        """
+        self._rootdir = rootdir
+
+    def _path(self, name):
+        return os.path.join(self._rootdir, name[:2], name)
+
+    def put(self, name, path):
+        dest = self._path(name)
+        destdir = os.path.dirname(dest)
+        os.makedirs(destdir, mode=0o775, exist_ok=True)
+        fd, tmpfile = tempfile.mkstemp(dir=destdir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as out, open(path, 'rb') as f:
+                shutil.copyfileobj(f, out, COPY_CHUNK_SIZE)
+            os.chmod(tmpfile, 0o664)
+            os.rename(tmpfile, dest)
+        except Exception:
+            if os.path.isfile(tmpfile):
+                os.unlink(tmpfile)
+            raise
+
+    def get(self, name, path):
+        src = self._path(name)
+        if not os.path.isfile(src):
+            raise StagingError('Blob ' + name + ' not found in ' +
+                               self._rootdir)
+        shutil.copyfile(src, path)
+
+    def delete(self, name):
+        try:
+            os.unlink(self._path(name))
+        except OSError:
+            pass
+
+
+class HttpBlobStore(BlobStore):
+    """
+    Blob store behind an HTTP server that accepts PUT, GET
+    and DELETE of <url>/<name>
+    """
+    def __init__(self, url, timeout=60):
+        """
+        Constructor
+
+        :param url: base url of blob store
+        :param timeout: seconds to wait on server
+        """
+        self._url = url.rstrip('/')
+        self._timeout = timeout
+
+    def put(self, name, path):
+        with open(path, 'rb') as f:
+            req = urllib.request.Request(self._url + '/' + name, data=f,
+                                         method='PUT')
+            req.add_header('Content-Length', str(os.path.getsize(path)))
+            req.add_header('Content-Type', 'application/octet-stream')
+            with urllib.request.urlopen(req, timeout=self._timeout):
+                pass
+
+    def get(self, name, path):
+        try:
+            with urllib.request.urlopen(self._url + '/' + name,
+                                        timeout=self._timeout) as resp,\
+                    open(path, 'wb') as f:
+                shutil.copyfileobj(resp, f, COPY_CHUNK_SIZE)
+        except urllib.error.HTTPError as e:
+            raise StagingError('Unable to get blob ' + name + ': ' +
+                               str(e))
+
+    def delete(self, name):
+        req = urllib.request.Request(self._url + '/' + name,
+                                     method='DELETE')
+        try:
+            with urllib.request.urlopen(req, timeout=self._timeout):
+                pass
+        except urllib.error.HTTPError as e:
+            if e.code != 404:
+                logger.warning('Unable to delete blob ' + name + ': ' +
+                               str(e))
+        except OSError as e:
+            logger.warning('Unable to delete blob ' + name + ': ' +
+                           str(e))
+
+
+def create_blob_store(location):
+    """
+    Creates blob store
+
+    :param location: http(s) url or directory, None for no blob store
+    :return: blob store or None
+    :rtype: :py:class:`BlobStore`
+    """
+    if location is None:
+        return None
+    if location.startswith('http://') or location.startswith('https://'):
+        return HttpBlobStore(location)
+    return DirectoryBlobStore(location)
+
+
+class BlobReferences(object):
+    """
+    Tasks using each blob, kept in redis so the REST service and
+    workers share them. Identical inputs are stored once as a blob
+    named by their content hash, which is deleted when the last
+    task using it releases it
+    """
+    def __init__(self, blobstore, client, ttl=REF_TTL,
+                 locktimeout=REF_LOCK_TIMEOUT):
+        """
+        Constructor
+
+        :param blobstore: blob store
+        :type blobstore: :py:class:`BlobStore`
+        :param client: redis client
+        :param ttl: seconds references are kept
+        :param locktimeout: longest time in seconds a blob is locked
+        """
+        self._blobstore = blobstore
+        self._redis = client
+        self._ttl = ttl
+        self._locktimeout = locktimeout
+
+    def _refs(self, name):
+        return REDIS_PREFIX + 'refs:' + name
+
+    def _blobof(self, taskid):
+        return REDIS_PREFIX + 'blobof:' + taskid
+
+    def _lock(self, name):
+        # so a blob is not deleted while it is stored for a new task
+        return self._redis.lock(REDIS_PREFIX + 'lock:' + name,
+                                timeout=self._locktimeout)
+
+    def add(self, name, taskid, path):
+        """
+        Stores file as blob name for task, unless another task
+        already stored the same content
+
+        :param name: name of blob, hash of file content
+        :param taskid: id of task using blob
+        :param path: path to file
+        """
+        refs = self._refs(name)
+        with self._lock(name):
+            if self._redis.scard(refs) == 0:
+                self._blobstore.put(name, path)
+            self._redis.sadd(refs, taskid)
+            self._redis.expire(refs, self._ttl)
+            self._redis.set(self._blobof(taskid), name, ex=self._ttl)
+
+    def release(self, taskid):
+        """
+        Drops reference of task on its blob, the blob is deleted if
+        no other task uses it. Releasing a task again does nothing
+
+        :param taskid: id of task
+        :return: True if blob was deleted
+        :rtype: bool
+        """
+        name = self._redis.get(self._blobof(taskid))
+        if name is None:
+            return False
+        if isinstance(name, bytes):
+            name = name.decode('utf-8')
+        refs = self._refs(name)
+        with self._lock(name):
+            self._redis.srem(refs, taskid)
+            self._redis.delete(self._blobof(taskid))
+            if self._redis.scard(refs) > 0:
+                return False
+            self._blobstore.delete(name)
+            return True
+
+
+class InputStager(object):
+    """
+    Makes an input file written by the REST service available
+    to a worker that may be on another machine
+    """
+    def __init__(self, backend=SHARED_STAGING, inline_max=0,
+                 blobrefs=None):
+        """
+        Constructor
+
+        :param backend: 'shared' or 'blob', used for inputs
+                        too big to send inline
+        :param inline_max: inputs up to this many bytes are sent
+                           inline with the task, 0 to disable
+        :param blobrefs: references to blob store, required for
+                         'blob' backend
+        :type blobrefs: :py:class:`BlobReferences`
+        :raises ValueError: if backend is unknown or missing blob store
+        """
+        if backend not in [SHARED_STAGING, BLOB_STAGING]:
+            raise ValueError('Unknown input staging: ' + str(backend))
+        if backend == BLOB_STAGING and blobrefs is None:
+            raise ValueError('Blob staging requires ' + BLOB_STORE_KEY)
+        self._backend = backend
+        self._inline_max = inline_max
+        self._blobrefs = blobrefs
+
+    def stage(self, path, taskid, contenthash):
+        """
+        Stages input
+
+        :param path: input file
+        :param taskid: id of task input is for
+        :param contenthash: hash of input, names blob so identical
+                            inputs are stored once
+        :return: input reference to pass to task, the input file
+                 can be removed by caller unless type is 'shared'
+        :rtype: dict
+        """
+        if self._inline_max > 0 and\
+                os.path.getsize(path) <= self._inline_max:
+            with open(path, 'rb') as f:
+                data = zlib.compress(f.read())
+            return {REF_TYPE: INLINE_STAGING,
+                    REF_DATA: base64.b64encode(data).decode('ascii')}
+
+        if self._backend == BLOB_STAGING:
+            self._blobrefs.add(contenthash, taskid, path)
+            return {REF_TYPE: BLOB_STAGING, REF_NAME: contenthash,
+                    REF_TASK: taskid}
+
+        return {REF_TYPE: SHARED_STAGING}
+
+    def discard(self, taskid):
+        """
+        Releases input staged in blob store for a task that will not
+        run or was deleted before it could release its input
+
+        :param taskid: id of task
+        """
+        if self._backend == BLOB_STAGING:
+            self._blobrefs.release(taskid)
+
+
+def fetch_input(inputref, path, blobstore=None):
+    """
+    Writes staged input to path, for 'shared' inputs it is
+    already there
+
+    :param inputref: input reference from :py:meth:`InputStager.stage`
+    :param path: where input should be written
+    :param blobstore: blob store for 'blob' inputs
+    :raises StagingError: if input cannot be fetched
+    """
+    reftype = inputref.get(REF_TYPE, SHARED_STAGING)
+    if reftype == SHARED_STAGING:
+        if not os.path.isfile(path):
+            raise StagingError('Input not found: ' + path)
+        return
+
+    os.makedirs(os.path.dirname(path), mode=0o775, exist_ok=True)
+    if reftype == INLINE_STAGING:
+        with open(path, 'wb') as f:
+            f.write(zlib.decompress(base64.b64decode(inputref[REF_DATA])))
+        return
+
+    if reftype == BLOB_STAGING:
+        if blobstore is None:
+            raise StagingError('Input is in blob store but ' +
+                               BLOB_STORE_KEY + ' is not set')
+        blobstore.get(inputref[REF_NAME], path)
+        return
+
+    raise StagingError('Unknown input type: ' + str(reftype))
+
+
+def remove_input(inputref, blobrefs=None):
+    """
+    Releases input staged outside of the task directory once
+    task is done with it
+
+    :param inputref: input reference from :py:meth:`InputStager.stage`
+    :param blobrefs: references to blob store for 'blob' inputs
+    :type blobrefs: :py:class:`BlobReferences`
+    """
+    if inputref.get(REF_TYPE) != BLOB_STAGING or blobrefs is None:
+        return
+    try:
+        blobrefs.release(inputref[REF_TASK])
+    except Exception:
+        logger.exception('Unable to release input ' + inputref[REF_NAME])
@@ -1,12 +1,33 @@
 
 import os
+import time
 import tempfile
 import shutil
-import time
 import logging
 import subprocess
 import numpy as np
+from contextlib import contextmanager
 from celery import Celery
+from celery.exceptions import SoftTimeLimitExceeded
+from celery.worker.request import Request
+from flask import Config
+
+from commundetect_rest import backpressure
+from commundetect_rest import compression
+from commundetect_rest import containers
+from commundetect_rest import costs
+from commundetect_rest import edgelist
+from commundetect_rest import fairshare
+from commundetect_rest import offload
+from commundetect_rest import registry
+from commundetect_rest import resources
+from commundetect_rest import routing
+from commundetect_rest import staging
+from commundetect_rest.parsers import parse_infomap_tree
+from commundetect_rest.results import ResultWriter
+from commundetect_rest.results import TERM_TERM
+from commundetect_rest.results import TERM_GENE
+from commundetect_rest.results import translate_result
 
 celeryapp = Celery('tasks', broker='pyamqp://guest@localhost:5672//',
                    backend='redis://localhost')
@@ -16,233 +37,763 @@ celeryapp.conf.update(
     task_time_limit=120,
     task_acks_late=True,
     worker_prefetch_multiplier=1,
-    worker_concurrency=1,
-    task_routes={'commundetect_rest.*': {'queue': 'communitydetection'}}
+    worker_concurrency=1
 )
 
 logger = logging.getLogger(__name__)
 
+RESULT_FILE = 'result.txt'
+
+# name of edge list file in task directory, written
+# by the REST service before the task is queued. Holds a
+# text or binary edge list, told apart by its first bytes
+EDGE_FILE = 'edgefile.txt'
+
+INFOMAP_IMAGE = 'coleslawndex/infomap'
+
+# directory in task directory holding edge list with
+# nodes interned as ids 0..n-1 that algorithms are run on
+INTERNED_DIR = 'interned'
+
+# standard out of algorithm when run in a warm container
+STDOUT_FILE = 'stdout.txt'
+
+SETTINGS_ENV = 'COMMUNDETECT_REST_SETTINGS'
+
+# if True run algorithms in long lived containers for images
+# listed in WARM_CONTAINER_PROFILES instead of a docker run per job
+WARM_CONTAINERS_KEY = 'WARM_CONTAINERS'
+WARM_CONTAINER_PROFILES_KEY = 'WARM_CONTAINER_PROFILES'
+
+# worker settings, loaded from same configuration file as the REST service
+workerconfig = Config(os.getcwd())
+workerconfig[WARM_CONTAINERS_KEY] = False
+workerconfig[WARM_CONTAINER_PROFILES_KEY] = {
+    'coleslawndex/testlouvain': {containers.MODE_KEY: containers.SERVE_MODE,
+                                 containers.ENTRYPOINT_KEY: '/run.py',
+                                 containers.ARGS_KEY: ['--serve'],
+                                 containers.POOLSIZE_KEY: 1}
+}
+workerconfig[registry.ALGORITHMS_KEY] = registry.DEFAULT_ALGORITHMS
+workerconfig[staging.BLOB_STORE_KEY] = None
+workerconfig[offload.RESULT_STORE_KEY] = None
+workerconfig[offload.RESULT_STORE_MIN_KEY] = 1024 * 1024
+workerconfig[offload.RESULT_TTL_KEY] = 86400
+workerconfig[routing.SIZE_CLASSES_KEY] = routing.DEFAULT_SIZE_CLASSES
+workerconfig[costs.RUN_TIMES_FILE_KEY] = None
+workerconfig[backpressure.THROUGHPUT_WINDOW_KEY] = 600
+workerconfig[fairshare.FAIR_SHARE_KEY] = None
+workerconfig[fairshare.FAIR_SHARE_TARGET_KEY] = 2
+workerconfig[resources.RESOURCES_KEY] = resources.DEFAULT_RESOURCES
+workerconfig[resources.CORE_LOCK_DIR_KEY] = resources.DEFAULT_CORE_LOCK_DIR
+workerconfig.from_envvar(SETTINGS_ENV, silent=True)
+
+# jobs are queued by size of input graph so small jobs
+# are not stuck behind large ones
+sizeclasses = routing.SizeClasses(workerconfig[routing.SIZE_CLASSES_KEY])
+celeryapp.conf.update(
+    task_queues=sizeclasses.get_queues(),
+    task_queue_max_priority=routing.MAX_PRIORITY,
+    task_default_priority=0,
+    task_routes={'commundetect_rest.*': {
+        'queue': sizeclasses.get_queues()[-1].name}})
+
+# a worker started for one size class only runs jobs of that class
+workersizeclass = os.environ.get(routing.WORKER_SIZE_CLASS_ENV)
+if workersizeclass:
+    celeryapp.conf.update(
+        task_queues=sizeclasses.get_queues(workersizeclass),
+        worker_concurrency=sizeclasses.get(
+            workersizeclass)[routing.CONCURRENCY_KEY])
+
+# task results, or references to results in result store,
+# expire from result backend along with stored results
+celeryapp.conf.update(result_expires=workerconfig[offload.RESULT_TTL_KEY])
+
+resultstore = offload.create_result_store(
+    workerconfig[offload.RESULT_STORE_KEY],
+    ttl=workerconfig[offload.RESULT_TTL_KEY])
+
+blobstore = staging.create_blob_store(workerconfig[staging.BLOB_STORE_KEY])
+blobrefs = None
+if blobstore is not None:
+    blobrefs = staging.BlobReferences(blobstore, celeryapp.backend.client)
+
+# algorithms this worker can run, loaded once from configuration
+algorithms = registry.AlgorithmRegistry(workerconfig[registry.ALGORITHMS_KEY])
+
+# concurrent jobs on this host are given their own cores
+coreallocator = resources.create_core_allocator(
+    workerconfig[resources.CORE_LOCK_DIR_KEY])
+
+
+def run_warm_cmd(imagename, workdir, args, stdout=None, profile=None):
+    """
+    Runs algorithm in a warm container if warm containers are enabled
+    and a profile exists for image. Warm containers are started with
+    the limits of profile and pinned to its cores for each job
+
+    :param imagename: docker image
+    :param workdir: job directory, its parent is bind mounted
+    :param args: arguments for algorithm
+    :param stdout: file object to write standard out of command to,
+                   if None standard out is returned as bytes
+    :param profile: resources container may use or None
+    :raises OutOfMemoryError: if container ran out of memory
+    :return: None if image is not run warm otherwise
+             (return code, out, err)
+    """
+    if workerconfig[WARM_CONTAINERS_KEY] is not True:
+        return None
+    warmprofile = workerconfig[WARM_CONTAINER_PROFILES_KEY].get(imagename)
+    if warmprofile is None:
+        return None
+
+    mountdir = os.path.dirname(os.path.abspath(workdir))
+    pool = containers.get_container_pool(imagename, mountdir, warmprofile,
+                                         limits=profile)
+    if stdout is None:
+        stdoutfile = os.path.join(workdir, STDOUT_FILE)
+    else:
+        stdoutfile = stdout.name
+
+    ecode, err = pool.run(args, stdoutfile,
+                          cpuset=profile.cpuset if profile else None)
+    out = None
+    if stdout is None and os.path.isfile(stdoutfile):
+        with open(stdoutfile, 'rb') as f:
+            out = f.read()
+    return ecode, out, err
+
+
+def communicate(p, taskid=None):
+    """
+    Waits for process to finish, killing it if waiting is
+    interrupted such as by the soft time limit of the task
+
+    :param p: process
+    :type p: :py:class:`subprocess.Popen`
+    :param taskid: id of task whose job container process runs,
+                   the container is stopped too since killing
+                   docker run does not stop it
+    :return: (out, err)
+    :rtype: tuple
+    """
+    try:
+        return p.communicate()
+    except BaseException:
+        if taskid is not None:
+            containers.stop_job_container(taskid)
+        logger.error('Killing process ' + str(p.pid))
+        p.kill()
+        p.wait()
+        raise
+
+
+def get_docker_cmd(imagename, workdir, profile=None):
+    """
+    Gets docker run command for job whose task directory is
+    workdir. Task directory is named after task so container
+    is named and labeled after task too
+
+    :param imagename: docker image
+    :param workdir: task directory, bind mounted into container
+    :param profile: resources container may use or None for
+                    no limits
+    :type profile: :py:class:`~commundetect_rest.resources.ResourceProfile`
+    :return: (command, task id)
+    :rtype: tuple
+    """
+    # to run as current user add this to list below before
+    # imagename
+    # '--user', str(os.getuid()) + ':' + str(os.getgid()),
+    taskid = os.path.basename(os.path.normpath(workdir))
+    cmd = ['docker', 'run']
+    cmd.extend(containers.get_job_run_options(taskid))
+    if profile is not None:
+        cmd.extend(profile.get_docker_options())
+    cmd.extend(['-v', workdir + ':' + workdir, imagename])
+    return cmd, taskid
+
+
+def finish_job_container(taskid, ecode, profile=None):
+    """
+    Removes container of job once docker run exited. If it was
+    killed docker is first asked whether the OOM killer did it,
+    as a container killed on revoke or time limit exits with the
+    same exit code
+
+    :param taskid: id of task of job
+    :param ecode: exit code of docker run
+    :param profile: resources container could use or None
+    :raises OutOfMemoryError: if container was killed for using
+                              more than its memory limit
+    """
+    oomkilled = False
+    if ecode == resources.KILLED_EXIT_CODE and profile is not None and\
+            profile.memory is not None:
+        oomkilled = containers.is_oom_killed(
+            containers.get_job_container_name(taskid))
+    containers.remove_job_container(taskid)
+    if profile is not None:
+        profile.check_oom_killed(oomkilled)
+
 
-def run_infomap_cmd(workdir, args):
+def run_infomap_cmd(workdir, args, imagename=INFOMAP_IMAGE, profile=None):
     """
     Runs docker
 
     :param cmd_to_run: command to run as list
+    :param imagename: Infomap docker image
+    :param profile: resources container may use or None
+    :raises OutOfMemoryError: if container ran out of memory
     :return:
     """
-    # to run as current user add this to list below before
-    # coleslawndex/infomap
-    # '--user', str(os.getuid()) + ':' + str(os.getgid()),
-    cmd = ['docker', 'run',
-           '-v', workdir + ':' + workdir,
-           'coleslawndex/infomap']
+    res = run_warm_cmd(imagename, workdir, args, profile=profile)
+    if res is not None:
+        return res
+
+    cmd, taskid = get_docker_cmd(imagename, workdir, profile=profile)
     cmd.extend(args)
     logger.info('Running command: ' + ' '.join(cmd))
     p = subprocess.Popen(cmd,
                          stdout=subprocess.PIPE,
                          stderr=subprocess.PIPE)
 
-    out, err = p.communicate()
+    out, err = communicate(p, taskid=taskid)
+    finish_job_container(taskid, p.returncode, profile=profile)
     return p.returncode, out, err
 
-def check_if_file_contains_zero(edgelistfile):
-    with open(edgelistfile, 'r') as f:
-        lines = f.read().splitlines()
-
-    for line in lines:
-        elts = line.split()
-        if int(elts[0]) == 0:
-            return True
-        if int(elts[1]) == 0:
-            return True
-    return False
-
-def run_infomap(edgelistfile, outdir='.', overlap=False, directed=False):
+def run_infomap(edgelistfile, outdir='.', overlap=False, directed=False,
+                imagename=INFOMAP_IMAGE, flags=None, profile=None):
     """
 
-    :param edgelistfile:
+    :param edgelistfile: edge list with nodes interned as ids
+                         0..n-1, see :py:func:`intern_input`
     :param outdir: the output directory to comprehend the output link file
     :param overlap: bool, whether to enable overlapping community detection
     :param directed
+    :param imagename: Infomap docker image
+    :param flags: list of additional flags to pass to Infomap
+    :param profile: resources Infomap may use or None
+    :raises OutOfMemoryError: if Infomap ran out of memory
     :return
     """
     cmdargs = ['-i', 'link-list']
+    if flags is not None:
+        cmdargs.extend(flags)
 
-    if check_if_file_contains_zero(edgelistfile) is True:
-        cmdargs.append('-z')
+    # interned node ids start at zero
+    cmdargs.append('-z')
     if overlap is True:
         cmdargs.append('--overlapping')
     if directed is True:
         cmdargs.append('-d')
-
     cmdargs.append(edgelistfile)
     cmdargs.append(outdir)
 
-    cmdecode, cmdout, cmderr = run_infomap_cmd(outdir, cmdargs)
+    cmdecode, cmdout, cmderr = run_infomap_cmd(outdir, cmdargs,
+                                               imagename=imagename,
+                                               profile=profile)
 
     logger.info('Cmd exit: ' + str(cmdecode))
     logger.info('Cmd out: ' + str(cmdout))
     logger.info('Cmd err: ' + str(cmderr))
     if cmdecode != 0:
         logger.error('Command failed' + str(cmderr))
-        return 'Command failed with non-zero exit code: ' + str(cmdecode), None
+        return resources.get_exit_message(cmdecode), None
 
     tree_name = os.path.join(outdir, 'edgefile.tree')
-    treef = open(tree_name, 'r')
-    lines = treef.read().splitlines()
-    non_zero_lines = []
-    while '#' in lines[0]:
-        lines.pop(0)
-    for i in range(len(lines)):
-        if 0 != float(lines[i].split()[1]):
-            non_zero_lines.append(lines[i])
-    lines = non_zero_lines
-    nrow = len(lines)
-    ncol_list = []
-    for line in lines:
-        ncol_list.append(len(line.split(':')))
-    ncol = max(ncol_list)
-    treef.close()
-
-    A = np.zeros((nrow, ncol))
-    for i in range(len(lines)):
-        Elts = lines[i].split()
-        leaf = Elts[2][1:-1]
-        links = Elts[0].split(':')
-        for j in range(len(links) - 1):
-            A[i, j] = int(links[j])
-        A[i, -1] = int(leaf)
-    maxElt = max(A[:, -1])
-    for j in range(A.shape[1] - 1):
-        k = A.shape[1] - 2 - j
-        lastone = A[0, k]
-        A[0, k] = A[0, k] + maxElt
-        maxElt = A[0, k]
-        for i in range(1, A.shape[0]):
-            if A[i, k] == 0:
-                continue
-            if lastone != A[i, k]:
-                maxElt = maxElt + 1
-            lastone = A[i, k]
-            A[i, k] = maxElt
-    root = maxElt + 1
-
-    edges = set()
-    for i in range(A.shape[0]):
-        edges.add((int(root), int(A[i, 0]), 't-t'))
-        last = int(A[i, A.shape[1] - 2])
-        for j in range(0, A.shape[1] - 2):
-            if A[i, j + 1] == 0:
-                last = int(A[i, j])
-                break
-            else:
-                edges.add((int(A[i, j]), int(A[i, j + 1]), 't-t'))
-        edges.add((last, int(A[i, A.shape[1] - 1]), 't-g'))
-
-    result = ''
-    for edge in edges:
-        result = result + str(edge[0]) + ',' + str(edge[1]) + ',' + edge[2] + ';'
-
-    return None, result
-
-
-def run_algo_cmd(imagename, workdir, args):
+    termedges, geneedges = parse_infomap_tree(tree_name)
+
+    writer = ResultWriter(os.path.join(outdir, RESULT_FILE))
+    writer.add_edges(termedges, TERM_TERM)
+    writer.add_edges(geneedges, TERM_GENE)
+    return None, writer.get_result()
+
+
+def run_algo_cmd(imagename, workdir, args, stdout=None, profile=None):
     """
     Runs docker
 
     :param cmd_to_run: command to run as list
+    :param stdout: file object to write standard out of command to,
+                   if None standard out is returned as bytes
+    :param profile: resources container may use or None
+    :raises OutOfMemoryError: if container ran out of memory
     :return:
     """
-    # to run as current user add this to list below before
-    # coleslawndex/infomap
-    # '--user', str(os.getuid()) + ':' + str(os.getgid()),
-    cmd = ['docker', 'run',
-           '-v', workdir + ':' + workdir,
-           imagename]
+    res = run_warm_cmd(imagename, workdir, args, stdout=stdout,
+                       profile=profile)
+    if res is not None:
+        return res
+
+    cmd, taskid = get_docker_cmd(imagename, workdir, profile=profile)
     cmd.extend(args)
     logger.info('Running command: ' + ' '.join(cmd))
+    if stdout is None:
+        stdout = subprocess.PIPE
     p = subprocess.Popen(cmd,
-                         stdout=subprocess.PIPE,
+                         stdout=stdout,
                          stderr=subprocess.PIPE)
 
-    out, err = p.communicate()
+    out, err = communicate(p, taskid=taskid)
+    finish_job_container(taskid, p.returncode, profile=profile)
     return p.returncode, out, err
 
 
-def run_algo(algorithm, edgelist_file,taskdir, directed=False):
+def run_inprocess(algo, edgelist_file, taskdir, directed=False,
+                  profile=None):
     """
-    Runs algorithm
+    Runs python callable for algorithm in this process
 
-    :param algorithm:
+    :param algo: algorithm
+    :type algo: :py:class:`~commundetect_rest.registry.Algorithm`
     :param edgelist_file:
     :param taskdir:
     :param directed:
+    :param profile: resources algorithm may use or None, only
+                    the cores are applied, to this process while
+                    algorithm runs
+    :raises OutOfMemoryError: if algorithm ran out of memory
     :return:
     """
-    # TODO need a configuration file to provide mapping of algorithm name with
-    #      docker image and additional custom flags etc...
-    if algorithm == 'louvain':
-        imagename = 'coleslawndex/testlouvain'
+    writer = ResultWriter(os.path.join(taskdir, RESULT_FILE))
+    affinity = None
+    if profile is not None and profile.cpuset:
+        affinity = os.sched_getaffinity(0)
+        os.sched_setaffinity(0, profile.cpuset)
+    try:
+        ecode = algo.get_callable()(edgelist_file, directed=directed,
+                                    writer=writer, **algo.kwargs)
+    except MemoryError:
+        writer.close()
+        raise resources.OutOfMemoryError(algo.name + ' ran out of memory')
+    except Exception as e:
+        writer.close()
+        logger.exception('Caught exception running ' + algo.name)
+        return algo.name + ' failed: ' + str(e), None
+    finally:
+        if affinity is not None:
+            os.sched_setaffinity(0, affinity)
+
+    if ecode != 0:
+        writer.close()
+        return algo.name + ' failed with non-zero exit code: ' +\
+            str(ecode), None
+    return None, writer.get_result()
+
+
+def read_input(edgelist_file):
+    """
+    Reads edge list of task
+
+    :param edgelist_file: text edge list, can be gzip or zstd
+                          compressed, or binary edge list
+    :raises EdgeListError: if edge list is not valid
+    :raises CompressionError: if edge list cannot be decompressed
+    :return: edges
+    :rtype: :py:class:`~commundetect_rest.edgelist.EdgeList`
+    """
+    if compression.detect_file_encoding(edgelist_file) ==\
+            compression.IDENTITY_ENCODING:
+        return edgelist.read_edge_list(edgelist_file)
+    try:
+        # decompressed as it is parsed, again from the start if
+        # node ids turn out to be labels
+        return edgelist.read_edge_list(
+            edgelist_file, opener=compression.open_decompressed)
+    except edgelist.EdgeListError:
+        raise
+    except Exception as e:
+        logger.exception('Unable to decompress ' + edgelist_file)
+        raise compression.CompressionError('Unable to decompress input: ' +
+                                           str(e))
+
+
+def intern_input(edgelist_file, taskdir, binary=False):
+    """
+    Interns nodes of edge list of task as ids 0..n-1 so
+    algorithms get a compact id space whatever the node ids
+    are, even labels. Edge list with interned ids is written
+    to :py:const:`INTERNED_DIR` of task directory under same
+    name so outputs named after input, such as Infomap's .tree
+    file, keep their names
+
+    :param edgelist_file: edge list, see :py:func:`read_input`
+    :param taskdir: task directory
+    :param binary: if True write interned edge list as binary
+                   edge list, memory mapped by reader, if input
+                   is binary. Otherwise write text
+    :raises EdgeListError: if edge list is not valid
+    :raises CompressionError: if edge list cannot be decompressed
+    :return: (path to interned edge list, node id of each
+             interned id, number of edges)
+    :rtype: tuple
+    """
+    edges = read_input(edgelist_file)
+    interneddir = os.path.join(taskdir, INTERNED_DIR)
+    os.makedirs(interneddir, mode=0o775, exist_ok=True)
+    interned = os.path.join(interneddir, os.path.basename(edgelist_file))
+    if binary is True and edgelist.is_edge_arrays(edgelist_file):
+        arrays = {edgelist.SRC_ARRAY: edges.src, edgelist.DST_ARRAY: edges.dst,
+                  edgelist.NODEIDS_ARRAY: np.arange(edges.nodes)}
+        if edges.weighted:
+            arrays[edgelist.WEIGHT_ARRAY] = edges.weight
+        with open(interned, 'wb') as f:
+            np.savez(f, **arrays)
     else:
+        edgelist.write_edge_list(edges, interned, compact=True)
+    return interned, edges.nodeids, edges.edges
+
+
+def run_algo(algorithm, edgelist_file,taskdir, directed=False, profile=None,
+             costinfo=None):
+    """
+    Runs algorithm using backend set for it in :py:data:`algorithms`.
+    Algorithm is run on edge list with nodes interned as ids
+    0..n-1, see :py:func:`intern_input`, and node ids of input
+    are put back in its result
+
+    :param algorithm:
+    :param edgelist_file:
+    :param taskdir:
+    :param directed:
+    :param profile: resources algorithm may use or None for no limits
+    :type profile: :py:class:`~commundetect_rest.resources.ResourceProfile`
+    :param costinfo: cost info of job, see
+                     :py:func:`~commundetect_rest.costs.get_cost_info`,
+                     given exact size of input graph once it is read
+    :raises OutOfMemoryError: if algorithm ran out of memory
+    :return:
+    """
+    algo = algorithms.get(algorithm)
+    if algo is None:
         return algorithm + ' is not supported', None
 
-    cmdargs = [edgelist_file]
-    if directed is True:
-        cmdargs.append('--directed')
+    # in process algorithms map binary edge list
+    # themselves, docker images only read text
+    try:
+        interned, nodeids, numedges = intern_input(
+            edgelist_file, taskdir,
+            binary=algo.backend == registry.INPROCESS_BACKEND)
+    except edgelist.EdgeListError as e:
+        return 'Unable to read input: ' + str(e), None
+    except compression.CompressionError as e:
+        return str(e), None
+    costs.set_graph_size(costinfo, len(nodeids), numedges)
+
+    if algo.backend == registry.INFOMAP_BACKEND:
+        flags = list(algo.flags)
+        if profile is not None:
+            flags.extend(profile.get_thread_flags(algo.threadflags))
+        errmsg, result = run_infomap(interned, taskdir, directed=directed,
+                                     imagename=algo.image, flags=flags,
+                                     profile=profile)
+    elif algo.backend == registry.INPROCESS_BACKEND:
+        errmsg, result = run_inprocess(algo, interned, taskdir,
+                                       directed=directed, profile=profile)
+    else:
+        errmsg, result = run_docker_algo(algo, interned, taskdir,
+                                         directed=directed, profile=profile)
+    if errmsg is not None:
+        return errmsg, result
+    try:
+        return None, translate_result(result, nodeids)
+    except ValueError as e:
+        logger.exception('Unable to translate result of ' + algorithm)
+        return 'Unable to read result of ' + algorithm + ': ' + str(e), None
+
+
+def run_docker_algo(algo, edgelist_file, taskdir, directed=False,
+                    profile=None):
+    """
+    Runs algorithm in docker image that writes result
+    edges to standard out
 
-    ecode, out, err = run_algo_cmd(imagename, taskdir, cmdargs)
+    :param algo: algorithm
+    :type algo: :py:class:`~commundetect_rest.registry.Algorithm`
+    :param edgelist_file:
+    :param taskdir:
+    :param directed:
+    :param profile: resources container may use or None
+    :raises OutOfMemoryError: if algorithm ran out of memory
+    :return:
+    """
+    cmdargs = [edgelist_file]
+    cmdargs.extend(algo.flags)
+    if directed is True and algo.directedflag is not None:
+        cmdargs.append(algo.directedflag)
+    if profile is not None:
+        cmdargs.extend(profile.get_thread_flags(algo.threadflags))
+
+    # algorithm writes its edges to standard out which
+    # goes straight to the result file
+    writer = ResultWriter(os.path.join(taskdir, RESULT_FILE))
+    try:
+        ecode, out, err = run_algo_cmd(algo.image, taskdir, cmdargs,
+                                       stdout=writer.stream,
+                                       profile=profile)
+    except Exception:
+        writer.close()
+        raise
 
     if ecode != 0:
+        writer.close()
         logger.error('Command failed' + str(err))
-        return 'Command failed with non-zero exit code: ' + str(ecode), None
+        return resources.get_exit_message(ecode), None
+
+    return None, writer.get_result()
+
+
+def get_resource_profile(algorithm, sizeinfo):
+    """
+    Gets resources job may use from profile of its size class
+    and algorithm
+
+    :param algorithm: name of algorithm
+    :param sizeinfo: size info of job or None
+    :return: profile
+    :rtype: :py:class:`~commundetect_rest.resources.ResourceProfile`
+    """
+    algo = algorithms.get(algorithm)
+    return resources.get_profile(
+        workerconfig[resources.RESOURCES_KEY],
+        (sizeinfo or {}).get(routing.SIZE_CLASS_STATUS_KEY),
+        algoprofile=None if algo is None else algo.resources)
 
-    return None, out.decode("utf-8")
 
+@contextmanager
+def pin_to_cores(profile):
+    """
+    Waits for cores of host for job and holds them
+    until context exits
+
+    :param profile: resources of job
+    :type profile: :py:class:`~commundetect_rest.resources.ResourceProfile`
+    :return: profile pinned to cores held, or profile as is if
+             cores are not handed out
+    """
+    if coreallocator is None:
+        yield profile
+        return
+    with coreallocator.allocate(profile.cpus) as cpuset:
+        yield profile.pin(cpuset)
 
-@celeryapp.task(bind=True)
-def run_communitydetection(self, algorithm, basedir, directed, rootnetwork):
+
+def cleanup_job(taskid, basedir, started=True, workerpid=None,
+                inputref=None):
+    """
+    Frees resources of a job that was cancelled or killed by its
+    hard time limit, which the worker process running it could
+    not do itself. Stops container of job and removes task
+    directory holding staged input and partial results, and
+    releases input staged in blob store
+
+    :param taskid: id of task
+    :param basedir: directory holding task directories or None
+    :param started: False if job never started so it has no
+                    container to stop
+    :param workerpid: id of killed worker process whose warm
+                      containers need stopping too, or None
+    :param inputref: input reference of task, see
+                     :py:meth:`~commundetect_rest.staging.InputStager.stage`
+                     or None
+    """
+    logger.info('Cleaning up job of task ' + taskid)
+    if started is True:
+        containers.stop_job_container(taskid)
+    if workerpid is not None:
+        containers.stop_process_containers(workerpid)
+    if basedir is not None:
+        shutil.rmtree(os.path.join(basedir, taskid), ignore_errors=True)
+    if inputref is not None:
+        staging.remove_input(inputref, blobrefs=blobrefs)
+
+
+class JobRequest(Request):
+    """
+    Request of community detection job. Handlers run in the main
+    worker process so they can clean up after a job whose worker
+    process was killed because job was revoked or ran past its
+    hard time limit
+    """
+    def _cleanup(self, started=True, killed=True):
+        args = self.args or []
+        kwargs = self.kwargs or {}
+        cleanup_job(self.id, args[1] if len(args) > 1 else None,
+                    started=started,
+                    workerpid=self.worker_pid if killed else None,
+                    inputref=kwargs.get('inputref'))
+        release_held_jobs(self)
+
+    def terminate(self, pool, signal=None):
+        started = bool(self.time_start)
+        super(JobRequest, self).terminate(pool, signal=signal)
+        # if not started terminate is called again once it is
+        if started is True:
+            self._cleanup()
+
+    def revoked(self):
+        announced = self._already_revoked
+        if not super(JobRequest, self).revoked():
+            return False
+        if not announced:
+            self._cleanup(started=False, killed=False)
+        return True
+
+    def on_timeout(self, soft, timeout):
+        super(JobRequest, self).on_timeout(soft, timeout)
+        if not soft:
+            self._cleanup()
+
+
+@celeryapp.task(bind=True, Request=JobRequest)
+def run_communitydetection(self, algorithm, basedir, directed, rootnetwork,
+                           inputref=None, sizeinfo=None, costinfo=None):
         """
         Runs community detection algorithm
 
         :param self:
         :param taskdict:
+        :param inputref: where to get input from, see
+                         :py:meth:`~commundetect_rest.staging.InputStager.stage`
+                         if None input is in task directory under basedir
+        :param sizeinfo: size class and size of input graph, added
+                         to status, see
+                         :py:func:`~commundetect_rest.routing.get_size_info`
+        :param costinfo: size of input graph and predicted run time,
+                         used to record run time of job, see
+                         :py:func:`~commundetect_rest.costs.get_cost_info`
         :return:
         """
         logger.info('Starting task (' + self.request.id + ') ' + str(algorithm))
 
         taskdir = os.path.join(basedir, self.request.id)
-        logger.debug('Created directory: ' + taskdir)
         try:
-            self.update_state(state='PROCESSING',
-                              meta={'message': 'Creating temporary file to hold edge list'})
-            edgelist_file = os.path.join(basedir, self.request.id,
-                                         'edgefile.txt')
-            while not os.path.exists(edgelist_file):
-                logger.debug('Waiting for file: ' + edgelist_file + ' to appear')
-                time.sleep(0.1)
-
-            self.update_state(state='PROCESSING',
-                              meta={'message': 'Running ' + algorithm})
-            if algorithm == 'infomap':
-                errmsg, finalresult = run_infomap(edgelist_file,
-                                                  taskdir, directed=directed)
-            else:
-                errmsg, finalresult = run_algo(algorithm, edgelist_file,
-                                               taskdir, directed=directed)
-            logger.debug('Done with task')
-
             resultdict = {}
+            if sizeinfo is not None:
+                resultdict.update(sizeinfo)
             resultdict['rootnetwork'] = rootnetwork
 
-            if errmsg is not None:
+            # input is fully staged before the task is queued
+            # so if it is not there it never will be
+            edgelist_file = os.path.join(taskdir, EDGE_FILE)
+            try:
+                staging.fetch_input(inputref or {}, edgelist_file,
+                                    blobstore=blobstore)
+            except Exception as e:
+                logger.error('Unable to get input: ' + str(e))
                 resultdict['status'] = 'error'
+                resultdict['message'] = 'Input edge list not found for ' \
+                                        'task ' + self.request.id + ': ' +\
+                                        str(e)
+                resultdict['result'] = None
+                return resultdict
+
+            meta = dict(sizeinfo or {})
+            meta['message'] = 'Running ' + algorithm
+            self.update_state(state='PROCESSING', meta=meta)
+            errstatus = 'error'
+            # run time is recorded against size of graph as read
+            runinfo = None if costinfo is None else dict(costinfo)
+            # set once cores are allocated, celery starts time limits
+            # with the task so they include the wait for cores
+            start = None
+            try:
+                with pin_to_cores(get_resource_profile(
+                        algorithm, sizeinfo)) as profile:
+                    start = time.time()
+                    errmsg, finalresult = run_algo(algorithm, edgelist_file,
+                                                   taskdir, directed=directed,
+                                                   profile=profile,
+                                                   costinfo=runinfo)
+            except SoftTimeLimitExceeded:
+                logger.error('Task ' + self.request.id +
+                             ' exceeded soft time limit')
+                finalresult = None
+                if start is None:
+                    # never ran so says nothing about its run time
+                    errmsg = 'Task exceeded time limit waiting for ' \
+                             'cores of host, try again later'
+                else:
+                    # would have taken at least this long
+                    costs.record_run_time(
+                        workerconfig[costs.RUN_TIMES_FILE_KEY], algorithm,
+                        runinfo, time.time() - start, timedout=True)
+                    errmsg = 'Task exceeded time limit predicted ' \
+                             'for size of input graph'
+            except resources.OutOfMemoryError as e:
+                logger.error('Task ' + self.request.id + ': ' + str(e))
+                errstatus = resources.OUT_OF_MEMORY_STATUS
+                errmsg = str(e)
+                finalresult = None
+            logger.debug('Done with task')
+            if errmsg is None:
+                costs.record_run_time(
+                    workerconfig[costs.RUN_TIMES_FILE_KEY], algorithm,
+                    runinfo, time.time() - start)
+
+            if errmsg is not None:
+                resultdict['status'] = errstatus
                 resultdict['message'] = errmsg
                 resultdict['result'] = None
                 return resultdict
 
             resultdict['status'] = 'done'
             resultdict['result'] = finalresult
-            return resultdict
+
+            # large results go to result store so the result
+            # backend only holds a reference to them
+            return offload.offload_result(
+                resultstore, self.request.id, resultdict,
+                workerconfig[offload.RESULT_STORE_MIN_KEY])
         finally:
             logger.debug('Deleting directory: ' + taskdir)
-            shutil.rmtree(taskdir)
+            shutil.rmtree(taskdir, ignore_errors=True)
+            staging.remove_input(inputref or {}, blobrefs=blobrefs)
+            record_done(self.request)
+            release_held_jobs(self.request)
+
+
+def record_done(request):
+    """
+    Counts finished job for throughput of queue it came from,
+    used by the REST service to estimate wait of new jobs
+
+    :param request: request of task
+    """
+    queue = (request.delivery_info or {}).get('routing_key')
+    if queue is None:
+        return
+    try:
+        backpressure.record_done(
+            celeryapp.backend.client, queue,
+            window=workerconfig[backpressure.THROUGHPUT_WINDOW_KEY])
+    except Exception:
+        logger.exception('Unable to count finished job of ' + queue)
+
+
+# jobs of each client are held and released to the broker in
+# turn, the REST service releases jobs as they are submitted and
+# workers release the next ones as their jobs finish
+dispatcher = None
+fairqueue = fairshare.create_fair_queue(workerconfig[fairshare.FAIR_SHARE_KEY],
+                                        celeryapp)
+if fairqueue is not None:
+    dispatcher = fairshare.FairDispatcher(
+        celeryapp, fairqueue, run_communitydetection.apply_async,
+        target=workerconfig[fairshare.FAIR_SHARE_TARGET_KEY])
+
+
+def release_held_jobs(request):
+    """
+    Releases held jobs to queue a finished job came from so
+    the next client in turn gets a worker
+
+    :param request: request of task
+    """
+    queue = (request.delivery_info or {}).get('routing_key')
+    if dispatcher is None or queue is None:
+        return
+    dispatcher.release(queue)
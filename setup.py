@@ -20,6 +20,7 @@ with open(os.path.join('commundetect_rest', '__init__.py')) as ver_file:
 
 requirements = [
     'celery',
+    'numpy',
     'tzlocal',
     'flask',
     'flask-restplus',
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `commundetect_rest.backpressure` module."""
+
+import unittest
+from unittest import mock
+
+from commundetect_rest import backpressure
+from commundetect_rest import routing
+
+
+class _FakePipeline(object):
+    def __init__(self, redis):
+        self._redis = redis
+        self._ops = []
+
+    def incr(self, key):
+        self._ops.append(('incr', key))
+
+    def expire(self, key, ttl):
+        self._ops.append(('expire', key, ttl))
+
+    def execute(self):
+        for op in self._ops:
+            if op[0] == 'incr':
+                self._redis.data[op[1]] = self._redis.data.get(op[1], 0) + 1
+            else:
+                self._redis.ttls[op[1]] = op[2]
+
+
+class _FakeRedis(object):
+    """
+    Stand in for the few redis calls used
+    """
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+
+    def pipeline(self):
+        return _FakePipeline(self)
+
+    def mget(self, keys):
+        return [None if self.data.get(k) is None else
+                str(self.data[k]).encode('utf-8') for k in keys]
+
+
+class _Clock(object):
+    def __init__(self):
+        self.now = 6000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestBackpressure(unittest.TestCase):
+
+    def test_record_done_and_get_throughput(self):
+        client = _FakeRedis()
+        for x in range(30):
+            backpressure.record_done(client, 'q', window=600, now=6000 - x)
+        backpressure.record_done(client, 'other', window=600, now=6000)
+        # too old to count
+        backpressure.record_done(client, 'q', window=600, now=5000)
+        self.assertEqual(660, list(client.ttls.values())[0])
+
+        # buckets 91 to 100 cover 5460 up to 6010
+        self.assertAlmostEqual(30 / 550.0, backpressure.get_throughput(
+            client, 'q', window=600, now=6010))
+        self.assertEqual(0.0, backpressure.get_throughput(
+            client, 'none', window=600, now=6010))
+
+    def test_get_queue_depth(self):
+        conn = mock.MagicMock()
+        conn.channel_errors = (KeyError,)
+        channel = conn.channel.return_value
+        channel.queue_declare.return_value = mock.Mock(message_count=5,
+                                                       consumer_count=2)
+        self.assertEqual((5, 2), backpressure.get_queue_depth(conn, 'q'))
+        channel.queue_declare.assert_called_with(queue='q', passive=True)
+        channel.close.assert_called_with()
+
+        channel.queue_declare.side_effect = KeyError('no queue')
+        self.assertEqual((0, 0), backpressure.get_queue_depth(conn, 'q'))
+
+    def test_estimate_wait(self):
+        self.assertEqual(0.0, backpressure.estimate_wait(0, 0, 0))
+        self.assertEqual(20.0, backpressure.estimate_wait(10, 1, 0.5))
+        # no recent throughput, use consumers and default job time
+        self.assertEqual(300.0, backpressure.estimate_wait(
+            10, 2, 0, defaultjobseconds=60))
+        self.assertIsNone(backpressure.estimate_wait(10, 0, 0))
+
+    def test_get_retry_after(self):
+        self.assertEqual(41, backpressure.get_retry_after(100.5, 60))
+        self.assertEqual(1, backpressure.get_retry_after(60, 60))
+        self.assertEqual(backpressure.MAX_RETRY_AFTER,
+                         backpressure.get_retry_after(None, 60))
+        self.assertEqual(backpressure.MAX_RETRY_AFTER,
+                         backpressure.get_retry_after(10 ** 9, 60))
+
+    def _monitor(self, depths, clock, dispatcher=None):
+        celeryapp = mock.MagicMock()
+        celeryapp.backend.client = _FakeRedis()
+        conn = celeryapp.connection_for_read.return_value.__enter__.return_value
+        conn.channel_errors = (KeyError,)
+
+        def declare(queue, passive):
+            return mock.Mock(message_count=depths[queue][0],
+                             consumer_count=depths[queue][1])
+        conn.channel.return_value.queue_declare.side_effect = declare
+        monitor = backpressure.QueueMonitor(celeryapp,
+                                            routing.SizeClasses(),
+                                            ttl=5, defaultjobseconds=10,
+                                            timefunc=clock,
+                                            dispatcher=dispatcher)
+        return monitor, celeryapp
+
+    def test_queue_monitor(self):
+        clock = _Clock()
+        depths = {'communitydetection-small': (0, 2),
+                  'communitydetection-medium': (30, 1),
+                  'communitydetection-large': (3, 0)}
+        monitor, celeryapp = self._monitor(depths, clock)
+        stats = monitor.get_stats()
+        self.assertEqual(['large', 'medium', 'small'], sorted(stats.keys()))
+        self.assertEqual({'sizeclass': 'medium',
+                          'queue': 'communitydetection-medium',
+                          'depth': 30, 'held': 0, 'clients': [],
+                          'consumers': 1, 'throughput': 0.0,
+                          'estimatedWait': 300.0}, stats['medium'])
+
+        monitor.check('small', 60)
+        monitor.check('medium', None)
+        with self.assertRaises(backpressure.OverloadedError) as oe:
+            monitor.check('medium', 60)
+        self.assertEqual(240, oe.exception.retryafter)
+        self.assertTrue('300 seconds' in str(oe.exception))
+        with self.assertRaises(backpressure.OverloadedError) as oe:
+            monitor.check('large', 60)
+        self.assertTrue('No workers' in str(oe.exception))
+
+        # job that would be revoked before it runs is refused
+        monitor.check('medium', 600, expires=300)
+        monitor.check('medium', None, expires=300)
+        with self.assertRaises(backpressure.OverloadedError) as oe:
+            monitor.check('medium', 600, expires=120)
+        self.assertEqual(180, oe.exception.retryafter)
+        with self.assertRaises(backpressure.OverloadedError) as oe:
+            monitor.check('medium', None, expires=120)
+
+        # stats are reused until ttl passes
+        self.assertEqual(1, celeryapp.connection_for_read.call_count)
+        clock.now += 5
+        monitor.get_stats()
+        self.assertEqual(2, celeryapp.connection_for_read.call_count)
+
+    def test_queue_monitor_counts_pending_jobs(self):
+        clock = _Clock()
+        depths = {'communitydetection-small': (0, 2),
+                  'communitydetection-medium': (0, 1),
+                  'communitydetection-large': (0, 1)}
+        monitor, celeryapp = self._monitor(depths, clock)
+        monitor.check('small', 60, pending=12)
+        # jobs accepted earlier in same batch are ahead of this one
+        with self.assertRaises(backpressure.OverloadedError) as oe:
+            monitor.check('small', 60, pending=13)
+        self.assertEqual(5, oe.exception.retryafter)
+        monitor.check('medium', 60, pending=6)
+
+    def test_queue_monitor_broker_down(self):
+        clock = _Clock()
+        monitor, celeryapp = self._monitor({}, clock)
+        celeryapp.connection_for_read.side_effect = OSError('down')
+        self.assertEqual({}, monitor.get_stats())
+        monitor.check('small', 60)
+        monitor.check('small', 60)
+        self.assertEqual(1, celeryapp.connection_for_read.call_count)
+
+    def test_queue_monitor_counts_held_jobs(self):
+        clock = _Clock()
+        depths = {'communitydetection-small': (2, 1),
+                  'communitydetection-medium': (0, 1),
+                  'communitydetection-large': (0, 1)}
+        dispatcher = mock.MagicMock()
+        held = {'communitydetection-small': [{'client': 'a', 'depth': 5},
+                                             {'client': 'b', 'depth': 3}]}
+        dispatcher.get_depths.side_effect = lambda q: held.get(q, [])
+        monitor, celeryapp = self._monitor(depths, clock,
+                                           dispatcher=dispatcher)
+        stats = monitor.get_stats()
+        self.assertEqual(10, stats['small']['depth'])
+        self.assertEqual(8, stats['small']['held'])
+        self.assertEqual(held['communitydetection-small'],
+                         stats['small']['clients'])
+        self.assertEqual(100.0, stats['small']['estimatedWait'])
+        self.assertEqual(0, stats['medium']['held'])
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `commundetect_rest.cache` module."""
+
+import unittest
+from unittest import mock
+
+from commundetect_rest import cache
+
+
+class FakeTime(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCache(unittest.TestCase):
+
+    def test_make_cache_key(self):
+        key = cache.make_cache_key('abc', 'louvain', '1', {'x': True})
+        self.assertEqual(key, cache.make_cache_key('abc', 'louvain', '1',
+                                                   {'x': True}))
+        self.assertNotEqual(key, cache.make_cache_key('abc', 'louvain', '2',
+                                                      {'x': True}))
+        self.assertNotEqual(key, cache.make_cache_key('abc', 'louvain', '1',
+                                                      {'x': False}))
+        self.assertNotEqual(key, cache.make_cache_key('abd', 'louvain', '1',
+                                                      {'x': True}))
+
+    def test_local_cache_lru(self):
+        c = cache.LocalResultCache(maxsize=2)
+        c.put('a', 1)
+        c.put('b', 2)
+        self.assertEqual(1, c.get('a'))
+        c.put('c', 3)
+        # b was least recently used
+        self.assertEqual(None, c.get('b'))
+        self.assertEqual(1, c.get('a'))
+        self.assertEqual(3, c.get('c'))
+        self.assertEqual({cache.HITS: 3, cache.MISSES: 1, cache.SIZE: 2},
+                         c.get_stats())
+
+    def test_local_cache_ttl(self):
+        faketime = FakeTime()
+        c = cache.LocalResultCache(ttl=10, timefunc=faketime)
+        c.put('a', 1)
+        faketime.now += 5
+        self.assertEqual(1, c.get('a'))
+        faketime.now += 6
+        self.assertEqual(None, c.get('a'))
+        self.assertEqual(0, c.get_stats()[cache.SIZE])
+
+    def test_local_cache_check(self):
+        c = cache.LocalResultCache()
+        c.put('a', 'task1')
+        self.assertEqual(None, c.get('a', check=lambda t: False))
+        # entry is kept until replaced
+        self.assertEqual(1, c.get_stats()[cache.SIZE])
+        self.assertEqual('task1', c.get('a', check=lambda t: t == 'task1'))
+        c.put('a', 'task2')
+        self.assertEqual('task2', c.get('a'))
+        self.assertEqual({cache.HITS: 2, cache.MISSES: 1, cache.SIZE: 1},
+                         c.get_stats())
+
+    def test_redis_cache(self):
+        client = mock.MagicMock()
+        client.get.return_value = b'task1'
+        c = cache.RedisResultCache(client=client)
+        self.assertEqual('task1', c.get('a'))
+        self.assertEqual(None, c.get('a', check=lambda t: False))
+        client.get.return_value = None
+        self.assertEqual(None, c.get('a'))
+        client.zrem.assert_called_once_with(cache.REDIS_PREFIX + 'lru', 'a')
+        self.assertEqual(2, client.incr.call_count)
+
+    def test_create_result_cache(self):
+        self.assertEqual(None, cache.create_result_cache(None))
+        self.assertTrue(isinstance(cache.create_result_cache('local'),
+                                   cache.LocalResultCache))
+        with self.assertRaises(ValueError):
+            cache.create_result_cache('foo')
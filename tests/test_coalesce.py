@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `commundetect_rest.coalesce` module."""
+
+import json
+import unittest
+from unittest import mock
+
+from commundetect_rest import coalesce
+
+
+class TestCoalesce(unittest.TestCase):
+
+    def test_claim(self):
+        tracker = coalesce.LocalInFlightTracker()
+        self.assertEqual(None, tracker.claim('key', 'a'))
+        self.assertEqual('a', tracker.claim('key', 'b'))
+        self.assertEqual(None, tracker.claim('otherkey', 'c'))
+
+    def test_claim_expires(self):
+        tracker = coalesce.LocalInFlightTracker()
+        with mock.patch.object(coalesce.time, 'time', return_value=100):
+            self.assertEqual(None, tracker.claim('key', 'a', ttl=10))
+            self.assertEqual('a', tracker.claim('key', 'b', ttl=10))
+        with mock.patch.object(coalesce.time, 'time', return_value=111):
+            self.assertEqual(None, tracker.claim('key', 'c'))
+            # finishing expired primary keeps the new claim
+            tracker.finish('a')
+            self.assertEqual('c', tracker.claim('key', 'd'))
+
+    def test_redis_claim_ttl(self):
+        client = mock.MagicMock()
+        client.set.return_value = True
+        tracker = coalesce.RedisInFlightTracker(client=client, ttl=100)
+        self.assertEqual(None, tracker.claim('key', 'a', ttl=10))
+        client.set.assert_called_once_with(coalesce.REDIS_PREFIX +
+                                           'key:key', 'a', ex=10, nx=True)
+        client.reset_mock()
+        tracker.claim('key', 'b')
+        client.set.assert_called_once_with(coalesce.REDIS_PREFIX +
+                                           'key:key', 'b', ex=100, nx=True)
+
+    def test_redis_finish_keeps_claim_of_other_task(self):
+        client = mock.MagicMock()
+        client.get.side_effect = [b'key', b'b']
+        client.scard.return_value = 1
+        tracker = coalesce.RedisInFlightTracker(client=client)
+        tracker.finish('a')
+        pipe = client.pipeline.return_value
+        self.assertEqual([mock.call(coalesce.REDIS_PREFIX + 'keyof:a'),
+                          mock.call(coalesce.REDIS_PREFIX + 'refs:a')],
+                         pipe.delete.call_args_list)
+
+    def test_resolve(self):
+        tracker = coalesce.LocalInFlightTracker()
+        tracker.claim('key', 'a')
+        tracker.add_alias('a', 'b', rootnetwork='net')
+        self.assertEqual(('a', None), tracker.resolve('a'))
+        primary, alias = tracker.resolve('b')
+        self.assertEqual('a', primary)
+        self.assertEqual('net', alias[coalesce.ROOTNETWORK])
+        self.assertEqual(('x', None), tracker.resolve('x'))
+
+    def test_resolve_many(self):
+        tracker = coalesce.LocalInFlightTracker()
+        tracker.claim('key', 'a')
+        tracker.add_alias('a', 'b', rootnetwork='net')
+        res = tracker.resolve_many(['x', 'b', 'a'])
+        self.assertEqual(('x', None), res[0])
+        self.assertEqual(('a', None), res[2])
+        self.assertEqual('a', res[1][0])
+        self.assertEqual('net', res[1][1][coalesce.ROOTNETWORK])
+        self.assertEqual([], tracker.resolve_many([]))
+
+    def test_redis_resolve_many(self):
+        client = mock.MagicMock()
+        client.mget.return_value = [None,
+                                    json.dumps({coalesce.PRIMARY: 'a',
+                                                coalesce.ROOTNETWORK:
+                                                    'net'}).encode('utf-8')]
+        tracker = coalesce.RedisInFlightTracker(client=client)
+        res = tracker.resolve_many(['x', 'b'])
+        self.assertEqual(('x', None), res[0])
+        self.assertEqual(('a', {coalesce.PRIMARY: 'a',
+                                coalesce.ROOTNETWORK: 'net'}), res[1])
+        client.mget.assert_called_once_with([coalesce.REDIS_PREFIX +
+                                             'alias:x',
+                                             coalesce.REDIS_PREFIX +
+                                             'alias:b'])
+        self.assertEqual([], tracker.resolve_many([]))
+
+    def test_release_only_cancels_when_last_reference_gone(self):
+        tracker = coalesce.LocalInFlightTracker()
+        tracker.claim('key', 'a')
+        tracker.add_alias('a', 'b')
+        tracker.add_alias('a', 'c')
+        self.assertEqual(('a', False), tracker.release('a'))
+        self.assertEqual(('a', False), tracker.release('b'))
+        # new submissions still coalesce while c refers to task
+        self.assertEqual('a', tracker.claim('key', 'd'))
+        self.assertEqual(('a', True), tracker.release('c'))
+        self.assertEqual(None, tracker.claim('key', 'e'))
+
+    def test_release_unknown(self):
+        tracker = coalesce.LocalInFlightTracker()
+        self.assertEqual(('x', True), tracker.release('x'))
+
+    def test_finish(self):
+        tracker = coalesce.LocalInFlightTracker()
+        tracker.claim('key', 'a')
+        tracker.finish('a')
+        self.assertEqual(None, tracker.claim('key', 'b'))
+        self.assertEqual(('a', True), tracker.release('a'))
+
+    def test_finish_with_alias_keeps_result(self):
+        tracker = coalesce.LocalInFlightTracker()
+        tracker.claim('key', 'a')
+        tracker.add_alias('a', 'b')
+        tracker.finish('a')
+        self.assertEqual(None, tracker.claim('key', 'c'))
+        self.assertEqual(('a', False), tracker.release('a'))
+        self.assertEqual(('a', True), tracker.release('b'))
+
+    def test_alias_of_finished_task_keeps_result(self):
+        tracker = coalesce.LocalInFlightTracker()
+        tracker.claim('key', 'a')
+        tracker.finish('a')
+        tracker.add_alias('a', 'b')
+        self.assertEqual(('a', False), tracker.release('b'))
+        self.assertEqual(('a', True), tracker.release('a'))
+
+    def test_redis_alias_of_finished_task_keeps_result(self):
+        client = mock.MagicMock()
+        pipe = client.pipeline.return_value
+        pipe.execute.return_value = [True, 0, 1, True]
+        tracker = coalesce.RedisInFlightTracker(client=client)
+        tracker.add_alias('a', 'b')
+        client.sadd.assert_called_once_with(coalesce.REDIS_PREFIX +
+                                            'refs:a', 'a')
+
+        client.reset_mock()
+        pipe.execute.return_value = [True, 1, 1, True]
+        tracker.add_alias('a', 'c')
+        self.assertFalse(client.sadd.called)
+
+    def test_maxsize(self):
+        tracker = coalesce.LocalInFlightTracker(maxsize=1)
+        tracker.claim('key1', 'a')
+        tracker.claim('key2', 'b')
+        self.assertEqual(None, tracker.claim('key1', 'c'))
+
+    def test_create_inflight_tracker(self):
+        self.assertEqual(None, coalesce.create_inflight_tracker(None))
+        self.assertTrue(isinstance(coalesce.create_inflight_tracker('local'),
+                                   coalesce.LocalInFlightTracker))
+        with self.assertRaises(ValueError):
+            coalesce.create_inflight_tracker('foo')
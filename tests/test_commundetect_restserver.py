@@ -9,8 +9,25 @@ import unittest
 import shutil
 import tempfile
 import re
+import io
+import gzip
+import hashlib
+import zipfile
+import tarfile
+import threading
+from unittest import mock
+import numpy
 from werkzeug.datastructures import FileStorage
 import commundetect_rest
+from commundetect_rest import cache
+from commundetect_rest import backpressure
+from commundetect_rest import coalesce
+from commundetect_rest import costs
+from commundetect_rest import fairshare
+from commundetect_rest import offload
+from commundetect_rest import quota
+from commundetect_rest import routing
+from commundetect_rest import staging
 
 
 class TestDdot_rest(unittest.TestCase):
@@ -25,8 +42,20 @@ class TestDdot_rest(unittest.TestCase):
         commundetect_rest.app.config[commundetect_rest.SLEEP_TIME_KEY] = 0
         self._app = commundetect_rest.app.test_client()
 
+        # submissions store size class of task in result backend
+        self._backend_patch = mock.patch.object(
+            commundetect_rest.celeryapp.backend, 'store_result')
+        self._backend_patch.start()
+
+        # queue stats come from broker
+        self._queue_patch = mock.patch.object(commundetect_rest.queuemonitor,
+                                              'get_stats', return_value={})
+        self._queue_patch.start()
+
     def tearDown(self):
         """Tear down test fixtures, if any."""
+        self._backend_patch.stop()
+        self._queue_patch.stop()
         shutil.rmtree(self._temp_dir)
 
     def test_baseurl(self):
@@ -123,6 +152,27 @@ class TestDdot_rest(unittest.TestCase):
         self.assertTrue(data['pcDiskFull'], -1)
         self.assertEqual(rv.status_code, 200)
 
+    def test_get_status_queues(self):
+        stats = {'large': {'sizeclass': 'large',
+                           'queue': 'communitydetection-large',
+                           'depth': 4, 'held': 3,
+                           'clients': [{'client': 'abc', 'depth': 2},
+                                       {'client': 'def', 'depth': 1}],
+                           'consumers': 1, 'throughput': 0.5,
+                           'estimatedWait': 8.0},
+                 'small': {'sizeclass': 'small',
+                           'queue': 'communitydetection-small',
+                           'depth': 0, 'held': 0, 'clients': [],
+                           'consumers': 0, 'throughput': 0.0,
+                           'estimatedWait': None}}
+        with mock.patch.object(commundetect_rest.queuemonitor, 'get_stats',
+                               return_value=stats):
+            rv = self._app.get(commundetect_rest.COMMUNDETECT_NS +
+                               '/v1/status')
+        self.assertEqual(200, rv.status_code)
+        self.assertEqual([stats['small'], stats['large']],
+                         rv.json['queues'])
+
     def test_get_status(self):
         submitdir = commundetect_rest.get_submit_dir()
         os.makedirs(submitdir, mode=0o755)
@@ -216,3 +266,1073 @@ class TestDdot_rest(unittest.TestCase):
 
     def test_log_task_json_file_with_none(self):
         self.assertEqual(commundetect_rest.log_task_json_file(None), None)
+
+    def _cache_key(self, data):
+        algo = commundetect_rest.algorithms.get('louvain')
+        return cache.make_cache_key(cache.hashlib.sha256(data).hexdigest(),
+                                    'louvain', algo.version,
+                                    {commundetect_rest.GRAPHDIRECTED_PARAM:
+                                     False})
+
+    def test_post_result_cache_hit(self):
+        data = b'1\t2\n2\t3\n'
+        resultcache = cache.LocalResultCache()
+        resultcache.put(self._cache_key(data), 'old')
+        inflight = coalesce.LocalInFlightTracker()
+        res = mock.MagicMock(state='SUCCESS',
+                             result={'status': 'done',
+                                     'result': '3,1,term-gene;',
+                                     'rootnetwork': 'oldnet'})
+        with mock.patch.object(commundetect_rest, 'resultcache',
+                               resultcache),\
+            mock.patch.object(commundetect_rest, 'inflight', inflight),\
+            mock.patch.object(commundetect_rest.celeryapp, 'AsyncResult',
+                              return_value=res) as asyncresult,\
+            mock.patch.object(commundetect_rest.celeryapp.backend,
+                              'store_result') as store_result,\
+            mock.patch.object(commundetect_rest.run_communitydetection,
+                              'apply_async') as apply_async:
+            pdict = {'algorithm': 'louvain',
+                     'rootnetwork': 'new',
+                     'edgefile': (io.BytesIO(data), 'edgefile.txt')}
+            rv = self._app.post(commundetect_rest.COMMUNDETECT_NS + '/v1',
+                                data=pdict,
+                                content_type='multipart/form-data')
+        self.assertEqual(202, rv.status_code)
+        taskid = rv.json['id']
+        self.assertTrue(rv.headers['Location'].endswith(taskid))
+        self.assertFalse(apply_async.called)
+        # result is not copied, new task is alias of finished one
+        self.assertFalse(store_result.called)
+        asyncresult.assert_called_with('old')
+        primary, alias = inflight.resolve(taskid)
+        self.assertEqual('old', primary)
+        self.assertEqual('new', alias[coalesce.ROOTNETWORK])
+        self.assertEqual(('old', False), inflight.release('old'))
+        self.assertEqual([], os.listdir(self._temp_dir))
+        self.assertEqual(1, resultcache.get_stats()[cache.HITS])
+
+    def test_post_result_cache_hit_without_aliases(self):
+        data = b'1\t2\n2\t3\n'
+        resultcache = cache.LocalResultCache()
+        resultcache.put(self._cache_key(data), 'old')
+        res = mock.MagicMock(state='SUCCESS',
+                             result={'status': 'done',
+                                     'result': '3,1,term-gene;',
+                                     'rootnetwork': 'oldnet'})
+        with mock.patch.object(commundetect_rest, 'resultcache',
+                               resultcache),\
+            mock.patch.object(commundetect_rest, 'inflight', None),\
+            mock.patch.object(commundetect_rest.celeryapp, 'AsyncResult',
+                              return_value=res),\
+            mock.patch.object(commundetect_rest.celeryapp.backend,
+                              'store_result') as store_result,\
+            mock.patch.object(commundetect_rest.run_communitydetection,
+                              'apply_async') as apply_async:
+            pdict = {'algorithm': 'louvain',
+                     'rootnetwork': 'new',
+                     'edgefile': (io.BytesIO(data), 'edgefile.txt')}
+            rv = self._app.post(commundetect_rest.COMMUNDETECT_NS + '/v1',
+                                data=pdict,
+                                content_type='multipart/form-data')
+        self.assertEqual(202, rv.status_code)
+        self.assertFalse(apply_async.called)
+        store_result.assert_called_once_with(rv.json['id'],
+                                             {'status': 'done',
+                                              'result': '3,1,term-gene;',
+                                              'rootnetwork': 'new'},
+                                             'SUCCESS')
+
+    def test_has_cached_result(self):
+        ref = {offload.REF_NAME: 'x'}
+        cases = [('SUCCESS', {'status': 'done', 'result': 'x'}, True),
+                 ('PENDING', None, False),
+                 ('STARTED', None, False),
+                 ('FAILURE', ValueError('bad'), False),
+                 ('SUCCESS', {'status': 'error', 'result': None}, False),
+                 ('SUCCESS', {'status': 'done',
+                              offload.RESULT_REF_KEY: ref}, False)]
+        for state, result, expected in cases:
+            res = mock.MagicMock(state=state, result=result)
+            with mock.patch.object(commundetect_rest, 'resultstore', None),\
+                mock.patch.object(commundetect_rest.celeryapp,
+                                  'AsyncResult', return_value=res):
+                self.assertEqual(expected,
+                                 commundetect_rest.has_cached_result('a'))
+
+    def test_post_result_cache_miss(self):
+        resultcache = cache.LocalResultCache()
+        with mock.patch.object(commundetect_rest, 'resultcache',
+                               resultcache),\
+            mock.patch.object(commundetect_rest, 'inflight',
+                              coalesce.LocalInFlightTracker()),\
+            mock.patch.object(commundetect_rest.run_communitydetection,
+                              'apply_async') as apply_async:
+            apply_async.side_effect = lambda **kw: commundetect_rest.SimpleTask(kw['task_id'])
+            pdict = {'algorithm': 'louvain',
+                     'edgefile': (io.BytesIO(b'1\t2\n'), 'edgefile.txt')}
+            rv = self._app.post(commundetect_rest.COMMUNDETECT_NS + '/v1',
+                                data=pdict,
+                                content_type='multipart/form-data')
+        self.assertEqual(202, rv.status_code)
+        taskid = rv.json['id']
+        self.assertEqual(taskid, apply_async.call_args[1]['task_id'])
+        edgefile = os.path.join(self._temp_dir, taskid,
+                                commundetect_rest.EDGE_FILE)
+        with open(edgefile, 'rb') as f:
+            self.assertEqual(b'1\t2\n', f.read())
+        # becomes a hit once worker stores result
+        self.assertEqual(taskid, resultcache.get(self._cache_key(b'1\t2\n')))
+        self.assertEqual(1, resultcache.get_stats()[cache.MISSES])
+
+    def test_post_routes_by_size(self):
+        store_result = commundetect_rest.celeryapp.backend.store_result
+        with mock.patch.object(commundetect_rest, 'resultcache', None),\
+            mock.patch.object(commundetect_rest, 'inflight', None),\
+            mock.patch.object(commundetect_rest.run_communitydetection,
+                              'apply_async') as apply_async:
+            apply_async.side_effect = lambda **kw: commundetect_rest.SimpleTask(kw['task_id'])
+            pdict = {'algorithm': 'louvain',
+                     'edgefile': (io.BytesIO(b'1\t2\n2\t3\n# x\n'),
+                                  'edgefile.txt')}
+            rv = self._app.post(commundetect_rest.COMMUNDETECT_NS + '/v1',
+                                data=pdict,
+                                content_type='multipart/form-data')
+        self.assertEqual(202, rv.status_code)
+        taskid = rv.json['id']
+        sizeinfo = {'sizeclass': 'small', 'nodes': 3, 'edges': 2}
+        opts = apply_async.call_args[1]
+        self.assertEqual('communitydetection-small', opts['queue'])
+        self.assertEqual(routing.MAX_PRIORITY, opts['priority'])
+        self.assertEqual(sizeinfo, opts['kwargs']['sizeinfo'])
+        store_result.assert_called_once_with(taskid, sizeinfo, 'PENDING')
+
+    def test_post_sets_time_limits(self):
+        model = costs.CostModel({'louvain': {costs.BASE_KEY: 10.0,
+                                             costs.PER_EDGE_KEY: 5.0}})
+        with mock.patch.object(commundetect_rest, 'resultcache', None),\
+            mock.patch.object(commundetect_rest, 'inflight', None),\
+            mock.patch.object(commundetect_rest, 'costmodel', model),\
+            mock.patch.object(commundetect_rest.run_communitydetection,
+                              'apply_async') as apply_async:
+            apply_async.side_effect = lambda **kw: commundetect_rest.SimpleTask(kw['task_id'])
+            pdict = {'algorithm': 'louvain',
+                     'edgefile': (io.BytesIO(b'1\t2\n2\t3\n'),
+                                  'edgefile.txt')}
+            rv = self._app.post(commundetect_rest.COMMUNDETECT_NS + '/v1',
+                                data=pdict,
+                                content_type='multipart/form-data')
+        self.assertEqual(202, rv.status_code)
+        opts = apply_async.call_args[1]
+        self.assertEqual(80, opts['soft_time_limit'])
+        self.assertEqual(110, opts['time_limit'])
+        # kept in queue at least as long as it may wait when admitted
+        self.assertEqual(2 * 600 + 110, opts['expires'])
+        self.assertEqual({'nodes': 3, 'edges': 2, 'predicted': 20.0},
+                         opts['kwargs']['costinfo'])
+
+    def test_post_task_expires_from_config(self):
+        with mock.patch.object(commundetect_rest, 'resultcache', None),\
+            mock.patch.object(commundetect_rest, 'inflight', None),\
+            mock.patch.dict(commundetect_rest.app.config,
+                            {costs.TASK_EXPIRES_KEY: 900}),\
+            mock.patch.object(commundetect_rest.run_communitydetection,
+                              'apply_async') as apply_async:
+            apply_async.side_effect = lambda **kw: commundetect_rest.SimpleTask(kw['task_id'])
+            pdict = {'algorithm': 'louvain',
+                     'edgefile': (io.BytesIO(b'1\t2\n'), 'edgefile.txt')}
+            rv = self._app.post(commundetect_rest.COMMUNDETECT_NS + '/v1',
+                                data=pdict,
+                                content_type='multipart/form-data')
+        self.assertEqual(202, rv.status_code)
+        self.assertEqual(900, apply_async.call_args[1]['expires'])
+
+    def test_post_rejects_costly_graph(self):
+        with mock.patch.object(commundetect_rest, 'resultcache', None),\
+            mock.patch.object(commundetect_rest, 'inflight', None),\
+            mock.patch.dict(commundetect_rest.app.config,
+                            {costs.MAX_JOB_COST_KEY: 1}),\
+            mock.patch.object(commundetect_rest.run_communitydetection,
+                              'apply_async') as apply_async:
+            pdict = {'algorithm': 'louvain',
+                     'edgefile': (io.BytesIO(b'1\t2\n'), 'edgefile.txt')}
+            rv = self._app.post(commundetect_rest.COMMUNDETECT_NS + '/v1',
+                                data=pdict,
+                                content_type='multipart/form-data')
+        self.assertEqual(413, rv.status_code)
+        self.assertTrue('seconds allowed' in rv.json['message'])
+        self.assertFalse(apply_async.called)
+        self.assertEqual([], os.listdir(self._temp_dir))
+
+    def test_post_overloaded(self):
+        overloaded = backpressure.OverloadedError('too busy', 42)
+        with mock.patch.object(commundetect_rest, 'resultcache', None),\
+            mock.patch.object(commundetect_rest, 'inflight', None),\
+            mock.patch.object(commundetect_rest.queuemonitor, 'check',
+                              side_effect=overloaded) as check,\
+            mock.patch.object(commundetect_rest.run_communitydetection,
+                              'apply_async') as apply_async:
+            pdict = {'algorithm': 'louvain',
+                     'edgefile': (io.BytesIO(b'1\t2\n'), 'edgefile.txt')}
+            rv = self._app.post(commundetect_rest.COMMUNDETECT_NS + '/v1',
+                                data=pdict,
+                                content_type='multipart/form-data')
+        self.assertEqual(503, rv.status_code)
+        self.assertEqual('42', rv.headers['Retry-After'])
+        self.assertEqual('too busy', rv.json['message'])
+        check.assert_called_once_with(
+            'small', commundetect_rest.app.config[
+                backpressure.MAX_QUEUE_WAIT_KEY], expires=2 * 600 + 60,
+            pending=0)
+        self.assertFalse(apply_async.called)
+        self.assertEqual([], os.listdir(self._temp_dir))
+
+    def test_post_work_quota(self):
+        workquota = quota.WorkQuota(commundetect_rest.limiter, '3 per hour')
+        with mock.patch.object(commundetect_rest, 'resultcache', None),\
+            mock.patch.object(commundetect_rest, 'inflight', None),\
+            mock.patch.object(commundetect_rest, 'workquota', workquota),\
+            mock.patch.object(commundetect_rest.run_communitydetection,
+                              'apply_async') as apply_async:
+            apply_async.side_effect = lambda **kw: commundetect_rest.SimpleTask(kw['task_id'])
+            responses = []
+            for x in range(2):
+                pdict = {'algorithm': 'louvain',
+                         'edgefile': (io.BytesIO(b'1\t2\n2\t3\n'),
+                                      'edgefile.txt')}
+                responses.append(self._app.post(
+                    commundetect_rest.COMMUNDETECT_NS + '/v1', data=pdict,
+                    content_type='multipart/form-data'))
+        self.assertEqual(202, responses[0].status_code)
+        self.assertEqual(429, responses[1].status_code)
+        self.assertTrue('2 edges' in responses[1].json['message'])
+        retryafter = int(responses[1].headers['Retry-After'])
+        self.assertTrue(0 < retryafter <= 3600)
+        self.assertEqual(1, apply_async.call_count)
+
+    def test_post_work_quota_refunded_if_not_queued(self):
+        workquota = quota.WorkQuota(commundetect_rest.limiter, '4 per hour')
+        with mock.patch.object(commundetect_rest, 'resultcache', None),\
+            mock.patch.object(commundetect_rest, 'inflight', None),\
+            mock.patch.object(commundetect_rest, 'workquota', workquota),\
+            mock.patch.object(commundetect_rest.run_communitydetection,
+                              'apply_async') as apply_async:
+            apply_async.side_effect = [Exception('broker down'),
+                                       commundetect_rest.SimpleTask('a'),
+                                       commundetect_rest.SimpleTask('b')]
+            codes = []
+            for x in range(4):
+                pdict = {'algorithm': 'louvain',
+                         'edgefile': (io.BytesIO(b'1\t2\n2\t3\n'),
+                                      'edgefile.txt')}
+                codes.append(self._app.post(
+                    commundetect_rest.COMMUNDETECT_NS + '/v1', data=pdict,
+                    content_type='multipart/form-data').status_code)
+        self.assertEqual([500, 202, 202, 429], codes)
+
+    def test_post_fair_share_holds_task(self):
+        dispatcher = mock.MagicMock()
+        with mock.patch.object(commundetect_rest, 'resultcache', None),\
+            mock.patch.object(commundetect_rest, 'inflight', None),\
+            mock.patch.object(commundetect_rest, 'dispatcher', dispatcher),\
+            mock.patch.dict(commundetect_rest.app.config,
+                            {fairshare.CLIENT_KEY_HEADER_KEY: 'X-Api-Key',
+                             fairshare.FAIR_SHARE_WEIGHTS_KEY: {'tok': 4}}),\
+            mock.patch.object(commundetect_rest.run_communitydetection,
+                              'apply_async') as apply_async:
+            for headers in [{}, {'X-Api-Key': 'tok'}]:
+                pdict = {'algorithm': 'louvain',
+                         'edgefile': (io.BytesIO(b'1\t2\n'),
+                                      'edgefile.txt')}
+                rv = self._app.post(commundetect_rest.COMMUNDETECT_NS +
+                                    '/v1', data=pdict, headers=headers,
+                                    content_type='multipart/form-data')
+                self.assertEqual(202, rv.status_code)
+        self.assertFalse(apply_async.called)
+        self.assertEqual(2, dispatcher.submit.call_count)
+        calls = dispatcher.submit.call_args_list
+        self.assertEqual('communitydetection-small', calls[0][0][0])
+        self.assertEqual(fairshare.make_client_key('127.0.0.1'),
+                         calls[0][0][1])
+        self.assertEqual(1, calls[0][1]['weight'])
+        self.assertEqual(rv.json['id'], calls[1][0][2][0]['task_id'])
+        self.assertEqual(fairshare.make_client_key('127.0.0.1',
+                                                   token='tok'),
+                         calls[1][0][1])
+        self.assertEqual(4, calls[1][1]['weight'])
+
+    def test_post_gzip_edgefile(self):
+        data = b'1\t2\n2\t3\n'
+        resultcache = cache.LocalResultCache()
+        with mock.patch.object(commundetect_rest, 'resultcache',
+                               resultcache),\
+            mock.patch.object(commundetect_rest, 'inflight', None),\
+            mock.patch.object(commundetect_rest.run_communitydetection,
+                              'apply_async') as apply_async:
+            apply_async.side_effect = lambda **kw: commundetect_rest.SimpleTask(kw['task_id'])
+            pdict = {'algorithm': 'louvain',
+                     'edgefile': (io.BytesIO(gzip.compress(data)),
+                                  'edgefile.txt.gz')}
+            rv = self._app.post(commundetect_rest.COMMUNDETECT_NS + '/v1',
+                                data=pdict,
+                                content_type='multipart/form-data')
+        self.assertEqual(202, rv.status_code)
+        taskid = rv.json['id']
+
+        # kept compressed on disk
+        edgefile = os.path.join(self._temp_dir, taskid,
+                                commundetect_rest.EDGE_FILE)
+        with open(edgefile, 'rb') as f:
+            self.assertEqual(data, gzip.decompress(f.read()))
+
+        # cache key is same as for uncompressed upload
+        self.assertEqual(taskid, resultcache.get(self._cache_key(data)))
+
+    def _npz(self, **arrays):
+        buf = io.BytesIO()
+        numpy.savez(buf, **arrays)
+        return buf.getvalue()
+
+    def test_post_edge_arrays(self):
+        data = self._npz(src=numpy.array([1, 2, 2]),
+                         dst=numpy.array([2, 3, 4]))
+        with mock.patch.object(commundetect_rest, 'resultcache', None),\
+            mock.patch.object(commundetect_rest, 'inflight', None),\
+            mock.patch.object(commundetect_rest.run_communitydetection,
+                              'apply_async') as apply_async:
+            pdict = {'algorithm': 'louvain',
+                     'edgearrays': (io.BytesIO(data), 'graph.npz')}
+            rv = self._app.post(commundetect_rest.COMMUNDETECT_NS + '/v1',
+                                data=pdict,
+                                content_type='multipart/form-data')
+        self.assertEqual(202, rv.status_code)
+        taskid = rv.json['id']
+        edgefile = os.path.join(self._temp_dir, taskid,
+                                commundetect_rest.EDGE_FILE)
+        with open(edgefile, 'rb') as f:
+            self.assertEqual(data, f.read())
+        sizeinfo = apply_async.call_args[1]['kwargs']['sizeinfo']
+        self.assertEqual(3, sizeinfo[routing.EDGES_STATUS_KEY])
+        self.assertEqual(4, sizeinfo[routing.NODES_STATUS_KEY])
+
+    def test_post_edge_arrays_invalid(self):
+        with mock.patch.object(commundetect_rest.run_communitydetection,
+                               'apply_async') as apply_async:
+            for pdict in [{'algorithm': 'louvain'},
+                          {'algorithm': 'louvain',
+                           'edgefile': (io.BytesIO(b'1\t2\n'), 'e.txt'),
+                           'edgearrays': (io.BytesIO(self._npz(
+                               src=numpy.array([1]),
+                               dst=numpy.array([2]))), 'g.npz')},
+                          {'algorithm': 'louvain',
+                           'edgearrays': (io.BytesIO(b'1\t2\n'), 'g.npz')},
+                          {'algorithm': 'louvain',
+                           'edgearrays': (io.BytesIO(self._npz(
+                               src=numpy.array([1]))), 'g.npz')},
+                          {'algorithm': 'louvain',
+                           'edgearrays': (io.BytesIO(gzip.compress(
+                               self._npz(src=numpy.array([1]),
+                                         dst=numpy.array([2])))),
+                               'g.npz')}]:
+                rv = self._app.post(commundetect_rest.COMMUNDETECT_NS +
+                                    '/v1', data=pdict,
+                                    content_type='multipart/form-data')
+                self.assertEqual(400, rv.status_code)
+            apply_async.assert_not_called()
+        self.assertEqual([], os.listdir(self._temp_dir))
+
+    def test_post_unsupported_content_encoding(self):
+        with mock.patch.object(commundetect_rest.run_communitydetection,
+                               'apply_async') as apply_async:
+            # test client does not send headers of file parts
+            body = (b'--xx\r\n'
+                    b'Content-Disposition: form-data; name="algorithm"'
+                    b'\r\n\r\nlouvain\r\n--xx\r\n'
+                    b'Content-Disposition: form-data; name="edgefile"; '
+                    b'filename="edgefile.txt"\r\n'
+                    b'Content-Type: application/octet-stream\r\n'
+                    b'Content-Encoding: br\r\n\r\n'
+                    b'1\t2\n\r\n--xx--\r\n')
+            rv = self._app.post(commundetect_rest.COMMUNDETECT_NS + '/v1',
+                                data=body,
+                                content_type='multipart/form-data; '
+                                             'boundary=xx')
+        self.assertEqual(400, rv.status_code)
+        self.assertTrue('Unsupported Content-Encoding' in rv.json['message'])
+        self.assertFalse(apply_async.called)
+        self.assertEqual([], os.listdir(self._temp_dir))
+
+    def _mock_task_states(self, asyncresult, states):
+        """
+        Makes AsyncResult mock report each state in turn
+        """
+        results = []
+        for state, info in states:
+            res = mock.MagicMock()
+            res.ready.return_value = state == 'SUCCESS'
+            res.get.return_value = info
+            res.state = state
+            res.info = info
+            results.append(res)
+        asyncresult.side_effect = results
+
+    def test_get_long_poll(self):
+        taskevents = mock.MagicMock()
+        sub = taskevents.watch.return_value
+        sub.wait.return_value = True
+        with mock.patch.object(commundetect_rest, 'taskevents', taskevents),\
+            mock.patch.object(commundetect_rest, 'inflight', None),\
+            mock.patch.object(commundetect_rest, 'resultcache', None),\
+            mock.patch.object(commundetect_rest.celeryapp,
+                              'AsyncResult') as asyncresult:
+            self._mock_task_states(asyncresult,
+                                   [('PROCESSING', {'message': 'x'}),
+                                    ('SUCCESS', {'status': 'done'})])
+            rv = self._app.get(commundetect_rest.COMMUNDETECT_NS +
+                               '/v1/abc?wait=1000')
+        self.assertEqual(200, rv.status_code)
+        self.assertEqual({'status': 'done'}, rv.json)
+        taskevents.watch.assert_called_once_with('abc')
+        maxwait = commundetect_rest.app.config[commundetect_rest.MAX_WAIT_KEY]
+        sub.wait.assert_called_once_with(maxwait)
+
+    def test_get_long_poll_timeout(self):
+        taskevents = mock.MagicMock()
+        sub = taskevents.watch.return_value
+        sub.wait.return_value = False
+        with mock.patch.object(commundetect_rest, 'taskevents', taskevents),\
+            mock.patch.object(commundetect_rest, 'inflight', None),\
+            mock.patch.object(commundetect_rest.celeryapp,
+                              'AsyncResult') as asyncresult:
+            self._mock_task_states(asyncresult,
+                                   [('PROCESSING', {'message': 'x'})])
+            rv = self._app.get(commundetect_rest.COMMUNDETECT_NS +
+                               '/v1/abc?wait=2')
+        self.assertEqual({'status': 'processing', 'message': 'x'}, rv.json)
+        sub.wait.assert_called_once_with(2.0)
+
+    def test_get_long_poll_too_many_held(self):
+        taskevents = mock.MagicMock()
+        heldrequests = threading.BoundedSemaphore(1)
+        heldrequests.acquire()
+        with mock.patch.object(commundetect_rest, 'taskevents', taskevents),\
+            mock.patch.object(commundetect_rest, 'inflight', None),\
+            mock.patch.object(commundetect_rest, 'heldrequests',
+                              heldrequests):
+            rv = self._app.get(commundetect_rest.COMMUNDETECT_NS +
+                               '/v1/abc?wait=2')
+            self.assertEqual(503, rv.status_code)
+            self.assertEqual(str(commundetect_rest.HELD_REQUEST_RETRY_AFTER),
+                             rv.headers['Retry-After'])
+            self.assertFalse(taskevents.watch.called)
+
+            # slot is given back once poll is answered
+            heldrequests.release()
+            taskevents.watch.return_value.wait.return_value = False
+            with mock.patch.object(commundetect_rest.celeryapp,
+                                   'AsyncResult') as asyncresult:
+                self._mock_task_states(asyncresult,
+                                       [('PENDING', None)])
+                rv = self._app.get(commundetect_rest.COMMUNDETECT_NS +
+                                   '/v1/abc?wait=2')
+            self.assertEqual(200, rv.status_code)
+            self.assertTrue(heldrequests.acquire(False))
+
+    def test_get_without_wait_does_not_watch(self):
+        taskevents = mock.MagicMock()
+        with mock.patch.object(commundetect_rest, 'taskevents', taskevents),\
+            mock.patch.object(commundetect_rest, 'inflight', None),\
+            mock.patch.object(commundetect_rest.celeryapp,
+                              'AsyncResult') as asyncresult:
+            self._mock_task_states(asyncresult, [('PENDING', None)])
+            rv = self._app.get(commundetect_rest.COMMUNDETECT_NS + '/v1/abc')
+        self.assertEqual({'status': 'submitted'}, rv.json)
+        self.assertFalse(taskevents.watch.called)
+
+    def _get_done(self, result, query='', headers=None, streammin=10):
+        with mock.patch.object(commundetect_rest, 'inflight', None),\
+            mock.patch.object(commundetect_rest, 'resultcache', None),\
+            mock.patch.dict(commundetect_rest.app.config,
+                            {commundetect_rest.RESULT_STREAM_MIN_KEY:
+                             streammin}),\
+            mock.patch.object(commundetect_rest.celeryapp,
+                              'AsyncResult') as asyncresult:
+            self._mock_task_states(asyncresult, [('SUCCESS', result)])
+            rv = self._app.get(commundetect_rest.COMMUNDETECT_NS +
+                               '/v1/abc' + query, headers=headers)
+            data = rv.get_data()
+        return rv, data
+
+    def test_get_result_streamed_gzip(self):
+        result = {'status': 'done', 'rootnetwork': 'net',
+                  'result': '1,2,t-g;' * 1000}
+        rv, data = self._get_done(result,
+                                  headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(200, rv.status_code)
+        self.assertEqual('gzip', rv.headers['Content-Encoding'])
+        self.assertEqual('Accept-Encoding', rv.headers['Vary'])
+        self.assertEqual(result, json.loads(gzip.decompress(data)))
+
+    def test_get_result_streamed_uncompressed(self):
+        result = {'status': 'done', 'rootnetwork': 'net',
+                  'result': '1,2,t-g;' * 1000}
+        rv, data = self._get_done(result)
+        self.assertFalse('Content-Encoding' in rv.headers)
+        self.assertEqual(result, json.loads(data))
+
+    def test_get_small_result_not_streamed(self):
+        result = {'status': 'done', 'result': '1,2,t-g;'}
+        rv, data = self._get_done(result,
+                                  headers={'Accept-Encoding': 'gzip'},
+                                  streammin=1000)
+        self.assertFalse('Content-Encoding' in rv.headers)
+        self.assertEqual(result, json.loads(data))
+
+    def test_get_result_page(self):
+        edges = [str(x) + ',1,t-g;' for x in range(100)]
+        result = {'status': 'done', 'result': ''.join(edges)}
+        rv, data = self._get_done(result, query='?offset=10&limit=5',
+                                  streammin=1000)
+        self.assertEqual({'status': 'done', 'result': ''.join(edges[10:15]),
+                          'offset': 10, 'count': 5, 'total': 100},
+                         json.loads(data))
+
+        rv, data = self._get_done(result, query='?offset=98&limit=5')
+        self.assertEqual({'status': 'done', 'result': ''.join(edges[98:]),
+                          'offset': 98, 'count': 2, 'total': 100},
+                         json.loads(data))
+
+        rv, data = self._get_done(result, query='?offset=-1')
+        self.assertEqual(400, rv.status_code)
+
+    def _store_result(self, text):
+        store = offload.DirectoryResultStore(os.path.join(self._temp_dir,
+                                                          'results'))
+        ref = store.put('abc', text)
+        return store, {'status': 'done', 'rootnetwork': 'net',
+                       'result': None, offload.RESULT_REF_KEY: ref}
+
+    def test_get_stored_result(self):
+        text = '1,2,t-g;' * 1000
+        store, result = self._store_result(text)
+        with mock.patch.object(commundetect_rest, 'resultstore', store):
+            rv, data = self._get_done(result,
+                                      headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(200, rv.status_code)
+        self.assertEqual('gzip', rv.headers['Content-Encoding'])
+        self.assertEqual({'status': 'done', 'rootnetwork': 'net',
+                          'result': text},
+                         json.loads(gzip.decompress(data)))
+
+        # small stored results are sent uncompressed
+        with mock.patch.object(commundetect_rest, 'resultstore', store):
+            rv, data = self._get_done(result,
+                                      headers={'Accept-Encoding': 'gzip'},
+                                      streammin=100000)
+        self.assertFalse('Content-Encoding' in rv.headers)
+        self.assertEqual(text, json.loads(data)['result'])
+
+    def test_get_stored_result_page(self):
+        edges = [str(x) + ',1,t-g;' for x in range(100)]
+        store, result = self._store_result(''.join(edges))
+        with mock.patch.object(commundetect_rest, 'resultstore', store):
+            rv, data = self._get_done(result, query='?offset=10&limit=5')
+        self.assertEqual({'status': 'done', 'rootnetwork': 'net',
+                          'result': ''.join(edges[10:15]),
+                          'offset': 10, 'count': 5, 'total': 100},
+                         json.loads(data))
+
+    def test_get_stored_result_expired(self):
+        store, result = self._store_result('1,2,t-g;')
+        store.delete(result[offload.RESULT_REF_KEY])
+        with mock.patch.object(commundetect_rest, 'resultstore', store):
+            rv, data = self._get_done(result)
+        self.assertEqual(410, rv.status_code)
+        self.assertEqual('error', rv.json['status'])
+        self.assertIsNone(rv.json['result'])
+        self.assertFalse(offload.RESULT_REF_KEY in rv.json)
+
+        # no result store configured in REST service
+        with mock.patch.object(commundetect_rest, 'resultstore', None):
+            rv, data = self._get_done(result)
+        self.assertEqual(410, rv.status_code)
+
+    def test_delete_removes_stored_result(self):
+        store, result = self._store_result('1,2,t-g;')
+        ref = result[offload.RESULT_REF_KEY]
+        with mock.patch.object(commundetect_rest, 'resultstore', store),\
+            mock.patch.object(commundetect_rest, 'inflight', None),\
+            mock.patch.object(commundetect_rest,
+                              'AsyncResult') as asyncresult:
+            asyncresult.return_value.state = 'SUCCESS'
+            asyncresult.return_value.result = result
+            rv = self._app.delete(commundetect_rest.COMMUNDETECT_NS +
+                                  '/v1/abc')
+        self.assertEqual(200, rv.status_code)
+        self.assertFalse(store.exists(ref))
+        asyncresult.return_value.forget.assert_called_once_with()
+
+    def test_get_event_stream(self):
+        taskevents = mock.MagicMock()
+        sub = taskevents.watch.return_value
+        sub.wait.side_effect = [False, True, True]
+        with mock.patch.object(commundetect_rest, 'taskevents', taskevents),\
+            mock.patch.object(commundetect_rest, 'inflight', None),\
+            mock.patch.object(commundetect_rest, 'resultcache', None),\
+            mock.patch.object(commundetect_rest.celeryapp,
+                              'AsyncResult') as asyncresult:
+            self._mock_task_states(asyncresult,
+                                   [('PENDING', None),
+                                    ('PENDING', None),
+                                    ('SUCCESS', {'status': 'done'})])
+            rv = self._app.get(commundetect_rest.COMMUNDETECT_NS +
+                               '/v1/abc/events')
+            data = rv.get_data(as_text=True)
+            rv.close()
+        self.assertEqual(200, rv.status_code)
+        self.assertTrue(rv.content_type.startswith('text/event-stream'))
+        self.assertEqual('event: status\ndata: {"status": "submitted"}\n\n'
+                         ': keepalive\n\n'
+                         'event: status\ndata: {"status": "done"}\n\n',
+                         data)
+        sub.close.assert_called_once_with()
+
+    def test_get_event_stream_too_many_held(self):
+        taskevents = mock.MagicMock()
+        taskevents.watch.return_value.wait.return_value = True
+        heldrequests = threading.BoundedSemaphore(1)
+        with mock.patch.object(commundetect_rest, 'taskevents', taskevents),\
+            mock.patch.object(commundetect_rest, 'inflight', None),\
+            mock.patch.object(commundetect_rest, 'resultcache', None),\
+            mock.patch.object(commundetect_rest, 'heldrequests',
+                              heldrequests),\
+            mock.patch.object(commundetect_rest.celeryapp,
+                              'AsyncResult') as asyncresult:
+            self._mock_task_states(asyncresult,
+                                   [('PENDING', None),
+                                    ('SUCCESS', {'status': 'done'})])
+            stream = self._app.get(commundetect_rest.COMMUNDETECT_NS +
+                                   '/v1/abc/events', buffered=False)
+            self.assertEqual(200, stream.status_code)
+            rv = self._app.get(commundetect_rest.COMMUNDETECT_NS +
+                               '/v1/abc/events')
+            self.assertEqual(503, rv.status_code)
+            self.assertTrue('Retry-After' in rv.headers)
+            stream.get_data()
+            stream.close()
+        self.assertTrue(heldrequests.acquire(False))
+
+    def test_get_event_stream_timeout(self):
+        taskevents = mock.MagicMock()
+        with mock.patch.object(commundetect_rest, 'taskevents', taskevents),\
+            mock.patch.object(commundetect_rest, 'inflight', None),\
+            mock.patch.dict(commundetect_rest.app.config,
+                            {commundetect_rest.EVENT_STREAM_TIMEOUT_KEY: 0}),\
+            mock.patch.object(commundetect_rest.celeryapp,
+                              'AsyncResult') as asyncresult:
+            self._mock_task_states(asyncresult, [('PENDING', None)])
+            rv = self._app.get(commundetect_rest.COMMUNDETECT_NS +
+                               '/v1/abc/events')
+            data = rv.get_data(as_text=True)
+            rv.close()
+        self.assertTrue(data.endswith('event: timeout\ndata: {}\n\n'))
+
+    def _post_batch(self, pdict):
+        with mock.patch.object(commundetect_rest, 'resultcache', None),\
+            mock.patch.object(commundetect_rest, 'inflight', None),\
+            mock.patch.object(commundetect_rest.celeryapp.backend,
+                              'set') as save_group,\
+            mock.patch.object(commundetect_rest.celeryapp.backend,
+                              'expire') as expire,\
+            mock.patch.object(commundetect_rest, 'group') as grp:
+            rv = self._app.post(commundetect_rest.COMMUNDETECT_NS +
+                                '/v1/batch', data=pdict,
+                                content_type='multipart/form-data')
+        if save_group.called:
+            expire.assert_called_once_with(
+                save_group.call_args[0][0],
+                commundetect_rest.celeryapp.backend.expires)
+        return rv, grp, save_group
+
+    def test_post_batch_edgefiles(self):
+        items = {'b.txt': {'algorithm': 'infomap', 'graphdirected': True,
+                           'rootnetwork': 'netb'}}
+        pdict = {'algorithm': 'louvain',
+                 'edgefiles': [(io.BytesIO(b'1\t2\n'), 'a.txt'),
+                               (io.BytesIO(gzip.compress(b'2\t3\n')),
+                                'b.txt')],
+                 'items': json.dumps(items)}
+        rv, grp, save_group = self._post_batch(pdict)
+        self.assertEqual(202, rv.status_code)
+        batchid = rv.json['id']
+        self.assertTrue(rv.headers['Location'].endswith('/v1/batch/' +
+                                                        batchid))
+        self.assertEqual(['a.txt', 'b.txt'],
+                         [t['name'] for t in rv.json['tasks']])
+        taskids = [t['id'] for t in rv.json['tasks']]
+
+        # published once as a group
+        grp.return_value.apply_async.assert_called_once_with()
+        sigs = grp.call_args[0][0]
+        self.assertEqual(2, len(sigs))
+        self.assertEqual(['louvain', self._temp_dir, False, 'a.txt'],
+                         list(sigs[0].args))
+        self.assertEqual(['infomap', self._temp_dir, True, 'netb'],
+                         list(sigs[1].args))
+        self.assertEqual(taskids, [sig.options['task_id'] for sig in sigs])
+        self.assertEqual(sorted(taskids), sorted(os.listdir(self._temp_dir)))
+
+        save_group.assert_called_once_with(
+            commundetect_rest.BATCH_KEY_PREFIX + batchid,
+            json.dumps(rv.json['tasks']))
+
+    def test_post_batch_fair_share(self):
+        dispatcher = mock.MagicMock()
+        pdict = {'algorithm': 'louvain',
+                 'edgefiles': [(io.BytesIO(b'1\t2\n'), 'a.txt'),
+                               (io.BytesIO(b'2\t3\n'), 'b.txt')]}
+        with mock.patch.object(commundetect_rest, 'dispatcher', dispatcher):
+            rv, grp, save_group = self._post_batch(pdict)
+        self.assertEqual(202, rv.status_code)
+        self.assertFalse(grp.called)
+        dispatcher.submit.assert_called_once()
+        queue, clientkey, taskoptslist = dispatcher.submit.call_args[0]
+        self.assertEqual('communitydetection-small', queue)
+        self.assertEqual([t['id'] for t in rv.json['tasks']],
+                         [x['task_id'] for x in taskoptslist])
+        self.assertEqual([None, None], [x['expires'] for x in taskoptslist])
+
+    def test_post_batch_zip_archive(self):
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, 'w') as zf:
+            zf.writestr('nets/a.txt', '1\t2\n')
+            zf.writestr('nets/.hidden', 'x')
+            zf.writestr('b.txt', '2\t3\n')
+        buf.seek(0)
+        rv, grp, save_group = self._post_batch({'archive': (buf, 'x.zip')})
+        self.assertEqual(202, rv.status_code)
+        self.assertEqual(['nets/a.txt', 'b.txt'],
+                         [t['name'] for t in rv.json['tasks']])
+        self.assertEqual(2, len(grp.call_args[0][0]))
+
+    def test_post_batch_tar_archive(self):
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode='w:gz') as tf:
+            data = b'1\t2\n'
+            info = tarfile.TarInfo('a.txt')
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+        buf.seek(0)
+        rv, grp, save_group = self._post_batch({'archive': (buf, 'x.tgz')})
+        self.assertEqual(202, rv.status_code)
+        self.assertEqual(['a.txt'], [t['name'] for t in rv.json['tasks']])
+
+    def test_post_batch_invalid(self):
+        rv, grp, save_group = self._post_batch({'algorithm': 'louvain'})
+        self.assertEqual(400, rv.status_code)
+
+        rv, grp, save_group = self._post_batch(
+            {'archive': (io.BytesIO(b'not an archive'), 'x.zip')})
+        self.assertEqual(400, rv.status_code)
+
+        rv, grp, save_group = self._post_batch(
+            {'edgefiles': [(io.BytesIO(b'1\t2\n'), 'a.txt')],
+             'items': json.dumps({'a.txt': {'algorithm': 'foo'}})})
+        self.assertEqual(400, rv.status_code)
+
+        rv, grp, save_group = self._post_batch(
+            {'edgefiles': [(io.BytesIO(b'1\t2\n'), 'a.txt')],
+             'items': json.dumps({'a.txt': 'louvain'})})
+        self.assertEqual(400, rv.status_code)
+        self.assertTrue('a.txt' in rv.json['message'])
+        self.assertFalse(grp.called)
+        self.assertEqual([], os.listdir(self._temp_dir))
+
+    def test_post_batch_rejects_costly_graph(self):
+        with mock.patch.dict(commundetect_rest.app.config,
+                             {costs.MAX_JOB_COST_KEY: 1}):
+            rv, grp, save_group = self._post_batch(
+                {'edgefiles': [(io.BytesIO(b'1\t2\n'), 'a.txt')]})
+        self.assertEqual(413, rv.status_code)
+        self.assertTrue(rv.json['message'].startswith('a.txt: '))
+        self.assertFalse(grp.called)
+        self.assertEqual([], os.listdir(self._temp_dir))
+
+    def test_post_batch_overloaded(self):
+        overloaded = backpressure.OverloadedError('too busy', 7)
+        with mock.patch.object(commundetect_rest.queuemonitor, 'check',
+                               side_effect=[None, overloaded]) as check:
+            rv, grp, save_group = self._post_batch(
+                {'edgefiles': [(io.BytesIO(b'1\t2\n'), 'a.txt'),
+                               (io.BytesIO(b'2\t3\n'), 'b.txt')]})
+        self.assertEqual(503, rv.status_code)
+        # second item is checked behind first one, not queued yet
+        self.assertEqual([0, 1], [c[1]['pending']
+                                  for c in check.call_args_list])
+        self.assertEqual('7', rv.headers['Retry-After'])
+        self.assertFalse(grp.called)
+        self.assertEqual([], os.listdir(self._temp_dir))
+
+    def test_post_batch_publish_fails(self):
+        with mock.patch.object(commundetect_rest, 'resultcache', None),\
+            mock.patch.object(commundetect_rest, 'inflight', None),\
+            mock.patch.object(commundetect_rest, 'group') as grp:
+            grp.return_value.apply_async.side_effect = Exception('down')
+            pdict = {'edgefiles': [(io.BytesIO(b'1\t2\n'), 'a.txt')]}
+            rv = self._app.post(commundetect_rest.COMMUNDETECT_NS +
+                                '/v1/batch', data=pdict,
+                                content_type='multipart/form-data')
+        self.assertEqual(500, rv.status_code)
+        self.assertEqual([], os.listdir(self._temp_dir))
+
+    def _fake_mget(self, states):
+        """
+        Creates fake mget of result backend returning states, a dict
+        of task id => (celery state, result)
+        """
+        backend = commundetect_rest.celeryapp.backend
+
+        def fake_mget(keys):
+            values = []
+            for key in keys:
+                taskid = key.decode('utf-8')[len(backend.task_keyprefix):]
+                if taskid not in states:
+                    values.append(None)
+                    continue
+                values.append(backend.encode({'status': states[taskid][0],
+                                              'result': states[taskid][1],
+                                              'task_id': taskid}))
+            return values
+        return fake_mget
+
+    def test_get_batch(self):
+        batch = json.dumps([{'name': x + '.txt', 'id': x}
+                            for x in ['a', 'b', 'c', 'd']])
+        states = {'a': ('SUCCESS', {'status': 'done'}),
+                  'b': ('SUCCESS', {'status': 'error'}),
+                  'c': ('PROCESSING', {})}
+
+        with mock.patch.object(commundetect_rest, 'inflight', None),\
+            mock.patch.object(commundetect_rest, 'resultcache', None),\
+            mock.patch.object(commundetect_rest.celeryapp.backend,
+                              'get', return_value=batch) as get,\
+            mock.patch.object(commundetect_rest.celeryapp.backend, 'mget',
+                              side_effect=self._fake_mget(states)) as mget:
+            rv = self._app.get(commundetect_rest.COMMUNDETECT_NS +
+                               '/v1/batch/xyz')
+        self.assertEqual(200, rv.status_code)
+        self.assertEqual({'id': 'xyz', 'status': 'processing', 'total': 4,
+                          'progress': 50, 'submitted': 1, 'processing': 1,
+                          'done': 1, 'error': 1, 'outofmemory': 0,
+                          'tasks': [{'name': 'a.txt', 'id': 'a',
+                                     'status': 'done'},
+                                    {'name': 'b.txt', 'id': 'b',
+                                     'status': 'error'},
+                                    {'name': 'c.txt', 'id': 'c',
+                                     'status': 'processing'},
+                                    {'name': 'd.txt', 'id': 'd',
+                                     'status': 'submitted'}]},
+                         rv.json)
+        get.assert_called_once_with(commundetect_rest.BATCH_KEY_PREFIX +
+                                    'xyz')
+        self.assertEqual(1, mget.call_count)
+
+    def test_get_batch_out_of_memory_is_finished(self):
+        batch = json.dumps([{'name': x + '.txt', 'id': x}
+                            for x in ['a', 'b']])
+        states = {'a': ('SUCCESS', {'status': 'done'}),
+                  'b': ('SUCCESS', {'status': 'outofmemory',
+                                    'message': 'Job was killed'})}
+        with mock.patch.object(commundetect_rest, 'inflight', None),\
+            mock.patch.object(commundetect_rest, 'resultcache', None),\
+            mock.patch.object(commundetect_rest.celeryapp.backend,
+                              'get', return_value=batch),\
+            mock.patch.object(commundetect_rest.celeryapp.backend, 'mget',
+                              side_effect=self._fake_mget(states)):
+            rv = self._app.get(commundetect_rest.COMMUNDETECT_NS +
+                               '/v1/batch/xyz')
+        self.assertEqual(200, rv.status_code)
+        self.assertEqual('done', rv.json['status'])
+        self.assertEqual(1, rv.json['outofmemory'])
+        self.assertEqual(100, rv.json['progress'])
+
+    def test_post_bulk_status(self):
+        states = {'a': ('SUCCESS', {'status': 'done', 'result': 'x',
+                                    'rootnetwork': 'old'}),
+                  'b': ('PROCESSING', {'message': 'Running louvain'}),
+                  'c': ('FAILURE', {'exc_type': 'ValueError',
+                                    'exc_message': ['bad'],
+                                    'exc_module': 'builtins'})}
+        inflight = coalesce.LocalInFlightTracker()
+        inflight.claim('key', 'a')
+        inflight.add_alias('a', 'e', rootnetwork='new')
+        with mock.patch.object(commundetect_rest, 'inflight', inflight),\
+            mock.patch.object(commundetect_rest.celeryapp.backend, 'mget',
+                              side_effect=self._fake_mget(states)) as mget:
+            rv = self._app.post(commundetect_rest.COMMUNDETECT_NS +
+                                '/v1/tasks',
+                                json={'ids': ['a', 'b', 'c', 'd', 'e']})
+            self.assertEqual(200, rv.status_code)
+            self.assertEqual({'tasks': {
+                'a': {'status': 'done'},
+                'b': {'status': 'processing',
+                      'message': 'Running louvain'},
+                'c': {'status': 'error', 'message': 'bad'},
+                'd': {'status': 'submitted'},
+                'e': {'status': 'done'}}}, rv.json)
+            self.assertEqual(1, mget.call_count)
+            self.assertEqual(4, len(mget.call_args[0][0]))
+
+            rv = self._app.post(commundetect_rest.COMMUNDETECT_NS +
+                                '/v1/tasks',
+                                json={'ids': ['a', 'e'], 'results': True})
+            self.assertEqual({'tasks': {
+                'a': {'status': 'done', 'result': {'status': 'done',
+                                                   'result': 'x',
+                                                   'rootnetwork': 'old'}},
+                'e': {'status': 'done', 'result': {'status': 'done',
+                                                   'result': 'x',
+                                                   'rootnetwork': 'new'}}}},
+                rv.json)
+
+    def test_post_bulk_status_invalid(self):
+        rv = self._app.post(commundetect_rest.COMMUNDETECT_NS + '/v1/tasks',
+                            json={'foo': []})
+        self.assertEqual(400, rv.status_code)
+        with mock.patch.dict(commundetect_rest.app.config,
+                             {commundetect_rest.BULK_STATUS_MAX_KEY: 1}):
+            rv = self._app.post(commundetect_rest.COMMUNDETECT_NS +
+                                '/v1/tasks', json={'ids': ['a', 'b']})
+        self.assertEqual(400, rv.status_code)
+        with mock.patch.dict(commundetect_rest.app.config,
+                             {commundetect_rest.BULK_RESULTS_MAX_KEY: 1}):
+            rv = self._app.post(commundetect_rest.COMMUNDETECT_NS +
+                                '/v1/tasks', json={'ids': ['a', 'b'],
+                                                   'results': True})
+        self.assertEqual(400, rv.status_code)
+        self.assertTrue('results' in rv.json['message'])
+
+    def test_get_batch_not_found(self):
+        with mock.patch.object(commundetect_rest.celeryapp.backend,
+                               'get', return_value=None):
+            rv = self._app.get(commundetect_rest.COMMUNDETECT_NS +
+                               '/v1/batch/xyz')
+        self.assertEqual(404, rv.status_code)
+        self.assertEqual('notfound', rv.json['status'])
+
+    def test_blob_staged_input_removed(self):
+        store = staging.DirectoryBlobStore(os.path.join(self._temp_dir,
+                                                        'blobs'))
+        blobrefs = mock.MagicMock()
+        blobrefs.add.side_effect = lambda name, taskid, path: store.put(
+            name, path)
+        blobrefs.release.side_effect = lambda taskid: store.delete(
+            hashlib.sha256(b'1\t2\n').hexdigest())
+        stager = staging.InputStager(backend=staging.BLOB_STAGING,
+                                     blobrefs=blobrefs)
+        dest = os.path.join(self._temp_dir, 'fetched')
+        with mock.patch.object(commundetect_rest, 'resultcache', None),\
+            mock.patch.object(commundetect_rest, 'inflight', None),\
+            mock.patch.object(commundetect_rest, 'stager', stager),\
+            mock.patch.object(commundetect_rest, 'AsyncResult'),\
+            mock.patch.object(commundetect_rest.run_communitydetection,
+                              'apply_async') as apply_async:
+            apply_async.side_effect = lambda **kw: commundetect_rest.SimpleTask(kw['task_id'])
+            pdict = {'algorithm': 'louvain',
+                     'edgefile': (io.BytesIO(b'1\t2\n'), 'edgefile.txt')}
+            rv = self._app.post(commundetect_rest.COMMUNDETECT_NS + '/v1',
+                                data=pdict,
+                                content_type='multipart/form-data')
+            self.assertEqual(202, rv.status_code)
+            inputref = apply_async.call_args[1]['kwargs']['inputref']
+            # named by content so identical inputs are stored once
+            self.assertEqual(hashlib.sha256(b'1\t2\n').hexdigest(),
+                             inputref[staging.REF_NAME])
+            self.assertEqual(rv.json['id'], inputref[staging.REF_TASK])
+            staging.fetch_input(inputref, dest, blobstore=store)
+
+            # deleted before worker got to it
+            rv = self._app.delete(commundetect_rest.COMMUNDETECT_NS +
+                                  '/v1/' + rv.json['id'])
+            self.assertEqual(200, rv.status_code)
+            blobrefs.release.assert_called_once_with(
+                inputref[staging.REF_TASK])
+            with self.assertRaises(staging.StagingError):
+                staging.fetch_input(inputref, dest, blobstore=store)
+
+            # task that cannot be queued
+            apply_async.side_effect = Exception('broker down')
+            pdict = {'algorithm': 'louvain',
+                     'edgefile': (io.BytesIO(b'1\t2\n'), 'edgefile.txt')}
+            rv = self._app.post(commundetect_rest.COMMUNDETECT_NS + '/v1',
+                                data=pdict,
+                                content_type='multipart/form-data')
+            self.assertEqual(500, rv.status_code)
+            inputref = apply_async.call_args[1]['kwargs']['inputref']
+            with self.assertRaises(staging.StagingError):
+                staging.fetch_input(inputref, dest, blobstore=store)
+
+    def test_post_coalesces_identical_submissions(self):
+        inflight = coalesce.LocalInFlightTracker()
+        with mock.patch.object(commundetect_rest, 'resultcache', None),\
+            mock.patch.object(commundetect_rest, 'inflight', inflight),\
+            mock.patch.object(commundetect_rest.celeryapp,
+                              'AsyncResult') as asyncresult,\
+            mock.patch.object(commundetect_rest, 'AsyncResult') as delresult,\
+            mock.patch.object(commundetect_rest.run_communitydetection,
+                              'apply_async') as apply_async:
+            asyncresult.return_value.state = 'STARTED'
+            apply_async.side_effect = lambda **kw: commundetect_rest.SimpleTask(kw['task_id'])
+            ids = []
+            for x in range(3):
+                pdict = {'algorithm': 'louvain',
+                         'edgefile': (io.BytesIO(b'1\t2\n'),
+                                      'edgefile.txt')}
+                rv = self._app.post(commundetect_rest.COMMUNDETECT_NS + '/v1',
+                                    data=pdict,
+                                    content_type='multipart/form-data')
+                self.assertEqual(202, rv.status_code)
+                ids.append(rv.json['id'])
+            self.assertEqual(1, apply_async.call_count)
+            self.assertEqual(3, len(set(ids)))
+            self.assertEqual([ids[0]], os.listdir(self._temp_dir))
+
+            # deleting aliases and the primary only cancels after last one
+            for taskid in ids:
+                self.assertFalse(delresult.called)
+                rv = self._app.delete(commundetect_rest.COMMUNDETECT_NS +
+                                      '/v1/' + taskid)
+                self.assertEqual(200, rv.status_code)
+            delresult.assert_called_once_with(ids[0])
+            delresult.return_value.revoke.assert_called_once_with(terminate=True)
+            self.assertEqual([], os.listdir(self._temp_dir))
+
+    def test_post_does_not_coalesce_onto_failed_task(self):
+        inflight = coalesce.LocalInFlightTracker()
+        with mock.patch.object(commundetect_rest, 'resultcache', None),\
+            mock.patch.object(commundetect_rest, 'inflight', inflight),\
+            mock.patch.object(commundetect_rest.celeryapp,
+                              'AsyncResult') as asyncresult,\
+            mock.patch.object(commundetect_rest.run_communitydetection,
+                              'apply_async') as apply_async:
+            apply_async.side_effect = lambda **kw: commundetect_rest.SimpleTask(kw['task_id'])
+            ids = []
+            # state of task claimed by previous submission
+            for state, result in [('PENDING', None),
+                                  ('SUCCESS', {'status': 'error'}),
+                                  ('FAILURE', None),
+                                  ('STARTED', None)]:
+                asyncresult.return_value.state = state
+                asyncresult.return_value.result = result
+                pdict = {'algorithm': 'louvain',
+                         'edgefile': (io.BytesIO(b'1\t2\n'),
+                                      'edgefile.txt')}
+                rv = self._app.post(commundetect_rest.COMMUNDETECT_NS + '/v1',
+                                    data=pdict,
+                                    content_type='multipart/form-data')
+                self.assertEqual(202, rv.status_code)
+                ids.append(rv.json['id'])
+            # submissions after failed tasks ran again, last one
+            # shares the running task
+            self.assertEqual(3, apply_async.call_count)
+            self.assertEqual(ids[2], inflight.resolve(ids[3])[0])
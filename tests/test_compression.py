@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `commundetect_rest.compression` module."""
+
+import io
+import os
+import gzip
+import hashlib
+import unittest
+from unittest import mock
+import shutil
+import tempfile
+
+from commundetect_rest import compression
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class TestCompression(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+        self._data = b''.join([str(x).encode('utf-8') + b'\t' +
+                               str(x + 1).encode('utf-8') + b'\n'
+                               for x in range(20000)])
+
+    def tearDown(self):
+        shutil.rmtree(self._temp_dir)
+
+    def _write(self, name, data):
+        path = os.path.join(self._temp_dir, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_detect_encoding(self):
+        self.assertEqual(compression.IDENTITY_ENCODING,
+                         compression.detect_encoding(b'1\t2\n'))
+        self.assertEqual(compression.IDENTITY_ENCODING,
+                         compression.detect_encoding(b''))
+        self.assertEqual(compression.GZIP_ENCODING,
+                         compression.detect_encoding(gzip.compress(b'x')))
+        self.assertEqual(compression.ZSTD_ENCODING,
+                         compression.detect_encoding(b'\x28\xb5\x2f\xfd'))
+        self.assertEqual(compression.GZIP_ENCODING,
+                         compression.detect_encoding(b'1\t2\n',
+                                                     contentencoding=' X-Gzip'))
+        self.assertEqual(compression.GZIP_ENCODING,
+                         compression.detect_encoding(gzip.compress(b'x'),
+                                                     contentencoding='identity'))
+        with self.assertRaises(compression.CompressionError):
+            compression.detect_encoding(b'1', contentencoding='br')
+
+    def test_copy_and_hash_gzip(self):
+        # two gzip members, as from concatenated gzip files
+        compressed = gzip.compress(self._data[:100]) +\
+            gzip.compress(self._data[100:])
+        out = io.BytesIO()
+        digest = hashlib.sha256()
+        encoding = compression.copy_and_hash(io.BytesIO(compressed), out,
+                                             digest, chunksize=1000)
+        self.assertEqual(compression.GZIP_ENCODING, encoding)
+        self.assertEqual(compressed, out.getvalue())
+        self.assertEqual(hashlib.sha256(self._data).hexdigest(),
+                         digest.hexdigest())
+
+    def test_copy_and_hash_identity(self):
+        out = io.BytesIO()
+        digest = hashlib.sha256()
+        encoding = compression.copy_and_hash(io.BytesIO(self._data), out,
+                                             digest, chunksize=7)
+        self.assertEqual(compression.IDENTITY_ENCODING, encoding)
+        self.assertEqual(self._data, out.getvalue())
+        self.assertEqual(hashlib.sha256(self._data).hexdigest(),
+                         digest.hexdigest())
+
+    def test_copy_and_hash_counter(self):
+        counter = mock.MagicMock()
+        compression.copy_and_hash(io.BytesIO(gzip.compress(self._data)),
+                                  io.BytesIO(), hashlib.sha256(),
+                                  chunksize=7, counter=counter)
+        self.assertEqual(self._data, b''.join(
+            c[0][0] for c in counter.update.call_args_list))
+        counter.finish.assert_called_once_with()
+
+    def test_copy_and_hash_corrupt(self):
+        compressed = gzip.compress(self._data)
+        with self.assertRaises(compression.CompressionError):
+            compression.copy_and_hash(io.BytesIO(compressed[:200]),
+                                      io.BytesIO(), hashlib.sha256())
+        with self.assertRaises(compression.CompressionError):
+            compression.copy_and_hash(io.BytesIO(self._data), io.BytesIO(),
+                                      hashlib.sha256(),
+                                      contentencoding='gzip')
+
+    @unittest.skipIf(zstandard is None, 'zstandard not installed')
+    def test_zstd(self):
+        compressed = zstandard.ZstdCompressor().compress(self._data)
+        out = io.BytesIO()
+        digest = hashlib.sha256()
+        encoding = compression.copy_and_hash(io.BytesIO(compressed), out,
+                                             digest)
+        self.assertEqual(compression.ZSTD_ENCODING, encoding)
+        self.assertEqual(compressed, out.getvalue())
+        self.assertEqual(hashlib.sha256(self._data).hexdigest(),
+                         digest.hexdigest())
+
+        path = self._write('edgefile.txt', compressed)
+        with compression.open_decompressed(path) as f:
+            self.assertEqual(self._data, f.read())
@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `commundetect_rest.containers` module."""
+
+import os
+import sys
+import unittest
+import shutil
+import tempfile
+import subprocess
+from unittest import mock
+
+from commundetect_rest import containers
+from commundetect_rest import resources
+
+
+ECHO_SERVER = """
+import sys, json
+for line in sys.stdin:
+    job = json.loads(line)
+    with open(job['stdout'], 'w') as f:
+        f.write(' '.join(job['args']))
+    sys.stdout.write(json.dumps({'returncode': 0, 'stderr': 'ok'}) + '\\n')
+    sys.stdout.flush()
+"""
+
+
+def _start_echo_server(container):
+    container._proc = subprocess.Popen([sys.executable, '-c', ECHO_SERVER],
+                                       stdin=subprocess.PIPE,
+                                       stdout=subprocess.PIPE,
+                                       universal_newlines=True)
+
+
+class TestContainers(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+        self._profile = {containers.MODE_KEY: containers.SERVE_MODE,
+                         containers.ENTRYPOINT_KEY: '/run.py',
+                         containers.ARGS_KEY: ['--serve'],
+                         containers.POOLSIZE_KEY: 1}
+
+    def tearDown(self):
+        shutil.rmtree(self._temp_dir)
+
+    def test_warm_container_serve(self):
+        container = containers.WarmContainer('foo', self._temp_dir,
+                                             self._profile)
+        with mock.patch.object(containers.WarmContainer, 'start',
+                               _start_echo_server):
+            container.start()
+        try:
+            outfile = os.path.join(self._temp_dir, 'out.txt')
+            ecode, err = container.run(['a', 'b'], outfile)
+            self.assertEqual(0, ecode)
+            self.assertEqual(b'ok', err)
+            with open(outfile, 'r') as f:
+                self.assertEqual('a b', f.read())
+
+            # second job on same container
+            ecode, err = container.run(['c'], outfile)
+            self.assertEqual(0, ecode)
+            with open(outfile, 'r') as f:
+                self.assertEqual('c', f.read())
+        finally:
+            container._proc.kill()
+            container._proc.wait()
+
+    def test_warm_container_exec_needs_entrypoint(self):
+        profile = {containers.MODE_KEY: containers.EXEC_MODE}
+        with self.assertRaises(ValueError) as cm:
+            containers.WarmContainer('foo', self._temp_dir, profile)
+        self.assertIn(containers.ENTRYPOINT_KEY, str(cm.exception))
+
+    def test_warm_container_died(self):
+        container = containers.WarmContainer('foo', self._temp_dir,
+                                             self._profile)
+        container._proc = subprocess.Popen([sys.executable, '-c', ''],
+                                           stdin=subprocess.PIPE,
+                                           stdout=subprocess.PIPE,
+                                           universal_newlines=True)
+        container._proc.wait()
+        self.assertFalse(container.is_alive())
+        with self.assertRaises(containers.ContainerError):
+            container.run(['a'], os.path.join(self._temp_dir, 'out.txt'))
+
+    def test_pool_respawns_dead_container(self):
+        started = []
+
+        def fake_start(container):
+            started.append(container)
+            _start_echo_server(container)
+
+        pool = containers.ContainerPool('foo', self._temp_dir,
+                                        self._profile)
+        outfile = os.path.join(self._temp_dir, 'out.txt')
+        with mock.patch.object(containers.WarmContainer, 'start',
+                               fake_start):
+            try:
+                self.assertEqual(0, pool.run(['a'], outfile)[0])
+                self.assertEqual(0, pool.run(['b'], outfile)[0])
+                self.assertEqual(1, len(started))
+
+                # simulate crash
+                started[0]._proc.kill()
+                started[0]._proc.wait()
+                self.assertEqual(0, pool.run(['c'], outfile)[0])
+                self.assertEqual(2, len(started))
+            finally:
+                for c in started:
+                    if c._proc is not None:
+                        c._proc.kill()
+                        c._proc.wait()
+
+    def test_pool_stops_container_of_interrupted_job(self):
+        pool = containers.ContainerPool('foo', self._temp_dir,
+                                        self._profile)
+        container = mock.MagicMock()
+        container.run.side_effect = KeyboardInterrupt()
+        with mock.patch.object(pool, '_new_container',
+                               return_value=container):
+            with self.assertRaises(KeyboardInterrupt):
+                pool.run(['a'], os.path.join(self._temp_dir, 'out.txt'))
+        container.stop.assert_called_once_with()
+
+    def test_warm_container_start_with_limits(self):
+        limits = resources.ResourceProfile(cpus=2, memory='1g',
+                                           cpuset=[4, 5])
+        container = containers.WarmContainer('foo', self._temp_dir,
+                                             self._profile, limits=limits)
+        with mock.patch.object(containers.subprocess, 'Popen') as popen:
+            container.start()
+        cmd = popen.call_args[0][0]
+        self.assertFalse('--rm' in cmd)
+        self.assertFalse('--cpuset-cpus' in cmd)
+        self.assertEqual(['--cpus', '2', '--memory', '1g',
+                          '--memory-swap', '1g', '-e', 'OMP_NUM_THREADS=2',
+                          '--entrypoint', '/run.py', 'foo', '--serve'],
+                         cmd[7:])
+
+    def test_warm_container_pin(self):
+        container = containers.WarmContainer('foo', self._temp_dir,
+                                             self._profile)
+        with mock.patch.object(containers.subprocess, 'call',
+                               return_value=0) as call:
+            container.pin([1, 2])
+            container.pin([1, 2])
+        self.assertEqual(['docker', 'update', '--cpuset-cpus', '1,2',
+                          container.name], call.call_args[0][0])
+        self.assertEqual(1, call.call_count)
+        with mock.patch.object(containers.subprocess, 'call',
+                               return_value=1):
+            with self.assertRaises(containers.ContainerError):
+                container.pin([3])
+
+    def test_pool_runs_job_on_cores(self):
+        pool = containers.ContainerPool('foo', self._temp_dir,
+                                        self._profile)
+        container = mock.MagicMock()
+        container.run.return_value = (0, b'')
+        with mock.patch.object(pool, '_new_container',
+                               return_value=container):
+            self.assertEqual((0, b''), pool.run(['a'], 'out.txt',
+                                                cpuset=[3]))
+        container.run.assert_called_once_with(['a'], 'out.txt', cpuset=[3])
+
+    def test_pool_out_of_memory(self):
+        limits = resources.ResourceProfile(memory='1g')
+        pool = containers.ContainerPool('foo', self._temp_dir,
+                                        self._profile, limits=limits)
+        container = mock.MagicMock()
+        container.name = 'c'
+        container.run.return_value = (137, b'')
+        with mock.patch.object(pool, '_new_container',
+                               return_value=container),\
+            mock.patch.object(containers, 'is_oom_killed',
+                              return_value=True) as oomkilled:
+            with self.assertRaises(resources.OutOfMemoryError):
+                pool.run(['a'], 'out.txt')
+            oomkilled.assert_called_once_with('c')
+            container.stop.assert_called_once_with()
+
+            # killed some other way, container is kept
+            oomkilled.return_value = False
+            self.assertEqual((137, b''), pool.run(['a'], 'out.txt'))
+            self.assertEqual(1, container.stop.call_count)
+
+    def test_get_container_pool_by_limits(self):
+        try:
+            small = resources.ResourceProfile(cpus=1, memory='1g')
+            pool = containers.get_container_pool('foo', self._temp_dir,
+                                                 self._profile, limits=small)
+            self.assertTrue(pool is containers.get_container_pool(
+                'foo', self._temp_dir, self._profile,
+                limits=small.pin([7])))
+            self.assertFalse(pool is containers.get_container_pool(
+                'foo', self._temp_dir, self._profile,
+                limits=resources.ResourceProfile(cpus=2, memory='1g')))
+            self.assertFalse(pool is containers.get_container_pool(
+                'foo', self._temp_dir, self._profile))
+        finally:
+            containers.shutdown_container_pools()
+
+    def test_get_job_run_options(self):
+        self.assertEqual(['--name', 'commundetect_job_abc',
+                          '--label', 'commundetect.task=abc'],
+                         containers.get_job_run_options('abc'))
+
+    def test_is_oom_killed(self):
+        with mock.patch.object(containers.subprocess, 'check_output',
+                               return_value=b'true\n') as check_output:
+            self.assertTrue(containers.is_oom_killed('foo'))
+        self.assertEqual(['docker', 'inspect', '--format',
+                          '{{.State.OOMKilled}}', 'foo'],
+                         check_output.call_args[0][0])
+        with mock.patch.object(containers.subprocess, 'check_output',
+                               return_value=b'false\n'):
+            self.assertFalse(containers.is_oom_killed('foo'))
+        with mock.patch.object(containers.subprocess, 'check_output',
+                               side_effect=OSError('no docker')):
+            self.assertFalse(containers.is_oom_killed('foo'))
+
+    def test_remove_job_container(self):
+        with mock.patch.object(containers.subprocess, 'call') as call:
+            containers.remove_job_container('abc')
+        self.assertEqual(['docker', 'rm', '-f', 'commundetect_job_abc'],
+                         call.call_args[0][0])
+
+    def test_stop_job_container(self):
+        with mock.patch.object(containers.subprocess, 'call') as call:
+            containers.stop_job_container('abc')
+        self.assertEqual(['docker', 'rm', '-f', 'commundetect_job_abc'],
+                         call.call_args[0][0])
+
+        # missing docker is logged
+        with mock.patch.object(containers.subprocess, 'call',
+                               side_effect=OSError('no docker')):
+            containers.stop_job_container('abc')
+
+    def test_stop_process_containers(self):
+        with mock.patch.object(containers.subprocess, 'check_output',
+                               return_value=b'c1\nc2\n') as check,\
+            mock.patch.object(containers.subprocess, 'call') as call:
+            containers.stop_process_containers(42)
+        self.assertEqual('name=commundetect_42_',
+                         check.call_args[0][0][-1])
+        self.assertEqual(['docker', 'rm', '-f', 'c1', 'c2'],
+                         call.call_args[0][0])
+
+        with mock.patch.object(containers.subprocess, 'check_output',
+                               return_value=b''),\
+            mock.patch.object(containers.subprocess, 'call') as call:
+            containers.stop_process_containers(42)
+        self.assertFalse(call.called)
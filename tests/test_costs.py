@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `commundetect_rest.costs` module."""
+
+import os
+import json
+import unittest
+import shutil
+import tempfile
+
+from commundetect_rest import costs
+
+
+class TestCosts(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._temp_dir)
+
+    def test_predict(self):
+        model = costs.CostModel({'infomap': {costs.BASE_KEY: 1.0,
+                                             costs.PER_EDGE_KEY: 0.5,
+                                             costs.PER_NODE_KEY: 2.0}})
+        self.assertEqual(1.0 + 5.0 + 6.0, model.predict('infomap', 3, 10))
+        default = costs.DEFAULT_COST_MODEL[costs.DEFAULT_ALGORITHM]
+        self.assertEqual(default, model.get_coefficients('louvain'))
+        self.assertAlmostEqual(default[costs.BASE_KEY] +
+                               default[costs.PER_EDGE_KEY] * 1000,
+                               model.predict('louvain', 0, 1000))
+
+    def test_calibrate(self):
+        runtimes = []
+        for x in range(1, 21):
+            runtimes.append({costs.ALGORITHM_KEY: 'louvain',
+                             costs.NODES_KEY: x * 10,
+                             costs.EDGES_KEY: x * x * 100,
+                             costs.SECONDS_KEY: 2.0 + 0.01 * x * x * 100 +
+                             0.1 * x * 10})
+        runtimes.append({costs.ALGORITHM_KEY: 'infomap',
+                         costs.NODES_KEY: 1, costs.EDGES_KEY: 1,
+                         costs.SECONDS_KEY: 1000})
+        model = costs.CostModel()
+        self.assertEqual(['louvain'], model.calibrate(runtimes))
+        coef = model.get_coefficients('louvain')
+        self.assertAlmostEqual(2.0, coef[costs.BASE_KEY], places=5)
+        self.assertAlmostEqual(0.01, coef[costs.PER_EDGE_KEY], places=5)
+        self.assertAlmostEqual(0.1, coef[costs.PER_NODE_KEY], places=5)
+        # too few runs to fit
+        self.assertEqual(costs.DEFAULT_COST_MODEL[costs.DEFAULT_ALGORITHM],
+                         model.get_coefficients('infomap'))
+
+    def test_calibrate_no_negative_coefficients(self):
+        runtimes = [{costs.ALGORITHM_KEY: 'a', costs.NODES_KEY: x,
+                     costs.EDGES_KEY: x * 2,
+                     costs.SECONDS_KEY: 100.0 - x} for x in range(20)]
+        model = costs.CostModel()
+        model.calibrate(runtimes)
+        for val in model.get_coefficients('a').values():
+            self.assertTrue(val >= 0.0)
+
+    def test_calibrate_timed_out_runs_are_lower_bounds(self):
+        runtimes = [{costs.ALGORITHM_KEY: 'a', costs.NODES_KEY: 0,
+                     costs.EDGES_KEY: x * 100,
+                     costs.SECONDS_KEY: 1.0 + 0.1 * x * 100}
+                    for x in range(1, 21)]
+        # large jobs stopped well before they would have finished
+        timedout = [{costs.ALGORITHM_KEY: 'a', costs.NODES_KEY: 0,
+                     costs.EDGES_KEY: x * 1000, costs.SECONDS_KEY: 60.0,
+                     costs.TIMED_OUT_KEY: True} for x in range(10, 20)]
+        model = costs.CostModel()
+        model.calibrate(runtimes + timedout)
+        coef = model.get_coefficients('a')
+        self.assertAlmostEqual(0.1, coef[costs.PER_EDGE_KEY], places=5)
+
+        # were they finished runs the fit would be dragged down
+        for run in timedout:
+            del run[costs.TIMED_OUT_KEY]
+        model.calibrate(runtimes + timedout)
+        self.assertTrue(model.get_coefficients('a')[costs.PER_EDGE_KEY] <
+                        0.05)
+
+    def test_set_graph_size(self):
+        costinfo = costs.get_cost_info(2, 3, 4.0)
+        costs.set_graph_size(costinfo, 5, 6)
+        self.assertEqual(costs.get_cost_info(5, 6, 4.0), costinfo)
+        costs.set_graph_size(None, 5, 6)
+
+    def test_get_time_limits(self):
+        self.assertEqual((30, 60), costs.get_time_limits(1.0))
+        self.assertEqual((400, 430), costs.get_time_limits(100.0))
+        self.assertEqual((20, 25), costs.get_time_limits(10.0, factor=2.0,
+                                                         mintime=5,
+                                                         grace=5))
+
+    def test_get_expires(self):
+        self.assertEqual(None, costs.get_expires(None, 60))
+        self.assertEqual(1260, costs.get_expires(600, 60))
+        self.assertEqual(120, costs.get_expires(10, 30))
+        self.assertEqual(50, costs.get_expires(10, 30, mintime=0))
+
+    def test_check_cost(self):
+        costs.check_cost(10, None)
+        costs.check_cost(10, 10)
+        with self.assertRaises(costs.CostLimitError) as ce:
+            costs.check_cost(10.5, 10)
+        self.assertTrue('10 seconds allowed' in str(ce.exception))
+
+    def test_record_and_load_run_times(self):
+        path = os.path.join(self._temp_dir, 'runtimes.jsonl')
+        self.assertEqual([], costs.load_run_times(path))
+        self.assertEqual([], costs.load_run_times(None))
+        costs.record_run_time(None, 'louvain', {}, 1.0)
+        costs.record_run_time(path, 'louvain', None, 1.0)
+        self.assertFalse(os.path.isfile(path))
+
+        costinfo = costs.get_cost_info(2, 3, 4.0)
+        for x in range(3):
+            costs.record_run_time(path, 'louvain', costinfo, float(x))
+        with open(path, 'a') as f:
+            f.write('not json\n')
+            f.write(json.dumps({'algorithm': 'x'}) + '\n')
+        runtimes = costs.load_run_times(path, maxruns=2)
+        self.assertEqual([{costs.ALGORITHM_KEY: 'louvain',
+                           costs.NODES_KEY: 2, costs.EDGES_KEY: 3,
+                           costs.SECONDS_KEY: x} for x in (1.0, 2.0)],
+                         runtimes)
+
+    def test_record_run_time_unwritable(self):
+        costs.record_run_time(os.path.join(self._temp_dir, 'no', 'file'),
+                              'louvain', costs.get_cost_info(1, 1, 1), 1.0)
+
+    def test_create_cost_model(self):
+        path = os.path.join(self._temp_dir, 'runtimes.jsonl')
+        costinfo = costs.get_cost_info(0, 100, 1.0)
+        for x in range(costs.MIN_CALIBRATION_RUNS):
+            costs.record_run_time(path, 'louvain', costinfo, 7.0)
+        model = costs.create_cost_model({'infomap': {costs.BASE_KEY: 3}},
+                                        path)
+        self.assertAlmostEqual(7.0, model.predict('louvain', 0, 100))
+        self.assertEqual(3, model.predict('infomap', 5, 5))
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `commundetect_rest.delivery` module."""
+
+import json
+import zlib
+import gzip
+import unittest
+
+from commundetect_rest import delivery
+
+
+class TestDelivery(unittest.TestCase):
+
+    def setUp(self):
+        self._edges = [str(x) + ',' + str(x + 1) + ',t-g;'
+                       for x in range(1000)]
+        self._text = ''.join(self._edges)
+
+    def test_select_encoding(self):
+        self.assertEqual(None, delivery.select_encoding(None))
+        self.assertEqual(None, delivery.select_encoding(''))
+        self.assertEqual(None, delivery.select_encoding('br'))
+        self.assertEqual('gzip', delivery.select_encoding('gzip, deflate'))
+        self.assertEqual('deflate', delivery.select_encoding('deflate'))
+        self.assertEqual('deflate',
+                         delivery.select_encoding('gzip;q=0.5, deflate'))
+        self.assertEqual(None, delivery.select_encoding('gzip;q=0'))
+        self.assertEqual('gzip', delivery.select_encoding('*'))
+        self.assertEqual('deflate',
+                         delivery.select_encoding('gzip;q=0, *;q=0.1'))
+        self.assertEqual(None, delivery.select_encoding('gzip;q=x'))
+
+    def test_count_edges(self):
+        self.assertEqual(1000, delivery.count_edges(self._text))
+        self.assertEqual(0, delivery.count_edges(''))
+
+    def test_iter_text(self):
+        chunks = list(delivery.iter_text(self._text, chunksize=7))
+        self.assertEqual(self._text, ''.join(chunks))
+        self.assertTrue(all(len(c) <= 7 for c in chunks))
+        self.assertEqual([], list(delivery.iter_text('')))
+
+    def test_iter_edges(self):
+        for chunksize in [1, 5, 13, 100, 100000]:
+            for offset, limit in [(0, None), (0, 0), (0, 1), (3, 10),
+                                  (999, None), (999, 5), (1000, None),
+                                  (2000, 10), (250, 500)]:
+                chunks = delivery.iter_text(self._text, chunksize=chunksize)
+                res = ''.join(delivery.iter_edges(chunks, offset=offset,
+                                                  limit=limit))
+                end = None if limit is None else offset + limit
+                self.assertEqual(''.join(self._edges[offset:end]), res,
+                                 str((chunksize, offset, limit)))
+
+    def test_iter_json(self):
+        result = {'status': 'done', 'rootnetwork': 'a"b',
+                  'result': 'ignored', 'total': 3}
+        text = 'x"y\\z\né\U0001F600;' * 5
+        res = ''.join(delivery.iter_json(result, 'result',
+                                         delivery.iter_text(text, 3)))
+        result['result'] = text
+        self.assertEqual(json.dumps(result, sort_keys=True,
+                                    separators=(',', ':')), res)
+        self.assertEqual(result, json.loads(res))
+
+    def test_compress(self):
+        chunks = list(delivery.iter_text(self._text, chunksize=100))
+        data = b''.join(delivery.compress(chunks, 'gzip'))
+        self.assertEqual(self._text, gzip.decompress(data).decode('utf-8'))
+        data = b''.join(delivery.compress(chunks, 'deflate'))
+        self.assertEqual(self._text, zlib.decompress(data).decode('utf-8'))
+        with self.assertRaises(ValueError):
+            list(delivery.compress(chunks, 'br'))
+
+    def test_encode(self):
+        self.assertEqual([b'a', b'\xc3\xa9'],
+                         list(delivery.encode(['a', 'é'])))
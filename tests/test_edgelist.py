@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `commundetect_rest.edgelist` module."""
+
+import io
+import os
+import unittest
+import shutil
+import tempfile
+
+import numpy as np
+
+from commundetect_rest import edgelist
+
+
+class TestEdgeList(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._temp_dir)
+
+    def test_parse_unweighted(self):
+        edges = edgelist.parse_edge_list(b'10\t5\n5 7\r\n\n7\t10\n')
+        self.assertEqual(3, edges.edges)
+        self.assertEqual(3, edges.nodes)
+        self.assertEqual(5, edges.minid)
+        self.assertFalse(edges.weighted)
+        self.assertIsNone(edges.weight)
+        self.assertEqual([5, 7, 10], edges.nodeids.tolist())
+        self.assertEqual([[2, 0], [0, 1], [1, 2]],
+                         edges.get_edges().tolist())
+        self.assertEqual(np.int32, edges.src.dtype)
+
+    def test_parse_weighted(self):
+        edges = edgelist.parse_edge_list(b'0\t1\t0.5\n1\t2\t2\n')
+        self.assertTrue(edges.weighted)
+        self.assertEqual(0, edges.minid)
+        self.assertEqual([0.5, 2.0], edges.weight.tolist())
+        self.assertEqual([0, 1], edges.src.tolist())
+        self.assertEqual([1, 2], edges.dst.tolist())
+
+    def test_parse_comments_and_empty(self):
+        edges = edgelist.parse_edge_list(b'# header\n\n  # more\n1 2\n')
+        self.assertEqual(1, edges.edges)
+        self.assertEqual([1, 2], edges.nodeids.tolist())
+
+        edges = edgelist.parse_edge_list(b'')
+        self.assertEqual(0, edges.edges)
+        self.assertEqual(0, edges.nodes)
+        self.assertIsNone(edges.minid)
+        self.assertEqual(0, edgelist.parse_edge_list(b'# x\n\n').edges)
+
+    def test_parse_invalid(self):
+        for data in [b'1\t2\t3\t4\n', b'1\t2\n3\n', b'1\n',
+                     b'a\tb\nc\n', b'a\tb\tfoo\n']:
+            with self.assertRaises(ValueError):
+                edgelist.parse_edge_list(data)
+
+    def test_parse_labels(self):
+        edges = edgelist.parse_edge_list(b'TP53\tMDM2\nMDM2\t007\n')
+        self.assertEqual([b'007', b'MDM2', b'TP53'], edges.nodeids.tolist())
+        self.assertIsNone(edges.minid)
+        self.assertEqual([[2, 1], [1, 0]], edges.get_edges().tolist())
+
+        # integer ids read before first label are read again as labels
+        data = b'1\t2\t0.5\n' * 3 + b'02\tb\t1\n\xc3\xa9\t1\t2\n'
+        for chunksize in [1, 8, 1024]:
+            edges = edgelist.parse_edge_list(data, chunksize=chunksize)
+            self.assertEqual(['02', '1', '2', 'b', '\u00e9'],
+                             edgelist.get_labels(edges.nodeids))
+            self.assertEqual([[1, 2]] * 3 + [[0, 3], [4, 1]],
+                             edges.get_edges().tolist())
+            self.assertEqual([0.5] * 3 + [1.0, 2.0], edges.weight.tolist())
+
+        # node ids not written plainly as integers are kept as written
+        for data, labels in [(b'1.5\t2\n', [b'1.5', b'2']),
+                             (b'1\t+2\n', [b'+2', b'1']),
+                             (b'7.0 1\n', [b'1', b'7.0']),
+                             (b'1e0 2 1e-3\n', [b'1e0', b'2']),
+                             (b'-0\t1\n', [b'-0', b'1']),
+                             (b'1\t%d\n' % (2 ** 60), [b'1', b'%d' %
+                                                        (2 ** 60)])]:
+            self.assertEqual(labels, edgelist.parse_edge_list(
+                data).nodeids.tolist())
+        edges = edgelist.parse_edge_list(b'-3 0 1e-3\n10 -2 2.5\n')
+        self.assertEqual([-3, -2, 0, 10], edges.nodeids.tolist())
+
+    def test_read_edge_list_labels_again(self):
+        data = b'1\t2\n' * 10 + b'a\t01\n'
+        path = os.path.join(self._temp_dir, 'edges.txt')
+        with open(path, 'wb') as f:
+            f.write(data)
+        opened = []
+
+        def opener(p):
+            opened.append(p)
+            return open(p, 'rb')
+
+        for edges in [edgelist.read_edge_list(path, chunksize=4),
+                      edgelist.read_edge_list(path, chunksize=4,
+                                              opener=opener),
+                      edgelist.read_edge_list(io.BytesIO(data),
+                                              chunksize=4)]:
+            self.assertEqual([b'01', b'1', b'2', b'a'],
+                             edges.nodeids.tolist())
+            self.assertEqual(11, edges.edges)
+        self.assertEqual([path, path], opened)
+
+    def test_get_labels(self):
+        self.assertEqual(['3', '10'],
+                         edgelist.get_labels(np.array([3, 10])))
+        self.assertEqual(['a', '1'],
+                         edgelist.get_labels(np.array([b'a', b'1'])))
+
+    def test_get_max_integer_id(self):
+        self.assertEqual(-1, edgelist.get_max_integer_id(np.array([])))
+        self.assertEqual(10, edgelist.get_max_integer_id(np.array([3, 10])))
+        self.assertEqual(12, edgelist.get_max_integer_id(
+            np.array([b'12', b'9', b'x'])))
+        self.assertEqual(-1, edgelist.get_max_integer_id(
+            np.array([b'a', b'1.5'])))
+
+    def test_parse_numbers(self):
+        self.assertEqual([1000.0, -2.0, 1.5, 3.0],
+                         edgelist.parse_numbers(b'1e3 -2\n+1.5\t3').tolist())
+        self.assertEqual([], edgelist.parse_numbers(b' \n').tolist())
+        for data in [b'1 foo', b'0x10 1', b'nan 1', b'1-2 3', b'1..5',
+                     b'1 2 \xc3\xa9']:
+            with self.assertRaises(edgelist.EdgeListError):
+                edgelist.parse_numbers(data)
+
+    def test_read_edge_list(self):
+        path = os.path.join(self._temp_dir, 'edges.txt')
+        with open(path, 'wb') as f:
+            f.write(b'3\t4\n')
+        self.assertEqual([3, 4], edgelist.read_edge_list(
+            path).nodeids.tolist())
+        self.assertEqual([3, 4], edgelist.read_edge_list(
+            io.BytesIO(b'3\t4\n')).nodeids.tolist())
+
+    def test_parse_in_chunks(self):
+        data = b'# c\n' + b''.join(str(x).encode('utf-8') + b'\t' +
+                                   str(x + 1).encode('utf-8') + b'\t1.5\n'
+                                   for x in range(100))
+        whole = edgelist.parse_edge_list(data)
+        for chunksize in [1, 7, 64]:
+            edges = edgelist.parse_edge_list(data, chunksize=chunksize)
+            self.assertEqual(100, edges.edges)
+            self.assertEqual(101, edges.nodes)
+            self.assertEqual(whole.get_edges().tolist(),
+                             edges.get_edges().tolist())
+            self.assertEqual([1.5] * 100, edges.weight.tolist())
+
+        # chunk of only comment and blank lines
+        edges = edgelist.parse_edge_list(b'1\t2\n# c\n\n3\t4\n', chunksize=4)
+        self.assertEqual([[0, 1], [2, 3]], edges.get_edges().tolist())
+
+    def test_read_edge_list_mapped(self):
+        path = os.path.join(self._temp_dir, 'edges.txt')
+        with open(path, 'wb') as f:
+            f.write(b'1\t2\n\n2\t3')
+        edges = edgelist.read_edge_list(path, chunksize=3)
+        self.assertEqual([1, 2, 3], edges.nodeids.tolist())
+        self.assertEqual([[0, 1], [1, 2]], edges.get_edges().tolist())
+
+        with open(path, 'wb') as f:
+            pass
+        self.assertEqual(0, edgelist.read_edge_list(path).edges)
+
+    def test_iter_chunks(self):
+        chunks = list(edgelist.iter_chunks(io.BytesIO(b'ab\ncdef\ng'),
+                                           chunksize=2))
+        self.assertEqual([b'ab\n', b'cdef\n', b'g'], chunks)
+        self.assertEqual([], list(edgelist.iter_chunks(io.BytesIO(b''))))
+
+    def test_count_lines(self):
+        self.assertEqual(0, edgelist.count_lines(io.BytesIO(b'')))
+        self.assertEqual(2, edgelist.count_lines(io.BytesIO(b'a\nb\n'),
+                                                 chunksize=1))
+        self.assertEqual(3, edgelist.count_lines(io.BytesIO(b'a\nb\nc')))
+
+    def test_array_builder(self):
+        builder = edgelist.ArrayBuilder(np.int64, 2)
+        builder.append(np.array([1]))
+        builder.append(np.array([2, 3, 4]))
+        builder.append(np.array([], dtype=np.int64))
+        self.assertEqual(4, len(builder))
+        self.assertEqual([1, 2, 3, 4], builder.finish().tolist())
+        self.assertEqual(0, len(edgelist.ArrayBuilder(np.int64).finish()))
+
+    def _npz(self, compressed=False, **arrays):
+        path = os.path.join(self._temp_dir, 'edges.npz')
+        if compressed:
+            np.savez_compressed(path, **arrays)
+        else:
+            np.savez(path, **arrays)
+        return path
+
+    def test_load_edge_arrays(self):
+        path = self._npz(src=np.array([10, 20, 10]),
+                         dst=np.array([20, 30, 30]),
+                         weight=np.array([0.5, 1.0, 2.0]))
+        self.assertTrue(edgelist.is_edge_arrays(path))
+        edges = edgelist.read_edge_list(path)
+        self.assertEqual([10, 20, 30], edges.nodeids.tolist())
+        self.assertEqual([[0, 1], [1, 2], [0, 2]],
+                         edges.get_edges().tolist())
+        self.assertEqual(10, edges.minid)
+        # weights are mapped, not read
+        self.assertTrue(isinstance(edges.weight, np.memmap))
+        self.assertEqual([0.5, 1.0, 2.0], edges.weight.tolist())
+
+        path = self._npz(compressed=True, src=np.array([1]),
+                         dst=np.array([2]))
+        self.assertEqual([1, 2], edgelist.read_edge_list(
+            path).nodeids.tolist())
+
+    def test_load_edge_arrays_with_node_ids(self):
+        path = self._npz(src=np.array([1, 0], dtype=np.int32),
+                         dst=np.array([2, 2], dtype=np.int32),
+                         nodeids=np.array([7, 3, 9]))
+        edges = edgelist.load_edge_arrays(path)
+        self.assertTrue(isinstance(edges.src, np.memmap))
+        self.assertEqual([[1, 2], [0, 2]], edges.get_edges().tolist())
+        self.assertEqual(3, edges.nodes)
+        self.assertEqual(3, edges.minid)
+
+    def test_load_edge_arrays_csr(self):
+        path = self._npz(indptr=np.array([0, 2, 3, 3]),
+                         indices=np.array([1, 2, 2]),
+                         data=np.array([1.0, 2.0, 3.0]))
+        edges = edgelist.load_edge_arrays(path)
+        self.assertEqual([[0, 1], [0, 2], [1, 2]],
+                         edges.get_edges().tolist())
+        self.assertEqual([0, 1, 2], edges.nodeids.tolist())
+        self.assertEqual([1.0, 2.0, 3.0], edges.weight.tolist())
+
+    def test_load_edge_arrays_invalid(self):
+        for arrays in [{'src': np.array([1])},
+                       {'src': np.array([1.5]), 'dst': np.array([2])},
+                       {'src': np.array([1]), 'dst': np.array([2]),
+                        'weight': np.array([1.0, 2.0])},
+                       {'src': np.array([0]), 'dst': np.array([3]),
+                        'nodeids': np.array([5, 6])},
+                       {'indptr': np.array([0, 2]),
+                        'indices': np.array([1])},
+                       {'indptr': np.array([1, 1]),
+                        'indices': np.array([0])},
+                       {'foo': np.array([1])}]:
+            with self.assertRaises(edgelist.EdgeListError):
+                edgelist.load_edge_arrays(self._npz(**arrays))
+        path = os.path.join(self._temp_dir, 'bad.npz')
+        with open(path, 'wb') as f:
+            f.write(edgelist.NPZ_MAGIC + b'junk')
+        with self.assertRaises(edgelist.EdgeListError):
+            edgelist.read_edge_list(path)
+
+    def test_write_edge_list(self):
+        path = os.path.join(self._temp_dir, 'out.txt')
+        edges = edgelist.parse_edge_list(b'5\t9\t0.1\n9\t7\t2\n')
+        edgelist.write_edge_list(edges, path, chunkrows=1)
+        with open(path, 'r') as f:
+            self.assertEqual('5\t9\t0.1\n9\t7\t2.0\n', f.read())
+        edgelist.write_edge_list(edgelist.parse_edge_list(b'1 2\n'), path)
+        with open(path, 'r') as f:
+            self.assertEqual('1\t2\n', f.read())
+
+        edges = edgelist.parse_edge_list(b'b\ta\na\t9\n')
+        edgelist.write_edge_list(edges, path)
+        with open(path, 'r') as f:
+            self.assertEqual('b\ta\na\t9\n', f.read())
+        edgelist.write_edge_list(edges, path, compact=True)
+        with open(path, 'r') as f:
+            self.assertEqual('2\t1\n1\t0\n', f.read())
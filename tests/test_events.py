@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `commundetect_rest.events` module."""
+
+import time
+import queue
+import unittest
+
+from commundetect_rest import events
+
+
+class FakePubSub(object):
+    """
+    Stand in for redis pubsub
+    """
+    def __init__(self, server):
+        self._server = server
+        self.queue = queue.Queue()
+        self.channels = set()
+        self.fail = False
+
+    def subscribe(self, *channels):
+        for channel in channels:
+            self.channels.add(channel)
+            self.queue.put({'type': 'subscribe',
+                            'channel': channel.encode('utf-8'), 'data': 1})
+
+    def unsubscribe(self, *channels):
+        for channel in channels:
+            self.channels.discard(channel)
+
+    def get_message(self, timeout=0):
+        if self.fail:
+            raise ConnectionError('connection lost')
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.channels = set()
+
+
+class FakeRedis(object):
+    """
+    Stand in for redis client
+    """
+    def __init__(self):
+        self.pubsubs = []
+
+    def pubsub(self):
+        ps = FakePubSub(self)
+        self.pubsubs.append(ps)
+        return ps
+
+    def publish(self, channel, data):
+        for ps in self.pubsubs:
+            if channel in ps.channels:
+                ps.queue.put({'type': 'message',
+                              'channel': channel.encode('utf-8'),
+                              'data': data})
+
+
+class TestEvents(unittest.TestCase):
+
+    def setUp(self):
+        self._redis = FakeRedis()
+        self._events = events.RedisTaskEvents(client=self._redis,
+                                              poll_interval=0.01)
+
+    def _wait_for(self, func):
+        for x in range(200):
+            if func():
+                return
+            time.sleep(0.01)
+        self.fail('condition not met')
+
+    def test_get_task_channel(self):
+        self.assertEqual('celery-task-meta-abc',
+                         events.get_task_channel('abc'))
+
+    def test_watch(self):
+        channel = events.get_task_channel('abc')
+        with self._events.watch('abc') as sub:
+            self.assertFalse(sub.wait(0.01))
+            self._redis.publish(channel, b'{}')
+            self.assertTrue(sub.wait(1))
+            self.assertFalse(sub.wait(0.01))
+            self._redis.publish(events.get_task_channel('other'), b'{}')
+            self.assertFalse(sub.wait(0.05))
+        self.assertEqual(set(), self._redis.pubsubs[0].channels)
+        self._wait_for(lambda: self._events._thread is None)
+
+    def test_watch_shares_connection(self):
+        channel = events.get_task_channel('abc')
+        sub1 = self._events.watch('abc')
+        sub2 = self._events.watch('abc')
+        sub3 = self._events.watch('def')
+        self.assertEqual(1, len(self._redis.pubsubs))
+        self._redis.publish(channel, b'{}')
+        self.assertTrue(sub1.wait(1))
+        self.assertTrue(sub2.wait(1))
+        self.assertFalse(sub3.wait(0.05))
+        sub1.close()
+        self.assertTrue(channel in self._redis.pubsubs[0].channels)
+        sub2.close()
+        self.assertFalse(channel in self._redis.pubsubs[0].channels)
+        sub3.close()
+
+    def test_reconnect(self):
+        with self._events.watch('abc') as sub:
+            self._redis.pubsubs[0].fail = True
+            # subscription is told state may have changed
+            self.assertTrue(sub.wait(1))
+            self._wait_for(lambda: len(self._redis.pubsubs) == 2)
+            self._redis.publish(events.get_task_channel('abc'), b'{}')
+            self.assertTrue(sub.wait(1))
+
+    def test_create_task_events(self):
+        self.assertEqual(None, events.create_task_events(None))
+        self.assertTrue(isinstance(events.create_task_events('redis'),
+                                   events.RedisTaskEvents))
+        with self.assertRaises(ValueError):
+            events.create_task_events('foo')
@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `commundetect_rest.fairshare` module."""
+
+import json
+import unittest
+from unittest import mock
+
+from commundetect_rest import fairshare
+
+
+class _FakePipeline(object):
+    def __init__(self, redis):
+        self._redis = redis
+        self._ops = []
+
+    def __getattr__(self, name):
+        def op(*args):
+            self._ops.append((name, args))
+        return op
+
+    def execute(self):
+        return [getattr(self._redis, name)(*args) for name, args in self._ops]
+
+
+class _FakeRedis(object):
+    """
+    Stand in for the redis list and hash calls used, values
+    are returned as bytes like redis does
+    """
+    def __init__(self):
+        self.lists = {}
+        self.hashes = {}
+
+    @staticmethod
+    def _b(val):
+        return str(val).encode('utf-8')
+
+    def pipeline(self):
+        return _FakePipeline(self)
+
+    def rpush(self, key, *values):
+        self.lists.setdefault(key, []).extend(self._b(v) for v in values)
+        return len(self.lists[key])
+
+    def lpush(self, key, *values):
+        for v in values:
+            self.lists.setdefault(key, []).insert(0, self._b(v))
+        return len(self.lists[key])
+
+    def lpop(self, key):
+        items = self.lists.get(key)
+        if not items:
+            return None
+        return items.pop(0)
+
+    def lindex(self, key, index):
+        items = self.lists.get(key, [])
+        if len(items) == 0:
+            return None
+        return items[index]
+
+    def llen(self, key):
+        return len(self.lists.get(key, []))
+
+    def lrange(self, key, start, end):
+        return list(self.lists.get(key, []))
+
+    def lrem(self, key, count, value):
+        items = self.lists.get(key, [])
+        if self._b(value) in items:
+            items.remove(self._b(value))
+            return 1
+        return 0
+
+    def rpoplpush(self, src, dst):
+        val = self.lists[src].pop()
+        self.lists[dst].insert(0, val)
+        return val
+
+    def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = self._b(value)
+
+    def hget(self, key, field):
+        return self.hashes.get(key, {}).get(field)
+
+    def hdel(self, key, field):
+        self.hashes.get(key, {}).pop(field, None)
+
+    def hincrby(self, key, field, amount):
+        val = int(self.hashes.get(key, {}).get(field, 0)) + amount
+        self.hset(key, field, val)
+        return val
+
+
+class TestFairShare(unittest.TestCase):
+
+    def _pop_all(self, fq, queue='q'):
+        order = []
+        while True:
+            item = fq.pop(queue)
+            if item is None:
+                return order
+            order.append(item)
+
+    def test_make_client_key(self):
+        addr = fairshare.make_client_key('1.2.3.4')
+        self.assertEqual(16, len(addr))
+        self.assertFalse('1.2.3.4' in addr)
+        self.assertEqual(addr, fairshare.make_client_key('1.2.3.4', None))
+        self.assertNotEqual(addr, fairshare.make_client_key('1.2.3.5'))
+        token = fairshare.make_client_key('1.2.3.4', token='secret')
+        self.assertNotEqual(addr, token)
+        self.assertEqual(token, fairshare.make_client_key('9.9.9.9',
+                                                          token='secret'))
+
+    def test_get_weight(self):
+        self.assertEqual(1, fairshare.get_weight(None, '1.2.3.4'))
+        weights = {'1.2.3.4': 3, 'secret': 5, 'bad': 0}
+        self.assertEqual(3, fairshare.get_weight(weights, '1.2.3.4'))
+        self.assertEqual(1, fairshare.get_weight(weights, '1.2.3.5'))
+        self.assertEqual(5, fairshare.get_weight(weights, '1.2.3.5',
+                                                 token='secret'))
+        self.assertEqual(3, fairshare.get_weight(weights, '1.2.3.4',
+                                                 token='other'))
+        self.assertEqual(1, fairshare.get_weight(weights, 'bad'))
+
+    def test_round_robin(self):
+        fq = fairshare.RedisFairQueue(_FakeRedis())
+        self.assertIsNone(fq.pop('q'))
+        fq.push('q', 'bulk', ['b1', 'b2', 'b3', 'b4'])
+        fq.push('q', 'user', ['u1'])
+        fq.push('q', 'other', ['o1', 'o2'])
+        fq.push('q', 'bulk', [])
+        self.assertEqual({'bulk': 4, 'user': 1, 'other': 2},
+                         fq.get_depths('q'))
+        self.assertEqual([('other', 'o1'), ('user', 'u1'), ('bulk', 'b1'),
+                          ('other', 'o2'), ('bulk', 'b2'), ('bulk', 'b3'),
+                          ('bulk', 'b4')], self._pop_all(fq))
+        self.assertEqual({}, fq.get_depths('q'))
+        self.assertEqual({}, fq.get_depths('none'))
+
+    def test_late_client_gets_next_turn(self):
+        fq = fairshare.RedisFairQueue(_FakeRedis())
+        fq.push('q', 'bulk', ['b' + str(x) for x in range(100)])
+        self.assertEqual(('bulk', 'b0'), fq.pop('q'))
+        self.assertEqual(('bulk', 'b1'), fq.pop('q'))
+        fq.push('q', 'user', ['u1'])
+        self.assertEqual(('user', 'u1'), fq.pop('q'))
+        self.assertEqual(('bulk', 'b2'), fq.pop('q'))
+        fq.push('q', 'user', ['u2', 'u3'])
+        self.assertEqual(['u2', 'b3', 'u3', 'b4'],
+                         [fq.pop('q')[1] for x in range(4)])
+
+    def test_weights(self):
+        fq = fairshare.RedisFairQueue(_FakeRedis())
+        fq.push('q', 'heavy', ['h1', 'h2', 'h3', 'h4'], weight=3)
+        fq.push('q', 'light', ['l1', 'l2'])
+        self.assertEqual(['l1', 'h1', 'h2', 'h3', 'l2', 'h4'],
+                         [x[1] for x in self._pop_all(fq)])
+
+    def test_queues_are_separate(self):
+        fq = fairshare.RedisFairQueue(_FakeRedis())
+        fq.push('small', 'a', ['s1'])
+        fq.push('large', 'a', ['l1'])
+        self.assertEqual([('a', 'l1')], self._pop_all(fq, 'large'))
+        self.assertEqual({'a': 1}, fq.get_depths('small'))
+
+    def test_requeue(self):
+        fq = fairshare.RedisFairQueue(_FakeRedis())
+        fq.push('q', 'a', ['a1', 'a2'])
+        fq.push('q', 'b', ['b1'])
+        clientkey, entry = fq.pop('q')
+        fq.requeue('q', clientkey, entry)
+        self.assertEqual(['b1', 'a1', 'a2'],
+                         [x[1] for x in self._pop_all(fq)])
+
+        # client whose last job is requeued is put back in turn
+        fq.push('q', 'a', ['a3'])
+        clientkey, entry = fq.pop('q')
+        fq.requeue('q', clientkey, entry)
+        self.assertEqual([('a', 'a3')], self._pop_all(fq))
+
+    def test_stale_client_in_ring_is_dropped(self):
+        client = _FakeRedis()
+        fq = fairshare.RedisFairQueue(client)
+        fq.push('q', 'a', ['a1'])
+        client.lists[fairshare.KEY_PREFIX + 'q-ring'].append(b'gone')
+        self.assertEqual([('a', 'a1')], self._pop_all(fq))
+        self.assertEqual([], client.lists[fairshare.KEY_PREFIX + 'q-ring'])
+
+    def test_create_fair_queue(self):
+        self.assertIsNone(fairshare.create_fair_queue(None, None))
+        celeryapp = mock.MagicMock()
+        fq = fairshare.create_fair_queue('redis', celeryapp)
+        self.assertTrue(isinstance(fq, fairshare.RedisFairQueue))
+        with self.assertRaises(ValueError):
+            fairshare.create_fair_queue('nope', celeryapp)
+
+    def _dispatcher(self, ready, publish=None, target=2):
+        celeryapp = mock.MagicMock()
+        conn = celeryapp.connection_for_read.return_value.__enter__.return_value
+        conn.channel.return_value.queue_declare.side_effect = \
+            lambda queue, passive: mock.Mock(message_count=ready[0],
+                                             consumer_count=1)
+        fq = fairshare.RedisFairQueue(_FakeRedis())
+        if publish is None:
+            publish = mock.MagicMock()
+        return fairshare.FairDispatcher(celeryapp, fq, publish,
+                                        target=target), fq, publish
+
+    def test_dispatcher_releases_up_to_target(self):
+        ready = [0]
+        dispatcher, fq, publish = self._dispatcher(ready, target=3)
+        dispatcher.submit('q', 'bulk', [{'task_id': 'b' + str(x),
+                                         'queue': 'q'} for x in range(5)])
+        self.assertEqual(3, publish.call_count)
+        publish.assert_called_with(task_id='b2', queue='q')
+
+        ready[0] = 3
+        dispatcher.submit('q', 'user', [{'task_id': 'u1', 'queue': 'q'}],
+                          weight=2)
+        self.assertEqual(3, publish.call_count)
+        self.assertEqual([{'client': 'bulk', 'depth': 2},
+                          {'client': 'user', 'depth': 1}],
+                         dispatcher.get_depths('q'))
+
+        # worker finishing a job frees room for next client in turn
+        ready[0] = 1
+        self.assertEqual(2, dispatcher.release('q'))
+        self.assertEqual(['u1', 'b3'],
+                         [c[1]['task_id'] for c in
+                          publish.call_args_list[3:]])
+        ready[0] = 3
+        self.assertEqual(0, dispatcher.release('q'))
+        self.assertEqual([{'client': 'bulk', 'depth': 1}],
+                         dispatcher.get_depths('q'))
+
+    def test_dispatcher_holds_jobs_when_queue_full(self):
+        dispatcher, fq, publish = self._dispatcher([2])
+        dispatcher.submit('q', 'a', [{'task_id': 'a1'}])
+        publish.assert_not_called()
+        self.assertEqual({'a': 1}, fq.get_depths('q'))
+
+    def test_dispatcher_publish_fails(self):
+        publish = mock.MagicMock(side_effect=OSError('broker down'))
+        dispatcher, fq, publish = self._dispatcher([0], publish=publish)
+        dispatcher.submit('q', 'a', [{'task_id': 'a1'}, {'task_id': 'a2'}])
+        self.assertEqual(1, publish.call_count)
+        self.assertEqual(json.dumps({'task_id': 'a1'}), fq.pop('q')[1])
+
+    def test_dispatcher_broker_down(self):
+        dispatcher, fq, publish = self._dispatcher([0])
+        dispatcher._celeryapp.connection_for_read.side_effect = OSError('x')
+        self.assertEqual(0, dispatcher.release('q'))
+        dispatcher.submit('q', 'a', [{'task_id': 'a1'}])
+        publish.assert_not_called()
+        self.assertEqual({'a': 1}, fq.get_depths('q'))
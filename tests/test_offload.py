@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `commundetect_rest.offload` module."""
+
+import os
+import gzip
+import unittest
+import shutil
+import tempfile
+from unittest import mock
+
+from commundetect_rest import offload
+
+
+class _Clock(object):
+    """
+    Time function tests can move forward
+    """
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestOffload(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+        self._clock = _Clock()
+
+    def tearDown(self):
+        shutil.rmtree(self._temp_dir)
+
+    def _store(self, ttl=100, sweep_interval=50):
+        return offload.DirectoryResultStore(self._temp_dir, ttl=ttl,
+                                            sweep_interval=sweep_interval,
+                                            timefunc=self._clock)
+
+    def _set_mtime(self, ref, mtime):
+        path = os.path.join(self._temp_dir, ref[offload.REF_NAME][:2],
+                            ref[offload.REF_NAME] + offload.RESULT_SUFFIX)
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_put_and_get_text(self):
+        store = self._store()
+        text = '1,2,c-m;2,3,c-m;'
+        ref = store.put('abcdef', text)
+        self.assertEqual({offload.REF_NAME: 'abcdef',
+                          offload.REF_SIZE: len(text),
+                          offload.REF_EDGES: 2}, ref)
+        path = self._set_mtime(ref, self._clock.now)
+        self.assertEqual(os.path.join(self._temp_dir, 'ab',
+                                      'abcdef.gz'), path)
+        with gzip.open(path, 'rt') as f:
+            self.assertEqual(text, f.read())
+        self.assertTrue(store.exists(ref))
+        self.assertEqual(text, store.get_text(ref))
+        self.assertEqual(['1,2,c', '-m;2,', '3,c-m', ';'],
+                         list(store.iter_text(ref, chunksize=5)))
+        self.assertEqual([], [x for x in os.listdir(
+            os.path.dirname(path)) if x.endswith('.tmp')])
+
+    def test_missing_result(self):
+        store = self._store()
+        ref = {offload.REF_NAME: 'nope'}
+        self.assertFalse(store.exists(ref))
+        with self.assertRaises(offload.ResultStoreError):
+            store.iter_text(ref)
+        store.delete(ref)
+
+    def test_expired_result(self):
+        store = self._store()
+        ref = store.put('abcdef', 'x;')
+        self._set_mtime(ref, self._clock.now - 101)
+        self.assertFalse(store.exists(ref))
+        with self.assertRaises(offload.ResultStoreError):
+            store.get_text(ref)
+
+    def test_delete(self):
+        store = self._store()
+        ref = store.put('abcdef', 'x;')
+        store.delete(ref)
+        self.assertFalse(store.exists(ref))
+
+    def test_sweep(self):
+        store = self._store()
+        old = store.put('aaaa', 'x;')
+        new = store.put('bbbb', 'y;')
+        self._set_mtime(old, self._clock.now - 101)
+        self._set_mtime(new, self._clock.now)
+        self.assertEqual(1, store.sweep())
+        self.assertFalse(store.exists(old))
+        self.assertTrue(store.exists(new))
+
+    def test_sweep_missing_dir(self):
+        store = offload.DirectoryResultStore(os.path.join(self._temp_dir,
+                                                          'nope'))
+        self.assertEqual(0, store.sweep())
+
+    def test_put_sweeps_after_interval(self):
+        store = self._store()
+        old = store.put('aaaa', 'x;')
+        self._set_mtime(old, self._clock.now - 101)
+        store.put('bbbb', 'y;')
+        self.assertTrue(os.path.isfile(self._set_mtime(old, 0)))
+        self._clock.now += 51
+        store.put('cccc', 'z;')
+        self.assertFalse(store.exists(old))
+
+    def test_create_result_store(self):
+        self.assertIsNone(offload.create_result_store(None))
+        store = offload.create_result_store(self._temp_dir, ttl=5)
+        self.assertTrue(isinstance(store, offload.DirectoryResultStore))
+
+    def test_offload_result(self):
+        store = self._store()
+        resultdict = {'status': 'done', 'result': '1,2,c-m;'}
+        self.assertTrue(resultdict is offload.offload_result(
+            None, 'abcd', resultdict, 1))
+        self.assertTrue(resultdict is offload.offload_result(
+            store, 'abcd', resultdict, 100))
+        errdict = {'status': 'error', 'result': None}
+        self.assertTrue(errdict is offload.offload_result(
+            store, 'abcd', errdict, 1))
+
+        res = offload.offload_result(store, 'abcd', resultdict, 8)
+        self.assertEqual('1,2,c-m;', resultdict['result'])
+        self.assertEqual({'status': 'done', 'result': None,
+                          offload.RESULT_REF_KEY: {
+                              offload.REF_NAME: 'abcd',
+                              offload.REF_SIZE: 8,
+                              offload.REF_EDGES: 1}}, res)
+        self.assertEqual('1,2,c-m;',
+                         store.get_text(res[offload.RESULT_REF_KEY]))
+
+    def test_offload_result_store_fails(self):
+        store = mock.MagicMock()
+        store.put.side_effect = OSError('full')
+        resultdict = {'status': 'done', 'result': '1,2,c-m;'}
+        self.assertTrue(resultdict is offload.offload_result(
+            store, 'abcd', resultdict, 1))
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `commundetect_rest.parsers` module."""
+
+import os
+import unittest
+import shutil
+import tempfile
+
+from commundetect_rest import parsers
+
+
+TWO_LEVEL_TREE = """# v0.19.3
+# ./Infomap -i link-list edgefile.txt /tmp
+# codelength 2.1 bits
+1:1 0.2 "1" 0
+1:2 0.2 "2" 1
+2:1 0.2 "3" 2
+2:2 0.2 "4" 3
+2:3 0 "5" 4
+"""
+
+MULTI_LEVEL_TREE = """# codelength 3.2 bits
+1:1:1 0.1 "1" 0
+1:1:2 0.1 "2" 1
+1:2:1 0.1 "3" 2
+2:1 0.1 "4" 3
+2:2:1 0.1 "5" 4
+"""
+
+
+class TestParsers(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._temp_dir)
+
+    def _write_tree(self, data):
+        treefile = os.path.join(self._temp_dir, 'edgefile.tree')
+        with open(treefile, 'w') as f:
+            f.write(data)
+        return treefile
+
+    def test_parse_infomap_tree_two_level(self):
+        treefile = self._write_tree(TWO_LEVEL_TREE)
+        termedges, geneedges = parsers.parse_infomap_tree(treefile)
+        # leaf 5 has zero flow so modules start above leaf 4
+        self.assertEqual([[7, 5], [7, 6]], termedges.tolist())
+        self.assertEqual([[5, 1], [5, 2], [6, 3], [6, 4]],
+                         geneedges.tolist())
+
+    def test_parse_infomap_tree_multi_level(self):
+        treefile = self._write_tree(MULTI_LEVEL_TREE)
+        termedges, geneedges = parsers.parse_infomap_tree(treefile)
+        # level 1 modules 1:1, 1:2, 2:2 get 6, 7, 8 and
+        # level 0 modules 1, 2 get 9, 10 with root 11
+        self.assertEqual([[11, 9], [11, 10], [9, 6], [9, 7], [10, 8]],
+                         termedges.tolist())
+        self.assertEqual([[6, 1], [6, 2], [7, 3], [8, 5], [10, 4]],
+                         geneedges.tolist())
+
+    def test_parse_infomap_tree_same_index_different_parent(self):
+        # 1:1 and 2:1 share an index but are different modules
+        treefile = self._write_tree('1:1:1 0.1 "1" 0\n'
+                                    '1:1:2 0.1 "2" 1\n'
+                                    '1:2:1 0 "3" 2\n'
+                                    '2:1:1 0.1 "4" 3\n')
+        termedges, geneedges = parsers.parse_infomap_tree(treefile)
+        self.assertEqual([[9, 7], [9, 8], [7, 5], [8, 6]],
+                         termedges.tolist())
+        self.assertEqual([[5, 1], [5, 2], [6, 4]], geneedges.tolist())
+
+    def test_read_tree_in_chunks(self):
+        treefile = self._write_tree(MULTI_LEVEL_TREE)
+        whole = parsers._read_tree(treefile)
+        for chunksize in [1, 10]:
+            chunked = parsers._read_tree(treefile, chunksize=chunksize)
+            for a, b in zip(whole, chunked):
+                self.assertEqual(a.tolist(), b.tolist())
+        self.assertEqual([3, 3, 3, 2, 3], whole[0].tolist())
+        self.assertEqual([1, 2, 3, 4, 5], whole[2].tolist())
+
+    def test_parse_infomap_tree_bad_columns(self):
+        treefile = self._write_tree('1:1 0.1 "1"\n')
+        with self.assertRaises(ValueError):
+            parsers.parse_infomap_tree(treefile)
+
+    def test_parse_infomap_tree_empty(self):
+        treefile = self._write_tree('# nothing here\n')
+        with self.assertRaises(ValueError):
+            parsers.parse_infomap_tree(treefile)
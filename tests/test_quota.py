@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `commundetect_rest.quota` module."""
+
+import unittest
+from unittest import mock
+
+from limits.storage import MemoryStorage
+from limits.strategies import FixedWindowRateLimiter
+
+from commundetect_rest import quota
+
+
+class TestQuota(unittest.TestCase):
+
+    def _quota(self, limit):
+        limiter = mock.MagicMock()
+        limiter.limiter = FixedWindowRateLimiter(MemoryStorage())
+        return quota.WorkQuota(limiter, limit), limiter
+
+    def test_get_storage_uri(self):
+        self.assertEqual('memory://',
+                         quota.get_storage_uri(None, 'redis://x'))
+        self.assertEqual('redis://x',
+                         quota.get_storage_uri(quota.BACKEND_STORAGE,
+                                               'redis://x'))
+        self.assertEqual('redis://y:6379',
+                         quota.get_storage_uri('redis://y:6379',
+                                               'redis://x'))
+
+    def test_no_limit(self):
+        workquota, limiter = self._quota(None)
+        workquota.consume('1.2.3.4', 10 ** 12)
+
+    def test_consume(self):
+        workquota, limiter = self._quota('100 per hour')
+        workquota.consume('1.2.3.4', 60)
+        workquota.consume('1.2.3.4', 40)
+        with self.assertRaises(quota.QuotaExceededError) as qe:
+            workquota.consume('1.2.3.4', 1)
+        self.assertTrue(qe.exception.retryafter > 0)
+        self.assertTrue(qe.exception.retryafter <= 3600)
+        # other clients have their own quota
+        workquota.consume('5.6.7.8', 0)
+
+    def test_rejected_submission_uses_no_quota(self):
+        workquota, limiter = self._quota('100 per hour')
+        workquota.consume('1.2.3.4', 60)
+        with self.assertRaises(quota.QuotaExceededError) as qe:
+            workquota.consume('1.2.3.4', 50)
+        self.assertTrue('40 left' in str(qe.exception))
+        workquota.consume('1.2.3.4', 40)
+
+    def test_refund(self):
+        workquota, limiter = self._quota('100 per hour')
+        workquota.refund('1.2.3.4', 10)
+        workquota.consume('1.2.3.4', 60)
+        workquota.consume('1.2.3.4', 40)
+        workquota.refund('1.2.3.4', 40)
+        workquota.consume('1.2.3.4', 40)
+        with self.assertRaises(quota.QuotaExceededError):
+            workquota.consume('1.2.3.4', 1)
+        # never more than was used
+        workquota.refund('1.2.3.4', 1000)
+        workquota.refund('1.2.3.4', 1000)
+        workquota.consume('1.2.3.4', 100)
+        self._quota(None)[0].refund('1.2.3.4', 10)
+
+    def test_graph_larger_than_limit_uses_all_of_it(self):
+        workquota, limiter = self._quota('100 per hour')
+        workquota.consume('1.2.3.4', 1000)
+        with self.assertRaises(quota.QuotaExceededError):
+            workquota.consume('1.2.3.4', 1)
+
+    def test_storage_error_does_not_reject(self):
+        workquota, limiter = self._quota('100 per hour')
+        limiter.limiter = mock.MagicMock()
+        limiter.limiter.test.side_effect = ConnectionError('down')
+        workquota.consume('1.2.3.4', 1000)
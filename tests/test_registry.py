@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `commundetect_rest.registry` module."""
+
+import os
+import unittest
+import shutil
+import tempfile
+
+from commundetect_rest import registry
+
+
+class TestRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._temp_dir)
+
+    def test_default_algorithms(self):
+        reg = registry.AlgorithmRegistry(registry.DEFAULT_ALGORITHMS)
+        self.assertEqual(['infomap', 'louvain'], reg.get_names())
+        algo = reg.get('louvain')
+        self.assertEqual(registry.DOCKER_BACKEND, algo.backend)
+        self.assertEqual('coleslawndex/testlouvain', algo.image)
+        self.assertEqual('--directed', algo.directedflag)
+        self.assertEqual(registry.INFOMAP_BACKEND,
+                         reg.get('infomap').backend)
+        self.assertEqual(None, reg.get('foo'))
+
+    def test_invalid_settings(self):
+        with self.assertRaises(ValueError):
+            registry.Algorithm('x', {registry.BACKEND_KEY: 'foo'})
+        with self.assertRaises(ValueError):
+            registry.Algorithm('x', {registry.BACKEND_KEY:
+                                     registry.DOCKER_BACKEND})
+        with self.assertRaises(ValueError):
+            registry.Algorithm('x', {registry.BACKEND_KEY:
+                                     registry.INPROCESS_BACKEND})
+
+    def test_inprocess_callable_from_module(self):
+        algo = registry.Algorithm('x', {registry.BACKEND_KEY:
+                                        registry.INPROCESS_BACKEND,
+                                        registry.CALLABLE_KEY:
+                                            'os.path:basename'})
+        self.assertTrue(algo.get_callable() is os.path.basename)
+
+    def test_inprocess_callable_from_file(self):
+        pyfile = os.path.join(self._temp_dir, 'myalgo.py')
+        with open(pyfile, 'w') as f:
+            f.write('def run(edgefile, directed=False, writer=None):\n'
+                    '    writer.add_edge(2, 1, "term-gene")\n'
+                    '    return 0\n')
+        algo = registry.Algorithm('x', {registry.BACKEND_KEY:
+                                        registry.INPROCESS_BACKEND,
+                                        registry.CALLABLE_KEY:
+                                            pyfile + ':run'})
+        self.assertEqual('run', algo.get_callable().__name__)
+
+    def test_load_callable_bad_name(self):
+        with self.assertRaises(ValueError):
+            registry.load_callable('nocolon')
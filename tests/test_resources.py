@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `commundetect_rest.resources` module."""
+
+import unittest
+import shutil
+import tempfile
+from unittest import mock
+
+from commundetect_rest import resources
+
+
+class TestResources(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._temp_dir)
+
+    def test_docker_options(self):
+        self.assertEqual([], resources.ResourceProfile().get_docker_options())
+        profile = resources.ResourceProfile(cpus=2, memory='4g')
+        self.assertEqual(2, profile.threads)
+        self.assertEqual(['--cpus', '2', '--memory', '4g',
+                          '--memory-swap', '4g',
+                          '-e', 'OMP_NUM_THREADS=2'],
+                         profile.get_docker_options())
+        pinned = profile.pin([4, 5])
+        self.assertEqual(['--cpus', '2', '--cpuset-cpus', '4,5',
+                          '--memory', '4g', '--memory-swap', '4g',
+                          '-e', 'OMP_NUM_THREADS=2'],
+                         pinned.get_docker_options())
+        self.assertEqual(1, resources.ResourceProfile(cpus=0.5).threads)
+        self.assertEqual(3, resources.ResourceProfile(cpus=1,
+                                                      threads=3).threads)
+
+    def test_thread_flags(self):
+        profile = resources.ResourceProfile(cpus=4)
+        self.assertEqual(['--num-trials', '4'], profile.get_thread_flags(
+            ['--num-trials', '{threads}']))
+        self.assertEqual([], profile.get_thread_flags([]))
+        self.assertEqual([], resources.ResourceProfile().get_thread_flags(
+            ['--num-trials', '{threads}']))
+
+    def test_check_oom_killed(self):
+        profile = resources.ResourceProfile(memory='1g')
+        profile.check_oom_killed(False)
+        with self.assertRaises(resources.OutOfMemoryError) as oe:
+            profile.check_oom_killed(True)
+        self.assertTrue('1g' in str(oe.exception))
+
+        # without a memory limit a kill is not an out of memory
+        resources.ResourceProfile().check_oom_killed(True)
+
+    def test_get_exit_message(self):
+        self.assertEqual('Command failed with non-zero exit code: 1',
+                         resources.get_exit_message(1))
+        self.assertTrue(resources.get_exit_message(
+            resources.KILLED_EXIT_CODE).endswith('it was killed'))
+
+    def test_get_profile(self):
+        profile = resources.get_profile(resources.DEFAULT_RESOURCES, 'small')
+        self.assertEqual(1, profile.cpus)
+        self.assertEqual('2g', profile.memory)
+        profile = resources.get_profile(resources.DEFAULT_RESOURCES, 'small',
+                                        algoprofile={'memory': '3g',
+                                                     'threads': 2})
+        self.assertEqual(1, profile.cpus)
+        self.assertEqual('3g', profile.memory)
+        self.assertEqual(2, profile.threads)
+        with mock.patch.object(resources, 'get_host_cpus', return_value=6),\
+            mock.patch.object(resources, 'get_host_memory',
+                              return_value=1000):
+            profile = resources.get_profile(resources.DEFAULT_RESOURCES,
+                                            'large')
+        # large jobs get the whole host, pinned and memory limited
+        self.assertEqual(6, profile.cpus)
+        self.assertEqual(6, profile.threads)
+        self.assertEqual('800', profile.memory)
+        self.assertTrue(resources.get_host_cpus() >= 1)
+        self.assertTrue(resources.get_host_memory() > 0)
+        profile = resources.get_profile(resources.DEFAULT_RESOURCES, None)
+        self.assertEqual([], profile.get_docker_options())
+        self.assertEqual([], resources.get_profile(
+            None, 'nope').get_docker_options())
+
+    def test_core_allocator_packs_jobs(self):
+        allocator = resources.CoreAllocator(self._temp_dir,
+                                            cores=[0, 1, 2, 3])
+        other = resources.CoreAllocator(self._temp_dir, cores=[0, 1, 2, 3])
+        with allocator.allocate(None) as cores:
+            self.assertIsNone(cores)
+        with allocator.allocate(1) as first:
+            self.assertEqual([0], first)
+            with other.allocate(2) as second:
+                self.assertEqual([1, 2], second)
+                with allocator.allocate(1) as third:
+                    self.assertEqual([3], third)
+        with allocator.allocate(1.5) as cores:
+            self.assertEqual([0, 1], cores)
+
+        # asking for more cores than the host has gets all of them
+        with other.allocate(8) as cores:
+            self.assertEqual([0, 1, 2, 3], cores)
+
+    def test_core_allocator_waits_for_cores(self):
+        allocator = resources.CoreAllocator(self._temp_dir, cores=[0, 1])
+        held = allocator.allocate(2)
+        self.assertEqual([0, 1], held.__enter__())
+        sleeps = []
+
+        def fake_sleep(seconds):
+            sleeps.append(seconds)
+            if len(sleeps) == 2:
+                held.__exit__(None, None, None)
+
+        waiter = resources.CoreAllocator(self._temp_dir, cores=[0, 1],
+                                         poll=0.1, sleepfunc=fake_sleep)
+        with waiter.allocate(1) as cores:
+            self.assertEqual([0], cores)
+        self.assertEqual([0.1, 0.1], sleeps)
+
+    def test_create_core_allocator(self):
+        self.assertIsNone(resources.create_core_allocator(None))
+        self.assertTrue(isinstance(
+            resources.create_core_allocator(self._temp_dir),
+            resources.CoreAllocator))
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `commundetect_rest.results` module."""
+
+import os
+import unittest
+import shutil
+import tempfile
+import numpy as np
+
+from commundetect_rest import results
+
+
+class TestResults(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._temp_dir)
+
+    def test_result_writer_in_memory(self):
+        writer = results.ResultWriter()
+        writer.add_edge(5, 1, results.TERM_GENE)
+        self.assertEqual('5,1,t-g;', writer.get_result())
+
+    def test_result_writer_empty(self):
+        writer = results.ResultWriter()
+        writer.add_edges(np.empty((0, 2), dtype=np.int64),
+                         results.TERM_TERM)
+        self.assertEqual('', writer.get_result())
+
+    def test_result_writer_add_edges_sorted(self):
+        writer = results.ResultWriter()
+        writer.add_edges(np.array([[7, 6], [7, 5]]), results.TERM_TERM)
+        writer.add_edges(np.array([[6, 4], [5, 2], [6, 3], [5, 1]]),
+                         results.TERM_GENE)
+        self.assertEqual('7,5,t-t;7,6,t-t;5,1,t-g;5,2,t-g;'
+                         '6,3,t-g;6,4,t-g;', writer.get_result())
+
+    def test_result_writer_to_file(self):
+        outfile = os.path.join(self._temp_dir, 'result.txt')
+        writer = results.ResultWriter(outfile)
+        writer.stream.write(b'3,1,term-gene;')
+        writer.add_edge(4, 3, 'term-term')
+        self.assertEqual('3,1,term-gene;4,3,term-term;',
+                         writer.get_result())
+        self.assertTrue(writer.stream.closed)
+        self.assertTrue(os.path.isfile(outfile))
+
+    def test_translate_result(self):
+        self.assertEqual('', results.translate_result('', np.array([1])))
+        self.assertEqual('11,10,t-t;10,5,t-g;10,9,t-g;',
+                         results.translate_result('4,3,t-t;3,0,t-g;3,1,t-g;',
+                                                  np.array([5, 9])))
+        # terms already above node ids are left alone
+        self.assertEqual('20,1,term-gene;',
+                         results.translate_result('20,0,term-gene;',
+                                                  np.array([1])))
+        self.assertEqual('2,TP53,t-g;2,é,t-g;',
+                         results.translate_result(
+                             '2,0,t-g;2,1,t-g;',
+                             np.array(['TP53'.encode('utf-8'),
+                                       'é'.encode('utf-8')])))
+
+    def test_translate_result_invalid(self):
+        for result in ['2,5,t-g;', '2,-1,t-g;', '2,0;', 'a,0,t-g;']:
+            with self.assertRaises(ValueError):
+                results.translate_result(result, np.array([1, 2]))
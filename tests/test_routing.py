@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `commundetect_rest.routing` module."""
+
+import unittest
+
+from commundetect_rest import routing
+
+
+class TestRouting(unittest.TestCase):
+
+    def test_graph_counter(self):
+        counter = routing.GraphCounter()
+        counter.update(b'# comment\n1\t2\n2 ')
+        counter.update(b'3\n\n3\t1\t0.5\nbad\n4\t')
+        counter.update(b'5')
+        self.assertEqual(3, counter.edges)
+        counter.finish()
+        self.assertEqual(4, counter.edges)
+        self.assertEqual(5, counter.nodes)
+        self.assertTrue(counter.exact)
+
+    def test_graph_counter_labels(self):
+        counter = routing.GraphCounter()
+        counter.update(b'1 2\n2 3\n')
+        self.assertEqual(3, counter.nodes)
+        # ids seen as numbers are counted as labels from now on
+        counter.update(b'TP53\tMDM2\r\n3\tTP53\r\n\r\n  \n')
+        counter.update(b'1.5 2\n')
+        counter.finish()
+        self.assertEqual(5, counter.edges)
+        self.assertEqual(6, counter.nodes)
+        self.assertTrue(counter.exact)
+
+    def test_graph_counter_blank(self):
+        counter = routing.GraphCounter()
+        counter.update(b'')
+        counter.update(b'\n\n')
+        counter.update(b'# 1 2\n')
+        counter.finish()
+        self.assertEqual(0, counter.edges)
+        self.assertEqual(0, counter.nodes)
+
+    def test_graph_counter_max_nodes(self):
+        counter = routing.GraphCounter(maxnodes=2)
+        counter.update(b'1\t2\n')
+        self.assertTrue(counter.exact)
+        counter.update(b'3\t4\n')
+        self.assertFalse(counter.exact)
+        counter.update(b'5\t6\n7\t8\n')
+        self.assertEqual(4, counter.edges)
+        self.assertEqual(4, counter.nodes)
+
+    def test_classify(self):
+        sizeclasses = routing.SizeClasses()
+        self.assertEqual(['small', 'medium', 'large'],
+                         sizeclasses.get_names())
+        self.assertEqual('small',
+                         sizeclasses.classify(10, 10)[routing.NAME_KEY])
+        self.assertEqual('medium',
+                         sizeclasses.classify(10, 50001)[routing.NAME_KEY])
+        self.assertEqual('medium',
+                         sizeclasses.classify(10001, 10)[routing.NAME_KEY])
+        self.assertEqual('large',
+                         sizeclasses.classify(10, 2000000)[routing.NAME_KEY])
+        self.assertEqual(200000, sizeclasses.get_max_tracked_nodes())
+
+    def test_classify_custom(self):
+        sizeclasses = routing.SizeClasses([
+            {routing.NAME_KEY: 'tiny', routing.MAX_EDGES_KEY: 5,
+             routing.QUEUE_KEY: 'q1', routing.CONCURRENCY_KEY: 8},
+            {routing.NAME_KEY: 'rest', routing.MAX_EDGES_KEY: 100,
+             routing.QUEUE_KEY: 'q2', routing.CONCURRENCY_KEY: 1}])
+        self.assertEqual('tiny', sizeclasses.classify(100, 5)['name'])
+        # larger than every class goes in last one
+        self.assertEqual('rest', sizeclasses.classify(1, 1000)['name'])
+        self.assertEqual(0, sizeclasses.get_max_tracked_nodes())
+        self.assertEqual(8, sizeclasses.get('tiny')[routing.CONCURRENCY_KEY])
+        with self.assertRaises(KeyError):
+            sizeclasses.get('nope')
+
+    def test_no_size_classes(self):
+        with self.assertRaises(ValueError):
+            routing.SizeClasses([])
+
+    def test_get_queues(self):
+        sizeclasses = routing.SizeClasses()
+        self.assertEqual(['communitydetection-small',
+                          'communitydetection-medium',
+                          'communitydetection-large'],
+                         [q.name for q in sizeclasses.get_queues()])
+        self.assertEqual(['communitydetection-medium'],
+                         [q.name for q in sizeclasses.get_queues('medium')])
+
+    def test_get_priority(self):
+        self.assertEqual(routing.MAX_PRIORITY, routing.get_priority(0))
+        self.assertEqual(routing.MAX_PRIORITY, routing.get_priority(9))
+        self.assertEqual(routing.MAX_PRIORITY - 1, routing.get_priority(10))
+        self.assertEqual(routing.MAX_PRIORITY - 6,
+                         routing.get_priority(2000000))
+        self.assertEqual(0, routing.get_priority(10 ** 12))
+
+    def test_get_size_info(self):
+        sizeclass = routing.SizeClasses().get('small')
+        counter = routing.GraphCounter(maxnodes=1)
+        counter.update(b'1\t2\n')
+        self.assertEqual({'sizeclass': 'small', 'edges': 1},
+                         routing.get_size_info(sizeclass, counter))
+        counter = routing.GraphCounter()
+        counter.update(b'1\t2\n')
+        self.assertEqual({'sizeclass': 'small', 'edges': 1, 'nodes': 2},
+                         routing.get_size_info(sizeclass, counter))
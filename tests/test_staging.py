@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `commundetect_rest.staging` module."""
+
+import os
+import hashlib
+import unittest
+import shutil
+import tempfile
+import threading
+from unittest import mock
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+from commundetect_rest import staging
+
+
+class _BlobHandler(BaseHTTPRequestHandler):
+    """
+    Stand in blob server that keeps blobs in memory
+    """
+    blobs = {}
+
+    def do_PUT(self):
+        length = int(self.headers['Content-Length'])
+        _BlobHandler.blobs[self.path] = self.rfile.read(length)
+        self.send_response(201)
+        self.end_headers()
+
+    def do_GET(self):
+        data = _BlobHandler.blobs.get(self.path)
+        if data is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_DELETE(self):
+        if _BlobHandler.blobs.pop(self.path, None) is None:
+            self.send_response(404)
+        else:
+            self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _FakeRedis(object):
+    """
+    Stand in redis client with the commands blob references use
+    """
+    def __init__(self):
+        self.data = {}
+
+    def lock(self, name, timeout=None):
+        return mock.MagicMock()
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value.encode('utf-8')
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def sadd(self, key, value):
+        self.data.setdefault(key, set()).add(value)
+
+    def srem(self, key, value):
+        self.data.get(key, set()).discard(value)
+        if not self.data.get(key, True):
+            del self.data[key]
+
+    def scard(self, key):
+        return len(self.data.get(key, set()))
+
+    def expire(self, key, ttl):
+        pass
+
+
+class TestStaging(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+        self._data = b'1\t2\n2\t3\n' * 100
+        self._input = os.path.join(self._temp_dir, 'edgefile.txt')
+        with open(self._input, 'wb') as f:
+            f.write(self._data)
+        self._taskid = '5e1a9c3e-2b7d-4f0a-9d1e-6c8b2a4f3e10'
+        self._hash = hashlib.sha256(self._data).hexdigest()
+        self._dest = os.path.join(self._temp_dir, 'worker', 'task',
+                                  'edgefile.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self._temp_dir)
+
+    def _read_dest(self):
+        with open(self._dest, 'rb') as f:
+            return f.read()
+
+    def test_shared(self):
+        stager = staging.InputStager()
+        ref = stager.stage(self._input, self._taskid, self._hash)
+        self.assertEqual({staging.REF_TYPE: staging.SHARED_STAGING}, ref)
+        staging.fetch_input(ref, self._input)
+        with self.assertRaises(staging.StagingError):
+            staging.fetch_input(ref, self._dest)
+
+    def test_inline(self):
+        stager = staging.InputStager(inline_max=len(self._data))
+        ref = stager.stage(self._input, self._taskid, self._hash)
+        self.assertEqual(staging.INLINE_STAGING, ref[staging.REF_TYPE])
+        self.assertTrue(len(ref[staging.REF_DATA]) < len(self._data))
+        staging.fetch_input(ref, self._dest)
+        self.assertEqual(self._data, self._read_dest())
+
+    def test_too_big_for_inline(self):
+        stager = staging.InputStager(inline_max=len(self._data) - 1)
+        ref = stager.stage(self._input, self._taskid, self._hash)
+        self.assertEqual(staging.SHARED_STAGING, ref[staging.REF_TYPE])
+
+    def test_directory_blob_store(self):
+        store = staging.create_blob_store(os.path.join(self._temp_dir,
+                                                       'blobs'))
+        self.assertTrue(isinstance(store, staging.DirectoryBlobStore))
+        blobrefs = staging.BlobReferences(store, _FakeRedis())
+        stager = staging.InputStager(backend=staging.BLOB_STAGING,
+                                     blobrefs=blobrefs)
+        ref = stager.stage(self._input, self._taskid, self._hash)
+        self.assertEqual({staging.REF_TYPE: staging.BLOB_STAGING,
+                          staging.REF_NAME: self._hash,
+                          staging.REF_TASK: self._taskid}, ref)
+        staging.fetch_input(ref, self._dest, blobstore=store)
+        self.assertEqual(self._data, self._read_dest())
+
+        with self.assertRaises(staging.StagingError):
+            staging.fetch_input({staging.REF_TYPE: staging.BLOB_STAGING,
+                                 staging.REF_NAME: 'other'}, self._dest,
+                                blobstore=store)
+        with self.assertRaises(staging.StagingError):
+            staging.fetch_input(ref, self._dest)
+
+        # task removes its input once done
+        staging.remove_input(ref, blobrefs=blobrefs)
+        with self.assertRaises(staging.StagingError):
+            staging.fetch_input(ref, self._dest, blobstore=store)
+        staging.remove_input(ref, blobrefs=blobrefs)
+
+        stager.stage(self._input, self._taskid, self._hash)
+        stager.discard(self._taskid)
+        with self.assertRaises(staging.StagingError):
+            staging.fetch_input(ref, self._dest, blobstore=store)
+
+    def test_identical_inputs_share_blob(self):
+        store = mock.MagicMock()
+        blobrefs = staging.BlobReferences(store, _FakeRedis())
+        stager = staging.InputStager(backend=staging.BLOB_STAGING,
+                                     blobrefs=blobrefs)
+        refa = stager.stage(self._input, 'a', self._hash)
+        refb = stager.stage(self._input, 'b', self._hash)
+        self.assertEqual(refa[staging.REF_NAME], refb[staging.REF_NAME])
+        store.put.assert_called_once_with(self._hash, self._input)
+
+        # blob is kept until last task using it is done
+        self.assertFalse(blobrefs.release('a'))
+        self.assertFalse(blobrefs.release('a'))
+        self.assertFalse(store.delete.called)
+        staging.remove_input(refb, blobrefs=blobrefs)
+        store.delete.assert_called_once_with(self._hash)
+
+        # stored again for next task
+        stager.stage(self._input, 'c', self._hash)
+        self.assertEqual(2, store.put.call_count)
+
+    def test_remove_input_not_in_blob_store(self):
+        store = staging.DirectoryBlobStore(os.path.join(self._temp_dir,
+                                                        'blobs'))
+        blobrefs = staging.BlobReferences(store, _FakeRedis())
+        blobrefs.add(self._hash, self._taskid, self._input)
+        staging.remove_input({staging.REF_TYPE: staging.SHARED_STAGING},
+                             blobrefs=blobrefs)
+        staging.remove_input({}, blobrefs=blobrefs)
+        # only blob staging has anything to discard
+        staging.InputStager(blobrefs=blobrefs).discard(self._taskid)
+        staging.fetch_input({staging.REF_TYPE: staging.BLOB_STAGING,
+                             staging.REF_NAME: self._hash}, self._dest,
+                            blobstore=store)
+        self.assertEqual(self._data, self._read_dest())
+
+    def test_http_blob_store(self):
+        server = HTTPServer(('127.0.0.1', 0), _BlobHandler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            store = staging.create_blob_store('http://127.0.0.1:' +
+                                              str(server.server_port) +
+                                              '/blobs/')
+            self.assertTrue(isinstance(store, staging.HttpBlobStore))
+            blobrefs = staging.BlobReferences(store, _FakeRedis())
+            stager = staging.InputStager(backend=staging.BLOB_STAGING,
+                                         blobrefs=blobrefs)
+            ref = stager.stage(self._input, self._taskid, self._hash)
+            staging.fetch_input(ref, self._dest, blobstore=store)
+            self.assertEqual(self._data, self._read_dest())
+            with self.assertRaises(staging.StagingError):
+                store.get('other', self._dest)
+
+            self.assertEqual(['/blobs/' + self._hash],
+                             list(_BlobHandler.blobs.keys()))
+
+            staging.remove_input(ref, blobrefs=blobrefs)
+            self.assertEqual({}, _BlobHandler.blobs)
+            with self.assertRaises(staging.StagingError):
+                staging.fetch_input(ref, self._dest, blobstore=store)
+            # already gone
+            store.delete(self._hash)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_invalid_stager(self):
+        with self.assertRaises(ValueError):
+            staging.InputStager(backend='foo')
+        with self.assertRaises(ValueError):
+            staging.InputStager(backend=staging.BLOB_STAGING)
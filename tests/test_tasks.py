@@ -0,0 +1,571 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `commundetect_rest.tasks` module."""
+
+import os
+import gzip
+import unittest
+import shutil
+import tempfile
+from unittest import mock
+
+import numpy as np
+
+from commundetect_rest import tasks
+from commundetect_rest import registry
+from commundetect_rest import staging
+from commundetect_rest import offload
+from commundetect_rest import costs
+
+
+class TestTasks(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._temp_dir)
+
+    def _write_edgefile(self, data='1\t2\n2\t3\n3\t4\n'):
+        edgefile = os.path.join(self._temp_dir, 'edgefile.txt')
+        with open(edgefile, 'w') as f:
+            f.write(data)
+        return edgefile
+
+    def test_run_infomap(self):
+        edgefile = self._write_edgefile()
+
+        def fake_cmd(workdir, args, imagename=None, profile=None):
+            with open(os.path.join(workdir, 'edgefile.tree'), 'w') as f:
+                f.write('# codelength 1\n'
+                        '1:1 0.25 "1" 0\n1:2 0.25 "2" 1\n'
+                        '2:1 0.25 "3" 2\n2:2 0.25 "4" 3\n')
+            return 0, b'', b''
+
+        with mock.patch.object(tasks, 'run_infomap_cmd',
+                               side_effect=fake_cmd):
+            errmsg, res = tasks.run_infomap(edgefile, self._temp_dir)
+        self.assertEqual(None, errmsg)
+        self.assertEqual('7,5,t-t;7,6,t-t;5,1,t-g;5,2,t-g;'
+                         '6,3,t-g;6,4,t-g;', res)
+
+    def test_run_infomap_cmd_fails(self):
+        edgefile = self._write_edgefile()
+        with mock.patch.object(tasks, 'run_infomap_cmd',
+                               return_value=(1, b'', b'error')):
+            errmsg, res = tasks.run_infomap(edgefile, self._temp_dir)
+        self.assertTrue('non-zero exit code: 1' in errmsg)
+        self.assertEqual(None, res)
+
+    def test_run_algo_unknown(self):
+        errmsg, res = tasks.run_algo('foo', 'edgefile.txt', self._temp_dir)
+        self.assertEqual('foo is not supported', errmsg)
+        self.assertEqual(None, res)
+
+    def test_run_warm_cmd_disabled(self):
+        self.assertEqual(None, tasks.run_warm_cmd('coleslawndex/testlouvain',
+                                                  self._temp_dir, ['x']))
+
+    def test_run_warm_cmd_no_profile(self):
+        with mock.patch.dict(tasks.workerconfig,
+                             {tasks.WARM_CONTAINERS_KEY: True}):
+            self.assertEqual(None, tasks.run_warm_cmd('foo', self._temp_dir,
+                                                      ['x']))
+
+    def test_run_warm_cmd_with_profile(self):
+        profile = tasks.resources.ResourceProfile(cpus=1, memory='1g',
+                                                  cpuset=[3])
+        pool = mock.MagicMock()
+        pool.run.return_value = (0, b'')
+        with mock.patch.dict(tasks.workerconfig,
+                             {tasks.WARM_CONTAINERS_KEY: True,
+                              tasks.WARM_CONTAINER_PROFILES_KEY: {'foo': {}}}),\
+            mock.patch.object(tasks.containers, 'get_container_pool',
+                              return_value=pool) as get_pool:
+            self.assertEqual((0, None, b''),
+                             tasks.run_warm_cmd('foo', self._temp_dir, ['x'],
+                                                profile=profile))
+        self.assertTrue(get_pool.call_args[1]['limits'] is profile)
+        pool.run.assert_called_once_with(
+            ['x'], os.path.join(self._temp_dir, tasks.STDOUT_FILE),
+            cpuset=[3])
+
+    def test_run_algo_inprocess(self):
+        edgefile = self._write_edgefile()
+        pyfile = os.path.join(self._temp_dir, 'myalgo.py')
+        with open(pyfile, 'w') as f:
+            f.write('def run(edgefile, directed=False, writer=None):\n'
+                    '    writer.add_edge(4, 0, "term-gene")\n'
+                    '    return 0 if directed else 1\n')
+        reg = registry.AlgorithmRegistry({'myalgo': {
+            registry.BACKEND_KEY: registry.INPROCESS_BACKEND,
+            registry.CALLABLE_KEY: pyfile + ':run'}})
+        with mock.patch.object(tasks, 'algorithms', reg):
+            errmsg, res = tasks.run_algo('myalgo', edgefile, self._temp_dir,
+                                         directed=True)
+            self.assertEqual(None, errmsg)
+            self.assertEqual('5,1,term-gene;', res)
+
+            errmsg, res = tasks.run_algo('myalgo', edgefile, self._temp_dir)
+            self.assertTrue('non-zero exit code: 1' in errmsg)
+            self.assertEqual(None, res)
+
+    def test_run_infomap_gzip_input(self):
+        edgefile = os.path.join(self._temp_dir, 'edgefile.txt')
+        with open(edgefile, 'wb') as f:
+            f.write(gzip.compress(b'0\t2\n2\t3\n'))
+
+        def fake_cmd(workdir, args, imagename=None, profile=None):
+            self.assertEqual('-z', args[2])
+            self.assertEqual(os.path.join(workdir, tasks.INTERNED_DIR,
+                                          'edgefile.txt'), args[3])
+            with open(args[3], 'rb') as f:
+                self.assertEqual(b'0\t1\n1\t2\n', f.read())
+            with open(os.path.join(workdir, 'edgefile.tree'), 'w') as f:
+                f.write('1:1 0.5 "0" 0\n1:2 0.5 "1" 1\n')
+            return 0, b'', b''
+
+        with mock.patch.object(tasks, 'run_infomap_cmd',
+                               side_effect=fake_cmd):
+            errmsg, res = tasks.run_algo('infomap', edgefile, self._temp_dir)
+        self.assertEqual(None, errmsg)
+        self.assertEqual('5,4,t-t;4,0,t-g;4,2,t-g;', res)
+
+    def test_run_algo_inprocess_gzip_input(self):
+        edgefile = os.path.join(self._temp_dir, 'edgefile.txt')
+        with open(edgefile, 'wb') as f:
+            f.write(gzip.compress(b'1\t2\n'))
+        pyfile = os.path.join(self._temp_dir, 'myalgo.py')
+        with open(pyfile, 'w') as f:
+            f.write('def run(edgefile, directed=False, writer=None):\n'
+                    '    with open(edgefile, "r") as f:\n'
+                    '        a, b = f.read().split()\n'
+                    '    writer.add_edge(3, int(a), "term-gene")\n'
+                    '    return 0\n')
+        reg = registry.AlgorithmRegistry({'myalgo': {
+            registry.BACKEND_KEY: registry.INPROCESS_BACKEND,
+            registry.CALLABLE_KEY: pyfile + ':run'}})
+        with mock.patch.object(tasks, 'algorithms', reg):
+            errmsg, res = tasks.run_algo('myalgo', edgefile, self._temp_dir)
+        self.assertEqual(None, errmsg)
+        self.assertEqual('3,1,term-gene;', res)
+
+    def test_run_algo_docker_corrupt_gzip_input(self):
+        edgefile = os.path.join(self._temp_dir, 'edgefile.txt')
+        with open(edgefile, 'wb') as f:
+            f.write(gzip.compress(b'1\t2\n' * 1000)[:-20])
+
+        def fake_cmd(imagename, workdir, args, stdout=None, profile=None):
+            with open(args[0], 'rb') as f:
+                f.read()
+            return 0, None, b''
+
+        with mock.patch.object(tasks, 'run_algo_cmd', side_effect=fake_cmd):
+            errmsg, res = tasks.run_algo('louvain', edgefile, self._temp_dir)
+        self.assertTrue(errmsg.startswith('Unable to decompress input'))
+        self.assertEqual(None, res)
+
+    def test_run_algo_docker(self):
+        edgefile = self._write_edgefile()
+
+        def fake_cmd(imagename, workdir, args, stdout=None, profile=None):
+            self.assertEqual('coleslawndex/testlouvain', imagename)
+            self.assertEqual([os.path.join(self._temp_dir, tasks.INTERNED_DIR,
+                                           'edgefile.txt'), '--directed'],
+                             args)
+            with open(args[0], 'r') as f:
+                self.assertEqual('0\t1\n1\t2\n2\t3\n', f.read())
+            stdout.write(b'4,0,term-gene;4,3,term-gene;')
+            stdout.flush()
+            return 0, None, b''
+
+        # REST service counts nodes of large graphs up to a limit
+        costinfo = costs.get_cost_info(2, 3, 5.0)
+        with mock.patch.object(tasks, 'run_algo_cmd', side_effect=fake_cmd):
+            errmsg, res = tasks.run_algo('louvain', edgefile, self._temp_dir,
+                                         directed=True, costinfo=costinfo)
+        self.assertEqual(None, errmsg)
+        self.assertEqual('5,1,term-gene;5,4,term-gene;', res)
+        self.assertEqual(costs.get_cost_info(4, 3, 5.0), costinfo)
+
+    def test_run_algo_docker_labels(self):
+        edgefile = self._write_edgefile('TP53\tMDM2\nMDM2\t7\n')
+
+        def fake_cmd(imagename, workdir, args, stdout=None, profile=None):
+            with open(args[0], 'r') as f:
+                self.assertEqual('2\t1\n1\t0\n', f.read())
+            stdout.write(b'3,0,term-gene;3,1,term-gene;3,2,term-gene;')
+            stdout.flush()
+            return 0, None, b''
+
+        with mock.patch.object(tasks, 'run_algo_cmd', side_effect=fake_cmd):
+            errmsg, res = tasks.run_algo('louvain', edgefile, self._temp_dir)
+        self.assertEqual(None, errmsg)
+        self.assertEqual('8,7,term-gene;8,MDM2,term-gene;8,TP53,term-gene;',
+                         res)
+
+        def bad_cmd(imagename, workdir, args, stdout=None, profile=None):
+            stdout.write(b'3,5,term-gene;')
+            stdout.flush()
+            return 0, None, b''
+
+        with mock.patch.object(tasks, 'run_algo_cmd', side_effect=bad_cmd):
+            errmsg, res = tasks.run_algo('louvain', edgefile, self._temp_dir)
+        self.assertTrue(errmsg.startswith('Unable to read result of louvain'))
+        self.assertEqual(None, res)
+
+    def test_run_algo_docker_labels_gzip_input(self):
+        edgefile = os.path.join(self._temp_dir, 'edgefile.txt')
+        with open(edgefile, 'wb') as f:
+            f.write(gzip.compress(b'1\t2\n' * 100 + b'b\t007\n'))
+
+        def fake_cmd(imagename, workdir, args, stdout=None, profile=None):
+            stdout.write(b'4,0,term-gene;4,3,term-gene;')
+            stdout.flush()
+            return 0, None, b''
+
+        with mock.patch.object(tasks, 'run_algo_cmd', side_effect=fake_cmd):
+            errmsg, res = tasks.run_algo('louvain', edgefile, self._temp_dir)
+        self.assertEqual(None, errmsg)
+        self.assertEqual('8,007,term-gene;8,b,term-gene;', res)
+
+    def test_run_algo_docker_edge_arrays(self):
+        edgefile = os.path.join(self._temp_dir, tasks.EDGE_FILE)
+        with open(edgefile, 'wb') as f:
+            np.savez(f, src=np.array([4, 5]),
+                                    dst=np.array([5, 6]))
+
+        def fake_cmd(imagename, workdir, args, stdout=None, profile=None):
+            self.assertEqual(os.path.join(self._temp_dir,
+                                          tasks.INTERNED_DIR,
+                                          tasks.EDGE_FILE), args[0])
+            with open(args[0], 'r') as f:
+                self.assertEqual('0\t1\n1\t2\n', f.read())
+            stdout.write(b'3,0,term-gene;')
+            stdout.flush()
+            return 0, None, b''
+
+        with mock.patch.object(tasks, 'run_algo_cmd', side_effect=fake_cmd):
+            errmsg, res = tasks.run_algo('louvain', edgefile, self._temp_dir)
+        self.assertEqual(None, errmsg)
+        self.assertEqual('7,4,term-gene;', res)
+
+        with open(edgefile, 'wb') as f:
+            np.savez(f, src=np.array([4]))
+        errmsg, res = tasks.run_algo('louvain', edgefile, self._temp_dir)
+        self.assertTrue(errmsg.startswith('Unable to read input'))
+        self.assertEqual(None, res)
+
+    def test_run_algo_docker_killed(self):
+        edgefile = self._write_edgefile()
+        with mock.patch.object(tasks, 'run_algo_cmd',
+                               return_value=(tasks.resources.KILLED_EXIT_CODE,
+                                             None, b'')):
+            errmsg, res = tasks.run_algo('louvain', edgefile, self._temp_dir)
+        self.assertTrue(errmsg.endswith('it was killed'))
+        self.assertEqual(None, res)
+
+    def test_run_algo_cmd_out_of_memory(self):
+        workdir = os.path.join(self._temp_dir, 'abc')
+        profile = tasks.resources.ResourceProfile(cpus=2, memory='1g')
+        p = mock.MagicMock(returncode=tasks.resources.KILLED_EXIT_CODE)
+        p.communicate.return_value = (b'', b'')
+        with mock.patch.object(tasks.subprocess, 'Popen', return_value=p),\
+            mock.patch.object(tasks.containers, 'is_oom_killed',
+                              return_value=True) as oomkilled,\
+            mock.patch.object(tasks.containers,
+                              'remove_job_container') as remove:
+            with self.assertRaises(tasks.resources.OutOfMemoryError):
+                tasks.run_algo_cmd('foo', workdir, ['x'], profile=profile)
+            oomkilled.assert_called_once_with('commundetect_job_abc')
+            remove.assert_called_once_with('abc')
+
+            # killed on revoke or time limit is not out of memory
+            oomkilled.return_value = False
+            self.assertEqual((tasks.resources.KILLED_EXIT_CODE, b'', b''),
+                             tasks.run_algo_cmd('foo', workdir, ['x'],
+                                                profile=profile))
+
+            # docker is only asked about containers that were killed
+            oomkilled.reset_mock()
+            p.returncode = 1
+            self.assertEqual((1, b'', b''),
+                             tasks.run_algo_cmd('foo', workdir, ['x'],
+                                                profile=profile))
+            oomkilled.assert_not_called()
+            self.assertEqual(3, remove.call_count)
+
+    def test_run_communitydetection_missing_input(self):
+        res = tasks.run_communitydetection.apply(args=['louvain',
+                                                       self._temp_dir,
+                                                       False, 'net'],
+                                                 task_id='abc').get()
+        self.assertEqual('error', res['status'])
+        self.assertEqual('net', res['rootnetwork'])
+        self.assertTrue('not found' in res['message'])
+
+    def test_run_communitydetection(self):
+        taskdir = os.path.join(self._temp_dir, 'abc')
+        os.makedirs(taskdir)
+        with open(os.path.join(taskdir, tasks.EDGE_FILE), 'w') as f:
+            f.write('1\t2\n')
+        with mock.patch.object(tasks, 'run_algo',
+                               return_value=(None, '3,1,term-gene;')),\
+            mock.patch.object(tasks.run_communitydetection,
+                              'update_state'):
+            res = tasks.run_communitydetection.apply(args=['louvain',
+                                                           self._temp_dir,
+                                                           False, 'net'],
+                                                     task_id='abc').get()
+        self.assertEqual('done', res['status'])
+        self.assertEqual('3,1,term-gene;', res['result'])
+        self.assertFalse(os.path.isdir(taskdir))
+
+    def test_run_communitydetection_records_run_time(self):
+        taskdir = os.path.join(self._temp_dir, 'abc')
+        os.makedirs(taskdir)
+        with open(os.path.join(taskdir, tasks.EDGE_FILE), 'w') as f:
+            f.write('1\t2\n')
+        runtimes = os.path.join(self._temp_dir, 'runtimes.jsonl')
+        def fake_algo(algorithm, edgelist_file, taskdir, directed=False,
+                      profile=None, costinfo=None):
+            costs.set_graph_size(costinfo, 300000, 900000)
+            return None, '3,1,term-gene;'
+
+        with mock.patch.object(tasks, 'run_algo', side_effect=fake_algo),\
+            mock.patch.dict(tasks.workerconfig,
+                            {costs.RUN_TIMES_FILE_KEY: runtimes}),\
+            mock.patch.object(tasks.run_communitydetection,
+                              'update_state'):
+            tasks.run_communitydetection.apply(
+                args=['louvain', self._temp_dir, False, 'net'],
+                kwargs={'costinfo': costs.get_cost_info(200000, 900000,
+                                                        5.0)},
+                task_id='abc').get()
+        runs = costs.load_run_times(runtimes)
+        self.assertEqual(1, len(runs))
+        self.assertEqual('louvain', runs[0][costs.ALGORITHM_KEY])
+        # size of graph as read by worker is recorded
+        self.assertEqual(300000, runs[0][costs.NODES_KEY])
+        self.assertEqual(900000, runs[0][costs.EDGES_KEY])
+        self.assertFalse(costs.TIMED_OUT_KEY in runs[0])
+
+    def test_run_communitydetection_soft_time_limit(self):
+        taskdir = os.path.join(self._temp_dir, 'abc')
+        os.makedirs(taskdir)
+        with open(os.path.join(taskdir, tasks.EDGE_FILE), 'w') as f:
+            f.write('1\t2\n')
+        runtimes = os.path.join(self._temp_dir, 'runtimes.jsonl')
+        with mock.patch.object(tasks, 'run_algo',
+                               side_effect=tasks.SoftTimeLimitExceeded()),\
+            mock.patch.dict(tasks.workerconfig,
+                            {costs.RUN_TIMES_FILE_KEY: runtimes}),\
+            mock.patch.object(tasks.run_communitydetection,
+                              'update_state'):
+            res = tasks.run_communitydetection.apply(
+                args=['louvain', self._temp_dir, False, 'net'],
+                kwargs={'costinfo': costs.get_cost_info(2, 1, 5.0)},
+                task_id='abc').get()
+        self.assertEqual('error', res['status'])
+        self.assertTrue('time limit' in res['message'])
+        # recorded as lower bound of run time
+        runs = costs.load_run_times(runtimes)
+        self.assertEqual(1, len(runs))
+        self.assertTrue(runs[0][costs.TIMED_OUT_KEY])
+        self.assertFalse(os.path.isdir(taskdir))
+
+    def test_run_communitydetection_time_limit_waiting_for_cores(self):
+        taskdir = os.path.join(self._temp_dir, 'abc')
+        os.makedirs(taskdir)
+        with open(os.path.join(taskdir, tasks.EDGE_FILE), 'w') as f:
+            f.write('1\t2\n')
+        runtimes = os.path.join(self._temp_dir, 'runtimes.jsonl')
+        allocator = mock.MagicMock()
+        allocator.allocate.return_value.__enter__.side_effect =\
+            tasks.SoftTimeLimitExceeded()
+        with mock.patch.object(tasks, 'coreallocator', allocator),\
+            mock.patch.object(tasks, 'run_algo') as run_algo,\
+            mock.patch.dict(tasks.workerconfig,
+                            {costs.RUN_TIMES_FILE_KEY: runtimes}),\
+            mock.patch.object(tasks.run_communitydetection,
+                              'update_state'):
+            res = tasks.run_communitydetection.apply(
+                args=['louvain', self._temp_dir, False, 'net'],
+                kwargs={'costinfo': costs.get_cost_info(2, 1, 5.0)},
+                task_id='abc').get()
+        self.assertFalse(run_algo.called)
+        self.assertEqual('error', res['status'])
+        self.assertTrue('waiting for cores' in res['message'])
+        self.assertFalse(os.path.isfile(runtimes))
+
+    def test_communicate_kills_on_interrupt(self):
+        p = mock.MagicMock()
+        p.communicate.side_effect = tasks.SoftTimeLimitExceeded()
+        with self.assertRaises(tasks.SoftTimeLimitExceeded):
+            tasks.communicate(p)
+        p.kill.assert_called_once_with()
+        p.wait.assert_called_once_with()
+
+    def test_communicate_stops_job_container(self):
+        p = mock.MagicMock()
+        p.communicate.side_effect = tasks.SoftTimeLimitExceeded()
+        with mock.patch.object(tasks.containers,
+                               'stop_job_container') as stop:
+            with self.assertRaises(tasks.SoftTimeLimitExceeded):
+                tasks.communicate(p, taskid='abc')
+        stop.assert_called_once_with('abc')
+        p.kill.assert_called_once_with()
+
+    def test_get_docker_cmd(self):
+        cmd, taskid = tasks.get_docker_cmd('foo/bar', '/tmp/jobs/abc/')
+        self.assertEqual('abc', taskid)
+        self.assertEqual(['docker', 'run',
+                          '--name', 'commundetect_job_abc',
+                          '--label', 'commundetect.task=abc',
+                          '-v', '/tmp/jobs/abc/:/tmp/jobs/abc/',
+                          'foo/bar'], cmd)
+
+    def test_get_docker_cmd_with_profile(self):
+        profile = tasks.resources.ResourceProfile(cpus=2, memory='4g',
+                                                  cpuset=[2, 3])
+        cmd, taskid = tasks.get_docker_cmd('foo/bar', '/tmp/jobs/abc/',
+                                           profile=profile)
+        self.assertEqual(['--cpus', '2', '--cpuset-cpus', '2,3',
+                          '--memory', '4g', '--memory-swap', '4g',
+                          '-e', 'OMP_NUM_THREADS=2',
+                          '-v', '/tmp/jobs/abc/:/tmp/jobs/abc/',
+                          'foo/bar'], cmd[6:])
+
+    def test_run_communitydetection_out_of_memory(self):
+        taskdir = os.path.join(self._temp_dir, 'abc')
+        os.makedirs(taskdir)
+        with open(os.path.join(taskdir, tasks.EDGE_FILE), 'w') as f:
+            f.write('1\t2\n')
+        err = tasks.resources.OutOfMemoryError('killed')
+        with mock.patch.object(tasks, 'run_algo', side_effect=err),\
+            mock.patch.object(tasks.run_communitydetection,
+                              'update_state'):
+            res = tasks.run_communitydetection.apply(
+                args=['louvain', self._temp_dir, False, 'net'],
+                task_id='abc').get()
+        self.assertEqual(tasks.resources.OUT_OF_MEMORY_STATUS, res['status'])
+        self.assertEqual('killed', res['message'])
+        self.assertFalse(os.path.isdir(taskdir))
+
+    def test_cleanup_job(self):
+        taskdir = os.path.join(self._temp_dir, 'abc')
+        os.makedirs(taskdir)
+        with mock.patch.object(tasks.containers,
+                               'stop_job_container') as stop,\
+            mock.patch.object(tasks.containers,
+                              'stop_process_containers') as stopwarm:
+            tasks.cleanup_job('abc', self._temp_dir, workerpid=42)
+            stop.assert_called_once_with('abc')
+            stopwarm.assert_called_once_with(42)
+            self.assertFalse(os.path.isdir(taskdir))
+
+            # job that never started has no containers
+            os.makedirs(taskdir)
+            tasks.cleanup_job('abc', self._temp_dir, started=False)
+            self.assertEqual(1, stop.call_count)
+            self.assertEqual(1, stopwarm.call_count)
+            self.assertFalse(os.path.isdir(taskdir))
+
+    def test_cleanup_job_removes_blob_input(self):
+        inputref = {staging.REF_TYPE: staging.BLOB_STAGING,
+                    staging.REF_NAME: 'f00d', staging.REF_TASK: 'abc'}
+        blobrefs = mock.MagicMock()
+        with mock.patch.object(tasks, 'blobrefs', blobrefs):
+            tasks.cleanup_job('abc', None, started=False, inputref=inputref)
+        blobrefs.release.assert_called_once_with('abc')
+
+    def test_run_communitydetection_size_info(self):
+        taskdir = os.path.join(self._temp_dir, 'abc')
+        os.makedirs(taskdir)
+        with open(os.path.join(taskdir, tasks.EDGE_FILE), 'w') as f:
+            f.write('1\t2\n')
+        sizeinfo = {'sizeclass': 'small', 'nodes': 2, 'edges': 1}
+        with mock.patch.object(tasks, 'run_algo',
+                               return_value=(None, '3,1,term-gene;')),\
+            mock.patch.object(tasks.run_communitydetection,
+                              'update_state') as update_state:
+            res = tasks.run_communitydetection.apply(args=['louvain',
+                                                           self._temp_dir,
+                                                           False, 'net'],
+                                                     kwargs={'sizeinfo':
+                                                             sizeinfo},
+                                                     task_id='abc').get()
+        self.assertEqual('small', res['sizeclass'])
+        self.assertEqual(1, res['edges'])
+        meta = update_state.call_args[1]['meta']
+        self.assertEqual('small', meta['sizeclass'])
+        self.assertEqual('Running louvain', meta['message'])
+
+    def test_run_communitydetection_offloads_large_result(self):
+        taskdir = os.path.join(self._temp_dir, 'abc')
+        os.makedirs(taskdir)
+        with open(os.path.join(taskdir, tasks.EDGE_FILE), 'w') as f:
+            f.write('1\t2\n')
+        storedir = os.path.join(self._temp_dir, 'results')
+        store = offload.DirectoryResultStore(storedir)
+        with mock.patch.object(tasks, 'run_algo',
+                               return_value=(None, '3,1,term-gene;')),\
+            mock.patch.object(tasks, 'resultstore', store),\
+            mock.patch.dict(tasks.workerconfig,
+                            {offload.RESULT_STORE_MIN_KEY: 5}),\
+            mock.patch.object(tasks.run_communitydetection,
+                              'update_state'):
+            res = tasks.run_communitydetection.apply(args=['louvain',
+                                                           self._temp_dir,
+                                                           False, 'net'],
+                                                     task_id='abc').get()
+        self.assertEqual('done', res['status'])
+        self.assertIsNone(res['result'])
+        self.assertEqual('3,1,term-gene;',
+                         store.get_text(res[offload.RESULT_REF_KEY]))
+
+    def test_run_communitydetection_inline_input(self):
+        stager = staging.InputStager(inline_max=1000)
+        edgefile = self._write_edgefile()
+        inputref = stager.stage(edgefile, 'unused', 'f00d')
+
+        def fake_algo(algorithm, edgelist_file, taskdir, directed=False,
+                      profile=None, costinfo=None):
+            with open(edgelist_file, 'r') as f:
+                return None, f.read()
+
+        with mock.patch.object(tasks, 'run_algo', side_effect=fake_algo),\
+            mock.patch.object(tasks.run_communitydetection,
+                              'update_state'):
+            res = tasks.run_communitydetection.apply(args=['louvain',
+                                                           self._temp_dir,
+                                                           False, 'net'],
+                                                     kwargs={'inputref':
+                                                             inputref},
+                                                     task_id='abc').get()
+        self.assertEqual('done', res['status'])
+        self.assertEqual('1\t2\n2\t3\n3\t4\n', res['result'])
+        self.assertFalse(os.path.isdir(os.path.join(self._temp_dir, 'abc')))
+
+    def test_run_communitydetection_removes_blob_input(self):
+        store = staging.DirectoryBlobStore(os.path.join(self._temp_dir,
+                                                        'blobs'))
+        inputref = {staging.REF_TYPE: staging.BLOB_STAGING,
+                    staging.REF_NAME: 'f00d', staging.REF_TASK: 'abc'}
+        store.put('f00d', self._write_edgefile())
+        blobrefs = mock.MagicMock()
+        with mock.patch.object(tasks, 'blobstore', store),\
+            mock.patch.object(tasks, 'blobrefs', blobrefs),\
+            mock.patch.object(tasks, 'run_algo',
+                              return_value=(None, '3,1,term-gene;')),\
+            mock.patch.object(tasks.run_communitydetection,
+                              'update_state'):
+            res = tasks.run_communitydetection.apply(args=['louvain',
+                                                           self._temp_dir,
+                                                           False, 'net'],
+                                                     kwargs={'inputref':
+                                                             inputref},
+                                                     task_id='abc').get()
+        self.assertEqual('done', res['status'])
+        blobrefs.release.assert_called_once_with('abc')